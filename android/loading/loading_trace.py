@@ -5,11 +5,15 @@
 """Represents the trace of a page load."""
 
 import datetime
+import functools
 try:
   import ujson as json
 except ImportError:
   import json
+import os
+import struct
 import time
+import zlib
 
 import devtools_monitor
 import page_track
@@ -25,6 +29,13 @@ class LoadingTrace(object):
   _REQUEST_KEY = 'request_track'
   _TRACING_KEY = 'tracing_track'
 
+  # Compact files start with _COMPACT_MAGIC, followed by zlib compressed JSON
+  # blobs. The last one is an index giving the other blobs' offsets and sizes,
+  # and its own offset and size are packed at the very end of the file.
+  _COMPACT_MAGIC = 'clovis-loading-trace-compact-v1\n'
+  _COMPACT_FOOTER = struct.Struct('<QQ')
+  _COMPACT_EVENTS_PER_CHUNK = 5000
+
   def __init__(self, url, metadata, page, request, track):
     """Initializes a loading trace instance.
 
@@ -37,10 +48,14 @@ class LoadingTrace(object):
     """
     self.url = url
     self.metadata = metadata
-    self.page_track = page
-    self.request_track = request
+    self._page_track = page
+    self._request_track = request
     self._tracing_track = track
-    self._tracing_json_str = None
+    # Functions restoring tracks that are not decoded yet, keyed by the name of
+    # the member holding the track.
+    self._track_loaders = {}
+    # Function restoring the tracing track from the file it was read from.
+    self._tracing_track_file_loader = None
 
   def ToJsonDict(self):
     """Returns a dictionary representing this instance."""
@@ -71,10 +86,86 @@ class LoadingTrace(object):
     return LoadingTrace(json_dict[cls._URL_KEY], json_dict[cls._METADATA_KEY],
                         page, request, track)
 
+  def ToCompactFile(self, path):
+    """Saves a compact file representing this instance.
+
+    Unlike in json files, each track is compressed separately, and tracing
+    events are grouped by pid and category into separately compressed chunks.
+    This lets FromJsonFile() only decode a track when it is accessed, and only
+    the events of a tracing track that TracingTrack.Filter() and
+    TracingTrack.GetMatchingEvents() select.
+    """
+    with open(path, 'wb') as output_file:
+      output_file.write(self._COMPACT_MAGIC)
+      def WriteBlob(json_data):
+        data = zlib.compress(json.dumps(json_data))
+        offset = output_file.tell()
+        output_file.write(data)
+        return [offset, len(data)]
+
+      index = {self._URL_KEY: self.url, self._METADATA_KEY: self.metadata,
+               self._PAGE_KEY: WriteBlob(self.page_track.ToJsonDict()),
+               self._REQUEST_KEY: WriteBlob(self.request_track.ToJsonDict()),
+               self._TRACING_KEY: None}
+      if self.tracing_track:
+        base_msec, event_chunks = self.tracing_track.ToEventChunks(
+            self._COMPACT_EVENTS_PER_CHUNK)
+        index[self._TRACING_KEY] = {
+            'categories': list(self.tracing_track.Categories()),
+            'base_msec': base_msec,
+            'chunks': [{'pid': pid, 'category': category,
+                        'blob': WriteBlob(events)}
+                       for pid, category, events in event_chunks]}
+      output_file.write(self._COMPACT_FOOTER.pack(*WriteBlob(index)))
+
+  @classmethod
+  def FromCompactFile(cls, path):
+    """Returns an instance from a compact file saved by ToCompactFile().
+
+    Tracks are decoded from the file the first time they are accessed, so the
+    file must not be modified for as long as the instance is used.
+    """
+    with open(path, 'rb') as input_file:
+      if input_file.read(len(cls._COMPACT_MAGIC)) != cls._COMPACT_MAGIC:
+        raise ValueError('Not a compact loading trace: {}'.format(path))
+      input_file.seek(-cls._COMPACT_FOOTER.size, os.SEEK_END)
+      index = _ReadCompactBlob(
+          input_file, cls._COMPACT_FOOTER.unpack(
+              input_file.read(cls._COMPACT_FOOTER.size)))
+
+    def LoadTracingTrack():
+      tracing_index = index[cls._TRACING_KEY]
+      if not tracing_index:
+        return None
+      event_chunks = [
+          tracing_track.EventChunk(
+              chunk['pid'], chunk['category'],
+              functools.partial(_ReadCompactBlobFromPath, path, chunk['blob']))
+          for chunk in tracing_index['chunks']]
+      return tracing_track.TracingTrack.FromEventChunks(
+          tracing_index['categories'], tracing_index['base_msec'],
+          event_chunks)
+
+    trace = LoadingTrace(index[cls._URL_KEY], index[cls._METADATA_KEY],
+                         None, None, None)
+    trace._track_loaders = {
+        '_page_track': lambda: page_track.PageTrack.FromJsonDict(
+            _ReadCompactBlobFromPath(path, index[cls._PAGE_KEY])),
+        '_request_track': lambda: request_track.RequestTrack.FromJsonDict(
+            _ReadCompactBlobFromPath(path, index[cls._REQUEST_KEY])),
+        '_tracing_track': LoadTracingTrack}
+    trace._tracing_track_file_loader = LoadTracingTrack
+    return trace
+
   @classmethod
   def FromJsonFile(cls, json_path):
-    """Returns an instance from a json file saved by ToJsonFile()."""
-    with open(json_path) as input_file:
+    """Returns an instance from a file saved by ToJsonFile() or
+    ToCompactFile().
+    """
+    with open(json_path, 'rb') as input_file:
+      if input_file.read(len(cls._COMPACT_MAGIC)) == cls._COMPACT_MAGIC:
+        return cls.FromCompactFile(json_path)
+      input_file.seek(0)
       return cls.FromJsonDict(json.load(input_file))
 
   @classmethod
@@ -110,23 +201,46 @@ class LoadingTrace(object):
                           seconds_since_epoch=seconds_since_epoch)
     return trace
 
+  @property
+  def page_track(self):
+    return self._GetTrack('_page_track')
+
+  @property
+  def request_track(self):
+    return self._GetTrack('_request_track')
+
   @property
   def tracing_track(self):
-    if not self._tracing_track:
-      self._RestoreTracingTrack()
-    return self._tracing_track
+    return self._GetTrack('_tracing_track')
 
   def Slim(self):
     """Slims the memory usage of a trace by dropping the TraceEvents from it.
 
     The tracing track is restored on-demand when accessed.
     """
-    self._tracing_json_str = json.dumps(self._tracing_track.ToJsonDict())
+    if '_tracing_track' in self._track_loaders:
+      return
+    if self._tracing_track_file_loader:
+      loader = self._tracing_track_file_loader
+    else:
+      tracing_json_str = json.dumps(self._tracing_track.ToJsonDict())
+      loader = lambda: tracing_track.TracingTrack.FromJsonDict(
+          json.loads(tracing_json_str))
+    self._track_loaders['_tracing_track'] = loader
     self._tracing_track = None
 
-  def _RestoreTracingTrack(self):
-    if not self._tracing_json_str:
-      return None
-    self._tracing_track = tracing_track.TracingTrack.FromJsonDict(
-        json.loads(self._tracing_json_str))
-    self._tracing_json_str = None
+  def _GetTrack(self, member_name):
+    if member_name in self._track_loaders:
+      setattr(self, member_name, self._track_loaders.pop(member_name)())
+    return getattr(self, member_name)
+
+
+def _ReadCompactBlob(input_file, blob):
+  offset, size = blob
+  input_file.seek(offset)
+  return json.loads(zlib.decompress(input_file.read(size)))
+
+
+def _ReadCompactBlobFromPath(path, blob):
+  with open(path, 'rb') as input_file:
+    return _ReadCompactBlob(input_file, blob)
@@ -50,6 +50,15 @@ def _ArgumentParser():
   prune_parser.add_argument('-o', '--output',
       type=argparse.FileType('w'), default=sys.stdout,
       help='Output destination path if different from stdout.')
+
+  # compact subcommand.
+  compact_parser = subparsers.add_parser('compact',
+      help='Converts a loading trace to the compact format, that is faster to '
+           'load and to analyze.')
+  compact_parser.add_argument('loading_trace', type=str,
+      help='Input path of the loading trace.')
+  compact_parser.add_argument('output', type=str,
+      help='Output path of the compact loading trace.')
   return parser
 
 
@@ -171,6 +180,9 @@ def main(command_line_args):
     return 1
   elif args.subcommand == 'prune':
     return _PruneMain(args)
+  elif args.subcommand == 'compact':
+    LoadingTrace.FromJsonFile(args.loading_trace).ToCompactFile(args.output)
+    return 0
   assert False
 
 
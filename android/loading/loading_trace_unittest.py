@@ -0,0 +1,90 @@
+# Copyright 2016 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import loading_trace
+import test_utils
+
+
+class LoadingTraceTestCase(unittest.TestCase):
+  _TRACE_EVENTS = [
+      {'ts': 5000, 'ph': 'X', 'dur': 1000, 'pid': 1, 'tid': 1, 'cat': 'A',
+       'name': 'a'},
+      {'ts': 3000, 'ph': 'X', 'dur': 4000, 'pid': 2, 'tid': 1, 'cat': 'B',
+       'name': 'b'},
+      {'ts': 10000, 'ph': 'B', 'pid': 1, 'tid': 2, 'cat': 'A,B', 'name': 'c'},
+      {'ts': 11000, 'ph': 'E', 'pid': 1, 'tid': 2, 'cat': 'A,B', 'name': 'c',
+       'args': {'hello': 'world'}},
+      {'ts': 0, 'ph': 'M', 'pid': 1, 'tid': 1, 'cat': '__metadata',
+       'name': 'thread_name'}]
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    requests = [test_utils.MakeRequest(0, 'null', 100, 110, 120),
+                test_utils.MakeRequest(1, 0, 115, 120, 130)]
+    page_events = [{'method': 'Page.frameStartedLoading', 'frame_id': '1'}]
+    self.trace = test_utils.LoadingTraceFromEvents(
+        requests, page_events, self._TRACE_EVENTS)
+    self.trace.url = 'http://0'
+    self.trace.metadata = {'hello': 'world'}
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _TracePath(self, name):
+    return os.path.join(self._temp_dir, name)
+
+  def testCompactFile(self):
+    self.trace.ToJsonFile(self._TracePath('trace.json'))
+    self.trace.ToCompactFile(self._TracePath('trace.compact'))
+    json_trace = loading_trace.LoadingTrace.FromJsonFile(
+        self._TracePath('trace.json'))
+    compact_trace = loading_trace.LoadingTrace.FromJsonFile(
+        self._TracePath('trace.compact'))
+    self.assertEquals(json_trace.ToJsonDict(), compact_trace.ToJsonDict())
+    self.assertEquals(json_trace.tracing_track.GetFirstEventMillis(),
+                      compact_trace.tracing_track.GetFirstEventMillis())
+    self.assertEquals(
+        [e.tracing_event for e in json_trace.tracing_track.Filter(
+            pid=1, categories=set(['B'])).GetEvents()],
+        [e.tracing_event for e in compact_trace.tracing_track.Filter(
+            pid=1, categories=set(['B'])).GetEvents()])
+
+  def testCompactFileTracksAreDecodedOnAccess(self):
+    self.trace.ToCompactFile(self._TracePath('trace.compact'))
+    trace = loading_trace.LoadingTrace.FromCompactFile(
+        self._TracePath('trace.compact'))
+    self.assertEquals('http://0', trace.url)
+    self.assertEquals({'hello': 'world'}, trace.metadata)
+    self.assertEquals(None, trace._page_track)
+    self.assertEquals(None, trace._request_track)
+    self.assertEquals('1', trace.page_track.GetMainFrameId())
+    self.assertEquals(None, trace._request_track)
+    self.assertEquals(2, len(trace.request_track.GetEvents()))
+
+    self.assertEquals(5, len(trace.tracing_track.GetEvents()))
+    trace.Slim()
+    self.assertEquals(None, trace._tracing_track)
+    self.assertEquals(5, len(trace.tracing_track.GetEvents()))
+
+  def testNoTracingTrack(self):
+    self.trace._tracing_track = None
+    self.trace.ToCompactFile(self._TracePath('trace.compact'))
+    trace = loading_trace.LoadingTrace.FromJsonFile(
+        self._TracePath('trace.compact'))
+    self.assertEquals(None, trace.tracing_track)
+    self.assertEquals(2, len(trace.request_track.GetEvents()))
+
+  def testSlim(self):
+    self.trace.Slim()
+    self.assertEquals(None, self.trace._tracing_track)
+    self.assertEquals(5, len(self.trace.tracing_track.GetEvents()))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -13,6 +13,7 @@ import argparse
 import csv
 import json
 import logging
+import multiprocessing
 import os
 import re
 import sys
@@ -32,6 +33,7 @@ import devil_chromium
 import csv_util
 import device_setup
 import options
+import sandwich_metrics
 import sandwich_prefetch
 import sandwich_swr
 import sandwich_utils
@@ -94,6 +96,9 @@ def _ArgumentParser():
       dest='android_device_serial', help='Android device\'s serial to use.')
   sandwich_setup_parser.add_argument('-c', '--corpus', required=True,
       help='Path to a JSON file with a corpus such as in %s/.' % _CORPUS_DIR)
+  sandwich_setup_parser.add_argument('--compact-traces', action='store_true',
+      help='Save the loading traces in a compact format that is faster to '
+           'analyze, but that only LoadingTrace.FromJsonFile() can read.')
   sandwich_setup_parser.add_argument('-m', '--measure', default=[], nargs='+',
       choices=[_SPEED_INDEX_MEASUREMENT,
                _MEMORY_MEASUREMENT,
@@ -139,6 +144,20 @@ def _ArgumentParser():
   collect_csv_parser.add_argument('output_csv', type=argparse.FileType('w'),
                                   help='Path to the output CSV.')
 
+  # Extract metrics subcommand.
+  extract_metrics_parser = subparsers.add_parser('extract-metrics',
+      help='Extracts the common metrics of all the traces from Sandwich output '
+           'directory into a single CSV, processing traces in parallel.')
+  extract_metrics_parser.add_argument('output_dir', type=str,
+                                      help='Path to the run output directory.')
+  extract_metrics_parser.add_argument('output_csv',
+                                      type=argparse.FileType('w'),
+                                      help='Path to the output CSV.')
+  extract_metrics_parser.add_argument('-j', '--jobs', type=int,
+                                      default=multiprocessing.cpu_count(),
+                                      help='Number of traces to process in '
+                                           'parallel (default: %(default)s).')
+
   return parser
 
 
@@ -232,7 +251,8 @@ def _SetupBenchmarkMain(args, benchmark_type, benchmark_specific_handler):
       'record_first_meaningful_paint': (
           _TTFMP_MEASUREMENT in args.optional_measures),
       'repeat': args.url_repeat,
-      'android_device_serial': args.android_device_serial
+      'android_device_serial': args.android_device_serial,
+      'compact_trace': args.compact_traces
     },
     'urls': _GenerateUrlDirectoryMap(urls)
   }
@@ -259,6 +279,7 @@ def _RunBenchmarkMain(args):
     runner.record_first_meaningful_paint = (
         setup['sandwich_runner']['record_first_meaningful_paint'])
     runner.repeat = setup['sandwich_runner']['repeat']
+    runner.compact_trace = setup['sandwich_runner'].get('compact_trace', False)
 
   default_final_tasks = []
   for output_subdirectory, url in setup['urls'].iteritems():
@@ -293,6 +314,12 @@ def main(command_line_args):
       if not csv_util.CollectCSVsFromDirectory(args.output_dir, output_file):
         return 1
     return 0
+  if args.subcommand == 'extract-metrics':
+    with args.output_csv as output_file:
+      if not sandwich_metrics.WriteCommonMetricsCsv(
+          args.output_dir, output_file, args.jobs):
+        return 1
+    return 0
   assert False
 
 
@@ -8,8 +8,11 @@ python pull_sandwich_metrics.py -h
 """
 
 import collections
+import csv
+import itertools
 import json
 import logging
+import multiprocessing
 import os
 import shutil
 import subprocess
@@ -49,6 +52,10 @@ COMMON_CSV_COLUMN_NAMES = [
     'net_emul.upload',
     'net_emul.latency']
 
+# Column of the CSV written by WriteCommonMetricsCsv() identifying the repeat
+# directory of a row, relative to the sandwich output directory.
+REPEAT_DIR_CSV_COLUMN_NAME = 'repeat_dir'
+
 _UNAVAILABLE_CSV_VALUE = 'unavailable'
 
 _FAILED_CSV_VALUE = 'failed'
@@ -79,7 +86,7 @@ def _GetBrowserPID(track):
   Returns:
     The browser's PID as an integer.
   """
-  for event in track.GetEvents():
+  for event in track.Filter(categories=set(['__metadata'])).GetEvents():
     if event.category != '__metadata' or event.name != 'process_name':
       continue
     if event.args['name'] == 'Browser':
@@ -99,7 +106,8 @@ def _GetBrowserDumpEvents(track):
   assert sandwich_runner.MEMORY_DUMP_CATEGORY in track.Categories()
   browser_pid = _GetBrowserPID(track)
   browser_dumps_events = []
-  for event in track.GetEvents():
+  for event in track.Filter(
+      categories=set(['disabled-by-default-memory-infra'])).GetEvents():
     if event.category != 'disabled-by-default-memory-infra':
       continue
     if event.type != 'v' or event.name != 'periodic_interval':
@@ -125,8 +133,9 @@ def _GetWebPageTrackedEvents(track):
   """
   main_frame_id = None
   tracked_events = {}
-  sorted_events = sorted(track.GetEvents(),
-                         key=lambda event: event.start_msec)
+  sorted_events = sorted(
+      track.Filter(categories=set(['blink.user_timing'])).GetEvents(),
+      key=lambda event: event.start_msec)
   for event in sorted_events:
     if event.category != 'blink.user_timing':
       continue
@@ -343,3 +352,97 @@ def ExtractCommonMetricsFromRepeatDirectory(repeat_dir, trace):
     run_metrics['net_emul.' + key] = value
   assert set(run_metrics.keys()) == set(COMMON_CSV_COLUMN_NAMES)
   return run_metrics
+
+
+def _ExtractCommonMetricsFromRepeatDirectoryPath(repeat_dir):
+  """Loads the trace of a repeat directory and extracts its metrics.
+
+  Args:
+    repeat_dir: Path of the repeat directory within a run directory.
+
+  Returns:
+    Dictionary of extracted metrics, or None if the extraction failed.
+  """
+  trace_path = os.path.join(repeat_dir, sandwich_runner.TRACE_FILENAME)
+  logging.info('extracting metrics from trace: %s', trace_path)
+  try:
+    trace = loading_trace_module.LoadingTrace.FromJsonFile(trace_path)
+    return ExtractCommonMetricsFromRepeatDirectory(repeat_dir, trace)
+  except Exception:
+    logging.exception('could not extract metrics from trace: %s', trace_path)
+    return None
+
+
+def ListRepeatDirectories(output_dir):
+  """Lists recursively the repeat directories containing a trace.
+
+  Args:
+    output_dir: Path of the sandwich output directory.
+
+  Returns:
+    Sorted list of repeat directories' paths.
+  """
+  repeat_dirs = []
+  for root, _, files in os.walk(output_dir):
+    if sandwich_runner.TRACE_FILENAME in files:
+      repeat_dirs.append(root)
+  repeat_dirs.sort()
+  return repeat_dirs
+
+
+def ExtractCommonMetricsFromRepeatDirectories(repeat_dirs, jobs=1):
+  """Extracts all the metrics of several repeat directories.
+
+  Traces are loaded and processed in |jobs| processes, one trace at a time per
+  process.
+
+  Args:
+    repeat_dirs: Paths of the repeat directories.
+    jobs: Number of processes to use.
+
+  Returns:
+    List of dictionaries of extracted metrics as returned by
+    ExtractCommonMetricsFromRepeatDirectory(), or None for the repeat
+    directories whose extraction failed, in the order of |repeat_dirs|.
+  """
+  if jobs <= 1:
+    return map(_ExtractCommonMetricsFromRepeatDirectoryPath, repeat_dirs)
+  pool = multiprocessing.Pool(jobs)
+  try:
+    return pool.map(_ExtractCommonMetricsFromRepeatDirectoryPath, repeat_dirs,
+                    chunksize=1)
+  finally:
+    pool.close()
+    pool.join()
+
+
+def WriteCommonMetricsCsv(output_dir, output_file, jobs=1):
+  """Extracts the metrics of all the traces of an output directory into one CSV.
+
+  Args:
+    output_dir: Path of the sandwich output directory.
+    output_file: File-like object to write the CSV to.
+    jobs: Number of processes to use.
+
+  Returns:
+    Whether the metrics of all the traces were extracted.
+  """
+  repeat_dirs = ListRepeatDirectories(output_dir)
+  if not repeat_dirs:
+    logging.error('No traces found in %s', output_dir)
+    return False
+  writer = csv.DictWriter(output_file, fieldnames=(
+      [REPEAT_DIR_CSV_COLUMN_NAME] + COMMON_CSV_COLUMN_NAMES))
+  writer.writeheader()
+  failed_repeat_dirs = []
+  for repeat_dir, run_metrics in itertools.izip(repeat_dirs,
+      ExtractCommonMetricsFromRepeatDirectories(repeat_dirs, jobs)):
+    if run_metrics is None:
+      failed_repeat_dirs.append(repeat_dir)
+      continue
+    run_metrics[REPEAT_DIR_CSV_COLUMN_NAME] = os.path.relpath(
+        repeat_dir, output_dir)
+    writer.writerow(run_metrics)
+  for repeat_dir in failed_repeat_dirs:
+    logging.error('could not extract metrics from: %s', repeat_dir)
+  return not failed_repeat_dirs
@@ -3,9 +3,11 @@
 # found in the LICENSE file.
 
 import copy
+import csv
 import json
 import os
 import shutil
+import StringIO
 import subprocess
 import tempfile
 import unittest
@@ -220,6 +222,44 @@ class PageTrackTest(unittest.TestCase):
     self.assertEquals(30971, metrics['browser_malloc_avg'])
     self.assertEquals(55044, metrics['browser_malloc_max'])
 
+  def testWriteCommonMetricsCsv(self):
+    output_dir = tempfile.mkdtemp()
+    try:
+      for repeat_dir in ['run0/0', 'run0/1', 'run1/0']:
+        os.makedirs(os.path.join(output_dir, repeat_dir))
+        trace = LoadingTrace(_MINIMALIST_TRACE_EVENTS)
+        trace.metadata = {
+            'chromium_commit': 'deadbeef',
+            'platform': {'os': 'android', 'product_model': 'Nexus'},
+            'network_emulation': {
+                'name': 'Regular3G', 'download': 1, 'upload': 2, 'latency': 3}}
+        trace.ToJsonFile(os.path.join(
+            output_dir, repeat_dir, sandwich_runner.TRACE_FILENAME))
+      self.assertEquals(
+          [os.path.join(output_dir, d) for d in ['run0/0', 'run0/1', 'run1/0']],
+          puller.ListRepeatDirectories(output_dir))
+
+      output_csv = StringIO.StringIO()
+      self.assertTrue(puller.WriteCommonMetricsCsv(output_dir, output_csv))
+      rows = list(csv.DictReader(StringIO.StringIO(output_csv.getvalue())))
+      self.assertEquals(['run0/0', 'run0/1', 'run1/0'],
+                        [row['repeat_dir'] for row in rows])
+      for row in rows:
+        self.assertEquals('android-Nexus', row['platform'])
+        self.assertEquals('11.0', row['first_contentful_paint'])
+        self.assertEquals('55044', row['browser_malloc_max'])
+
+      with open(os.path.join(output_dir, 'run1/0',
+                             sandwich_runner.TRACE_FILENAME), 'w') as f:
+        f.write('{')
+      output_csv = StringIO.StringIO()
+      self.assertFalse(puller.WriteCommonMetricsCsv(output_dir, output_csv))
+      rows = list(csv.DictReader(StringIO.StringIO(output_csv.getvalue())))
+      self.assertEquals(['run0/0', 'run0/1'],
+                        [row['repeat_dir'] for row in rows])
+    finally:
+      shutil.rmtree(output_dir)
+
   def testComputeSpeedIndex(self):
     def point(time, frame_completeness):
       return puller.CompletenessPoint(time=time,
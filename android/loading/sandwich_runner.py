@@ -135,6 +135,10 @@ class SandwichRunner(object):
     # Configures whether to record tracing categories needed for TTFMP.
     self.record_first_meaningful_paint = False
 
+    # Configures whether to save the traces in LoadingTrace's compact format
+    # rather than in json.
+    self.compact_trace = False
+
     # Path to the WPR archive to load or save. Is str or None.
     self.wpr_archive_path = None
 
@@ -222,7 +226,10 @@ class SandwichRunner(object):
           raise SandwichRunnerError('Page load has failed.')
     if run_path is not None:
       trace_path = os.path.join(run_path, TRACE_FILENAME)
-      trace.ToJsonFile(trace_path)
+      if self.compact_trace:
+        trace.ToCompactFile(trace_path)
+      else:
+        trace.ToJsonFile(trace_path)
 
   def _RunInRetryLoop(self, repeat_id, perform_dry_run_before):
     """Attempts to run monitoring navigation.
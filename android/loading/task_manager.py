@@ -55,11 +55,16 @@ import argparse
 import collections
 import datetime
 import errno
+import heapq
+import json
 import logging
 import os
+import Queue
 import re
 import subprocess
 import sys
+import threading
+import time
 
 import common_util
 
@@ -69,6 +74,7 @@ _TASK_GRAPH_DOTFILE_NAME = 'tasks_graph.dot'
 _TASK_GRAPH_PNG_NAME = 'tasks_graph.png'
 _TASK_RESUME_ARGUMENTS_FILE = 'resume.txt'
 _TASK_EXECUTION_LOG_NAME_FORMAT = 'task-execution-%Y-%m-%d-%H-%M-%S.log'
+_TASK_TIMING_REPORT_NAME_FORMAT = 'task-timing-%Y-%m-%d-%H-%M-%S.json'
 
 FROMFILE_PREFIX_CHARS = '@'
 
@@ -261,6 +267,45 @@ def ListResumingTasksToFreeze(scenario, final_tasks, skipped_tasks):
   return frozen_tasks
 
 
+def ComputeCriticalPath(scenario, task_durations):
+  """Computes the longest chain of dependent tasks, weighted by duration.
+
+  Args:
+    scenario: The scenario (list of Task) that was executed.
+    task_durations: {Task: duration} of the tasks that were executed. Tasks
+      of the scenario that are missing from it are ignored.
+
+  Returns:
+    ([Task] in execution order, the sum of their durations)
+  """
+  path_durations = {}
+  path_parents = {}
+  for task in scenario:
+    if task not in task_durations:
+      continue
+    parent = None
+    for dependency in task._dependencies:
+      if dependency not in path_durations:
+        continue
+      if (parent is None or
+          path_durations[dependency] > path_durations[parent]):
+        parent = dependency
+    path_parents[task] = parent
+    path_durations[task] = task_durations[task]
+    if parent is not None:
+      path_durations[task] += path_durations[parent]
+  if not path_durations:
+    return [], 0
+  task = max(path_durations, key=lambda t: path_durations[t])
+  total_duration = path_durations[task]
+  critical_path = []
+  while task is not None:
+    critical_path.append(task)
+    task = path_parents[task]
+  critical_path.reverse()
+  return critical_path, total_duration
+
+
 def OutputGraphViz(scenario, final_tasks, output):
   """Outputs the build dependency graph covered by this scenario.
 
@@ -322,6 +367,11 @@ def CommandLineParser():
   parser.add_argument('-f', '--to-freeze', metavar='REGEX', type=str,
                       action='append', dest='frozen_regexes', default=[],
                       help='Regex selecting tasks to not execute.')
+  parser.add_argument('-j', '--jobs', type=int, default=1,
+                      help='Number of tasks to execute at the same time, as '
+                           'soon as their dependencies are done. Only use '
+                           'with tasks that don\'t share resources such as '
+                           'a device (default: %(default)s).')
   parser.add_argument('-k', '--keep-going', action='store_true', default=False,
                       help='Keep going when some targets can\'t be made.')
   parser.add_argument('-o', '--output', type=str, required=True,
@@ -418,6 +468,183 @@ class _ResumingFileBuilder(object):
     print '#   ' + FROMFILE_PREFIX_CHARS + self._resume_output.name
 
 
+class _ScenarioExecution(object):
+  """Executes the tasks of a scenario as soon as their dependencies are done.
+
+  Up to |jobs| tasks are executed at the same time, each in its own thread. With
+  a single job, tasks are executed in the main thread in the scenario order. All
+  the bookkeeping (resuming file, failures, skipped tasks) happens in the main
+  thread, once a task has finished.
+  """
+
+  def __init__(self, scenario, jobs, keep_going, resume_file_builder):
+    self.failed_tasks = []
+    self.tasks_to_skip = set()
+    # KeyboardInterrupt's sys.exc_info() to raise once the scenario is finished.
+    self.interruption = None
+    # {Task: (start time, end time, succeeded)}
+    self.task_timings = {}
+
+    self._scenario = scenario
+    self._jobs = jobs
+    self._keep_going = keep_going
+    self._resume_file_builder = resume_file_builder
+    self._task_indexes = {t: i for i, t in enumerate(scenario)}
+    self._dependents_per_task = GenerateDependentSetPerTask(scenario)
+    self._started_tasks = set()
+    self._running_tasks = set()
+    self._completions = Queue.Queue()
+    self._aborted = False
+    self._fatal_exc_info = None
+
+  def Run(self):
+    """Executes the scenario.
+
+    Raises:
+      MemoryError, SyntaxError or IOError(ENOSPC) raised by a task, once the
+      other running tasks are finished.
+    """
+    scenario_tasks = set(self._scenario)
+    pending_dependency_counts = {}
+    ready_tasks = []
+    for task in self._scenario:
+      pending_dependency_counts[task] = len(
+          set(task._dependencies).intersection(scenario_tasks))
+      if pending_dependency_counts[task] == 0:
+        ready_tasks.append((self._task_indexes[task], task))
+    heapq.heapify(ready_tasks)
+
+    while True:
+      while (ready_tasks and not self._aborted and
+             len(self._running_tasks) < self._jobs):
+        _, task = heapq.heappop(ready_tasks)
+        if task not in self.tasks_to_skip:
+          self._StartTask(task)
+      if not self._running_tasks:
+        break
+      try:
+        task, exc_info, start_time, end_time = self._WaitForCompletion()
+      except KeyboardInterrupt:
+        # Running tasks can't be interrupted from the main thread, so give up on
+        # them rather than waiting for them.
+        self.failed_tasks.extend(
+            sorted(self._running_tasks, key=lambda t: self._task_indexes[t]))
+        self.tasks_to_skip.update(
+            t for t in self._scenario if t not in self.task_timings)
+        self.interruption = sys.exc_info()
+        return
+      self._running_tasks.remove(task)
+      self.task_timings[task] = (start_time, end_time, exc_info is None)
+      if exc_info is None:
+        self._resume_file_builder.OnTaskSuccess(task)
+        for dependent in self._dependents_per_task[task]:
+          pending_dependency_counts[dependent] -= 1
+          if pending_dependency_counts[dependent] == 0:
+            heapq.heappush(ready_tasks, (self._task_indexes[dependent],
+                                         dependent))
+      else:
+        self._OnTaskFailure(task, exc_info)
+
+    if self._fatal_exc_info:
+      raise self._fatal_exc_info[0], self._fatal_exc_info[1], \
+          self._fatal_exc_info[2]
+
+  def _StartTask(self, task):
+    logging.info('%s %s', '-' * 60, task.name)
+    self._started_tasks.add(task)
+    self._running_tasks.add(task)
+    if self._jobs == 1:
+      self._ExecuteTask(task)
+      return
+    thread = threading.Thread(target=self._ExecuteTask, args=(task,),
+                              name=task.name)
+    # Don't prevent the process from exiting on a KeyboardInterrupt.
+    thread.daemon = True
+    thread.start()
+
+  def _ExecuteTask(self, task):
+    start_time = time.time()
+    try:
+      task.Execute()
+    except BaseException:
+      exc_info = sys.exc_info()
+    else:
+      exc_info = None
+    self._completions.put((task, exc_info, start_time, time.time()))
+
+  def _WaitForCompletion(self):
+    # Queue.get() without timeout can't be interrupted by a KeyboardInterrupt.
+    while True:
+      try:
+        return self._completions.get(timeout=1)
+      except Queue.Empty:
+        pass
+
+  def _OnTaskFailure(self, task, exc_info):
+    exc_type, exc_value = exc_info[:2]
+    # The resuming file being incrementally generated by
+    # resume_file_builder.OnTaskSuccess() is automatically fsynced().
+    # But resume_file_builder.OnScenarioFinish() completely rewrite
+    # this file with the mininal subset of task to freeze, and in case
+    # of an ENOSPC, we don't want to touch the resuming file at all so
+    # that it remains uncorrupted.
+    if (exc_type in (MemoryError, SyntaxError) or
+        (exc_type == IOError and exc_value.errno == errno.ENOSPC)):
+      if not self._fatal_exc_info:
+        self._fatal_exc_info = exc_info
+      self._aborted = True
+      return
+    logging.error('%s %s failed', '-' * 60, task.name, exc_info=exc_info)
+    self.failed_tasks.append(task)
+    if self._keep_going and exc_type != KeyboardInterrupt:
+      self._MarkTaskNotToExecute(task)
+    else:
+      if exc_type == KeyboardInterrupt and not self.interruption:
+        self.interruption = exc_info
+      self.tasks_to_skip.add(task)
+      self.tasks_to_skip.update(
+          t for t in self._scenario if t not in self._started_tasks)
+      self._aborted = True
+
+  def _MarkTaskNotToExecute(self, task):
+    if task not in self.tasks_to_skip:
+      logging.warning('can not execute task: %s', task.name)
+      self.tasks_to_skip.add(task)
+      for dependent in self._dependents_per_task[task]:
+        self._MarkTaskNotToExecute(dependent)
+
+
+def _WriteTimingReport(scenario, execution, jobs, output_path):
+  """Writes how long each executed task took and the scenario's critical path.
+
+  The critical path is the chain of dependent tasks that bounds the duration of
+  the scenario, however many jobs execute it.
+  """
+  if not execution.task_timings:
+    return
+  start_time = min(t[0] for t in execution.task_timings.itervalues())
+  end_time = max(t[1] for t in execution.task_timings.itervalues())
+  task_durations = {task: timing[1] - timing[0]
+                    for task, timing in execution.task_timings.iteritems()}
+  critical_path, critical_path_duration = ComputeCriticalPath(
+      scenario, task_durations)
+  report = {
+      'jobs': jobs,
+      'duration': end_time - start_time,
+      'tasks': [{'name': task.name,
+                 'start': execution.task_timings[task][0] - start_time,
+                 'duration': task_durations[task],
+                 'succeeded': execution.task_timings[task][2]}
+                for task in scenario if task in execution.task_timings],
+      'critical_path': [task.name for task in critical_path],
+      'critical_path_duration': critical_path_duration}
+  with open(output_path, 'w') as output:
+    json.dump(report, output, indent=2)
+  logging.info('executed %d tasks in %.1fs, critical path of %.1fs: %s',
+               len(execution.task_timings), report['duration'],
+               critical_path_duration, ' -> '.join(report['critical_path']))
+
+
 def ExecuteWithCommandLine(args, default_final_tasks):
   """Helper to execute tasks using command line arguments.
 
@@ -455,20 +682,15 @@ def ExecuteWithCommandLine(args, default_final_tasks):
     return 0
 
   # Run the Scenario while saving intermediate state to be able to resume later.
-  failed_tasks = []
-  tasks_to_skip = set()
-  dependents_per_task = GenerateDependentSetPerTask(scenario)
-
-  def MarkTaskNotToExecute(task):
-    if task not in tasks_to_skip:
-      logging.warning('can not execute task: %s', task.name)
-      tasks_to_skip.add(task)
-      for dependent in dependents_per_task[task]:
-        MarkTaskNotToExecute(dependent)
-
-  log_filename = datetime.datetime.now().strftime(
-      _TASK_EXECUTION_LOG_NAME_FORMAT)
-  log_path = os.path.join(args.output, _TASK_LOGS_DIR_NAME, log_filename)
+  if args.jobs < 1:
+    logging.error('--jobs must be at least 1.')
+    return 1
+  now = datetime.datetime.now()
+  log_path = os.path.join(args.output, _TASK_LOGS_DIR_NAME,
+                          now.strftime(_TASK_EXECUTION_LOG_NAME_FORMAT))
+  timing_report_path = os.path.join(
+      args.output, _TASK_LOGS_DIR_NAME,
+      now.strftime(_TASK_TIMING_REPORT_NAME_FORMAT))
   if not os.path.isdir(os.path.dirname(log_path)):
     os.makedirs(os.path.dirname(log_path))
   formatter = logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s')
@@ -479,41 +701,22 @@ def ExecuteWithCommandLine(args, default_final_tasks):
       '%s %s', '-' * 60, common_util.GetCommandLineForLogging(sys.argv))
   try:
     with _ResumingFileBuilder(args) as resume_file_builder:
-      for task_execute_id, task in enumerate(scenario):
-        if task in tasks_to_skip:
-          continue
-        logging.info('%s %s', '-' * 60, task.name)
-        try:
-          task.Execute()
-        except (MemoryError, SyntaxError):
-          raise
-        except BaseException:
-          # The resuming file being incrementally generated by
-          # resume_file_builder.OnTaskSuccess() is automatically fsynced().
-          # But resume_file_builder.OnScenarioFinish() completely rewrite
-          # this file with the mininal subset of task to freeze, and in case
-          # of an ENOSPC, we don't want to touch the resuming file at all so
-          # that it remains uncorrupted.
-          if (sys.exc_info()[0] == IOError and
-              sys.exc_info()[1].errno == errno.ENOSPC):
-            raise
-          logging.exception('%s %s failed', '-' * 60, task.name)
-          failed_tasks.append(task)
-          if args.keep_going and sys.exc_info()[0] != KeyboardInterrupt:
-            MarkTaskNotToExecute(task)
-          else:
-            tasks_to_skip.update(set(scenario[task_execute_id:]))
-            break
-        else:
-          resume_file_builder.OnTaskSuccess(task)
-      if tasks_to_skip:
-        assert failed_tasks
+      execution = _ScenarioExecution(
+          scenario, args.jobs, args.keep_going, resume_file_builder)
+      try:
+        execution.Run()
+      finally:
+        _WriteTimingReport(scenario, execution, args.jobs, timing_report_path)
+      if execution.tasks_to_skip:
+        assert execution.failed_tasks
         resume_file_builder.OnScenarioFinish(
-            scenario, final_tasks, failed_tasks, tasks_to_skip)
-        if sys.exc_info()[0] == KeyboardInterrupt:
-          raise
+            scenario, final_tasks, execution.failed_tasks,
+            execution.tasks_to_skip)
+        if execution.interruption:
+          raise execution.interruption[0], execution.interruption[1], \
+              execution.interruption[2]
         return 1
   finally:
     logging.getLogger().removeHandler(handler)
-  assert not failed_tasks
+  assert not execution.failed_tasks
   return 0
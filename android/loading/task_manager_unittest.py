@@ -5,12 +5,14 @@
 import argparse
 import contextlib
 import errno
+import json
 import os
 import re
 import shutil
 import StringIO
 import sys
 import tempfile
+import threading
 import unittest
 
 import common_util
@@ -333,6 +335,32 @@ class GenerateScenarioTest(TaskManagerTestCase):
     RunSubTest([TaskD, TaskE, TaskF], set([]), set([TaskD, TaskF]),
                [TaskA, TaskE, TaskC])
 
+  def testComputeCriticalPath(self):
+    builder = task_manager.Builder(self.output_directory, None)
+    @builder.RegisterTask('a')
+    def TaskA():
+      pass
+    @builder.RegisterTask('b')
+    def TaskB():
+      pass
+    @builder.RegisterTask('c', dependencies=[TaskA, TaskB])
+    def TaskC():
+      pass
+    @builder.RegisterTask('d', dependencies=[TaskA])
+    def TaskD():
+      pass
+    scenario = task_manager.GenerateScenario([TaskC, TaskD], set())
+    self.assertEqual(([], 0), task_manager.ComputeCriticalPath(scenario, {}))
+    durations = {TaskA: 1, TaskB: 2, TaskC: 3, TaskD: 7}
+    self.assertEqual(([TaskA, TaskD], 8),
+                     task_manager.ComputeCriticalPath(scenario, durations))
+    durations[TaskD] = 1
+    self.assertEqual(([TaskB, TaskC], 5),
+                     task_manager.ComputeCriticalPath(scenario, durations))
+    del durations[TaskB]
+    self.assertEqual(([TaskA, TaskC], 4),
+                     task_manager.ComputeCriticalPath(scenario, durations))
+
 
 class CommandLineControlledExecutionTest(TaskManagerTestCase):
   def setUp(self):
@@ -528,6 +556,57 @@ class CommandLineControlledExecutionTest(TaskManagerTestCase):
     with open(self.ResumeFilePath()) as resume_input:
       self.assertEqual('-f\n^d$\n-f\n^b$', resume_input.read())
 
+  def testParallelExecution(self):
+    self.assertEqual(0, self.Execute(['-j', '3']))
+    history = self.task_execution_history
+    self.assertItemsEqual(['a', 'b', 'c', 'd', 'e'], history)
+    self.assertLess(history.index('a'), history.index('c'))
+    self.assertLess(history.index('b'), history.index('c'))
+    self.assertLess(history.index('a'), history.index('d'))
+    self.assertLess(history.index('c'), history.index('e'))
+
+    timing_reports = [f for f in os.listdir(self.OutputPath('logs'))
+                      if f.endswith('.json')]
+    self.assertEqual(1, len(timing_reports))
+    with open(self.OutputPath(os.path.join('logs', timing_reports[0]))) as f:
+      timing_report = json.load(f)
+    self.assertEqual(3, timing_report['jobs'])
+    self.assertItemsEqual(history, [t['name'] for t in timing_report['tasks']])
+    self.assertIn(timing_report['critical_path'],
+                  [['a', 'c', 'e'], ['b', 'c', 'e'], ['a', 'd']])
+
+  def testParallelKeepGoing(self):
+    ARGS = ['-j', '2', '-k', '-e', 'exception', '-e', r'^b$']
+    self.with_raise_exception_tasks = True
+    self.assertEqual(1, self.Execute(ARGS))
+    self.assertItemsEqual(
+        ['a', 'd', 'raise_exception', 'b'], self.task_execution_history)
+    with open(self.ResumeFilePath()) as resume_input:
+      self.assertEqual('-f\n^d$\n-f\n^b$', resume_input.read())
+
+    self.TouchOutputFile('d')
+    self.TouchOutputFile('b')
+    self.assertEqual(1, self.Execute(ARGS + [self.ResumeCmd()]))
+    self.assertListEqual(['raise_exception'], self.task_execution_history)
+
+  def testParallelTasksRunConcurrently(self):
+    builder = task_manager.Builder(self.output_directory, None)
+    a_started = threading.Event()
+    b_started = threading.Event()
+    @builder.RegisterTask('a')
+    def TaskA():
+      a_started.set()
+      self.assertTrue(b_started.wait(10))
+    @builder.RegisterTask('b')
+    def TaskB():
+      b_started.set()
+      self.assertTrue(a_started.wait(10))
+    parser = argparse.ArgumentParser(parents=[task_manager.CommandLineParser()])
+    args = parser.parse_args(['-o', self.output_directory, '-j', '2'])
+    with EatStdoutAndStderr():
+      self.assertEqual(
+          0, task_manager.ExecuteWithCommandLine(args, [TaskA, TaskB]))
+
   def testImpossibleTasks(self):
     self.assertEqual(1, self.Execute(['-f', r'^a$', '-e', r'^c$']))
     self.assertListEqual([], self.task_execution_history)
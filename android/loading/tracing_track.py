@@ -4,6 +4,8 @@
 
 """Monitor tracing events on chrome via chrome remote debugging."""
 
+import collections
+import heapq
 import itertools
 import logging
 import operator
@@ -43,9 +45,13 @@ class TracingTrack(devtools_monitor.Track):
       connection.SyncRequestNoResponse('Tracing.start', params)
 
     self._events = []
+    # List of EventChunk whose events are not in |_events| yet, or None.
+    self._event_chunks = None
     self._base_msec = None
     self._interval_tree = None
     self._main_frame_id = None
+    # Tracks returned by Filter(), keyed by its arguments.
+    self._filtered_tracks = {}
 
   def Handle(self, method, event):
     for e in event['params']['value']:
@@ -56,6 +62,7 @@ class TracingTrack(devtools_monitor.Track):
     # Invalidate our index rather than trying to be fancy and incrementally
     # update.
     self._interval_tree = None
+    self._filtered_tracks = {}
 
   def Categories(self):
     """Returns the set of categories in this trace."""
@@ -71,11 +78,19 @@ class TracingTrack(devtools_monitor.Track):
 
   def GetEvents(self):
     """Returns a list of tracing.Event. Not sorted."""
+    if self._event_chunks is not None:
+      self._events = self._GetChunksEvents(self._event_chunks)
+      self._event_chunks = None
     return self._events
 
   def GetMatchingEvents(self, category, name):
     """Gets events matching |category| and |name|."""
-    return [e for e in self.GetEvents() if e.Matches(category, name)]
+    if self._event_chunks is not None:
+      events = self._GetChunksEvents(
+          [c for c in self._event_chunks if c.MayMatch(categories=[category])])
+    else:
+      events = self._events
+    return [e for e in events if e.Matches(category, name)]
 
   def GetMatchingMainFrameEvents(self, category, name):
     """Gets events matching |category| and |name| that occur in the main frame.
@@ -126,13 +141,24 @@ class TracingTrack(devtools_monitor.Track):
   def Filter(self, pid=None, tid=None, categories=None):
     """Returns a new TracingTrack with a subset of the events.
 
+    The same track is returned for the same arguments, so that the lenses
+    filtering a track the same way share its interval index.
+
     Args:
       pid: (int or None) Selects events from this PID.
       tid: (int or None) Selects events from this TID.
       categories: (set([str]) or None) Selects events belonging to one of the
                   categories.
     """
-    events = self._events
+    filter_key = (pid, tid,
+                  frozenset(categories) if categories is not None else None)
+    if filter_key in self._filtered_tracks:
+      return self._filtered_tracks[filter_key]
+    if self._event_chunks is not None:
+      events = self._GetChunksEvents([c for c in self._event_chunks
+                                      if c.MayMatch(pid, categories)])
+    else:
+      events = self._events
     if pid is not None:
       events = filter(lambda e : e.tracing_event['pid'] == pid, events)
     if tid is not None:
@@ -146,11 +172,12 @@ class TracingTrack(devtools_monitor.Track):
     tracing_track._categories = self._categories
     if categories is not None:
       tracing_track._categories = self._categories.intersection(categories)
+    self._filtered_tracks[filter_key] = tracing_track
     return tracing_track
 
   def ToJsonDict(self):
     return {'categories': list(self._categories),
-            'events': [e.ToJsonDict() for e in self._events]}
+            'events': [e.ToJsonDict() for e in self.GetEvents()]}
 
   @classmethod
   def FromJsonDict(cls, json_dict):
@@ -161,14 +188,61 @@ class TracingTrack(devtools_monitor.Track):
     tracing_track = TracingTrack(None, clovis_constants.DEFAULT_CATEGORIES)
     tracing_track._categories = set(json_dict.get('categories', []))
     tracing_track._events = events
-    tracing_track._base_msec = events[0].start_msec if events else 0
+    tracing_track._base_msec = cls._ComputeBaseMsec(events)
+    return tracing_track
+
+  def ToEventChunks(self, max_chunk_size):
+    """Splits the events into chunks of events sharing a pid and a category.
+
+    Args:
+      max_chunk_size: Maximum number of events per chunk.
+
+    Returns:
+      (first event milliseconds as restored by FromJsonDict(),
+       [(pid, category, [[index of the event in GetEvents(), JSON event]])])
+    """
+    events = self.GetEvents()
+    events_per_key = collections.OrderedDict()
+    for i, event in enumerate(events):
+      key = (event.tracing_event.get('pid'), event.tracing_event.get('cat'))
+      events_per_key.setdefault(key, []).append([i, event.ToJsonDict()])
+    chunks = []
+    for (pid, category), key_events in events_per_key.iteritems():
+      for i in xrange(0, len(key_events), max_chunk_size):
+        chunks.append((pid, category, key_events[i:i + max_chunk_size]))
+    return self._ComputeBaseMsec(events), chunks
+
+  @classmethod
+  def FromEventChunks(cls, categories, base_msec, event_chunks):
+    """Returns an instance whose events are decoded from chunks on demand.
+
+    Args:
+      categories: ([str]) Categories of the track.
+      base_msec: First event milliseconds, as returned by ToEventChunks().
+      event_chunks: [EventChunk] covering all the events of the track.
+    """
+    tracing_track = TracingTrack(None, clovis_constants.DEFAULT_CATEGORIES)
+    tracing_track._categories = set(categories)
+    tracing_track._event_chunks = event_chunks
+    tracing_track._base_msec = base_msec
+    return tracing_track
+
+  @classmethod
+  def _ComputeBaseMsec(cls, events):
+    base_msec = events[0].start_msec if events else 0
     for e in events[1:]:
       if e.type == 'M':
         continue  # No timestamp for metadata events.
       assert e.start_msec > 0
-      if e.start_msec < tracing_track._base_msec:
-        tracing_track._base_msec = e.start_msec
-    return tracing_track
+      if e.start_msec < base_msec:
+        base_msec = e.start_msec
+    return base_msec
+
+  @classmethod
+  def _GetChunksEvents(cls, event_chunks):
+    """Returns the events of chunks, in the order of the track."""
+    return [event for _, event in heapq.merge(
+        *[chunk.GetIndexedEvents() for chunk in event_chunks])]
 
   def OverlappingEvents(self, start_msec, end_msec):
     self._IndexEvents()
@@ -212,7 +286,7 @@ class TracingTrack(devtools_monitor.Track):
       return
     complete_events = []
     spanning_events = self._SpanningEvents()
-    for event in self._events:
+    for event in self.GetEvents():
       if not event.IsIndexable():
         continue
       if event.IsComplete():
@@ -349,6 +423,44 @@ class TracingTrack(devtools_monitor.Track):
       return start
 
 
+class EventChunk(object):
+  """Events of a TracingTrack sharing a pid and a category, decoded lazily."""
+
+  def __init__(self, pid, category, load_function):
+    """Creates EventChunk.
+
+    Args:
+      pid: (int or None) PID of the events, or None if they have none.
+      category: (str or None) Category of the events (event['cat']), or None if
+        they have none.
+      load_function: Function returning the chunk's events as in
+        TracingTrack.ToEventChunks(), called the first time they are needed.
+    """
+    self.pid = pid
+    self.categories = set(category.split(',')) if category is not None else None
+    self._load_function = load_function
+    self._indexed_events = None
+
+  def MayMatch(self, pid=None, categories=None):
+    """Returns whether some events may be selected by TracingTrack.Filter().
+
+    Chunks of events without pid or category always match, so that the events
+    are processed exactly as if they were not chunked.
+    """
+    if pid is not None and self.pid is not None and self.pid != pid:
+      return False
+    return (categories is None or self.categories is None or
+            bool(self.categories.intersection(categories)))
+
+  def GetIndexedEvents(self):
+    """Returns [(index of the event in the track, Event)]."""
+    if self._indexed_events is None:
+      self._indexed_events = [
+          (i, Event(e)) for i, e in self._load_function()]
+      self._load_function = None
+    return self._indexed_events
+
+
 class Event(object):
   """Wraps a tracing event."""
   CLOSING_EVENTS = {'E': 'B',
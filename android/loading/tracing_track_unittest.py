@@ -10,7 +10,8 @@ import unittest
 
 import devtools_monitor
 
-from tracing_track import (Event, TracingTrack, _IntervalTree)
+from tracing_track import (Event, EventChunk, TracingTrack,
+                           _IntervalTree)
 
 
 class TracingTrackTestCase(unittest.TestCase):
@@ -295,6 +296,15 @@ class TracingTrackTestCase(unittest.TestCase):
     tracing_track = self.track.Filter(2, 42)
     self.assertEquals(0, len(tracing_track.GetEvents()))
 
+  def testFilteredTracksAreShared(self):
+    self._HandleEvents(self._EVENTS)
+    tracing_track = self.track.Filter(2, 1)
+    self.assertTrue(tracing_track is self.track.Filter(2, 1))
+    self.assertTrue(tracing_track is not self.track.Filter(2, 2))
+    self._HandleEvents(self._EVENTS)
+    self.assertTrue(tracing_track is not self.track.Filter(2, 1))
+    self.assertEquals(8, len(self.track.Filter(2, 1).GetEvents()))
+
   def testGetMainFrameID(self):
     _MAIN_FRAME_ID = 0xffff
     _SUBFRAME_ID = 0xaaaa
@@ -405,6 +415,56 @@ class TracingTrackTestCase(unittest.TestCase):
             'ts': 5, 'ph': 'X', 'dur': 10, 'pid': 1, 'tid': 1}]})
     self.assertFalse(track.HasLoadingSucceeded())
 
+  def testEventChunks(self):
+    events = [
+        {'ts': 5, 'ph': 'X', 'dur': 1, 'pid': 1, 'tid': 1, 'cat': 'A',
+         'name': 'a'},
+        {'ts': 3, 'ph': 'X', 'dur': 4, 'pid': 2, 'tid': 1, 'cat': 'B',
+         'name': 'b'},
+        {'ts': 10, 'ph': 'X', 'dur': 1, 'pid': 1, 'tid': 2, 'cat': 'A,B',
+         'name': 'a'},
+        {'ts': 11, 'ph': 'X', 'dur': 2, 'pid': 2, 'tid': 2, 'cat': 'A',
+         'name': 'a'},
+        {'ts': 12, 'ph': 'X', 'dur': 1, 'pid': 1, 'tid': 1, 'cat': 'A',
+         'name': 'b'}]
+    self._HandleEvents(events)
+    events = [e.tracing_event for e in self.track.GetEvents()]
+    base_msec, chunks = self.track.ToEventChunks(max_chunk_size=1)
+    self.assertEquals(self.track.GetFirstEventMillis(), base_msec)
+    self.assertEquals([(1, 'A'), (1, 'A'), (2, 'B'), (1, 'A,B'), (2, 'A')],
+                      [(pid, category) for pid, category, _ in chunks])
+    self.assertEquals([[4, events[4]]], chunks[1][2])
+    self.assertEquals(
+        [(1, 'A', [[0, events[0]], [4, events[4]]])],
+        self.track.ToEventChunks(max_chunk_size=2)[1][:1])
+
+    loaded_chunks = []
+    def MakeEventChunk(chunk_id):
+      pid, category, chunk_events = chunks[chunk_id]
+      def Load():
+        loaded_chunks.append(chunk_id)
+        return chunk_events
+      return EventChunk(pid, category, Load)
+
+    track = TracingTrack.FromEventChunks(
+        self.track.Categories(), base_msec,
+        [MakeEventChunk(i) for i in xrange(len(chunks))])
+    self.assertEquals(base_msec, track.GetFirstEventMillis())
+    self.assertEquals([events[1], events[2]], [e.tracing_event for e in
+        track.Filter(categories=set(['B'])).GetEvents()])
+    self.assertEquals([2, 3], loaded_chunks)
+    self.assertEquals([events[0], events[2], events[4]], [e.tracing_event
+        for e in track.Filter(pid=1, categories=set(['A'])).GetEvents()])
+    self.assertEquals([2, 3, 0, 1], loaded_chunks)
+    matching_events = track.GetMatchingEvents('A', 'a')
+    self.assertEquals([2, 3, 0, 1, 4], loaded_chunks)
+    self.assertEquals([events[0], events[2], events[3]],
+                      [e.tracing_event for e in matching_events])
+    self.assertEquals(events, [e.tracing_event for e in track.GetEvents()])
+    self.assertEquals([2, 3, 0, 1, 4], loaded_chunks)
+    # Events are only decoded once.
+    self.assertTrue(matching_events[0] is track.GetEvents()[0])
+
   def _HandleEvents(self, events):
     self.track.Handle('Tracing.dataCollected', {'params': {'value': [
         self.EventToMicroseconds(e) for e in events]}})
@@ -32,6 +32,7 @@ import ninja_parser
 import nm
 import obj_analyzer
 import path_util
+import stage_cache
 
 sys.path.insert(1, os.path.join(path_util.SRC_ROOT, 'tools', 'grit'))
 from grit.format import data_pack
@@ -39,6 +40,10 @@ from grit.format import data_pack
 _OWNERS_FILENAME = 'OWNERS'
 _COMPONENT_REGEX = re.compile(r'\s*#\s*COMPONENT\s*:\s*(\S+)')
 _FILE_PATH_REGEX = re.compile(r'\s*file://(\S+)')
+_OWNERS_CACHE_STAGE = 'owners'
+# OWNERS entries are keyed by the set of directories looked up, which changes
+# as sources are added and removed. Keep those of the last few sets.
+_MAX_OWNERS_CACHE_ENTRIES = 16
 
 # Holds computation state that is live only when an output directory exists.
 _OutputDirectoryContext = collections.namedtuple('_OutputDirectoryContext', [
@@ -98,6 +103,10 @@ class SectionSizeKnobs(object):
 
     self.src_root = path_util.SRC_ROOT
 
+    # Directory in which to cache intermediate results across runs (e.g. nm
+    # output for unchanged object files). None disables caching.
+    self.cache_dir = None
+
 
 def _OpenMaybeGz(path):
   """Calls `gzip.open()` if |path| ends in ".gz", otherwise calls `open()`."""
@@ -549,7 +558,7 @@ def _CalculatePadding(raw_symbols):
         '%r\nprev symbol: %r' % (symbol, prev_symbol))
 
 
-def _ParseComponentFromOwners(filename):
+def _ParseComponentFromOwners(filename, read_paths=None):
   """Searches an OWNERS file for lines that start with `# COMPONENT:`.
 
   If an OWNERS file has no COMPONENT but references another OWNERS file, follow
@@ -557,10 +566,14 @@ def _ParseComponentFromOwners(filename):
 
   Args:
     filename: Path to the file to parse.
+    read_paths: If not None, a list to which all paths that were consulted are
+      appended.
   Returns:
     The text that follows the `# COMPONENT:` prefix, such as 'component>name'.
     Empty string if no component found or the file didn't exist.
   """
+  if read_paths is not None:
+    read_paths.append(filename)
   reference_paths = []
   try:
     with open(filename) as f:
@@ -576,12 +589,34 @@ def _ParseComponentFromOwners(filename):
 
   if len(reference_paths) == 1:
     newpath = os.path.join(path_util.SRC_ROOT, reference_paths[0])
-    return _ParseComponentFromOwners(newpath)
+    return _ParseComponentFromOwners(newpath, read_paths)
   else:
     return ''
 
 
-def _FindComponentRoot(start_path, cache, knobs):
+def _LookupComponentFromOwners(filename, owners_cache):
+  """Returns _ParseComponentFromOwners(filename), using |owners_cache|.
+
+  Args:
+    filename: Path to the OWNERS file to parse.
+    owners_cache: Dict of OWNERS path -> (component, [(path, stat signature)])
+      that persists across runs. Entries are valid only while none of the files
+      they were computed from have changed, which is checked via stat() rather
+      than hashing so that lookups stay cheaper than parsing.
+  """
+  entry = owners_cache.get(filename)
+  if entry is not None:
+    component, signatures = entry
+    if all(stage_cache.StatSignature(p) == sig for p, sig in signatures):
+      return component
+  read_paths = []
+  component = _ParseComponentFromOwners(filename, read_paths)
+  owners_cache[filename] = (
+      component, [(p, stage_cache.StatSignature(p)) for p in read_paths])
+  return component
+
+
+def _FindComponentRoot(start_path, cache, knobs, owners_cache=None):
   """Searches all parent directories for COMPONENT in OWNERS files.
 
   Args:
@@ -590,6 +625,7 @@ def _FindComponentRoot(start_path, cache, knobs):
     cache: Dict of OWNERS paths. Used instead of filesystem if paths are present
       in the dict.
     knobs: Instance of SectionSizeKnobs. Tunable knobs and options.
+    owners_cache: Optional dict used by _LookupComponentFromOwners().
 
   Returns:
     COMPONENT belonging to |start_path|, or empty string if not found.
@@ -604,7 +640,10 @@ def _FindComponentRoot(start_path, cache, knobs):
       return cached_component
     elif cached_component is None:
       owners_path = os.path.join(knobs.src_root, test_dir, _OWNERS_FILENAME)
-      component = _ParseComponentFromOwners(owners_path)
+      if owners_cache is None:
+        component = _ParseComponentFromOwners(owners_path)
+      else:
+        component = _LookupComponentFromOwners(owners_path, owners_cache)
       cache[test_dir] = component
       if component:
         return component
@@ -613,7 +652,7 @@ def _FindComponentRoot(start_path, cache, knobs):
   return ''
 
 
-def _PopulateComponents(raw_symbols, knobs):
+def _PopulateComponents(raw_symbols, knobs, cache=None):
   """Populates the |component| field based on |source_path|.
 
   Symbols without a |source_path| are skipped.
@@ -621,12 +660,24 @@ def _PopulateComponents(raw_symbols, knobs):
   Args:
     raw_symbols: list of Symbol objects.
     knobs: Instance of SectionSizeKnobs. Tunable knobs and options.
+    cache: Optional StageCache in which to persist parsed OWNERS files.
   """
+  owners_cache = None
+  if cache:
+    folder_paths = sorted(set(
+        os.path.dirname(s.source_path) for s in raw_symbols if s.source_path))
+    cache_key = stage_cache.MakeKey(knobs.src_root, '\n'.join(folder_paths))
+    owners_cache = cache.Get(_OWNERS_CACHE_STAGE, cache_key) or {}
+    prev_owners_cache = dict(owners_cache)
   seen_paths = {}
   for symbol in raw_symbols:
     if symbol.source_path:
       folder_path = os.path.dirname(symbol.source_path)
-      symbol.component = _FindComponentRoot(folder_path, seen_paths, knobs)
+      symbol.component = _FindComponentRoot(
+          folder_path, seen_paths, knobs, owners_cache=owners_cache)
+  if cache and owners_cache != prev_owners_cache:
+    cache.Put(_OWNERS_CACHE_STAGE, cache_key, owners_cache)
+    cache.Prune(_OWNERS_CACHE_STAGE, _MAX_OWNERS_CACHE_ENTRIES)
 
 
 def _AddNmAliases(raw_symbols, names_by_address):
@@ -689,10 +740,12 @@ def LoadAndPostProcessSizeInfo(path, fileobj=None):
   """Returns a SizeInfo for the given |path|."""
   logging.debug('Loading results from: %s', path)
   size_info = file_format.LoadSizeInfo(path, fileobj)
-  logging.info('Normalizing symbol names')
-  _NormalizeNames(size_info.raw_symbols)
-  logging.info('Calculating padding')
-  _CalculatePadding(size_info.raw_symbols)
+  # Columnar .size files store names and padding in their final form.
+  if not file_format.IsColumnar(size_info):
+    logging.info('Normalizing symbol names')
+    _NormalizeNames(size_info.raw_symbols)
+    logging.info('Calculating padding')
+    _CalculatePadding(size_info.raw_symbols)
   logging.info('Loaded %d symbols', len(size_info.raw_symbols))
   return size_info
 
@@ -762,15 +815,19 @@ def _ResolveThinArchivePaths(raw_symbols, thin_archives):
 
 
 def _ParseElfInfo(map_path, elf_path, tool_prefix, track_string_literals,
-                  outdir_context=None, linker_name=None):
+                  outdir_context=None, linker_name=None, cache=None,
+                  timer=None):
   """Adds ELF section sizes and symbols."""
+  cache = cache or stage_cache.StageCache()
+  timer = timer or stage_cache.StageTimer()
   if elf_path:
     # Run nm on the elf file to retrieve the list of symbol names per-address.
     # This list is required because the .map file contains only a single name
     # for each address, yet multiple symbols are often coalesced when they are
     # identical. This coalescing happens mainly for small symbols and for C++
     # templates. Such symbols make up ~500kb of libchrome.so on Android.
-    elf_nm_result = nm.CollectAliasesByAddressAsync(elf_path, tool_prefix)
+    elf_nm_result = nm.CollectAliasesByAddressAsync(
+        elf_path, tool_prefix, cache_dir=cache.cache_dir)
 
     # Run nm on all .o/.a files to retrieve the symbol names within them.
     # The list is used to detect when mutiple .o files contain the same symbol
@@ -782,11 +839,12 @@ def _ParseElfInfo(map_path, elf_path, tool_prefix, track_string_literals,
     # common ancestor of all paths.
     if outdir_context:
       bulk_analyzer = obj_analyzer.BulkObjectFileAnalyzer(
-          tool_prefix, outdir_context.output_directory)
+          tool_prefix, outdir_context.output_directory,
+          cache_dir=cache.cache_dir)
       bulk_analyzer.AnalyzePaths(outdir_context.elf_object_paths)
 
   logging.info('Parsing Linker Map')
-  with _OpenMaybeGz(map_path) as map_file:
+  with timer.Measure('Parse linker map'), _OpenMaybeGz(map_path) as map_file:
     section_sizes, raw_symbols = (
         linker_map_parser.MapFileParser().Parse(linker_name, map_file))
 
@@ -824,17 +882,21 @@ def _ParseElfInfo(map_path, elf_path, tool_prefix, track_string_literals,
   _StripLinkerAddedSymbolPrefixes(raw_symbols)
   # Map file for some reason doesn't demangle all names.
   # Demangle prints its own log statement.
-  demangle.DemangleRemainingSymbols(raw_symbols, tool_prefix)
+  with timer.Measure('Demangle'):
+    demangle.DemangleRemainingSymbols(raw_symbols, tool_prefix, cache=cache)
 
   if elf_path:
     logging.info(
         'Adding symbols removed by identical code folding (as reported by nm)')
     # This normally does not block (it's finished by this time).
-    names_by_address = elf_nm_result.get()
-    raw_symbols = _AddNmAliases(raw_symbols, names_by_address)
+    with timer.Measure('Wait for nm (ELF)'):
+      names_by_address = elf_nm_result.get()
+    with timer.Measure('Add nm aliases'):
+      raw_symbols = _AddNmAliases(raw_symbols, names_by_address)
 
     if outdir_context:
-      object_paths_by_name = bulk_analyzer.GetSymbolNames()
+      with timer.Measure('Wait for nm (object files)'):
+        object_paths_by_name = bulk_analyzer.GetSymbolNames()
       logging.debug(
           'Fetched path information for %d symbols from %d files',
           len(object_paths_by_name),
@@ -842,18 +904,21 @@ def _ParseElfInfo(map_path, elf_path, tool_prefix, track_string_literals,
 
       # For aliases, this provides path information where there wasn't any.
       logging.info('Creating aliases for symbols shared by multiple paths')
-      raw_symbols = _AssignNmAliasPathsAndCreatePathAliases(
-          raw_symbols, object_paths_by_name)
+      with timer.Measure('Create path aliases'):
+        raw_symbols = _AssignNmAliasPathsAndCreatePathAliases(
+            raw_symbols, object_paths_by_name)
 
       if track_string_literals:
         logging.info('Waiting for string literal extraction to complete.')
-        list_of_positions_by_object_path = bulk_analyzer.GetStringPositions()
+        with timer.Measure('Wait for string literals'):
+          list_of_positions_by_object_path = bulk_analyzer.GetStringPositions()
       bulk_analyzer.Close()
 
       if track_string_literals:
         logging.info('Deconstructing ** merge strings into literals')
-        replacements = _CreateMergeStringsReplacements(merge_string_syms,
-            list_of_positions_by_object_path)
+        with timer.Measure('Create string literal symbols'):
+          replacements = _CreateMergeStringsReplacements(merge_string_syms,
+              list_of_positions_by_object_path)
         for merge_sym, literal_syms in itertools.izip(
             merge_string_syms, replacements):
           # Don't replace if no literals were found.
@@ -1153,15 +1218,20 @@ def CreateSectionSizesAndSymbols(
         alias information will not be recorded.
     track_string_literals: Whether to break down "** merge string" sections into
         smaller symbols (requires output_directory).
+    knobs: Instance of SectionSizeKnobs. When |knobs.cache_dir| is set,
+        intermediate results are cached there so that re-running on a build
+        where few object files changed is faster.
 
   Returns:
     A tuple of (section_sizes, raw_symbols).
     section_sizes is a dict mapping section names to their size
     raw_symbols is a list of Symbol objects
   """
+  cache = stage_cache.StageCache(knobs.cache_dir)
+  timer = stage_cache.StageTimer()
   if apk_path and elf_path:
     # Extraction takes around 1 second, so do it in parallel.
-    apk_elf_result = concurrent.ForkAndCall(
+    apk_elf_result = concurrent.CallOnPool(
         _ElfInfoFromApk, (apk_path, apk_so_path, tool_prefix))
 
   outdir_context = None
@@ -1170,8 +1240,9 @@ def CreateSectionSizesAndSymbols(
     # Start by finding the elf_object_paths, so that nm can run on them while
     # the linker .map is being parsed.
     logging.info('Parsing ninja files.')
-    source_mapper, ninja_elf_object_paths = (
-        ninja_parser.Parse(output_directory, elf_path))
+    with timer.Measure('Parse ninja files'):
+      source_mapper, ninja_elf_object_paths = (
+          ninja_parser.Parse(output_directory, elf_path))
     logging.debug('Parsed %d .ninja files.', source_mapper.parsed_file_count)
     assert not elf_path or ninja_elf_object_paths, (
         'Failed to find link command in ninja files for ' +
@@ -1200,7 +1271,8 @@ def CreateSectionSizesAndSymbols(
 
   section_sizes, raw_symbols = _ParseElfInfo(
       map_path, elf_path, tool_prefix, track_string_literals,
-      outdir_context=outdir_context, linker_name=linker_name)
+      outdir_context=outdir_context, linker_name=linker_name, cache=cache,
+      timer=timer)
   elf_overhead_size = _CalculateElfOverhead(section_sizes, elf_path)
 
   pak_symbols_by_id = None
@@ -1228,16 +1300,21 @@ def CreateSectionSizesAndSymbols(
 
   if pak_symbols_by_id:
     object_paths = (p for p in source_mapper.IterAllPaths() if p.endswith('.o'))
-    pak_raw_symbols = _ParsePakSymbols(
-        section_sizes, object_paths, output_directory, pak_symbols_by_id)
+    with timer.Measure('Create pak symbols'):
+      pak_raw_symbols = _ParsePakSymbols(
+          section_sizes, object_paths, output_directory, pak_symbols_by_id)
     raw_symbols.extend(pak_raw_symbols)
 
-  _ExtractSourcePathsAndNormalizeObjectPaths(raw_symbols, source_mapper)
-  _PopulateComponents(raw_symbols, knobs)
+  with timer.Measure('Populate source paths'):
+    _ExtractSourcePathsAndNormalizeObjectPaths(raw_symbols, source_mapper)
+  with timer.Measure('Populate components'):
+    _PopulateComponents(raw_symbols, knobs, cache=cache)
   logging.info('Converting excessive aliases into shared-path symbols')
-  _CompactLargeAliasesIntoSharedSymbols(raw_symbols, knobs)
+  with timer.Measure('Compact aliases'):
+    _CompactLargeAliasesIntoSharedSymbols(raw_symbols, knobs)
   logging.debug('Connecting nm aliases')
   _ConnectNmAliases(raw_symbols)
+  logging.info('Time spent per stage:\n  %s', '\n  '.join(timer.Describe()))
   return section_sizes, raw_symbols
 
 
@@ -1407,6 +1484,13 @@ def AddArguments(parser):
                            'granular symbols.')
   parser.add_argument('--source-directory',
                       help='Custom path to the root source directory.')
+  parser.add_argument('--cache-dir',
+                      help='Directory in which to cache intermediate results '
+                           '(e.g. nm output) keyed by the contents of input '
+                           'files. Speeds up re-archiving incremental builds.')
+  parser.add_argument('--text-format', action='store_true',
+                      help='Write the gzipped text .size format rather than '
+                           'the (larger, but faster to load) columnar one.')
   AddMainPathsArguments(parser)
 
 
@@ -1481,6 +1565,7 @@ def Run(args, parser):
   knobs = SectionSizeKnobs()
   if args.source_directory:
     knobs.src_root = args.source_directory
+  knobs.cache_dir = args.cache_dir
 
   section_sizes, raw_symbols = CreateSectionSizesAndSymbols(
       map_path=map_path, tool_prefix=tool_prefix, elf_path=elf_path,
@@ -1489,8 +1574,11 @@ def Run(args, parser):
       metadata=metadata, apk_so_path=apk_so_path,
       pak_files=args.pak_file, pak_info_file=args.pak_info_file,
       linker_name=linker_name, knobs=knobs)
+  # Columnar .size files store normalized names so that they can be loaded
+  # lazily. The text format leaves normalization until load time.
   size_info = CreateSizeInfo(
-      section_sizes, raw_symbols, metadata=metadata, normalize_names=False)
+      section_sizes, raw_symbols, metadata=metadata,
+      normalize_names=not args.text_format)
 
   if logging.getLogger().isEnabledFor(logging.INFO):
     for line in describe.DescribeSizeInfoCoverage(size_info):
@@ -1499,6 +1587,7 @@ def Run(args, parser):
   logging.info('Recording metadata: \n  %s',
                '\n  '.join(describe.DescribeMetadata(size_info.metadata)))
   logging.info('Saving result to %s', args.size_file)
-  file_format.SaveSizeInfo(size_info, args.size_file)
+  file_format.SaveSizeInfo(size_info, args.size_file,
+                           text_format=args.text_format)
   size_in_mb = os.path.getsize(args.size_file) / 1024.0 / 1024.0
   logging.info('Done. File size is %.2fMiB.', size_in_mb)
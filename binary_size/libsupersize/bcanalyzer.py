@@ -13,7 +13,7 @@ ParseTag():
   testing).
 
 RunBcAnalyzerOnIntermediates():
-  BulkForkAndCall() target: Given BC file [paths], runs (llvm-)bcanalyzer on
+  BulkCallOnPool() target: Given BC file [paths], runs (llvm-)bcanalyzer on
   each path, parses the output, extracts strings, and returns {path: [strings]}.
 
 This file can also be run stand-alone in order to test out the logic on smaller
@@ -336,7 +336,7 @@ class _BcAnalyzerRunner:
     return output.splitlines()
 
 
-# This is a target for BulkForkAndCall().
+# This is a target for BulkCallOnPool().
 def RunBcAnalyzerOnIntermediates(target, tool_prefix, output_directory):
   """Calls bcanalyzer and returns encoded map from path to strings.
 
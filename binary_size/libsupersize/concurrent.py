@@ -2,17 +2,41 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
-"""Helpers related to multiprocessing."""
+"""Helpers related to multiprocessing.
+
+There are two flavours of process pools:
+  * ForkAndCall() / BulkForkAndCall() fork a new pool for each call. Parameters
+    are inherited through fork() rather than pickled, which makes them a good
+    fit for jobs that share large inputs (e.g. ELF string data).
+  * CallOnPool() / BulkCallOnPool() use a long-lived pool that is created on
+    first use and reused by all later calls from the same process. Parameters
+    are pickled, so they should be small (e.g. lists of paths).
+
+For both, large return values are written by the worker to a temporary file
+(in /dev/shm when available) and mmap()ed by the caller, rather than being
+pickled through the pool's result pipe. Files of results that are never read
+(e.g. when a caller stops iterating early) are deleted when the calling process
+exits.
+
+The slowest jobs of each function are recorded, along with the number of jobs
+and their total time, so that slow inputs can be identified (see
+DescribeSlowestJobs()).
+"""
 
 import __builtin__  # __builtins__ does not have exception types.
 import atexit
+import heapq
 import itertools
 import logging
+import mmap
 import multiprocessing
 import multiprocessing.dummy
 import os
+import shutil
 import sys
+import tempfile
 import threading
+import time
 import traceback
 
 
@@ -20,6 +44,7 @@ DISABLE_ASYNC = os.environ.get('SUPERSIZE_DISABLE_ASYNC') == '1'
 if DISABLE_ASYNC:
   logging.debug('Running in synchronous mode.')
 
+# List of (owner pid, pool) for all active pools.
 _all_pools = None
 _is_child_process = False
 _silence_exceptions = False
@@ -28,6 +53,32 @@ _silence_exceptions = False
 _fork_params = None
 _fork_kwargs = None
 
+# The pool used by CallOnPool() and BulkCallOnPool(), and the pid of the process
+# that created it (forked children must not use their parent's pool).
+_persistent_pool = None
+_persistent_pool_pid = None
+
+# Return values with more than this many bytes of strings are passed back to the
+# calling process via a temporary file.
+_SHARED_RESULT_THRESHOLD = 256 * 1024
+# Directory for those files. /dev/shm is memory-backed, so writing to it never
+# touches the disk.
+_SHARED_RESULT_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Directory within _SHARED_RESULT_DIR that holds the files of the workers of
+# this process, and the pid of the process that created it. Created before
+# forking workers, which inherit it.
+_shared_result_subdir = None
+_shared_result_subdir_pid = None
+
+# Number of the slowest jobs of each function that are recorded.
+_MAX_JOB_TIMINGS_PER_FUNC = 100
+
+# Function name -> [number of jobs, total seconds, min-heap of (seconds, job
+# description) for the slowest jobs].
+_job_timings = {}
+_job_timings_lock = threading.Lock()
+
 
 class _ImmediateResult(object):
   def __init__(self, value):
@@ -58,27 +109,197 @@ class _ExceptionWrapper(object):
           'Originally caused by: ' + self.msg)
 
 
+def _RunJob(func, args, kwargs):
+  """Runs on the worker side to time |func| and to catch exceptions.
+
+  Returns:
+    A tuple of (return value or _ExceptionWrapper, seconds).
+  """
+  start_time = time.time()
+  try:
+    value = _MaybeShareResult(func(*args, **kwargs))
+  except Exception, e:
+    # Only keep the exception type for builtin exception types or else risk
+    # further marshalling exceptions.
+    exception_type = None
+    if type(e).__name__ in dir(__builtin__):
+      exception_type = type(e).__name__
+    # multiprocessing is supposed to catch and return exceptions automatically
+    # but it doesn't seem to work properly :(.
+    value = _ExceptionWrapper(traceback.format_exc(), exception_type)
+  except:  # pylint: disable=bare-except
+    value = _ExceptionWrapper(traceback.format_exc())
+  return value, time.time() - start_time
+
+
 class _FuncWrapper(object):
   """Runs on the fork()'ed side to catch exceptions and spread *args."""
   def __init__(self, func):
+    self._func = func
+
+  def __call__(self, index, _=None):
     global _is_child_process
     _is_child_process = True
+    value, duration = _RunJob(self._func, _fork_params[index], _fork_kwargs)
+    return index, value, duration
+
+
+class _PickledFuncWrapper(object):
+  """Like _FuncWrapper, but for the persistent pool, where args are pickled."""
+  def __init__(self, func, kwargs):
     self._func = func
+    self._kwargs = kwargs
 
-  def __call__(self, index, _=None):
+  def __call__(self, index_and_args):
+    index, args = index_and_args
+    value, duration = _RunJob(self._func, args, self._kwargs)
+    return index, value, duration
+
+
+class _SharedResult(object):
+  """A return value that was written to a file rather than pickled.
+
+  The value must be a string, or a (possibly nested) list / tuple of strings.
+  The strings are stored back-to-back, and |shape| describes how to rebuild the
+  value: it has the same structure, but with string lengths in place of the
+  strings.
+  """
+  def __init__(self, path, shape):
+    self._path = path
+    self._shape = shape
+
+  def Load(self):
+    """Returns the value and deletes the file."""
     try:
-      return self._func(*_fork_params[index], **_fork_kwargs)
-    except Exception, e:
-      # Only keep the exception type for builtin exception types or else risk
-      # further marshalling exceptions.
-      exception_type = None
-      if type(e).__name__ in dir(__builtin__):
-        exception_type = type(e).__name__
-      # multiprocessing is supposed to catch and return exceptions automatically
-      # but it doesn't seem to work properly :(.
-      return _ExceptionWrapper(traceback.format_exc(), exception_type)
-    except:  # pylint: disable=bare-except
-      return _ExceptionWrapper(traceback.format_exc())
+      with open(self._path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+          data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+          data = ''
+      try:
+        value, _ = _UnflattenStrings(self._shape, data, 0)
+      finally:
+        if data:
+          data.close()
+    finally:
+      os.unlink(self._path)
+    return value
+
+
+def _FlattenStrings(value, strings):
+  """Appends strings within |value| to |strings| and returns their shape.
+
+  Returns None if |value| contains something other than strings, lists and
+  tuples.
+  """
+  if isinstance(value, str):
+    strings.append(value)
+    return len(value)
+  if isinstance(value, (list, tuple)):
+    shape = []
+    for item in value:
+      item_shape = _FlattenStrings(item, strings)
+      if item_shape is None:
+        return None
+      shape.append(item_shape)
+    return shape if isinstance(value, list) else tuple(shape)
+  return None
+
+
+def _UnflattenStrings(shape, data, pos):
+  """Inverse of _FlattenStrings(). Returns (value, new pos)."""
+  if isinstance(shape, (int, long)):
+    return data[pos:pos + shape], pos + shape
+  ret = []
+  for item_shape in shape:
+    item, pos = _UnflattenStrings(item_shape, data, pos)
+    ret.append(item)
+  return (ret if isinstance(shape, list) else tuple(ret)), pos
+
+
+def _MaybeShareResult(value):
+  """Runs on the worker side. Writes large return values to a file."""
+  strings = []
+  shape = _FlattenStrings(value, strings)
+  if shape is None or sum(len(x) for x in strings) < _SHARED_RESULT_THRESHOLD:
+    return value
+  fd, path = tempfile.mkstemp(prefix='supersize-',
+                              dir=_shared_result_subdir or _SHARED_RESULT_DIR)
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      for x in strings:
+        f.write(x)
+  except:  # pylint: disable=bare-except
+    os.unlink(path)
+    raise
+  return _SharedResult(path, shape)
+
+
+def _RemoveSharedResultSubdir(path, owner_pid):
+  # Processes created by os.fork() run their parent's atexit handlers.
+  if os.getpid() == owner_pid:
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _EnsureSharedResultSubdir():
+  """Creates the directory for the shared results of this process's workers.
+
+  Must be called before forking workers.
+  """
+  global _shared_result_subdir
+  global _shared_result_subdir_pid
+  if _shared_result_subdir_pid == os.getpid():
+    return
+  _shared_result_subdir = tempfile.mkdtemp(prefix='supersize-',
+                                           dir=_SHARED_RESULT_DIR)
+  _shared_result_subdir_pid = os.getpid()
+  atexit.register(_RemoveSharedResultSubdir, _shared_result_subdir,
+                  _shared_result_subdir_pid)
+
+
+def _DescribeJob(func, args):
+  """Returns a short description of a job, for timing reports."""
+  desc = ''
+  if args:
+    arg = args[0]
+    if isinstance(arg, (list, tuple)) and arg and isinstance(arg[0], str):
+      desc = arg[0]
+      if len(arg) > 1:
+        desc += ' (+%d more)' % (len(arg) - 1)
+    elif isinstance(arg, str):
+      desc = arg
+  if len(desc) > 100:
+    desc = '...' + desc[-97:]
+  return '%s(%s)' % (func.__name__, desc)
+
+
+def _CallInProcess(func, args, kwargs):
+  """Calls |func| directly, returning what _RunJob() would (plus the index)."""
+  start_time = time.time()
+  value = func(*args, **kwargs)
+  return 0, value, time.time() - start_time
+
+
+def _RecordJobTiming(func, args, duration):
+  with _job_timings_lock:
+    timings = _job_timings.setdefault(func.__name__, [0, 0, []])
+    timings[0] += 1
+    timings[1] += duration
+    slowest = timings[2]
+    if len(slowest) < _MAX_JOB_TIMINGS_PER_FUNC:
+      heapq.heappush(slowest, (duration, _DescribeJob(func, args)))
+    elif duration > slowest[0][0]:
+      heapq.heapreplace(slowest, (duration, _DescribeJob(func, args)))
+
+
+def _HandleJobResult(func, arg_tuples, job_result):
+  """Runs on the calling side to unpack what _RunJob() returned."""
+  index, value, duration = job_result
+  _RecordJobTiming(func, arg_tuples[index], duration)
+  _CheckForException(value)
+  if isinstance(value, _SharedResult):
+    value = value.Load()
+  return value
 
 
 class _WrappedResult(object):
@@ -88,15 +309,16 @@ class _WrappedResult(object):
   * Raises exception caught by _FuncWrapper.
   * Allows for custom unmarshalling of return value.
   """
-  def __init__(self, result, pool=None, decode_func=None):
+  def __init__(self, result, func, args, pool=None, decode_func=None):
     self._result = result
+    self._func = func
+    self._args = args
     self._pool = pool
     self._decode_func = decode_func
 
   def get(self):
     self.wait()
-    value = self._result.get()
-    _CheckForException(value)
+    value = _HandleJobResult(self._func, [self._args], self._result.get())
     if not self._decode_func or not self._result.successful():
       return value
     return self._decode_func(value)
@@ -104,7 +326,7 @@ class _WrappedResult(object):
   def wait(self):
     self._result.wait()
     if self._pool:
-      _all_pools.remove(self._pool)
+      _UnregisterPool(self._pool)
       self._pool = None
 
   def ready(self):
@@ -122,7 +344,7 @@ def _TerminatePools():
   """
   global _silence_exceptions
   _silence_exceptions = True
-  # Child processes cannot have pools, but atexit runs this function because
+  # Pool workers cannot have pools, but atexit runs this function because
   # it was registered before fork()ing.
   if _is_child_process:
     return
@@ -132,7 +354,11 @@ def _TerminatePools():
     except:  # pylint: disable=bare-except
       pass
 
-  for i, pool in enumerate(_all_pools):
+  # Processes created by os.fork() inherit their parent's pools, which they
+  # must not terminate.
+  pid = os.getpid()
+  owned_pools = [pool for owner_pid, pool in _all_pools if owner_pid == pid]
+  for i, pool in enumerate(owned_pools):
     # Without calling terminate() on a separate thread, the call can block
     # forever.
     thread = threading.Thread(name='Pool-Terminate-{}'.format(i),
@@ -151,25 +377,52 @@ def _CheckForException(value):
     sys.exit(1)
 
 
-def _MakeProcessPool(job_params, **job_kwargs):
+def _RegisterPool(pool):
   global _all_pools
+  if _all_pools is None:
+    _all_pools = []
+    atexit.register(_TerminatePools)
+  _all_pools.append((os.getpid(), pool))
+
+
+def _UnregisterPool(pool):
+  _all_pools.remove((os.getpid(), pool))
+
+
+def _MakeProcessPool(job_params, **job_kwargs):
   global _fork_params
   global _fork_kwargs
   assert _fork_params is None
   assert _fork_kwargs is None
   pool_size = min(len(job_params), multiprocessing.cpu_count())
+  _EnsureSharedResultSubdir()
   _fork_params = job_params
   _fork_kwargs = job_kwargs
   ret = multiprocessing.Pool(pool_size)
   _fork_params = None
   _fork_kwargs = None
-  if _all_pools is None:
-    _all_pools = []
-    atexit.register(_TerminatePools)
-  _all_pools.append(ret)
+  _RegisterPool(ret)
   return ret
 
 
+def _InitPersistentPoolWorker():
+  global _is_child_process
+  _is_child_process = True
+
+
+def _GetPersistentPool():
+  """Returns the pool used by CallOnPool(), creating it if need be."""
+  global _persistent_pool
+  global _persistent_pool_pid
+  if _persistent_pool_pid != os.getpid():
+    _EnsureSharedResultSubdir()
+    _persistent_pool = multiprocessing.Pool(
+        multiprocessing.cpu_count(), initializer=_InitPersistentPoolWorker)
+    _persistent_pool_pid = os.getpid()
+    _RegisterPool(_persistent_pool)
+  return _persistent_pool
+
+
 def ForkAndCall(func, args, decode_func=None):
   """Runs |func| in a fork'ed process.
 
@@ -178,12 +431,12 @@ def ForkAndCall(func, args, decode_func=None):
   """
   if DISABLE_ASYNC:
     pool = None
-    result = _ImmediateResult(func(*args))
+    result = _ImmediateResult(_CallInProcess(func, args, {}))
   else:
     pool = _MakeProcessPool([args])  # Omit |kwargs|.
     result = pool.apply_async(_FuncWrapper(func), (0,))
     pool.close()
-  return _WrappedResult(result, pool=pool, decode_func=decode_func)
+  return _WrappedResult(result, func, args, pool=pool, decode_func=decode_func)
 
 
 def BulkForkAndCall(func, arg_tuples, **kwargs):
@@ -200,17 +453,99 @@ def BulkForkAndCall(func, arg_tuples, **kwargs):
 
   if DISABLE_ASYNC:
     for args in arg_tuples:
-      yield func(*args, **kwargs)
+      yield _HandleJobResult(func, [args], _CallInProcess(func, args, kwargs))
     return
 
   pool = _MakeProcessPool(arg_tuples, **kwargs)
   wrapped_func = _FuncWrapper(func)
   for result in pool.imap_unordered(wrapped_func, xrange(len(arg_tuples))):
-    _CheckForException(result)
-    yield result
+    yield _HandleJobResult(func, arg_tuples, result)
   pool.close()
   pool.join()
-  _all_pools.remove(pool)
+  _UnregisterPool(pool)
+
+
+def CallOnPool(func, args, decode_func=None):
+  """Runs |func| on the persistent process pool.
+
+  Unlike ForkAndCall(), |func| must be a module-level function and |args| must
+  be picklable.
+
+  Returns:
+    A Result object (call .get() to get the return value)
+  """
+  if DISABLE_ASYNC:
+    result = _ImmediateResult(_CallInProcess(func, args, {}))
+  else:
+    pool = _GetPersistentPool()
+    result = pool.apply_async(_PickledFuncWrapper(func, {}), ((0, args),))
+  return _WrappedResult(result, func, args, decode_func=decode_func)
+
+
+def BulkCallOnPool(func, arg_tuples, **kwargs):
+  """Calls |func| on the persistent process pool for each of |arg_tuples|.
+
+  Unlike BulkForkAndCall(), |func| must be a module-level function, and
+  |arg_tuples| and |kwargs| must be picklable.
+
+  Args:
+    kwargs: Common key word arguments to be passed to |func|.
+
+  Yields the return values as they come in.
+  """
+  arg_tuples = list(arg_tuples)
+  if not len(arg_tuples):
+    return
+
+  if DISABLE_ASYNC:
+    for args in arg_tuples:
+      yield _HandleJobResult(func, [args], _CallInProcess(func, args, kwargs))
+    return
+
+  pool = _GetPersistentPool()
+  wrapped_func = _PickledFuncWrapper(func, kwargs)
+  for result in pool.imap_unordered(wrapped_func, enumerate(arg_tuples)):
+    yield _HandleJobResult(func, arg_tuples, result)
+
+
+def _GetJobTimings(func):
+  with _job_timings_lock:
+    if func is not None:
+      timings = _job_timings.get(func.__name__)
+      return [timings] if timings else []
+    return list(_job_timings.itervalues())
+
+
+def GetJobTimings(func=None):
+  """Returns a list of (job description, seconds) for the slowest completed
+  jobs, slowest first.
+
+  Only the slowest _MAX_JOB_TIMINGS_PER_FUNC jobs of each function are kept.
+
+  Args:
+    func: If given, returns only jobs that called this function.
+  """
+  ret = []
+  for _, _, slowest in _GetJobTimings(func):
+    ret.extend((desc, duration) for duration, desc in slowest)
+  ret.sort(key=lambda t: (-t[1], t[0]))
+  return ret
+
+
+def DescribeSlowestJobs(func=None, count=10):
+  """Returns lines describing the jobs that took the longest.
+
+  Args:
+    func: If given, considers only jobs that called this function.
+    count: Maximum number of jobs to describe.
+  """
+  timings = _GetJobTimings(func)
+  num_jobs = sum(t[0] for t in timings)
+  total = sum(t[1] for t in timings)
+  lines = ['%d jobs took %.2fs in total' % (num_jobs, total)]
+  for desc, duration in GetJobTimings(func)[:count]:
+    lines.append('%7.2fs %s' % (duration, desc))
+  return lines
 
 
 def CallOnThread(func, *args, **kwargs):
@@ -4,6 +4,10 @@
 # found in the LICENSE file.
 
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import threading
 import unittest
 
@@ -16,6 +20,15 @@ def _ForkTestHelper(arg1, arg2, pickle_me_not, test_instance, parent_pid):
   return arg1 + arg2
 
 
+def _PoolTestHelper(arg1, arg2, parent_pid):
+  assert os.getpid() != parent_pid
+  return arg1 + arg2, os.getpid()
+
+
+def _LargeResultHelper(size):
+  return ('a' * size, ['b' * size, ('c', '')], 'd')
+
+
 class Unpicklable(object):
   """Ensures that pickle() is not called on parameters."""
   def __getstate__(self):
@@ -144,5 +157,87 @@ class ConcurrentTest(unittest.TestCase):
         (1, 'a', self, parent_pid)])
     self.assertRaises(TypeError, results.next)
 
+  def testCallOnPool_normal(self):
+    result = concurrent.CallOnPool(_PoolTestHelper, (1, 2, os.getpid()))
+    self.assertEquals(3, result.get()[0])
+
+  def testCallOnPool_exception(self):
+    result = concurrent.CallOnPool(_PoolTestHelper, (1, 'a', os.getpid()))
+    self.assertRaises(TypeError, result.get)
+
+  def testBulkCallOnPool_reusesPool(self):
+    parent_pid = os.getpid()
+    results = concurrent.BulkCallOnPool(
+        _PoolTestHelper, [(1, 2) for _ in xrange(100)], parent_pid=parent_pid)
+    values, pids = zip(*results)
+    self.assertEquals([3] * 100, list(values))
+    results = concurrent.BulkCallOnPool(
+        _PoolTestHelper, [(1, 2) for _ in xrange(100)], parent_pid=parent_pid)
+    # Workers are not re-created for each call.
+    self.assertTrue(set(pids) & set(p for _, p in results))
+
+  def testBulkCallOnPool_none(self):
+    results = concurrent.BulkCallOnPool(_PoolTestHelper, [])
+    self.assertEquals([], list(results))
+
+  def testBulkCallOnPool_largeResult(self):
+    size = concurrent._SHARED_RESULT_THRESHOLD
+    results = list(concurrent.BulkCallOnPool(_LargeResultHelper, [(size,)]))
+    self.assertEquals([_LargeResultHelper(size)], results)
+
+  def testBulkForkAndCall_largeResult(self):
+    size = concurrent._SHARED_RESULT_THRESHOLD
+    results = list(concurrent.BulkForkAndCall(_LargeResultHelper, [(size,)]))
+    self.assertEquals([_LargeResultHelper(size)], results)
+
+  def testSharedResultsNotReadAreDeleted(self):
+    # Stop iterating after the first of many large results, in a separate
+    # process so that its exit can be checked.
+    shared_result_dir = tempfile.mkdtemp()
+    script = '\n'.join([
+        'import concurrent, concurrent_test',
+        'concurrent._SHARED_RESULT_DIR = %r' % shared_result_dir,
+        'size = concurrent._SHARED_RESULT_THRESHOLD',
+        'for result in concurrent.BulkCallOnPool(',
+        '    concurrent_test._LargeResultHelper, [(size,)] * 8):',
+        '  break',
+    ])
+    try:
+      # Pool threads may log errors while the interpreter shuts down.
+      subprocess.check_output([sys.executable, '-c', script],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stderr=subprocess.STDOUT)
+      self.assertEquals([], os.listdir(shared_result_dir))
+    finally:
+      shutil.rmtree(shared_result_dir)
+
+  def testDescribeSlowestJobs(self):
+    num_jobs = len(concurrent.GetJobTimings(_LargeResultHelper))
+    list(concurrent.BulkCallOnPool(
+        _LargeResultHelper, [(i,) for i in xrange(5)]))
+    self.assertEquals(
+        num_jobs + 5, len(concurrent.GetJobTimings(_LargeResultHelper)))
+    lines = concurrent.DescribeSlowestJobs(_LargeResultHelper, count=2)
+    self.assertEquals(3, len(lines))
+    self.assertIn('_LargeResultHelper', lines[1])
+
+  def testJobTimingsAreBounded(self):
+    def Func():
+      pass
+    max_timings = concurrent._MAX_JOB_TIMINGS_PER_FUNC
+    concurrent._MAX_JOB_TIMINGS_PER_FUNC = 3
+    try:
+      for i in xrange(10):
+        concurrent._RecordJobTiming(Func, ('job%d' % i,), i % 5)
+    finally:
+      concurrent._MAX_JOB_TIMINGS_PER_FUNC = max_timings
+    self.assertEquals([('Func(job4)', 4), ('Func(job9)', 4)],
+                      concurrent.GetJobTimings(Func)[:2])
+    self.assertEquals(3, len(concurrent.GetJobTimings(Func)))
+    lines = concurrent.DescribeSlowestJobs(Func, count=1)
+    self.assertEquals(['10 jobs took 20.00s in total',
+                       '   4.00s Func(job4)'], lines)
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -143,18 +143,21 @@ class _Session(object):
           ret.append((symbol, data))
     return ret
 
-  def _DiffFunc(self, before=None, after=None, sort=True):
+  def _DiffFunc(self, before=None, after=None, sort=True, summary_only=False):
     """Diffs two SizeInfo objects. Returns a DeltaSizeInfo.
 
     Args:
       before: Defaults to first size_infos[0].
       after: Defaults to second size_infos[1].
       sort: When True (default), calls SymbolGroup.Sorted() after diffing.
+          Ignored when |summary_only|.
+      summary_only: When True, computes only per-section and per-component
+          deltas (much faster, and does not match up individual symbols).
     """
     before = before if before is not None else self._size_infos[0]
     after = after if after is not None else self._size_infos[1]
-    ret = diff.Diff(before, after)
-    if sort:
+    ret = diff.Diff(before, after, summary_only=summary_only)
+    if sort and not summary_only:
       syms = ret.symbols  # Triggers clustering.
       logging.debug('Grouping')
       # Group path aliases so that functions defined in headers will be sorted
@@ -5,18 +5,70 @@
 """Utilities for demangling C++ symbols."""
 
 import collections
+import itertools
 import logging
 import subprocess
+import zlib
 
 import path_util
+import stage_cache
 
-def _DemangleNames(names, tool_prefix):
-  """Uses c++filt to demangle a list of names."""
+_CACHE_STAGE = 'demangle'
+# Names are cached in shards, by hash of the name, so that a few new names
+# invalidate only a few shards. Each shard is keyed by a hash of its names, so
+# entries are never rewritten, and concurrent runs cannot drop each other's.
+_NUM_SHARDS = 256
+# Enough for the shards of several binaries across a few builds.
+_MAX_CACHED_SHARDS = 16 * _NUM_SHARDS
+
+
+def _RunCppFilt(names, tool_prefix):
   proc = subprocess.Popen([path_util.GetCppFiltPath(tool_prefix)],
                           stdin=subprocess.PIPE, stdout=subprocess.PIPE)
   stdout = proc.communicate('\n'.join(names))[0]
   assert proc.returncode == 0
-  ret = stdout.splitlines()
+  return stdout.splitlines()
+
+
+def _DemangleNamesWithCache(names, tool_prefix, cache):
+  tool_fingerprint = stage_cache.ToolFingerprint(
+      path_util.GetCppFiltPath(tool_prefix))
+  shards = [[] for _ in xrange(_NUM_SHARDS)]
+  for name in set(names):
+    shards[zlib.crc32(name) % _NUM_SHARDS].append(name)
+
+  demangled_by_name = {}
+  missed_shards = []
+  for shard in shards:
+    if not shard:
+      continue
+    shard.sort()
+    key = stage_cache.MakeKey(tool_fingerprint, '\n'.join(shard))
+    demangled = cache.Get(_CACHE_STAGE, key)
+    if demangled is None:
+      missed_shards.append((key, shard))
+    else:
+      demangled_by_name.update(itertools.izip(shard, demangled))
+
+  if missed_shards:
+    missing = [n for _, shard in missed_shards for n in shard]
+    logging.debug('Demangle cache: %d hits, %d misses',
+                  len(demangled_by_name), len(missing))
+    demangled = iter(_RunCppFilt(missing, tool_prefix))
+    for key, shard in missed_shards:
+      shard_demangled = list(itertools.islice(demangled, len(shard)))
+      demangled_by_name.update(itertools.izip(shard, shard_demangled))
+      cache.Put(_CACHE_STAGE, key, shard_demangled)
+    cache.Prune(_CACHE_STAGE, _MAX_CACHED_SHARDS)
+  return [demangled_by_name[n] for n in names]
+
+
+def _DemangleNames(names, tool_prefix, cache=None):
+  """Uses c++filt to demangle a list of names."""
+  if cache:
+    ret = _DemangleNamesWithCache(list(names), tool_prefix, cache)
+  else:
+    ret = _RunCppFilt(names, tool_prefix)
   if logging.getLogger().isEnabledFor(logging.INFO):
     fail_count = sum(1 for s in ret if s.startswith('_Z'))
     if fail_count:
@@ -24,19 +76,24 @@ def _DemangleNames(names, tool_prefix):
   return ret
 
 
-def DemangleRemainingSymbols(raw_symbols, tool_prefix):
-  """Demangles any symbols that need it."""
+def DemangleRemainingSymbols(raw_symbols, tool_prefix, cache=None):
+  """Demangles any symbols that need it.
+
+  Args:
+    cache: Optional StageCache for demangled names.
+  """
   to_process = [s for s in raw_symbols if s.full_name.startswith('_Z')]
   if not to_process:
     return
 
   logging.info('Demangling %d symbols', len(to_process))
-  names = _DemangleNames((s.full_name for s in to_process), tool_prefix)
+  names = _DemangleNames((s.full_name for s in to_process), tool_prefix,
+                         cache=cache)
   for i, name in enumerate(names):
     to_process[i].full_name = name
 
 
-def DemangleSetsInDicts(key_to_names, tool_prefix):
+def DemangleSetsInDicts(key_to_names, tool_prefix, cache=None):
   """Demangles values as sets, and returns the result.
 
   |key_to_names| is a dict from key to sets (or lists) of mangled names.
@@ -48,7 +105,7 @@ def DemangleSetsInDicts(key_to_names, tool_prefix):
     return key_to_names
 
   logging.info('Demangling %d values', len(all_names))
-  it = iter(_DemangleNames(all_names, tool_prefix))
+  it = iter(_DemangleNames(all_names, tool_prefix, cache=cache))
   ret = {}
   for key, names in key_to_names.iteritems():
     ret[key] = set(next(it) if n.startswith('_Z') else n for n in names)
@@ -56,7 +113,7 @@ def DemangleSetsInDicts(key_to_names, tool_prefix):
   return ret
 
 
-def DemangleKeysAndMergeLists(name_to_list, tool_prefix):
+def DemangleKeysAndMergeLists(name_to_list, tool_prefix, cache=None):
   """Demangles keys of a dict of lists, and returns the result.
 
   Keys may demangle to a common name. When this happens, the corresponding lists
@@ -67,7 +124,7 @@ def DemangleKeysAndMergeLists(name_to_list, tool_prefix):
     return name_to_list
 
   logging.info('Demangling %d keys', len(keys))
-  key_iter = iter(_DemangleNames(keys, tool_prefix))
+  key_iter = iter(_DemangleNames(keys, tool_prefix, cache=cache))
   ret = collections.defaultdict(list)
   for key, val in name_to_list.iteritems():
     ret[next(key_iter) if key.startswith('_Z') else key] += val
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import distutils.spawn
+import os
+import shutil
+import tempfile
+import unittest
+
+import demangle
+import stage_cache
+
+
+_NAMES = ['_ZN3foo3barEv', 'main', '_ZN3foo3bazEi', '_ZN3foo3barEv',
+          '_ZN3qux4quuxEPKc']
+
+
+class DemangleTest(unittest.TestCase):
+  def setUp(self):
+    cppfilt_path = distutils.spawn.find_executable('c++filt')
+    if not cppfilt_path:
+      self.skipTest('c++filt not found')
+    self.tool_prefix = cppfilt_path[:-len('c++filt')]
+    self.cache_dir = tempfile.mkdtemp()
+    self.cache = stage_cache.StageCache(self.cache_dir)
+    self._orig_run_cppfilt = demangle._RunCppFilt
+    self.cppfilt_inputs = []
+    def run_cppfilt(names, tool_prefix):
+      self.cppfilt_inputs.append(sorted(names))
+      return self._orig_run_cppfilt(names, tool_prefix)
+    demangle._RunCppFilt = run_cppfilt
+
+  def tearDown(self):
+    demangle._RunCppFilt = self._orig_run_cppfilt
+    shutil.rmtree(self.cache_dir)
+
+  def _Demangle(self, names):
+    return demangle._DemangleNames(names, self.tool_prefix, cache=self.cache)
+
+  def testCache(self):
+    expected = demangle._DemangleNames(_NAMES, self.tool_prefix)
+    self.assertEquals('foo::bar()', expected[0])
+    self.assertEquals(expected, self._Demangle(_NAMES))
+    del self.cppfilt_inputs[:]
+    self.assertEquals(expected, self._Demangle(_NAMES))
+    self.assertEquals([], self.cppfilt_inputs)
+
+    # Only the shard of a new name is demangled again.
+    names = _NAMES + ['_ZN3new4nameEv']
+    self.assertEquals(expected + ['new::name()'], self._Demangle(names))
+    self.assertEquals(1, len(self.cppfilt_inputs))
+    self.assertIn('_ZN3new4nameEv', self.cppfilt_inputs[0])
+    self.assertLess(len(self.cppfilt_inputs[0]), len(set(names)))
+
+  def testCache_ConcurrentCallersKeepTheirNames(self):
+    other_names = ['_ZN5other4funcEv']
+    self._Demangle(_NAMES)
+    self._Demangle(other_names)
+    del self.cppfilt_inputs[:]
+    self._Demangle(_NAMES)
+    self._Demangle(other_names)
+    self.assertEquals([], self.cppfilt_inputs)
+
+  def testCache_Bounded(self):
+    orig_max_cached_shards = demangle._MAX_CACHED_SHARDS
+    demangle._MAX_CACHED_SHARDS = 3
+    try:
+      self._Demangle(['_ZN1a%dEv' % i for i in xrange(20)])
+    finally:
+      demangle._MAX_CACHED_SHARDS = orig_max_cached_shards
+    num_entries = sum(len(f) for _, _, f in os.walk(self.cache_dir))
+    self.assertEquals(3, num_entries)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -165,7 +165,8 @@ class Describer(object):
       return self._DescribeDeltaSymbolGroup(obj)
     if isinstance(obj, models.SymbolGroup):
       return self._DescribeSymbolGroup(obj)
-    if isinstance(obj, (models.Symbol, models.DeltaSymbol)):
+    if isinstance(obj, (models.Symbol, models.StoredSymbol,
+                        models.DeltaSymbol)):
       return self._DescribeSymbol(obj)
     if hasattr(obj, '__iter__'):
       return self._DescribeIterable(obj)
@@ -433,6 +434,48 @@ class DescriberText(Describer):
     group_desc = self._DescribeSymbolGroup(delta_group)
     return itertools.chain(diff_summary_desc, path_delta_desc, group_desc)
 
+  def _DescribeDeltaSummary(self, delta_group):
+    """Describes the symbols of Diff(summary_only=True).
+
+    Each symbol is the change in PSS of a (section, component), rounded to
+    whole bytes. Rows for each section are followed by rows for its
+    components, by decreasing change.
+    """
+    by_section = collections.defaultdict(list)
+    for sym in delta_group:
+      by_section[sym.section_name].append(sym)
+
+    def make_row(name, before_pss, after_pss):
+      delta = after_pss - before_pss
+      return (name, '%d' % before_pss, '%d' % after_pss,
+              '%+d' % delta if delta else '0')
+
+    rows = [('Section / Component', 'Before', 'After', 'Delta')]
+    num_unchanged = 0
+    for section_name in sorted(by_section):
+      syms = by_section[section_name]
+      befores = [s.before_symbol.pss if s.before_symbol else 0 for s in syms]
+      afters = [s.after_symbol.pss if s.after_symbol else 0 for s in syms]
+      rows.append(make_row(section_name, sum(befores), sum(afters)))
+      component_rows = []
+      for sym, before_pss, after_pss in zip(syms, befores, afters):
+        if not self.verbose and before_pss == after_pss:
+          num_unchanged += 1
+          continue
+        component_rows.append((-abs(after_pss - before_pss), sym.full_name,
+                               before_pss, after_pss))
+      for _, name, before_pss, after_pss in sorted(component_rows):
+        rows.append(make_row('    ' + name, before_pss, after_pss))
+
+    widths = [max(len(row[i]) for row in rows) for i in xrange(4)]
+    yield ('Changes in PSS by section and component (symbols were not '
+           'matched up):')
+    for row in rows:
+      yield '{:<{}}  {:>{}}  {:>{}}  {:>{}}'.format(
+          *itertools.chain(*zip(row, widths))).rstrip()
+    if num_unchanged:
+      yield '{} unchanged components not shown'.format(num_unchanged)
+
   def _DescribeDeltaSizeInfo(self, diff):
     common_metadata = {k: v for k, v in diff.before.metadata.iteritems()
                        if diff.after.metadata[k] == v}
@@ -448,7 +491,10 @@ class DescriberText(Describer):
         ('New Metadata:',),
         ('    %s' % line for line in DescribeMetadata(after_metadata)))
     section_desc = self._DescribeSectionSizes(diff.section_sizes)
-    group_desc = self.GenerateLines(diff.symbols)
+    if diff.summary_only:
+      group_desc = self._DescribeDeltaSummary(diff.raw_symbols)
+    else:
+      group_desc = self.GenerateLines(diff.symbols)
     return itertools.chain(metadata_desc, section_desc, ('',), group_desc)
 
   def _DescribeSizeInfo(self, size_info):
@@ -548,9 +594,22 @@ class DescriberCsv(Describer):
 
   def _DescribeDeltaSizeInfo(self, diff):
     section_desc = self._DescribeSectionSizes(diff.section_sizes)
-    group_desc = self.GenerateLines(diff.symbols)
+    if diff.summary_only:
+      group_desc = self._DescribeDeltaSummary(diff.raw_symbols)
+    else:
+      group_desc = self.GenerateLines(diff.symbols)
     return itertools.chain(section_desc, ('',), group_desc)
 
+  def _DescribeDeltaSummary(self, delta_group):
+    yield self._RenderCsv(['Section', 'Component', 'BeforePSS', 'AfterPSS',
+                           'DeltaPSS'])
+    for sym in sorted(delta_group, key=lambda s: (s.section_name, s.full_name)):
+      before_pss = sym.before_symbol.pss if sym.before_symbol else 0
+      after_pss = sym.after_symbol.pss if sym.after_symbol else 0
+      yield self._RenderCsv([sym.section_name, sym.full_name,
+                             round(before_pss, 3), round(after_pss, 3),
+                             round(after_pss - before_pss, 3)])
+
   def _DescribeSizeInfo(self, size_info):
     section_desc = self._DescribeSectionSizes(size_info.section_sizes)
     group_desc = self.GenerateLines(size_info.symbols)
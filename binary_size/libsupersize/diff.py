@@ -3,6 +3,7 @@
 # found in the LICENSE file.
 """Logic for diffing two SizeInfo objects."""
 
+import array
 import collections
 import logging
 import re
@@ -12,6 +13,7 @@ import models
 
 _STRIP_NUMBER_SUFFIX_PATTERN = re.compile(r'[.0-9]+$')
 _NORMALIZE_STAR_SYMBOLS_PATTERN = re.compile(r'\s+\d+( \(.*\))?$')
+_NO_COMPONENT_NAME = '{no component}'
 
 
 def _ExactMatchKey(s):
@@ -55,69 +57,192 @@ def _PoorMatchKey(symbol):
   return section, name
 
 
-def _MatchSymbols(before, after, key_func, padding_by_section_name):
-  logging.debug('%s: Building symbol index', key_func.__name__)
-  before_symbols_by_key = collections.defaultdict(list)
-  for s in before:
-    before_symbols_by_key[key_func(s)].append(s)
+# The fields of a symbol used by the match key functions above. Lets keys be
+# computed from a SymbolStore's columns without creating StoredSymbols.
+_KeyFields = collections.namedtuple('_KeyFields', [
+    'section',
+    'full_name',
+    'object_path',
+    'size_without_padding',
+])
 
-  logging.debug('%s: Creating delta symbols', key_func.__name__)
-  unmatched_after = []
-  delta_symbols = []
-  for after_sym in after:
-    before_sym = before_symbols_by_key.get(key_func(after_sym))
-    if before_sym:
-      before_sym = before_sym.pop(0)
-      # Padding tracked in aggregate, except for padding-only symbols.
-      if before_sym.size_without_padding != 0:
-        padding_by_section_name[before_sym.section_name] += (
-            after_sym.padding_pss - before_sym.padding_pss)
-      delta_symbols.append(models.DeltaSymbol(before_sym, after_sym))
+
+def _KeyFieldsGetter(symbols):
+  """Returns a function that maps an index within |symbols| to its key fields.
+
+  Args:
+    symbols: A SymbolGroup.
+  """
+  stored = symbols._StoredSymbols()  # pylint: disable=protected-access
+  if stored is None:
+    symbols = list(symbols)
+    return symbols.__getitem__
+  store = stored.store
+  indices = stored.indices
+  sections = [models.SECTION_NAME_TO_SECTION.get(n, n)
+              for n in store.section_names]
+  def getter(i):
+    row = indices[i]
+    return _KeyFields(sections[store.section_indices[row]],
+                      store.strings[store.full_name_indices[row]],
+                      store.path_tuples[store.path_indices[row]][0],
+                      store.sizes[row] - store.paddings[row])
+  return getter
+
+
+def _MatchSymbols(before_indices, after_indices, before_fields, after_fields,
+                  key_func):
+  """Matches up symbols with equal keys by merging key-sorted indices.
+
+  When multiple symbols share a key, they are matched in order of appearance.
+
+  Returns:
+    A tuple of (matches, unmatched_before_indices, unmatched_after_indices),
+    where |matches| is a list of (before_index, after_index) sorted by
+    after_index.
+  """
+  logging.debug('%s: Sorting symbol keys', key_func.__name__)
+  # Including the index in the sort key ensures symbols with equal keys remain
+  # in order of appearance.
+  before_keys = sorted((key_func(before_fields(i)), i) for i in before_indices)
+  after_keys = sorted((key_func(after_fields(i)), i) for i in after_indices)
+
+  logging.debug('%s: Merging', key_func.__name__)
+  matches = []
+  unmatched_before = array.array('l')
+  unmatched_after = array.array('l')
+  before_count = len(before_keys)
+  after_count = len(after_keys)
+  before_pos = 0
+  after_pos = 0
+  while before_pos < before_count and after_pos < after_count:
+    before_key, before_idx = before_keys[before_pos]
+    after_key, after_idx = after_keys[after_pos]
+    if before_key < after_key:
+      unmatched_before.append(before_idx)
+      before_pos += 1
+    elif after_key < before_key:
+      unmatched_after.append(after_idx)
+      after_pos += 1
     else:
-      unmatched_after.append(after_sym)
+      matches.append((before_idx, after_idx))
+      before_pos += 1
+      after_pos += 1
+  unmatched_before.extend(i for _, i in before_keys[before_pos:])
+  unmatched_after.extend(i for _, i in after_keys[after_pos:])
 
   logging.debug('%s: Matched %d of %d symbols', key_func.__name__,
-                len(delta_symbols), len(after))
+                len(matches), after_count)
+  matches.sort(key=lambda t: t[1])
+  return (matches, array.array('l', sorted(unmatched_before)),
+          array.array('l', sorted(unmatched_after)))
 
-  unmatched_before = []
-  for syms in before_symbols_by_key.itervalues():
-    unmatched_before.extend(syms)
-  return delta_symbols, unmatched_before, unmatched_after
 
+def IterDeltaSymbols(before, after):
+  """Yields DeltaSymbols that describe the changes from |before| to |after|.
+
+  Symbols are matched by successively looser keys. Rather than building an
+  index of one side, each pass sorts the keys of both sides and merges them,
+  so only the keys and indices of not-yet-matched symbols are held in memory.
+  When a group is backed by a SymbolStore, keys are read from its columns.
+
+  Args:
+    before: SymbolGroup of "before" symbols.
+    after: SymbolGroup of "after" symbols.
+  """
+  before_fields = _KeyFieldsGetter(before)
+  after_fields = _KeyFieldsGetter(after)
+  before_indices = array.array('l', xrange(len(before)))
+  after_indices = array.array('l', xrange(len(after)))
 
-def _DiffSymbolGroups(before, after):
   # For changed symbols, padding is zeroed out. In order to not lose the
   # information entirely, store it in aggregate.
   padding_by_section_name = collections.defaultdict(int)
 
-  # Usually >90% of symbols are exact matches, so all of the time is spent in
-  # this first pass.
-  all_deltas, before, after = _MatchSymbols(
-      before, after, _ExactMatchKey, padding_by_section_name)
-  for key_func in (_GoodMatchKey, _PoorMatchKey):
-    delta_syms, before, after = _MatchSymbols(
-        before, after, key_func, padding_by_section_name)
-    all_deltas.extend(delta_syms)
-
-  logging.debug('Creating %d unmatched symbols', len(after) + len(before))
-  for after_sym in after:
-    all_deltas.append(models.DeltaSymbol(None, after_sym))
-  for before_sym in before:
-    all_deltas.append(models.DeltaSymbol(before_sym, None))
+  # Usually >90% of symbols are exact matches, so most of the time is spent in
+  # the first pass.
+  for key_func in (_ExactMatchKey, _GoodMatchKey, _PoorMatchKey):
+    matches, before_indices, after_indices = _MatchSymbols(
+        before_indices, after_indices, before_fields, after_fields, key_func)
+    for before_idx, after_idx in matches:
+      before_sym = before[before_idx]
+      after_sym = after[after_idx]
+      # Padding tracked in aggregate, except for padding-only symbols.
+      if before_sym.size_without_padding != 0:
+        padding_by_section_name[before_sym.section_name] += (
+            after_sym.padding_pss - before_sym.padding_pss)
+      yield models.DeltaSymbol(before_sym, after_sym)
+
+  logging.debug('Creating %d unmatched symbols',
+                len(after_indices) + len(before_indices))
+  for after_idx in after_indices:
+    yield models.DeltaSymbol(None, after[after_idx])
+  for before_idx in before_indices:
+    yield models.DeltaSymbol(before[before_idx], None)
 
   # Create a DeltaSymbol to represent the zero'd out padding of matched symbols.
-  for section_name, padding in padding_by_section_name.iteritems():
+  for section_name, padding in sorted(padding_by_section_name.iteritems()):
     if padding != 0:
       after_sym = models.Symbol(section_name, padding,
                                 name="** aggregate padding of diff'ed symbols")
       after_sym.padding = padding
-      all_deltas.append(models.DeltaSymbol(None, after_sym))
+      yield models.DeltaSymbol(None, after_sym)
+
+
+def _DiffSymbolGroups(before, after):
+  return models.DeltaSymbolGroup(list(IterDeltaSymbols(before, after)))
 
-  return models.DeltaSymbolGroup(all_deltas)
 
+def _SumPssBySectionAndComponent(symbols):
+  """Returns a dict of (section_name, component) -> total pss of |symbols|."""
+  ret = collections.defaultdict(float)
+  stored = symbols._StoredSymbols()  # pylint: disable=protected-access
+  if stored is None:
+    for s in symbols:
+      ret[(s.section_name, s.component)] += s.pss
+    return ret
+  store = stored.store
+  pss_by_table_indices = collections.defaultdict(float)
+  for row in stored.indices:
+    key = (store.section_indices[row], store.component_indices[row])
+    pss_by_table_indices[key] += (
+        float(store.sizes[row]) / (store.num_aliases[row] or 1))
+  for (section_idx, component_idx), pss in pss_by_table_indices.iteritems():
+    key = (store.section_names[section_idx], store.components[component_idx])
+    ret[key] += pss
+  return ret
 
-def Diff(before, after):
-  """Diffs two SizeInfo objects. Returns a DeltaSizeInfo."""
+
+def _CreateSummarySymbols(pss_by_key):
+  ret = {}
+  for (section_name, component), pss in pss_by_key.iteritems():
+    sym = models.Symbol(section_name, int(round(pss)),
+                        full_name=component or _NO_COMPONENT_NAME)
+    sym.component = component
+    ret[(section_name, component)] = sym
+  return ret
+
+
+def _SummarizeSymbolGroups(before, after):
+  before_syms = _CreateSummarySymbols(_SumPssBySectionAndComponent(before))
+  after_syms = _CreateSummarySymbols(_SumPssBySectionAndComponent(after))
+  delta_symbols = []
+  for key in sorted(set(before_syms).union(after_syms)):
+    delta_symbols.append(
+        models.DeltaSymbol(before_syms.get(key), after_syms.get(key)))
+  return models.DeltaSymbolGroup(delta_symbols)
+
+
+def Diff(before, after, summary_only=False):
+  """Diffs two SizeInfo objects. Returns a DeltaSizeInfo.
+
+  Args:
+    before: SizeInfo for "before".
+    after: SizeInfo for "after".
+    summary_only: When True, symbols are not matched up. Instead, the result
+        contains one DeltaSymbol per (section, component), whose size is the
+        change in total PSS of that section & component.
+  """
   assert isinstance(before, models.SizeInfo)
   assert isinstance(after, models.SizeInfo)
   section_sizes = {k: after.section_sizes.get(k, 0) - v
@@ -126,5 +251,9 @@ def Diff(before, after):
     if k not in section_sizes:
       section_sizes[k] = v
 
-  symbol_diff = _DiffSymbolGroups(before.raw_symbols, after.raw_symbols)
-  return models.DeltaSizeInfo(before, after, section_sizes, symbol_diff)
+  if summary_only:
+    symbol_diff = _SummarizeSymbolGroups(before.raw_symbols, after.raw_symbols)
+  else:
+    symbol_diff = _DiffSymbolGroups(before.raw_symbols, after.raw_symbols)
+  return models.DeltaSizeInfo(before, after, section_sizes, symbol_diff,
+                              summary_only=summary_only)
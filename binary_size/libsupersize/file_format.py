@@ -67,22 +67,103 @@ a single symbol. Values are tab seperated and follow this format:
 symbol.full_name, symbol.num_aliases, symbol.flags
 |num_aliases| will be omitted if the aliases of the symbol are the same as the
 previous line. |flags| will be omitted if there are no flags.
+
+Columnar format
+---------------
+Version 2 of the format is not gzipped, so that it can be mmap()ed and have
+symbols created only when they are accessed. It starts with the same 4 header
+lines as above (with a different version string), but the JSON header also
+contains the path list, the component list, symbol counts by section, and the
+location of each column.
+
+The header is followed by zero-padding up to an 8-byte boundary, and then by
+a series of fixed-width column arrays (each also padded to 8 bytes). Every
+per-symbol column has one entry for each symbol, in the same order as for the
+text format. Unlike the text format, sizes include padding, and names are
+stored after normalization (so no post-processing is required after loading).
+Column widths do not depend on the host that wrote the file, and values are in
+the byte order given by the header.
+
+Names are stored in a string table: a "string_ends" column holding the end
+offset of each string within a "strings" blob. Each of full_name,
+template_name and name is stored as an index into this table.
 """
 
+import array
+import collections
 import cStringIO
 import contextlib
 import gzip
 import itertools
 import json
 import logging
+import mmap
 import os
 import shutil
+import struct
+import sys
 
 import models
 
 
 # File format version for .size files.
 _SERIALIZATION_VERSION = 'Size File Format v1'
+_COLUMNAR_SERIALIZATION_VERSION = 'Size File Format v2 (columnar)'
+
+_GZIP_MAGIC = '\x1f\x8b'
+_COLUMN_ALIGNMENT = 8
+
+# (name, struct format character) of each per-symbol column of the columnar
+# format. Standard struct sizes are used so that files can be loaded on hosts
+# with a different word size than the one they were written on.
+_SYMBOL_COLUMNS = (
+    ('addresses', 'q'),
+    ('sizes', 'q'),
+    ('paddings', 'i'),
+    ('path_indices', 'I'),
+    ('component_indices', 'I'),
+    ('flags', 'I'),
+    # 0 for symbols without aliases.
+    ('num_aliases', 'I'),
+    # Position of the symbol within its alias group.
+    ('alias_indices', 'I'),
+    ('full_name_indices', 'I'),
+    ('template_name_indices', 'I'),
+    ('name_indices', 'I'),
+)
+
+
+def _ArrayTypecode(column_format):
+  """Returns the array typecode whose items have the standard size of
+  |column_format|, or None if there is none on this platform.
+
+  Python 2 has no typecode for 8-byte integers, and 'l' is 8 bytes only on
+  LP64 hosts.
+  """
+  if column_format == 'c':
+    return 'c'
+  itemsize = struct.calcsize('=' + column_format)
+  candidates = 'bhil' if column_format.islower() else 'BHIL'
+  for typecode in candidates:
+    if array.array(typecode).itemsize == itemsize:
+      return typecode
+  return None
+
+
+def _NewColumn(column_format):
+  """Returns an empty column of |column_format| items.
+
+  The column is an array.array when possible, and a list otherwise.
+  """
+  typecode = _ArrayTypecode(column_format)
+  return array.array(typecode) if typecode else []
+
+
+def _ColumnToString(values, column_format):
+  """Returns the native byte order data of |values|."""
+  if isinstance(values, array.array):
+    return values.tostring()
+  return struct.pack('=%d%s' % (len(values), column_format), *values)
 
 
 def _LogSize(file_obj, desc):
@@ -340,6 +421,201 @@ def _LoadSizeInfoFromFile(file_obj, size_path):
                          size_path=size_path)
 
 
+def _Align(offset):
+  return (offset + _COLUMN_ALIGNMENT - 1) & ~(_COLUMN_ALIGNMENT - 1)
+
+
+def _SaveColumnarSizeInfoToFile(size_info, file_obj):
+  """Saves size info to a columnar .size file.
+
+  Args:
+    size_info: Data to write to the file
+    file_object: File opened for writing
+  """
+  raw_symbols = size_info.raw_symbols
+  unique_path_tuples = sorted(set(
+      (s.object_path, s.source_path) for s in raw_symbols))
+  path_tuples = {tup: i for i, tup in enumerate(unique_path_tuples)}
+  unique_components = sorted(set(s.component for s in raw_symbols))
+  components = {comp: i for i, comp in enumerate(unique_components)}
+  by_section = raw_symbols.GroupedBySectionName()
+
+  column_formats = dict(_SYMBOL_COLUMNS)
+  column_formats['string_ends'] = 'I'
+  column_formats['strings'] = 'c'
+  columns = collections.OrderedDict(
+      (name, _NewColumn(column_format))
+      for name, column_format in _SYMBOL_COLUMNS)
+  string_indices = {}
+  string_ends = _NewColumn('I')
+  strings = cStringIO.StringIO()
+
+  def string_index(value):
+    ret = string_indices.get(value)
+    if ret is None:
+      ret = len(string_ends)
+      string_indices[value] = ret
+      strings.write(value)
+      string_ends.append(strings.tell())
+    return ret
+
+  prev_aliases = None
+  alias_index = 0
+  for group in by_section:
+    for symbol in group:
+      columns['addresses'].append(symbol.address)
+      columns['sizes'].append(symbol.size)
+      columns['paddings'].append(symbol.padding)
+      columns['path_indices'].append(
+          path_tuples[(symbol.object_path, symbol.source_path)])
+      columns['component_indices'].append(components[symbol.component])
+      columns['flags'].append(symbol.flags)
+      if symbol.aliases and symbol.aliases is prev_aliases:
+        alias_index += 1
+      else:
+        alias_index = 0
+      prev_aliases = symbol.aliases
+      columns['num_aliases'].append(len(symbol.aliases or ()))
+      columns['alias_indices'].append(alias_index)
+      columns['full_name_indices'].append(string_index(symbol.full_name))
+      columns['template_name_indices'].append(
+          string_index(symbol.template_name))
+      columns['name_indices'].append(string_index(symbol.name))
+  columns['string_ends'] = string_ends
+  columns['strings'] = array.array('c', strings.getvalue())
+
+  # Offsets are relative to the (aligned) end of the header.
+  column_infos = {}
+  offset = 0
+  for name, values in columns.iteritems():
+    column_format = column_formats[name]
+    itemsize = struct.calcsize('=' + column_format)
+    column_infos[name] = [offset, column_format, itemsize, len(values)]
+    offset = _Align(offset + itemsize * len(values))
+
+  headers = {
+      'metadata': size_info.metadata,
+      'section_sizes': size_info.section_sizes,
+      'section_names': [g.name for g in by_section],
+      'section_counts': [len(g) for g in by_section],
+      'paths': unique_path_tuples,
+      'components': unique_components,
+      'columns': column_infos,
+      'byteorder': sys.byteorder,
+  }
+  metadata_str = json.dumps(headers, indent=2, sort_keys=True)
+  header = '# Created by //tools/binary_size\n%s\n%d\n%s\n' % (
+      _COLUMNAR_SERIALIZATION_VERSION, len(metadata_str), metadata_str)
+  file_obj.write(header)
+  file_obj.write('\0' * (_Align(len(header)) - len(header)))
+  _LogSize(file_obj, 'header')
+
+  for name, values in columns.iteritems():
+    data = _ColumnToString(values, column_formats[name])
+    file_obj.write(data)
+    file_obj.write('\0' * (_Align(len(data)) - len(data)))
+    _LogSize(file_obj, name)
+
+
+class _StringTable(object):
+  """A read-only list of the strings within a columnar .size file.
+
+  Strings are sliced out of the buffer upon first access.
+  """
+
+  def __init__(self, buf, offset, string_ends):
+    self._buf = buf
+    self._offset = offset
+    self._string_ends = string_ends
+    self._strings = [None] * len(string_ends)
+
+  def __len__(self):
+    return len(self._strings)
+
+  def __iter__(self):
+    return (self[i] for i in xrange(len(self._strings)))
+
+  def __getitem__(self, idx):
+    ret = self._strings[idx]
+    if ret is None:
+      start = self._offset + (self._string_ends[idx - 1] if idx else 0)
+      ret = self._buf[start:self._offset + self._string_ends[idx]]
+      # Use a bit less RAM by using the same instance for this common string.
+      if ret == models.STRING_LITERAL_NAME:
+        ret = models.STRING_LITERAL_NAME
+      self._strings[idx] = ret
+    return ret
+
+
+def _ReadColumn(buf, data_offset, column_info, byteorder):
+  offset, column_format, itemsize, length = column_info
+  column_format = str(column_format)
+  assert struct.calcsize('=' + column_format) == itemsize, (
+      'Column has an unsupported item size.')
+  start = data_offset + offset
+  data = buf[start:start + itemsize * length]
+  typecode = _ArrayTypecode(column_format)
+  if typecode is None:
+    order = '<' if byteorder == 'little' else '>'
+    return list(struct.unpack('%s%d%s' % (order, length, column_format), data))
+  ret = array.array(typecode)
+  ret.fromstring(data)
+  if byteorder != sys.byteorder:
+    ret.byteswap()
+  return ret
+
+
+def _LoadColumnarSizeInfo(buf, size_path):
+  """Loads a size_info from the given buffer (a string or an mmap).
+
+  See _SaveColumnarSizeInfoToFile for details on the .size file format.
+  """
+  pos = buf.find('\n') + 1  # Line 0: Created by supersize header
+  end = buf.find('\n', pos)
+  actual_version = buf[pos:end]
+  assert actual_version == _COLUMNAR_SERIALIZATION_VERSION, (
+      'Version mismatch. Need to write some upgrade code.')
+  pos = end + 1
+  end = buf.find('\n', pos)
+  json_len = int(buf[pos:end])
+  pos = end + 1
+  headers = json.loads(buf[pos:pos + json_len])
+  data_offset = _Align(pos + json_len + 1)
+
+  column_infos = headers['columns']
+  byteorder = headers['byteorder']
+  columns = {name: _ReadColumn(buf, data_offset, column_infos[name], byteorder)
+             for name, _ in _SYMBOL_COLUMNS}
+  section_indices = array.array('H')
+  for i, count in enumerate(headers['section_counts']):
+    section_indices.extend(array.array('H', [i]) * count)
+  columns['section_indices'] = section_indices
+  string_ends = _ReadColumn(
+      buf, data_offset, column_infos['string_ends'], byteorder)
+  strings = _StringTable(
+      buf, data_offset + column_infos['strings'][0], string_ends)
+
+  # JSON decodes to unicode, but symbol fields are always str.
+  encode = lambda value: value.encode('utf-8')
+  store = models.SymbolStore(
+      columns, [encode(n) for n in headers['section_names']],
+      [(encode(o), encode(p)) for o, p in headers['paths']],
+      [encode(c) for c in headers['components']], strings)
+  return models.SizeInfo(headers['section_sizes'],
+                         models.SymbolGroup(store.Symbols()),
+                         metadata=headers.get('metadata'), size_path=size_path)
+
+
+def IsColumnar(size_info):
+  """Returns whether |size_info| was loaded from a columnar .size file.
+
+  Columnar files store names and padding in their final form, so symbols
+  loaded from them do not need to be post-processed.
+  """
+  # pylint: disable=protected-access
+  return isinstance(size_info.raw_symbols._symbols, models.StoredSymbolList)
+
+
 @contextlib.contextmanager
 def _OpenGzipForWrite(path):
   # Open in a way that doesn't set any gzip header fields.
@@ -348,9 +624,19 @@ def _OpenGzipForWrite(path):
       yield fz
 
 
-def SaveSizeInfo(size_info, path):
-  """Saves |size_info| to |path}."""
-  if os.environ.get('SUPERSIZE_MEASURE_GZIP') == '1':
+def SaveSizeInfo(size_info, path, text_format=False):
+  """Saves |size_info| to |path}.
+
+  Args:
+    size_info: Data to write.
+    path: Path of the .size file.
+    text_format: When True, writes the gzipped text format (v1) rather than
+        the columnar format.
+  """
+  if not text_format:
+    with open(path, 'wb') as f:
+      _SaveColumnarSizeInfoToFile(size_info, f)
+  elif os.environ.get('SUPERSIZE_MEASURE_GZIP') == '1':
     with _OpenGzipForWrite(path) as f:
       _SaveSizeInfoToFile(size_info, f)
   else:
@@ -365,6 +651,24 @@ def SaveSizeInfo(size_info, path):
 
 
 def LoadSizeInfo(filename, fileobj=None):
-  """Returns a SizeInfo loaded from |filename|."""
-  with gzip.GzipFile(filename=filename, fileobj=fileobj) as f:
-    return _LoadSizeInfoFromFile(f, filename)
+  """Returns a SizeInfo loaded from |filename|.
+
+  Columnar .size files are mmap()ed when possible, and their symbols are
+  backed by a models.SymbolStore.
+  """
+  if fileobj is None:
+    with open(filename, 'rb') as f:
+      return LoadSizeInfo(filename, f)
+  magic = fileobj.read(len(_GZIP_MAGIC))
+  fileobj.seek(0)
+  if magic == _GZIP_MAGIC:
+    with gzip.GzipFile(filename=filename, fileobj=fileobj) as f:
+      return _LoadSizeInfoFromFile(f, filename)
+  try:
+    # The mapping remains valid after |fileobj| is closed.
+    buf = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+  except (AttributeError, ValueError, EnvironmentError):
+    # E.g. For StringIO objects (AttributeError), empty files (ValueError), or
+    # files that cannot be mapped (mmap.error, an EnvironmentError).
+    buf = fileobj.read()
+  return _LoadColumnarSizeInfo(buf, filename)
@@ -6,9 +6,11 @@
 
 import codecs
 import collections
+import hashlib
 import json
 import logging
 import os
+import posixpath
 
 import archive
 import diff
@@ -28,6 +30,12 @@ _COMPACT_SYMBOL_BYTE_SIZE_KEY = 'b'
 _COMPACT_SYMBOL_TYPE_KEY = 't'
 _COMPACT_SYMBOL_COUNT_KEY = 'u'
 _COMPACT_SYMBOL_FLAGS_KEY = 'f'
+_COMPACT_SHARD_DIR_KEY = 'd'
+_COMPACT_SHARD_FILE_KEY = 'h'
+_COMPACT_SHARD_STATS_KEY = 's'
+
+_INDEX_FILENAME = 'index.json'
+_SHARDS_DIRNAME = 'shards'
 
 _SMALL_SYMBOL_DESCRIPTIONS = {
   'b': 'Other small uninitialized data',
@@ -44,6 +52,13 @@ _SMALL_SYMBOL_DESCRIPTIONS = {
 
 _DEFAULT_SYMBOL_COUNT = 250000
 
+# Use separators without whitespace to get a smaller file.
+_JSON_DUMP_ARGS = {
+  'separators': (',', ':'),
+  'ensure_ascii': True,
+  'check_circular': False,
+}
+
 
 def _GetSymbolType(symbol):
   symbol_type = symbol.section
@@ -174,18 +189,8 @@ def _MakeTreeViewList(symbols, include_all_symbols):
   return meta, file_nodes.values()
 
 
-def BuildReport(out_file, size_file, before_size_file=(None, None),
-                all_symbols=False):
-  """Builds a .ndjson report for a .size file.
-
-  Args:
-    out_file: File object to save JSON report to.
-    size_file: Size file to use as input. Tuple of path and file object.
-    before_size_file: If used, creates a diff report where |size_file| is the
-      newer .size file. Tuple of path and file object.
-    all_symbols: If true, all symbols will be included in the report rather
-      than truncated.
-  """
+def _MakeReportData(size_file, before_size_file, all_symbols):
+  """Returns (meta, file_nodes) for BuildReport() / BuildShardedReport()."""
   logging.info('Reading .size file')
   diff_mode = any(before_size_file)
 
@@ -213,24 +218,111 @@ def BuildReport(out_file, size_file, before_size_file=(None, None),
     })
   else:
     meta['metadata'] = size_info.metadata
+  return meta, tree_nodes
+
+
+def BuildReport(out_file, size_file, before_size_file=(None, None),
+                all_symbols=False):
+  """Builds a .ndjson report for a .size file.
+
+  Args:
+    out_file: File object to save JSON report to.
+    size_file: Size file to use as input. Tuple of path and file object.
+    before_size_file: If used, creates a diff report where |size_file| is the
+      newer .size file. Tuple of path and file object.
+    all_symbols: If true, all symbols will be included in the report rather
+      than truncated.
+  """
+  meta, tree_nodes = _MakeReportData(size_file, before_size_file, all_symbols)
 
   # Write newline-delimited JSON file
   logging.info('Serializing JSON')
-  # Use separators without whitespace to get a smaller file.
-  json_dump_args = {
-    'separators': (',', ':'),
-    'ensure_ascii': True,
-    'check_circular': False,
-  }
-
-  json.dump(meta, out_file, **json_dump_args)
+  json.dump(meta, out_file, **_JSON_DUMP_ARGS)
   out_file.write('\n')
 
   for tree_node in tree_nodes:
-    json.dump(tree_node, out_file, **json_dump_args)
+    json.dump(tree_node, out_file, **_JSON_DUMP_ARGS)
     out_file.write('\n')
 
 
+def _ComputeShardStats(file_nodes):
+  """Returns {symbol_type: {size, count}} for the symbols in |file_nodes|.
+
+  Matches the childStats that the viewer computes when it loads the shard, so
+  that directories can be shown (and sorted) before their shard is fetched.
+  """
+  stats = {}
+  for file_node in file_nodes:
+    for symbol_entry in file_node[_COMPACT_FILE_SYMBOLS_KEY]:
+      symbol_type = symbol_entry[_COMPACT_SYMBOL_TYPE_KEY]
+      stat = stats.get(symbol_type)
+      if stat is None:
+        stat = {_COMPACT_SYMBOL_BYTE_SIZE_KEY: 0, _COMPACT_SYMBOL_COUNT_KEY: 0}
+        stats[symbol_type] = stat
+      stat[_COMPACT_SYMBOL_BYTE_SIZE_KEY] += (
+          symbol_entry[_COMPACT_SYMBOL_BYTE_SIZE_KEY])
+      stat[_COMPACT_SYMBOL_COUNT_KEY] += (
+          symbol_entry.get(_COMPACT_SYMBOL_COUNT_KEY) or 1)
+  return stats
+
+
+def BuildShardedReport(out_dir, size_file, before_size_file=(None, None)):
+  """Builds a report split into one .ndjson shard per source directory.
+
+  The viewer loads only the small index file up-front, and fetches each
+  directory's shard when it is expanded. Since shards are loaded on demand,
+  all symbols are included (small symbols are never lumped together).
+
+  Writes:
+    out_dir/index.json: A single line of JSON:
+        {"meta": <same as the first line of BuildReport()>,
+         "shards": [{"d": directory, "h": shard path, "s": symbol stats}]}
+    out_dir/shards/<hash>.ndjson: File entries for a single directory. Named
+        by the hash of their contents so that they can be cached indefinitely.
+
+  Args:
+    out_dir: Directory to write the report to.
+    size_file: Size file to use as input. Tuple of path and file object.
+    before_size_file: If used, creates a diff report where |size_file| is the
+      newer .size file. Tuple of path and file object.
+  """
+  meta, tree_nodes = _MakeReportData(size_file, before_size_file, True)
+
+  nodes_by_dir = collections.defaultdict(list)
+  for tree_node in tree_nodes:
+    # Same as dirname() in tree-worker.js, which differs from posixpath.dirname
+    # for paths that start with "/".
+    path = tree_node[_COMPACT_FILE_PATH_KEY]
+    nodes_by_dir[path[:max(path.rfind('/'), 0)]].append(tree_node)
+
+  logging.info('Writing %d shards', len(nodes_by_dir))
+  shards_dir = os.path.join(out_dir, _SHARDS_DIRNAME)
+  _MakeDirIfDoesNotExist(shards_dir)
+  shards = []
+  shard_names = set()
+  for dir_path, file_nodes in sorted(nodes_by_dir.iteritems()):
+    data = ''.join(json.dumps(n, **_JSON_DUMP_ARGS) + '\n' for n in file_nodes)
+    shard_path = posixpath.join(
+        _SHARDS_DIRNAME, hashlib.sha1(data).hexdigest()[:16] + '.ndjson')
+    shard_names.add(posixpath.basename(shard_path))
+    with open(os.path.join(out_dir, shard_path), 'wb') as out_file:
+      out_file.write(data)
+    shards.append({
+      _COMPACT_SHARD_DIR_KEY: dir_path,
+      _COMPACT_SHARD_FILE_KEY: shard_path,
+      _COMPACT_SHARD_STATS_KEY: _ComputeShardStats(file_nodes),
+    })
+
+  with open(os.path.join(out_dir, _INDEX_FILENAME), 'wb') as out_file:
+    json.dump({'meta': meta, 'shards': shards}, out_file, **_JSON_DUMP_ARGS)
+    out_file.write('\n')
+
+  # Remove shards left over from previous reports written to the same directory.
+  for name in os.listdir(shards_dir):
+    if name.endswith('.ndjson') and name not in shard_names:
+      os.remove(os.path.join(shards_dir, name))
+
+
 def _MakeDirIfDoesNotExist(rel_path):
   """Ensures a directory exists."""
   abs_path = os.path.abspath(rel_path)
@@ -244,9 +336,16 @@ def _MakeDirIfDoesNotExist(rel_path):
 def AddArguments(parser):
   parser.add_argument('input_file',
                       help='Path to input .size file.')
-  parser.add_argument('--report-file', metavar='PATH', required=True,
-                      help='Write generated data to the specified '
-                           '.ndjson file.')
+  output_group = parser.add_mutually_exclusive_group(required=True)
+  output_group.add_argument('--report-file', metavar='PATH',
+                            help='Write generated data to the specified '
+                                 '.ndjson file.')
+  output_group.add_argument('--report-dir', metavar='PATH',
+                            help='Write generated data as per-directory '
+                                 'shards (plus an index) to the specified '
+                                 'directory. The viewer loads shards as '
+                                 'directories are expanded, so all symbols '
+                                 'are included.')
   parser.add_argument('--all-symbols', action='store_true',
                       help='Include all symbols. Will cause the data file to '
                            'take longer to load.')
@@ -259,6 +358,20 @@ def Run(args, parser):
     parser.error('Input must end with ".size"')
   if args.diff_with and not args.diff_with.endswith('.size'):
     parser.error('Diff input must end with ".size"')
+  if args.report_dir:
+    if args.all_symbols:
+      parser.error('--all-symbols is implied by --report-dir')
+    BuildShardedReport(
+      args.report_dir,
+      size_file=(args.input_file, None),
+      before_size_file=(args.diff_with, None),
+    )
+    logging.warning('Report saved to %s', args.report_dir)
+    logging.warning('Open server by running: \n'
+                    'tools/binary_size/supersize start_server %s',
+                    args.report_dir)
+    return
+
   if not args.report_file.endswith('.ndjson'):
     parser.error('Output must end with ".ndjson"')
 
@@ -5,9 +5,12 @@
 
 import contextlib
 import copy
+import cStringIO
 import difflib
+import errno
 import glob
 import itertools
+import json
 import logging
 import os
 import unittest
@@ -22,7 +25,9 @@ import archive
 import describe
 import diff
 import file_format
+import html_report
 import models
+import size_index
 
 
 _SCRIPT_DIR = os.path.dirname(__file__)
@@ -200,7 +205,8 @@ class IntegrationTest(unittest.TestCase):
     return copy.deepcopy(IntegrationTest.cached_size_info[cache_key])
 
   def _DoArchive(self, archive_path, use_output_directory=True, use_elf=True,
-                 use_apk=False, use_pak=False, debug_measures=False):
+                 use_apk=False, use_pak=False, debug_measures=False,
+                 text_format=False, cache_dir=None):
     args = [
       archive_path,
       '--map-file', _TEST_MAP_PATH,
@@ -219,15 +225,21 @@ class IntegrationTest(unittest.TestCase):
     if use_pak:
       args += ['--pak-file', _TEST_APK_PAK_PATH,
                '--pak-info-file', _TEST_PAK_INFO_PATH]
+    if text_format:
+      args += ['--text-format']
+    if cache_dir:
+      args += ['--cache-dir', cache_dir]
     _RunApp('archive', args, debug_measures=debug_measures)
 
   def _DoArchiveTest(self, use_output_directory=True, use_elf=True,
-                     use_apk=False, use_pak=False, debug_measures=False):
+                     use_apk=False, use_pak=False, debug_measures=False,
+                     text_format=False, cache_dir=None):
     with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
       self._DoArchive(
           temp_file.name, use_output_directory=use_output_directory,
           use_elf=use_elf, use_apk=use_apk, use_pak=use_pak,
-          debug_measures=debug_measures)
+          debug_measures=debug_measures, text_format=text_format,
+          cache_dir=cache_dir)
       size_info = archive.LoadAndPostProcessSizeInfo(temp_file.name)
     # Check that saving & loading is the same as directly parsing.
     expected_size_info = self._CloneSizeInfo(
@@ -273,6 +285,129 @@ class IntegrationTest(unittest.TestCase):
   def test_Archive_Elf_DebugMeasures(self):
     return self._DoArchiveTest(debug_measures=True)
 
+  @_CompareWithGolden(name='Archive_Elf')
+  def test_Archive_Elf_TextFormat(self):
+    return self._DoArchiveTest(text_format=True)
+
+  @_CompareWithGolden(name='Archive_Elf')
+  def test_Archive_Elf_DebugMeasures_TextFormat(self):
+    return self._DoArchiveTest(debug_measures=True, text_format=True)
+
+  @_CompareWithGolden(name='Archive_Elf')
+  def test_Archive_Elf_Cached(self):
+    cache_dir = tempfile.mkdtemp()
+    try:
+      # The first run populates the cache, and the second reads from it.
+      cold_lines = list(self._DoArchiveTest(cache_dir=cache_dir))
+      for stage in ('nm-elf', 'nm-intermediates', 'demangle', 'owners',
+                    'string-positions'):
+        self.assertTrue(os.listdir(os.path.join(cache_dir, stage)), stage)
+      warm_lines = list(self._DoArchiveTest(cache_dir=cache_dir))
+      self.assertEquals(cold_lines, warm_lines)
+      return warm_lines
+    finally:
+      shutil.rmtree(cache_dir)
+
+  def test_LoadSizeInfo_FromStringIO(self):
+    size_info = self._CloneSizeInfo()
+    with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
+      file_format.SaveSizeInfo(size_info, temp_file.name)
+      data = temp_file.read()
+    loaded = file_format.LoadSizeInfo('x.size', cStringIO.StringIO(data))
+    self.assertTrue(file_format.IsColumnar(loaded))
+    # Access out of order to ensure aliases are created correctly.
+    loaded_syms = list(reversed(loaded.raw_symbols))[::-1]
+    self.assertEquals([repr(s) for s in size_info.raw_symbols],
+                      [repr(s) for s in loaded_syms])
+
+  def test_LoadSizeInfo_Unmappable(self):
+    size_info = self._CloneSizeInfo()
+    with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
+      file_format.SaveSizeInfo(size_info, temp_file.name)
+      orig_mmap = file_format.mmap.mmap
+      def FailingMmap(*args, **kwargs):
+        raise file_format.mmap.error(errno.ENODEV, 'No such device')
+      file_format.mmap.mmap = FailingMmap
+      try:
+        loaded = file_format.LoadSizeInfo(temp_file.name)
+      finally:
+        file_format.mmap.mmap = orig_mmap
+    self.assertEquals([repr(s) for s in size_info.raw_symbols],
+                      [repr(s) for s in loaded.raw_symbols])
+
+  def test_LoadSizeInfo_Empty(self):
+    with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
+      # mmap() fails on empty files, so this is read like any other bad file.
+      self.assertRaisesRegexp(AssertionError, 'Version mismatch',
+                              file_format.LoadSizeInfo, temp_file.name)
+
+  def test_LoadSizeInfo_PortableColumns(self):
+    size_info = self._CloneSizeInfo()
+    with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
+      file_format.SaveSizeInfo(size_info, temp_file.name)
+      data = temp_file.read()
+    headers = json.loads(data.split('\n', 3)[3][:int(data.split('\n')[2])])
+    self.assertEquals(['q', 8], headers['columns']['addresses'][1:3])
+    self.assertEquals(['i', 4], headers['columns']['paddings'][1:3])
+
+    # Simulate a host without an 8-byte array typecode (e.g. 32-bit builds).
+    orig_array_typecode = file_format._ArrayTypecode
+    file_format._ArrayTypecode = (
+        lambda f: None if f == 'q' else orig_array_typecode(f))
+    try:
+      loaded = file_format.LoadSizeInfo('x.size', cStringIO.StringIO(data))
+      self.assertEquals([repr(s) for s in size_info.raw_symbols],
+                        [repr(s) for s in loaded.raw_symbols])
+    finally:
+      file_format._ArrayTypecode = orig_array_typecode
+
+  def test_SymbolStore(self):
+    raw_symbols = self._CloneSizeInfo().raw_symbols
+    store = models.SymbolStore.FromSymbols(raw_symbols)
+    stored_symbols = models.SymbolGroup(store.Symbols())
+
+    def assert_same(func):
+      expected = describe.GenerateLines(func(raw_symbols), recursive=True,
+                                        verbose=True)
+      actual = describe.GenerateLines(func(stored_symbols), recursive=True,
+                                      verbose=True)
+      self.assertEquals(list(expected), list(actual))
+
+    # Methods with SymbolStore-specific implementations.
+    assert_same(lambda g: g.WhereSizeBiggerThan(50))
+    assert_same(lambda g: g.WhereSizeBiggerThan(50).Inverted())
+    assert_same(lambda g: g.WhereInSection('.text'))
+    assert_same(lambda g: g.WhereInSection('rd'))
+    assert_same(lambda g: g.WhereAddressInRange(0x2a0000, 0x2a1000))
+    assert_same(lambda g: g.SortedByAddress(reverse=True))
+    assert_same(lambda g: g.GroupedByPath(depth=1))
+    assert_same(lambda g: g.GroupedByPath(min_count=-2).Inverted())
+    assert_same(lambda g: g.GroupedBySectionName())
+    # Generic methods.
+    assert_same(lambda g: g.WhereNameMatches('Alias').Sorted())
+    assert_same(lambda g: g._Clustered())
+
+    # Aliases and views are shared.
+    sym = stored_symbols.Filter(lambda s: s.num_aliases == 4)[0]
+    self.assertIs(sym, sym.aliases[sym.aliases.index(sym)])
+    self.assertIs(sym.aliases, sym.aliases[-1].aliases)
+    self.assertIs(sym, stored_symbols[stored_symbols.index(sym)])
+
+    # Fields are writable.
+    size = sym.size
+    sym.size += 1
+    sym.full_name = 'NewName'
+    sym.source_path = 'new/path.cc'
+    self.assertEquals(size + 1, sym.size)
+    self.assertEquals('NewName', sym.full_name)
+    self.assertEquals('new/path.cc', sym.source_path)
+    self.assertEquals(1, len(stored_symbols.WhereSourcePathMatches('new/')))
+    num_components = len(store.components)
+    for other_sym in stored_symbols[:3]:
+      other_sym.component = 'New>Component'
+    self.assertEquals(num_components + 1, len(store.components))
+    self.assertEquals(3, len(stored_symbols.WhereComponentMatches('New>')))
+
   @_CompareWithGolden()
   def test_Console(self):
     with tempfile.NamedTemporaryFile(suffix='.size') as size_file, \
@@ -324,6 +459,44 @@ class IntegrationTest(unittest.TestCase):
         self.assertTrue(prev_contents is None or contents == prev_contents)
         prev_contents = contents
 
+  # Checks that a sharded report contains the same data as a regular one.
+  def test_ShardedHtmlReport(self):
+    report_dir = tempfile.mkdtemp()
+    try:
+      with tempfile.NamedTemporaryFile(suffix='.size') as temp_file:
+        file_format.SaveSizeInfo(self._CloneSizeInfo(), temp_file.name)
+        report_file = cStringIO.StringIO()
+        html_report.BuildReport(report_file, (temp_file.name, None),
+                                all_symbols=True)
+        html_report.BuildShardedReport(report_dir, (temp_file.name, None))
+      expected_lines = report_file.getvalue().splitlines()
+
+      with open(os.path.join(report_dir, 'index.json')) as index_file:
+        index = json.load(index_file)
+      self.assertEquals(json.loads(expected_lines[0]), index['meta'])
+
+      actual_entries = []
+      shard_files = set()
+      for shard in index['shards']:
+        shard_files.add(shard['h'])
+        with open(os.path.join(report_dir, shard['h'])) as shard_file:
+          entries = [json.loads(l) for l in shard_file]
+        self.assertTrue(all(
+            os.path.dirname(e['p']) == shard['d'] for e in entries))
+        self.assertEquals(sum(s['b'] for s in shard['s'].itervalues()),
+                          sum(sym['b'] for e in entries for sym in e['s']))
+        actual_entries.extend(entries)
+      expected_entries = [json.loads(l) for l in expected_lines[1:]]
+      key = lambda e: e['p']
+      self.assertEquals(sorted(expected_entries, key=key),
+                        sorted(actual_entries, key=key))
+      self.assertEquals(
+          shard_files,
+          set('shards/' + n for n in os.listdir(
+              os.path.join(report_dir, 'shards'))))
+    finally:
+      shutil.rmtree(report_dir)
+
   @_CompareWithGolden()
   def test_Diff_Basic(self):
     size_info1 = self._CloneSizeInfo(use_elf=False)
@@ -351,6 +524,123 @@ class IntegrationTest(unittest.TestCase):
 
     return describe.GenerateLines(d, verbose=True)
 
+  def _CreateDiffInputs(self):
+    size_info1 = self._CloneSizeInfo(use_elf=False)
+    size_info2 = self._CloneSizeInfo(use_elf=False)
+    size_info1.raw_symbols -= size_info1.raw_symbols[:2]
+    size_info2.raw_symbols -= size_info2.raw_symbols[-3:]
+    changed_sym = size_info1.raw_symbols.WhereNameMatches('Patcher::Name_')[0]
+    changed_sym.size -= 10
+    padding_sym = size_info2.raw_symbols.WhereNameMatches('symbol gap 0')[0]
+    padding_sym.padding += 20
+    padding_sym.size += 20
+    return size_info1, size_info2
+
+  def test_Diff_SymbolStore(self):
+    size_info1, size_info2 = self._CreateDiffInputs()
+    expected = diff.Diff(size_info1, size_info2)
+    for size_info in (size_info1, size_info2):
+      store = models.SymbolStore.FromSymbols(size_info.raw_symbols)
+      size_info.raw_symbols = models.SymbolGroup(store.Symbols())
+    actual = diff.Diff(size_info1, size_info2)
+    self.assertEquals(
+        list(describe.GenerateLines(expected.raw_symbols, verbose=True)),
+        list(describe.GenerateLines(actual.raw_symbols, verbose=True)))
+
+  @_CompareWithGolden()
+  def test_Diff_SummaryOnly(self):
+    size_info1, size_info2 = self._CreateDiffInputs()
+    full = diff.Diff(size_info1, size_info2)
+    summary = diff.Diff(size_info1, size_info2, summary_only=True)
+    self.assertEquals(full.section_sizes, summary.section_sizes)
+    self.assertAlmostEquals(full.raw_symbols.pss, summary.raw_symbols.pss,
+                            delta=len(summary.raw_symbols))
+    # Stored symbols are summed via their columns.
+    for size_info in (size_info1, size_info2):
+      store = models.SymbolStore.FromSymbols(size_info.raw_symbols)
+      size_info.raw_symbols = models.SymbolGroup(store.Symbols())
+    stored_summary = diff.Diff(size_info1, size_info2, summary_only=True)
+    lines = list(describe.GenerateLines(summary))
+    self.assertEquals(lines, list(describe.GenerateLines(stored_summary)))
+    csv_lines = list(describe.GenerateLines(summary, format_name='csv'))
+    self.assertIn('.data,Internal>Android,160.0,164.0,4.0', csv_lines)
+    return lines
+
+  def _TestSizeIndex(self):
+    size_info1, size_info2 = self._CreateDiffInputs()
+    size_dir = tempfile.mkdtemp()
+    try:
+      index_dir = os.path.join(size_dir, '.size_index')
+      os.mkdir(os.path.join(size_dir, 'sub'))
+      path1 = os.path.join(size_dir, 'sub', 'M9.size')
+      path2 = os.path.join(size_dir, 'M10.size')
+      file_format.SaveSizeInfo(size_info1, path1)
+      file_format.SaveSizeInfo(size_info2, path2)
+
+      index = size_index.SizeIndex(index_dir)
+      self.assertEquals((2, 0), index.Update(size_dir))
+      # Re-opening reads the existing index, and finds nothing to update.
+      index = size_index.SizeIndex(index_dir)
+      self.assertEquals((0, 0), index.Update(size_dir))
+      self.assertEquals(['M10.size', 'sub/M9.size'],
+                        [b.name for b in index.GetBuilds()])
+
+      def expected_sizes(kind, key):
+        ret = []
+        for path in (path2, path1):
+          symbols = archive.LoadAndPostProcessSizeInfo(path).raw_symbols
+          if kind == size_index.KIND_SYMBOL:
+            symbols = symbols.Filter(lambda s: s.full_name == key)
+          elif kind == size_index.KIND_PATH:
+            symbols = symbols.Filter(
+                lambda s: s.source_path and s.source_path.startswith(key))
+          else:
+            symbols = symbols.Filter(lambda s: s.component == key)
+          ret.append(symbols.pss)
+        return ret
+
+      queries = [
+        (size_index.KIND_SYMBOL, 'chrome::mojom::FilePatcher::Name_'),
+        (size_index.KIND_PATH, 'third_party/'),
+        (size_index.KIND_COMPONENT, 'Blink>Internal'),
+      ]
+      for kind, key in queries:
+        actual = [pss for _, pss in index.Query(kind, key)]
+        for a, e in zip(actual, expected_sizes(kind, key)):
+          self.assertAlmostEquals(e, a)
+      self.assertEquals([0, 0], [pss for _, pss in index.Query(
+          size_index.KIND_SYMBOL, 'does not exist')])
+      self.assertIn('chrome::mojom::FilePatcher::Name_',
+                    index.FindKeys(size_index.KIND_SYMBOL, 'Patcher'))
+
+      # Changed files are re-indexed, and deleted ones are removed.
+      size_info2.raw_symbols -= size_info2.raw_symbols.WhereNameMatches(
+          'Patcher::Name_')
+      file_format.SaveSizeInfo(size_info2, path2)
+      os.utime(path2, (0, 0))
+      self.assertEquals((1, 1), index.Update(size_dir))
+      os.unlink(path1)
+      self.assertEquals((0, 1), index.Update(size_dir))
+      self.assertEquals(
+          [0], [pss for _, pss in index.Query(*queries[0])])
+    finally:
+      shutil.rmtree(size_dir)
+
+  def test_SizeIndex(self):
+    self._TestSizeIndex()
+
+  def test_SizeIndex_SmallBuckets(self):
+    # Flush after every build, and split buckets many times.
+    builds_per_flush = size_index._BUILDS_PER_FLUSH
+    max_keys_per_bucket = size_index._MAX_KEYS_PER_BUCKET
+    size_index._BUILDS_PER_FLUSH = 1
+    size_index._MAX_KEYS_PER_BUCKET = 4
+    try:
+      self._TestSizeIndex()
+    finally:
+      size_index._BUILDS_PER_FLUSH = builds_per_flush
+      size_index._MAX_KEYS_PER_BUCKET = max_keys_per_bucket
+
   def test_Diff_Aliases1(self):
     size_info1 = self._CloneSizeInfo()
     size_info2 = self._CloneSizeInfo()
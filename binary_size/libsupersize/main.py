@@ -18,6 +18,7 @@ import sys
 import archive
 import console
 import html_report
+import size_index
 import start_server
 
 
@@ -43,12 +44,19 @@ class _DiffAction(object):
     parser.add_argument('before', help='Before-patch .size file.')
     parser.add_argument('after', help='After-patch .size file.')
     parser.add_argument('--all', action='store_true', help='Verbose diff')
+    parser.add_argument('--summary-only', action='store_true',
+                        help='Show only per-section and per-component deltas '
+                             'rather than matching up individual symbols.')
 
   @staticmethod
   def Run(args, parser):
     args.output_directory = None
     args.tool_prefix = None
     args.inputs = [args.before, args.after]
+    if args.summary_only:
+      args.query = 'Print(Diff(summary_only=True), verbose=%s)' % bool(args.all)
+      console.Run(args, parser)
+      return
     args.query = '\n'.join([
         'd = Diff()',
         'sis = canned_queries.StaticInitializers(d.symbols)',
@@ -80,6 +88,9 @@ def main():
       _DiffAction(),
       'Shorthand for console --query "Print(Diff())" (plus highlights static '
       'initializers in diff)')
+  actions['index'] = (
+      size_index,
+      'Index a directory of .size files, to query sizes across all of them.')
 
   for name, tup in actions.iteritems():
     sub_parser = sub_parsers.add_parser(name, help=tup[1])
@@ -5,6 +5,11 @@
 
 The primary classes are Symbol, and SymbolGroup.
 
+Symbols loaded from columnar .size files are StoredSymbols: views of the rows
+of a SymbolStore, which holds symbol fields as parallel arrays. SymbolGroups
+of StoredSymbols implement some filters, sorts and groupings directly on the
+arrays, without needing to access individual symbols.
+
 Description of common properties:
   * address: The start address of the symbol.
         May be 0 (e.g. for .bss or for SymbolGroups).
@@ -28,7 +33,9 @@ Description of common properties:
         Never None, but will be '' when no component exists.
 """
 
+import array
 import collections
+import itertools
 import logging
 import os
 import re
@@ -235,16 +242,21 @@ class DeltaSizeInfo(BaseSizeInfo):
   Fields:
     before: SizeInfo for "before".
     after: SizeInfo for "after".
+    summary_only: Whether symbols were not matched up. When True, each symbol
+        is the change in total PSS of a (section, component).
   """
   __slots__ = (
       'before',
       'after',
+      'summary_only',
   )
 
-  def __init__(self, before, after, section_sizes, raw_symbols):
+  def __init__(self, before, after, section_sizes, raw_symbols,
+               summary_only=False):
     super(DeltaSizeInfo, self).__init__(section_sizes, raw_symbols)
     self.before = before
     self.after = after
+    self.summary_only = summary_only
 
 
 class BaseSymbol(object):
@@ -405,6 +417,292 @@ class Symbol(BaseSymbol):
     return float(self.padding) / self.num_aliases
 
 
+# pylint: disable=protected-access
+def _StoredColumnProperty(name):
+  def getter(self):
+    return getattr(self._store, name)[self._index]
+  def setter(self, value):
+    getattr(self._store, name)[self._index] = value
+  return property(getter, setter)
+
+
+def _StoredStringProperty(name):
+  def getter(self):
+    return self._store.strings[getattr(self._store, name)[self._index]]
+  def setter(self, value):
+    getattr(self._store, name)[self._index] = self._store.InternString(value)
+  return property(getter, setter)
+
+
+def _StoredPathProperty(part):
+  def getter(self):
+    store = self._store
+    return store.path_tuples[store.path_indices[self._index]][part]
+  def setter(self, value):
+    store = self._store
+    path_tuple = list(store.path_tuples[store.path_indices[self._index]])
+    path_tuple[part] = value
+    store.path_indices[self._index] = store.InternTableValue(
+        'path_tuples', tuple(path_tuple))
+  return property(getter, setter)
+
+
+def _StoredTableProperty(table_name, index_name):
+  def getter(self):
+    store = self._store
+    return getattr(store, table_name)[getattr(store, index_name)[self._index]]
+  def setter(self, value):
+    store = self._store
+    getattr(store, index_name)[self._index] = store.InternTableValue(
+        table_name, value)
+  return property(getter, setter)
+# pylint: enable=protected-access
+
+
+class StoredSymbol(BaseSymbol):
+  """A lightweight view of a row within a SymbolStore.
+
+  Has the same interface as Symbol, but reads and writes its fields from the
+  columns of its SymbolStore.
+  """
+
+  __slots__ = (
+      '_store',
+      '_index',
+  )
+
+  def __init__(self, store, index):
+    self._store = store
+    self._index = index
+
+  address = _StoredColumnProperty('addresses')
+  size = _StoredColumnProperty('sizes')
+  padding = _StoredColumnProperty('paddings')
+  flags = _StoredColumnProperty('flags')
+  full_name = _StoredStringProperty('full_name_indices')
+  template_name = _StoredStringProperty('template_name_indices')
+  name = _StoredStringProperty('name_indices')
+  object_path = _StoredPathProperty(0)
+  source_path = _StoredPathProperty(1)
+  section_name = _StoredTableProperty('section_names', 'section_indices')
+  component = _StoredTableProperty('components', 'component_indices')
+
+  @property
+  def aliases(self):
+    return self._store.Aliases(self._index)
+
+  __repr__ = Symbol.__dict__['__repr__']
+  pss = Symbol.pss
+  pss_without_padding = Symbol.pss_without_padding
+  padding_pss = Symbol.padding_pss
+
+
+class StoredSymbolList(object):
+  """A read-only list of the StoredSymbols at |indices| within a SymbolStore.
+
+  Used in place of a list of Symbols by SymbolGroup.
+  """
+
+  __slots__ = (
+      'store',
+      'indices',
+  )
+
+  def __init__(self, store, indices):
+    self.store = store
+    self.indices = indices
+
+  def __len__(self):
+    return len(self.indices)
+
+  def __iter__(self):
+    symbol_at = self.store.Symbol
+    return (symbol_at(i) for i in self.indices)
+
+  def __getitem__(self, key):
+    if isinstance(key, slice):
+      return StoredSymbolList(self.store, self.indices[key])
+    return self.store.Symbol(self.indices[key])
+
+  def __eq__(self, other):
+    if isinstance(other, StoredSymbolList) and other.store is self.store:
+      return self.indices == other.indices
+    return list(self) == list(other)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __add__(self, other):
+    return list(self) + list(other)
+
+  def __radd__(self, other):
+    return list(other) + list(self)
+
+  def __contains__(self, item):
+    # pylint: disable=protected-access
+    return (isinstance(item, StoredSymbol) and item._store is self.store and
+            item._index in self.indices)
+
+  def index(self, item):
+    if item in self:
+      # pylint: disable=protected-access
+      return self.indices.index(item._index)
+    raise ValueError('Symbol not in list')
+
+  def Derived(self, indices):
+    """Returns a StoredSymbolList for |indices| of the same store."""
+    return StoredSymbolList(
+        self.store, array.array(self.indices.typecode, indices))
+
+
+class SymbolStore(object):
+  """Stores symbols as parallel arrays rather than as Symbol objects.
+
+  Each numeric field is an array.array with one entry per symbol. Strings,
+  paths, components and section names are stored in tables and referenced by
+  index. Each symbol's aliases are the |num_aliases| (0 when not aliased)
+  adjacent rows that start |alias_indices| rows before it.
+
+  StoredSymbol views are created on first access and then reused, so that
+  "is" comparisons behave as they do for Symbols.
+  """
+
+  _INDEX_COLUMNS = (
+      'section_indices',
+      'path_indices',
+      'component_indices',
+      'full_name_indices',
+      'template_name_indices',
+      'name_indices',
+  )
+  _VALUE_COLUMNS = (
+      'addresses',
+      'sizes',
+      'paddings',
+      'flags',
+      'num_aliases',
+      'alias_indices',
+  )
+
+  def __init__(self, columns, section_names, path_tuples, components, strings):
+    """Creates a store.
+
+    Args:
+      columns: Dict of column name -> array.array. Requires all of
+          _INDEX_COLUMNS and _VALUE_COLUMNS.
+      section_names: List of section names referenced by section_indices.
+      path_tuples: List of (object_path, source_path).
+      components: List of components.
+      strings: Sequence of names. Entries are looked up only when accessed.
+    """
+    for name in self._INDEX_COLUMNS + self._VALUE_COLUMNS:
+      setattr(self, name, columns[name])
+    self.section_names = section_names
+    self.path_tuples = path_tuples
+    self.components = components
+    self.strings = strings
+    self._string_indices = None
+    # Table name -> {value: index}, created when a table is first written to.
+    self._table_indices = {}
+    self._symbols = [None] * len(self.addresses)
+    self._aliases_by_start = {}
+
+  @classmethod
+  def FromSymbols(cls, symbols):
+    """Creates a SymbolStore containing copies of |symbols|.
+
+    Aliases must be adjacent to one another within |symbols|.
+    """
+    tables = ([], [], [], [])
+    interned = tuple({} for _ in tables)
+    def intern_value(table_idx, value):
+      ret = interned[table_idx].get(value)
+      if ret is None:
+        ret = len(tables[table_idx])
+        interned[table_idx][value] = ret
+        tables[table_idx].append(value)
+      return ret
+
+    columns = {name: array.array('l')
+               for name in cls._INDEX_COLUMNS + cls._VALUE_COLUMNS}
+    prev_aliases = None
+    alias_index = 0
+    for s in symbols:
+      columns['section_indices'].append(intern_value(0, s.section_name))
+      columns['path_indices'].append(
+          intern_value(1, (s.object_path, s.source_path)))
+      columns['component_indices'].append(intern_value(2, s.component))
+      columns['full_name_indices'].append(intern_value(3, s.full_name))
+      columns['template_name_indices'].append(intern_value(3, s.template_name))
+      columns['name_indices'].append(intern_value(3, s.name))
+      columns['addresses'].append(s.address)
+      columns['sizes'].append(s.size)
+      columns['paddings'].append(s.padding)
+      columns['flags'].append(s.flags)
+      if s.aliases and s.aliases is prev_aliases:
+        alias_index += 1
+      else:
+        alias_index = 0
+      prev_aliases = s.aliases
+      columns['num_aliases'].append(len(s.aliases or ()))
+      columns['alias_indices'].append(alias_index)
+    return cls(columns, *tables)
+
+  def __len__(self):
+    return len(self._symbols)
+
+  def Symbol(self, index):
+    """Returns the StoredSymbol for the row at |index|."""
+    ret = self._symbols[index]
+    if ret is None:
+      ret = StoredSymbol(self, index)
+      self._symbols[index] = ret
+    return ret
+
+  def Symbols(self):
+    """Returns a StoredSymbolList of all rows."""
+    return StoredSymbolList(self, array.array('l', xrange(len(self))))
+
+  def Aliases(self, index):
+    """Returns the shared list of aliases for the row at |index|, or None."""
+    num_aliases = self.num_aliases[index]
+    if not num_aliases:
+      return None
+    start = index - self.alias_indices[index]
+    ret = self._aliases_by_start.get(start)
+    if ret is None:
+      ret = [self.Symbol(i) for i in xrange(start, start + num_aliases)]
+      self._aliases_by_start[start] = ret
+    return ret
+
+  def InternString(self, value):
+    """Returns the index of |value| within |strings|, adding it if missing."""
+    if self._string_indices is None:
+      self.strings = list(self.strings)
+      self._string_indices = {s: i for i, s in enumerate(self.strings)}
+    ret = self._string_indices.get(value)
+    if ret is None:
+      ret = len(self.strings)
+      self._string_indices[value] = ret
+      self.strings.append(value)
+    return ret
+
+  def InternTableValue(self, table_name, value):
+    """Returns the index of |value| within the |table_name| table (one of
+    section_names, path_tuples or components), adding it if missing."""
+    table = getattr(self, table_name)
+    indices = self._table_indices.get(table_name)
+    if indices is None:
+      indices = {v: i for i, v in reversed(list(enumerate(table)))}
+      self._table_indices[table_name] = indices
+    ret = indices.get(value)
+    if ret is None:
+      ret = len(table)
+      indices[value] = ret
+      table.append(value)
+    return ret
+
+
 class DeltaSymbol(BaseSymbol):
   """Represents a changed symbol.
 
@@ -740,6 +1038,20 @@ class SymbolGroup(BaseSymbol):
     return self.Sorted(key=(lambda s:s.name), reverse=reverse)
 
   def SortedByAddress(self, reverse=False):
+    stored = self._StoredSymbols()
+    if stored is not None:
+      store = stored.store
+      addresses = store.addresses
+      path_indices = store.path_indices
+      path_tuples = store.path_tuples
+      name_indices = store.name_indices
+      strings = store.strings
+      indices = sorted(stored.indices, reverse=reverse, key=lambda i: (
+          addresses[i], path_tuples[path_indices[i]][0],
+          strings[name_indices[i]]))
+      return self._CreateTransformed(
+          stored.Derived(indices), filtered_symbols=self._filtered_symbols,
+          is_sorted=True)
     return self.Sorted(key=(lambda s:(s.address, s.object_path, s.name)),
                        reverse=reverse)
 
@@ -760,10 +1072,28 @@ class SymbolGroup(BaseSymbol):
     return self._CreateTransformed(filtered_and_kept[1],
                                    filtered_symbols=filtered_and_kept[0])
 
+  def _StoredSymbols(self):
+    """Returns the StoredSymbolList backing this group, or None."""
+    if isinstance(self._symbols, StoredSymbolList):
+      return self._symbols
+    return None
+
+  def _FilterStored(self, stored, mask):
+    """Like Filter(), but for a StoredSymbolList and a list of bools."""
+    kept = stored.Derived(itertools.compress(stored.indices, mask))
+    filtered = stored.Derived(
+        itertools.compress(stored.indices, [not m for m in mask]))
+    return self._CreateTransformed(kept, filtered_symbols=filtered)
+
   def WhereIsGroup(self):
     return self.Filter(lambda s: s.IsGroup())
 
   def WhereSizeBiggerThan(self, min_size):
+    stored = self._StoredSymbols()
+    if stored is not None:
+      sizes = stored.store.sizes
+      return self._FilterStored(
+          stored, [sizes[i] >= min_size for i in stored.indices])
     return self.Filter(lambda s: s.size >= min_size)
 
   def WherePssBiggerThan(self, min_pss):
@@ -772,12 +1102,26 @@ class SymbolGroup(BaseSymbol):
   def WhereInSection(self, section):
     """|section| can be section_name ('.bss'), or section chars ('bdr')."""
     if section.startswith('.'):
-      ret = self.Filter(lambda s: s.section_name == section)
-      ret.section_name = section
+      matches_section_name = lambda name: name == section
+    else:
+      matches_section_name = (
+          lambda name: SECTION_NAME_TO_SECTION.get(name, name) in section)
+
+    stored = self._StoredSymbols()
+    if stored is not None:
+      # Match each distinct section name only once.
+      store = stored.store
+      matches = [matches_section_name(n) for n in store.section_names]
+      section_indices = store.section_indices
+      ret = self._FilterStored(
+          stored, [matches[section_indices[i]] for i in stored.indices])
     else:
-      ret = self.Filter(lambda s: s.section in section)
-      if section in SECTION_TO_SECTION_NAME:
-        ret.section_name = SECTION_TO_SECTION_NAME[section]
+      ret = self.Filter(lambda s: matches_section_name(s.section_name))
+
+    if section.startswith('.'):
+      ret.section_name = section
+    elif section in SECTION_TO_SECTION_NAME:
+      ret.section_name = SECTION_TO_SECTION_NAME[section]
     return ret
 
   def WhereIsDex(self):
@@ -852,6 +1196,11 @@ class SymbolGroup(BaseSymbol):
       start = int(start, 16)
     if end is None:
       end = start + 1
+    stored = self._StoredSymbols()
+    if stored is not None:
+      addresses = stored.store.addresses
+      return self._FilterStored(
+          stored, [start <= addresses[i] < end for i in stored.indices])
     return self.Filter(lambda s: s.address >= start and s.address < end)
 
   def WhereHasPath(self):
@@ -936,6 +1285,43 @@ class SymbolGroup(BaseSymbol):
     return self._CreateTransformed(
         after_syms, filtered_symbols=filtered_symbols)
 
+  def _GroupedByStoredColumn(self, stored, column, func, min_count=0):
+    """Like GroupedBy(), but for a StoredSymbolList.
+
+    Rather than being called for each symbol, |func| is called once for each
+    distinct value of |column| (an index column of the SymbolStore).
+    """
+    token_by_key = {}
+    indices_by_token = collections.OrderedDict()
+    filtered_indices = []
+    for i in stored.indices:
+      key = column[i]
+      if key in token_by_key:
+        token = token_by_key[key]
+      else:
+        token = func(key)
+        token_by_key[key] = token
+      if token is None:
+        filtered_indices.append(i)
+      else:
+        indices_by_token.setdefault(token, []).append(i)
+
+    after_syms = []
+    include_singles = min_count >= 0
+    min_count = abs(min_count)
+    for token, indices in indices_by_token.iteritems():
+      if len(indices) >= min_count:
+        after_syms.append(self._CreateTransformed(
+            stored.Derived(indices), full_name=token, template_name=token,
+            name=token))
+      elif include_singles:
+        after_syms.extend(stored.Derived(indices))
+      else:
+        filtered_indices.extend(indices)
+
+    return self._CreateTransformed(
+        after_syms, filtered_symbols=stored.Derived(filtered_indices))
+
   def _Clustered(self):
     """Returns a new SymbolGroup with some symbols moved into subgroups.
 
@@ -1011,6 +1397,11 @@ class SymbolGroup(BaseSymbol):
         min_count=min_count, group_factory=group_factory)
 
   def GroupedBySectionName(self):
+    stored = self._StoredSymbols()
+    if stored is not None:
+      store = stored.store
+      return self._GroupedByStoredColumn(
+          stored, store.section_indices, lambda i: store.section_names[i])
     return self.GroupedBy(lambda s: s.section_name)
 
   def GroupedByComponent(self):
@@ -1073,10 +1464,10 @@ class SymbolGroup(BaseSymbol):
                  Use a negative value to omit symbols entirely rather than
                  include them outside of a group.
     """
-    def extract_path(symbol):
-      path = symbol.source_path
+    def extract_path_from_tuple(path_tuple):
+      object_path, path = path_tuple
       if fallback_to_object_path and not path:
-        path = symbol.object_path
+        path = object_path
       path = path or fallback
       if path is None:
         return None
@@ -1085,7 +1476,17 @@ class SymbolGroup(BaseSymbol):
       if shared_idx != -1:
         path = path[:shared_idx + 8]
       return _ExtractPrefixBeforeSeparator(path, os.path.sep, depth)
-    return self.GroupedBy(extract_path, min_count=min_count)
+
+    stored = self._StoredSymbols()
+    if stored is not None:
+      store = stored.store
+      return self._GroupedByStoredColumn(
+          stored, store.path_indices,
+          lambda i: extract_path_from_tuple(store.path_tuples[i]),
+          min_count=min_count)
+    return self.GroupedBy(
+        lambda s: extract_path_from_tuple((s.object_path, s.source_path)),
+        min_count=min_count)
 
 
 class DeltaSymbolGroup(SymbolGroup):
@@ -12,17 +12,36 @@ CollectAliasesByAddressAsync():
   Runs CollectAliasesByAddress in a subprocess and returns a promise.
 
 RunNmOnIntermediates():
-  BulkForkAndCall() target: Runs nm on a .a file or a list of .o files, parses
+  BulkCallOnPool() target: Runs nm on a .a file or a list of .o files, parses
   the output, extracts symbol information, and (if available) extracts string
   offset information.
+
+PruneIntermediatesCache():
+  Bounds the cache of RunNmOnIntermediates() once all files were processed.
+
+All of these accept a |cache_dir|, which when set causes results to be stored
+in (and read from) a stage_cache.StageCache, keyed by the contents of the file
+that nm was run on.
 """
 
 import collections
+import logging
+import os
 import subprocess
 
 import concurrent
 import demangle
 import path_util
+import stage_cache
+
+_ELF_CACHE_STAGE = 'nm-elf'
+_INTERMEDIATES_CACHE_STAGE = 'nm-intermediates'
+# Each nm-elf entry holds the aliases of a whole ELF, and is keyed by its
+# contents. Enough for a few binaries across a couple of builds.
+_MAX_ELF_CACHE_ENTRIES = 8
+# nm-intermediates entries are per object file, so the stage keeps a few
+# versions of each object file of a build.
+_INTERMEDIATES_CACHE_ENTRIES_PER_PATH = 4
 
 
 def _IsRelevantNmName(name):
@@ -71,8 +90,25 @@ def _IsRelevantObjectFileName(name):
   return name not in ('CSWTCH', 'lock', '__compound_literal', 'table')
 
 
-def CollectAliasesByAddress(elf_path, tool_prefix):
+def CollectAliasesByAddress(elf_path, tool_prefix, cache_dir=None):
   """Runs nm on |elf_path| and returns a dict of address->[names]"""
+  cache = stage_cache.StageCache(cache_dir)
+  if cache:
+    key = stage_cache.MakeKey(
+        stage_cache.ToolFingerprint(path_util.GetNmPath(tool_prefix)),
+        stage_cache.HashFile(elf_path))
+    ret = cache.Get(_ELF_CACHE_STAGE, key)
+    if ret is None:
+      ret = _CollectAliasesByAddress(elf_path, tool_prefix, cache)
+      cache.Put(_ELF_CACHE_STAGE, key, ret)
+      cache.Prune(_ELF_CACHE_STAGE, _MAX_ELF_CACHE_ENTRIES)
+    else:
+      logging.debug('Using cached nm output for %s', elf_path)
+    return ret
+  return _CollectAliasesByAddress(elf_path, tool_prefix, cache)
+
+
+def _CollectAliasesByAddress(elf_path, tool_prefix, cache):
   # Constructors often show up twice, so use sets to ensure no duplicates.
   names_by_address = collections.defaultdict(set)
 
@@ -100,7 +136,8 @@ def CollectAliasesByAddress(elf_path, tool_prefix):
     names_by_address[address].add(mangled_name)
 
   # Demangle all names.
-  names_by_address = demangle.DemangleSetsInDicts(names_by_address, tool_prefix)
+  names_by_address = demangle.DemangleSetsInDicts(names_by_address, tool_prefix,
+                                                  cache=cache)
 
   # Since this is run in a separate process, minimize data passing by returning
   # only aliased symbols.
@@ -108,17 +145,17 @@ def CollectAliasesByAddress(elf_path, tool_prefix):
   return {k: sorted(v) for k, v in names_by_address.iteritems() if len(v) > 1}
 
 
-def _CollectAliasesByAddressAsyncHelper(elf_path, tool_prefix):
-  result = CollectAliasesByAddress(elf_path, tool_prefix)
+def _CollectAliasesByAddressAsyncHelper(elf_path, tool_prefix, cache_dir):
+  result = CollectAliasesByAddress(elf_path, tool_prefix, cache_dir=cache_dir)
   return concurrent.EncodeDictOfLists(result, key_transform=str)
 
 
-def CollectAliasesByAddressAsync(elf_path, tool_prefix):
+def CollectAliasesByAddressAsync(elf_path, tool_prefix, cache_dir=None):
   """Calls CollectAliasesByAddress in a helper process. Returns a Result."""
   def decode(encoded):
     return concurrent.DecodeDictOfLists(encoded, key_transform=int)
-  return concurrent.ForkAndCall(
-      _CollectAliasesByAddressAsyncHelper, (elf_path, tool_prefix),
+  return concurrent.CallOnPool(
+      _CollectAliasesByAddressAsyncHelper, (elf_path, tool_prefix, cache_dir),
       decode_func=decode)
 
 
@@ -146,9 +183,8 @@ def _ParseOneObjectFileNmOutput(lines):
   return symbol_names, string_addresses
 
 
-# This is a target for BulkForkAndCall().
-def RunNmOnIntermediates(target, tool_prefix, output_directory):
-  """Returns encoded_symbol_names_by_path, encoded_string_addresses_by_path.
+def _RunNmOnIntermediates(target, tool_prefix, output_directory):
+  """Returns symbol_names_by_path, string_addresses_by_path.
 
   Args:
     target: Either a single path to a .a (as a string), or a list of .o paths.
@@ -163,7 +199,7 @@ def RunNmOnIntermediates(target, tool_prefix, output_directory):
   lines = output.splitlines()
   # Empty .a file has no output.
   if not lines:
-    return concurrent.EMPTY_ENCODED_DICT, concurrent.EMPTY_ENCODED_DICT
+    return {}, {}
   is_multi_file = not lines[0]
   lines = iter(lines)
   if is_multi_file:
@@ -185,6 +221,92 @@ def RunNmOnIntermediates(target, tool_prefix, output_directory):
     if string_addresses:
       string_addresses_by_path[path] = string_addresses
     path = next(lines, ':')[:-1]
+  return symbol_names_by_path, string_addresses_by_path
+
+
+def _RunNmOnIntermediatesWithCache(target, tool_prefix, output_directory,
+                                   cache):
+  """Like _RunNmOnIntermediates(), but runs nm only on uncached files."""
+  is_archive = isinstance(target, basestring)
+  paths = [target] if is_archive else target
+  tool_fingerprint = stage_cache.ToolFingerprint(
+      path_util.GetNmPath(tool_prefix))
+  symbol_names_by_path = {}
+  string_addresses_by_path = {}
+  missed_keys_by_path = {}
+  for path in paths:
+    try:
+      # Include |path| in the key since it appears in the results.
+      key = stage_cache.MakeKey(
+          tool_fingerprint, path,
+          stage_cache.HashFile(os.path.join(output_directory, path)))
+    except IOError:
+      # Let nm report the error (or handle the file if it is special).
+      missed_keys_by_path[path] = None
+      continue
+    entry = cache.Get(_INTERMEDIATES_CACHE_STAGE, key)
+    if entry is None:
+      missed_keys_by_path[path] = key
+    else:
+      symbol_names_by_path.update(entry[0])
+      string_addresses_by_path.update(entry[1])
+
+  if missed_keys_by_path:
+    if is_archive:
+      new_symbol_names, new_string_addresses = _RunNmOnIntermediates(
+          target, tool_prefix, output_directory)
+      if missed_keys_by_path[target]:
+        cache.Put(_INTERMEDIATES_CACHE_STAGE, missed_keys_by_path[target],
+                  (new_symbol_names, new_string_addresses))
+    else:
+      missed_paths = [p for p in paths if p in missed_keys_by_path]
+      new_symbol_names, new_string_addresses = _RunNmOnIntermediates(
+          missed_paths, tool_prefix, output_directory)
+      for path in missed_paths:
+        key = missed_keys_by_path[path]
+        if not key:
+          continue
+        entry = ({path: new_symbol_names.get(path, set())}, {})
+        if path in new_string_addresses:
+          entry[1][path] = new_string_addresses[path]
+        cache.Put(_INTERMEDIATES_CACHE_STAGE, key, entry)
+    symbol_names_by_path.update(new_symbol_names)
+    string_addresses_by_path.update(new_string_addresses)
+  return symbol_names_by_path, string_addresses_by_path
+
+
+def PruneIntermediatesCache(cache_dir, num_paths):
+  """Bounds the entries cached by RunNmOnIntermediates().
+
+  Called once all intermediates have been run through nm, rather than by each
+  batch, since the limit scales with the number of object files.
+
+  Args:
+    cache_dir: The |cache_dir| given to RunNmOnIntermediates(), or None.
+    num_paths: The number of .o and .a files of the build.
+  """
+  stage_cache.StageCache(cache_dir).Prune(
+      _INTERMEDIATES_CACHE_STAGE,
+      _INTERMEDIATES_CACHE_ENTRIES_PER_PATH * max(num_paths, 1))
+
+
+# This is a target for BulkCallOnPool().
+def RunNmOnIntermediates(target, tool_prefix, output_directory,
+                         cache_dir=None):
+  """Returns encoded_symbol_names_by_path, encoded_string_addresses_by_path.
+
+  Args:
+    target: Either a single path to a .a (as a string), or a list of .o paths.
+    cache_dir: Optional directory used to cache results per input file.
+  """
+  cache = stage_cache.StageCache(cache_dir)
+  if cache:
+    symbol_names_by_path, string_addresses_by_path = (
+        _RunNmOnIntermediatesWithCache(
+            target, tool_prefix, output_directory, cache))
+  else:
+    symbol_names_by_path, string_addresses_by_path = _RunNmOnIntermediates(
+        target, tool_prefix, output_directory)
 
   # The multiprocess API uses pickle, which is ridiculously slow. More than 2x
   # faster to use join & split.
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import nm
+import stage_cache
+
+
+class NmTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.cache_dir = os.path.join(self.temp_dir, 'cache')
+    self.cache = stage_cache.StageCache(self.cache_dir)
+    self.nm_inputs = []
+    self._orig_collect_aliases = nm._CollectAliasesByAddress
+    self._orig_run_nm = nm._RunNmOnIntermediates
+    def collect_aliases(elf_path, tool_prefix, cache):
+      self.nm_inputs.append(elf_path)
+      return {0x100: [elf_path]}
+    def run_nm(target, tool_prefix, output_directory):
+      self.nm_inputs.extend(target)
+      return dict((p, set([p])) for p in target), {}
+    nm._CollectAliasesByAddress = collect_aliases
+    nm._RunNmOnIntermediates = run_nm
+
+  def tearDown(self):
+    nm._CollectAliasesByAddress = self._orig_collect_aliases
+    nm._RunNmOnIntermediates = self._orig_run_nm
+    shutil.rmtree(self.temp_dir)
+
+  def _WriteFile(self, name, contents):
+    path = os.path.join(self.temp_dir, name)
+    with open(path, 'wb') as f:
+      f.write(contents)
+    return path
+
+  def _CountEntries(self, stage):
+    return sum(len(filenames) for _, _, filenames in
+               os.walk(os.path.join(self.cache_dir, stage)))
+
+  def _AgeEntries(self):
+    """Makes all entries older, so that newer ones are unambiguously newer."""
+    for dirpath, _, filenames in os.walk(self.cache_dir):
+      for filename in filenames:
+        path = os.path.join(dirpath, filename)
+        os.utime(path, (os.path.getmtime(path) - 1,) * 2)
+
+  def testCollectAliasesByAddress_EvictsOldBuilds(self):
+    # One ELF per build, each with different contents.
+    num_builds = nm._MAX_ELF_CACHE_ENTRIES + 3
+    elf_paths = [self._WriteFile('elf%d' % i, 'build %d' % i)
+                 for i in xrange(num_builds)]
+    for i, elf_path in enumerate(elf_paths):
+      self.assertEquals({0x100: [elf_path]}, nm.CollectAliasesByAddress(
+          elf_path, 'prefix-', cache_dir=self.cache_dir))
+      self._AgeEntries()
+    self.assertEquals(nm._MAX_ELF_CACHE_ENTRIES,
+                      self._CountEntries(nm._ELF_CACHE_STAGE))
+
+    # The latest builds are still cached, the oldest ones were evicted.
+    del self.nm_inputs[:]
+    nm.CollectAliasesByAddress(elf_paths[-1], 'prefix-',
+                               cache_dir=self.cache_dir)
+    self.assertEquals([], self.nm_inputs)
+    nm.CollectAliasesByAddress(elf_paths[0], 'prefix-',
+                               cache_dir=self.cache_dir)
+    self.assertEquals([elf_paths[0]], self.nm_inputs)
+
+  def testPruneIntermediatesCache(self):
+    obj_paths = ['a.o', 'b.o']
+    for i in xrange(nm._INTERMEDIATES_CACHE_ENTRIES_PER_PATH + 2):
+      # Each build changes every object file.
+      for obj_path in obj_paths:
+        self._WriteFile(obj_path, 'build %d' % i)
+      nm._RunNmOnIntermediatesWithCache(obj_paths, 'prefix-', self.temp_dir,
+                                        self.cache)
+      self._AgeEntries()
+    self.assertEquals(2 * (nm._INTERMEDIATES_CACHE_ENTRIES_PER_PATH + 2),
+                      self._CountEntries(nm._INTERMEDIATES_CACHE_STAGE))
+
+    nm.PruneIntermediatesCache(self.cache_dir, len(obj_paths))
+    self.assertEquals(2 * nm._INTERMEDIATES_CACHE_ENTRIES_PER_PATH,
+                      self._CountEntries(nm._INTERMEDIATES_CACHE_STAGE))
+    # The files of the latest build are still cached.
+    del self.nm_inputs[:]
+    nm._RunNmOnIntermediatesWithCache(obj_paths, 'prefix-', self.temp_dir,
+                                      self.cache)
+    self.assertEquals([], self.nm_inputs)
+
+
+if __name__ == '__main__':
+  unittest.main()
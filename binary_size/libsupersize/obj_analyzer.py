@@ -30,6 +30,8 @@ BulkObjectFileAnalyzer:
     "** merge strings" sections within an ELF's .rodata section.
   * GetSymbolNames(): Accessor.
   * Close(): Disposes data.
+  When given a |cache_dir|, nm results, demangled names and string literal
+  positions are cached (see stage_cache.py).
 
 This file can also be run stand-alone in order to test out the logic on smaller
 sample sizes.
@@ -54,6 +56,7 @@ import bcanalyzer
 import concurrent
 import demangle
 import nm
+import stage_cache
 import string_extract
 
 
@@ -63,6 +66,11 @@ _MSG_ANALYZE_STRINGS = 3
 _MSG_GET_SYMBOL_NAMES = 4
 _MSG_GET_STRINGS = 5
 
+_STRINGS_CACHE_STAGE = 'string-positions'
+# Each entry holds the string literal positions of a whole ELF, and is keyed by
+# its contents. Enough for a few binaries across a couple of builds.
+_MAX_STRINGS_CACHE_ENTRIES = 8
+
 _active_pids = None
 
 
@@ -89,13 +97,16 @@ class _PathsByType:
 
 
 class _BulkObjectFileAnalyzerWorker(object):
-  def __init__(self, tool_prefix, output_directory):
+  def __init__(self, tool_prefix, output_directory, cache_dir=None):
     self._tool_prefix = _MakeToolPrefixAbsolute(tool_prefix)
     self._output_directory = output_directory
+    self._cache_dir = cache_dir
+    self._cache = stage_cache.StageCache(cache_dir)
     self._list_of_encoded_elf_string_ranges_by_path = None
     self._paths_by_name = collections.defaultdict(list)
     self._encoded_string_addresses_by_path_chunks = []
     self._encoded_strings_by_path_chunks = []
+    self._num_paths = 0
 
   def _ClassifyPaths(self, paths):
     """Classifies |paths| (.o and .a files) by file type into separate lists.
@@ -126,12 +137,14 @@ class _BulkObjectFileAnalyzerWorker(object):
     # Create 1-tuples of arrays of strings.
     return [(paths[i:i + size],) for i in xrange(0, len(paths), size)]
 
-  def _DoBulkFork(self, runner, batches):
+  def _DoBulkCall(self, runner, batches, **kwargs):
     # Order of the jobs doesn't matter since each job owns independent paths,
     # and our output is a dict where paths are the key.
-    return concurrent.BulkForkAndCall(
+    # Use the persistent pool since AnalyzePaths() is called many times, and
+    # batches are just lists of paths.
+    return concurrent.BulkCallOnPool(
         runner, batches, tool_prefix=self._tool_prefix,
-        output_directory=self._output_directory)
+        output_directory=self._output_directory, **kwargs)
 
   def _RunNm(self, paths_by_type):
     """Calls nm to get symbols and (for non-BC files) string addresses."""
@@ -141,7 +154,8 @@ class _BulkObjectFileAnalyzerWorker(object):
     BATCH_SIZE = 50  # Arbitrarily chosen.
     batches.extend(
         self._MakeBatches(paths_by_type.obj + paths_by_type.bc, BATCH_SIZE))
-    results = self._DoBulkFork(nm.RunNmOnIntermediates, batches)
+    results = self._DoBulkCall(nm.RunNmOnIntermediates, batches,
+                               cache_dir=self._cache_dir)
 
     # Names are still mangled.
     all_paths_by_name = self._paths_by_name
@@ -158,7 +172,7 @@ class _BulkObjectFileAnalyzerWorker(object):
     """Calls llvm-bcanalyzer to extract string data (for LLD-LTO)."""
     BATCH_SIZE = 50  # Arbitrarily chosen.
     batches = self._MakeBatches(paths_by_type.bc, BATCH_SIZE)
-    results = self._DoBulkFork(
+    results = self._DoBulkCall(
         bcanalyzer.RunBcAnalyzerOnIntermediates, batches)
     for encoded_strs in results:
       if encoded_strs != concurrent.EMPTY_ENCODED_DICT:
@@ -171,13 +185,21 @@ class _BulkObjectFileAnalyzerWorker(object):
                  len(paths_by_type.arch), len(paths_by_type.obj),
                  len(paths_by_type.bc))
     self._RunNm(paths_by_type)
+    self._num_paths += len(paths)
+    if self._cache:
+      nm.PruneIntermediatesCache(self._cache_dir, self._num_paths)
     self._RunLlvmBcAnalyzer(paths_by_type)
     logging.debug('worker: AnalyzePaths() completed.')
 
   def SortPaths(self):
+    for runner in (nm.RunNmOnIntermediates,
+                   bcanalyzer.RunBcAnalyzerOnIntermediates):
+      if concurrent.GetJobTimings(runner):
+        logging.info('Slowest %s jobs:\n  %s', runner.__name__,
+                     '\n  '.join(concurrent.DescribeSlowestJobs(runner)))
     # Demangle all names, which can result in some merging of lists.
     self._paths_by_name = demangle.DemangleKeysAndMergeLists(
-        self._paths_by_name, self._tool_prefix)
+        self._paths_by_name, self._tool_prefix, cache=self._cache)
     # Sort and uniquefy.
     for key in self._paths_by_name.iterkeys():
       self._paths_by_name[key] = sorted(set(self._paths_by_name[key]))
@@ -196,6 +218,8 @@ class _BulkObjectFileAnalyzerWorker(object):
         for chunk in self._encoded_string_addresses_by_path_chunks)
     # Order of the jobs doesn't matter since each job owns independent paths,
     # and our output is a dict where paths are the key.
+    # Fork rather than use the persistent pool so that |string_data| (which
+    # can be many MB) is shared copy-on-write rather than pickled for each job.
     results = concurrent.BulkForkAndCall(
         string_extract.ResolveStringPiecesIndirect, params,
         string_data=string_data, tool_prefix=self._tool_prefix,
@@ -210,9 +234,27 @@ class _BulkObjectFileAnalyzerWorker(object):
         string_extract.ResolveStringPieces, params, string_data=string_data)
     return list(results)
 
+  def _StringLiteralsCacheKey(self, string_data):
+    # Positions are relative to the ELF's string sections, and depend only on
+    # their contents and on the strings / string addresses found by nm.
+    parts = list(string_data)
+    for chunks in (self._encoded_string_addresses_by_path_chunks,
+                   self._encoded_strings_by_path_chunks):
+      # Sort since chunk order depends on the order that batches finished in.
+      parts.extend(sorted('\x03'.join(c) for c in chunks))
+      parts.append('\x04')
+    return stage_cache.MakeKey(*parts)
+
   def AnalyzeStringLiterals(self, elf_path, elf_string_ranges):
     logging.debug('worker: AnalyzeStringLiterals() started.')
     string_data = self._ReadElfStringData(elf_path, elf_string_ranges)
+    if self._cache:
+      cache_key = self._StringLiteralsCacheKey(string_data)
+      cached_value = self._cache.Get(_STRINGS_CACHE_STAGE, cache_key)
+      if cached_value is not None:
+        logging.debug('worker: Using cached string literal positions.')
+        self._list_of_encoded_elf_string_ranges_by_path = cached_value
+        return
 
     # [source_idx][batch_idx][section_idx] -> Encoded {path: [string_ranges]}.
     encoded_ranges_sources = [
@@ -228,6 +270,10 @@ class _BulkObjectFileAnalyzerWorker(object):
         t.extend([b[section_idx] for b in encoded_ranges])  # [batch_idx].
       self._list_of_encoded_elf_string_ranges_by_path.append(
         concurrent.JoinEncodedDictOfLists(t))
+    if self._cache:
+      self._cache.Put(_STRINGS_CACHE_STAGE, cache_key,
+                      self._list_of_encoded_elf_string_ranges_by_path)
+      self._cache.Prune(_STRINGS_CACHE_STAGE, _MAX_STRINGS_CACHE_ENTRIES)
     logging.debug('worker: AnalyzeStringLiterals() completed.')
 
   def GetSymbolNames(self):
@@ -254,11 +300,12 @@ def _TerminateSubprocesses():
 
 class _BulkObjectFileAnalyzerMaster(object):
   """Runs BulkObjectFileAnalyzer in a subprocess."""
-  def __init__(self, tool_prefix, output_directory):
+  def __init__(self, tool_prefix, output_directory, cache_dir=None):
     self._child_pid = None
     self._pipe = None
     self._tool_prefix = tool_prefix
     self._output_directory = output_directory
+    self._cache_dir = cache_dir
 
   def _Spawn(self):
     global _active_pids
@@ -276,7 +323,7 @@ class _BulkObjectFileAnalyzerMaster(object):
       logging.root.handlers[0].setFormatter(logging.Formatter(
           'obj_analyzer: %(levelname).1s %(relativeCreated)6d %(message)s'))
       worker_analyzer = _BulkObjectFileAnalyzerWorker(
-          self._tool_prefix, self._output_directory)
+          self._tool_prefix, self._output_directory, cache_dir=self._cache_dir)
       slave = _BulkObjectFileAnalyzerSlave(worker_analyzer, child_conn)
       slave.Run()
 
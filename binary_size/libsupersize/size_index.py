@@ -0,0 +1,436 @@
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""An on-disk index for querying sizes across many .size files.
+
+Answering questions like "when did symbol X grow" otherwise requires loading
+every .size file in full. The index stores, for each symbol name, source path
+(and each of its parent directories) and component, the total PSS in each
+build (excluding .bss for paths and components). It is updated incrementally:
+only .size files that are new or that have changed since the last update are
+loaded.
+
+Layout of an index directory:
+  builds.json: Format version, number of buckets and keys of each kind, next
+      build ID, and for each build: its ID, .size path (relative to the
+      directory of .size files), file size & mtime (to detect changes),
+      metadata and section sizes.
+  <kind>/<num buckets>/<bucket>.marshal: For each kind of key ("symbol",
+      "path", "component"), keys are spread over buckets by hash. Each bucket
+      is a marshal'ed dict of {key: {build ID: pss}}. The number of buckets
+      doubles whenever they hold more than _MAX_KEYS_PER_BUCKET keys on
+      average, so a query reads a single file whose size depends on the number
+      of builds, but not on the number of keys.
+
+New builds are merged into buckets in batches of _BUILDS_PER_FLUSH, and only
+the buckets that receive new keys are rewritten (unless builds were removed).
+
+Usage:
+  index = size_index.SizeIndex('/path/to/index')
+  index.Update('/path/to/size/files')
+  for build, pss in index.Query('symbol', 'foo::Bar()'):
+    print build.name, pss
+"""
+
+import collections
+import json
+import logging
+import marshal
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import zlib
+
+import archive
+import concurrent
+
+
+_FORMAT_VERSION = 2
+_MAX_KEYS_PER_BUCKET = 2048
+_BUILDS_PER_FLUSH = 16
+_BUILDS_FILENAME = 'builds.json'
+
+KIND_SYMBOL = 'symbol'
+KIND_PATH = 'path'
+KIND_COMPONENT = 'component'
+KINDS = (KIND_SYMBOL, KIND_PATH, KIND_COMPONENT)
+
+
+Build = collections.namedtuple(
+    'Build', 'id name file_size mtime metadata section_sizes')
+
+
+def _NaturalSortKey(name):
+  """Sorts "M9.size" before "M10.size"."""
+  return [int(x) if x.isdigit() else x for x in re.split(r'(\d+)', name)]
+
+
+def _ParentDirs(path):
+  """Yields "a/b/", "a/" for "a/b/c.cc"."""
+  while True:
+    path = posixpath.dirname(path)
+    if not path or path == '/':
+      return
+    yield path + '/'
+
+
+# This is a target for BulkCallOnPool().
+def _AggregateSizeFile(size_path):
+  """Returns (size_path, encoded sizes by kind, metadata and section sizes).
+
+  The second item is marshal'ed ({kind: {key: pss}}, metadata, section_sizes).
+  It is a single string so that concurrent can pass it back through a file
+  rather than pickling it.
+  """
+  size_info = archive.LoadAndPostProcessSizeInfo(size_path)
+  by_kind = {kind: collections.defaultdict(float) for kind in KINDS}
+  symbol_sizes = by_kind[KIND_SYMBOL]
+  path_sizes = by_kind[KIND_PATH]
+  component_sizes = by_kind[KIND_COMPONENT]
+  for symbol in size_info.raw_symbols:
+    pss = symbol.pss
+    symbol_sizes[symbol.full_name] += pss
+    # Like SymbolGroup.pss, totals do not include .bss.
+    if symbol.IsBss():
+      continue
+    if symbol.source_path:
+      path_sizes[symbol.source_path] += pss
+    component_sizes[symbol.component] += pss
+
+  # Sizes of directories are the sum of their files.
+  for path, pss in path_sizes.items():
+    for parent_dir in _ParentDirs(path):
+      path_sizes[parent_dir] += pss
+
+  metadata = size_info.metadata or {}
+  return size_path, marshal.dumps((
+      {kind: dict(sizes) for kind, sizes in by_kind.iteritems()},
+      {k: v for k, v in metadata.iteritems()
+       if isinstance(v, (basestring, int, long, float, bool))},
+      dict(size_info.section_sizes)))
+
+
+def _HashKey(key):
+  return zlib.crc32(key) & 0xffffffff
+
+
+def _FilterPostings(postings, valid_ids):
+  """Returns |postings| without the sizes of builds not in |valid_ids|."""
+  ret = {}
+  for key, sizes in postings.iteritems():
+    sizes = {i: s for i, s in sizes.iteritems() if i in valid_ids}
+    if sizes:
+      ret[key] = sizes
+  return ret
+
+
+def _WriteFileAtomically(path, data):
+  dirname = os.path.dirname(path)
+  fd, tmp_path = tempfile.mkstemp(dir=dirname)
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      f.write(data)
+    os.rename(tmp_path, path)
+  except:  # pylint: disable=bare-except
+    os.unlink(tmp_path)
+    raise
+
+
+def _FindSizeFiles(size_dir):
+  """Returns {path relative to |size_dir|: (file size, mtime)}."""
+  ret = {}
+  for dirpath, dirnames, filenames in os.walk(size_dir):
+    # Sort so that traversal order is deterministic.
+    dirnames.sort()
+    for filename in filenames:
+      if filename.endswith('.size'):
+        path = os.path.join(dirpath, filename)
+        st = os.stat(path)
+        rel_path = os.path.relpath(path, size_dir).replace(os.sep, '/')
+        ret[rel_path] = (st.st_size, st.st_mtime)
+  return ret
+
+
+class SizeIndex(object):
+  """An inverted index of symbol / path / component sizes by build."""
+
+  def __init__(self, index_dir):
+    self._index_dir = index_dir
+    self._builds = []
+    self._next_id = 0
+    self._num_buckets = {kind: 1 for kind in KINDS}
+    self._num_keys = {kind: 0 for kind in KINDS}
+    self._ReadBuilds()
+
+  def _BuildsPath(self):
+    return os.path.join(self._index_dir, _BUILDS_FILENAME)
+
+  def _BucketDir(self, kind, num_buckets=None):
+    return os.path.join(self._index_dir, kind,
+                        str(num_buckets or self._num_buckets[kind]))
+
+  def _BucketPath(self, kind, bucket, num_buckets=None):
+    return os.path.join(self._BucketDir(kind, num_buckets),
+                        '%d.marshal' % bucket)
+
+  def _BucketForKey(self, kind, key):
+    return _HashKey(key) % self._num_buckets[kind]
+
+  def _ReadBuilds(self):
+    try:
+      with open(self._BuildsPath()) as f:
+        data = json.load(f)
+    except IOError:
+      return
+    if data.get('version') != _FORMAT_VERSION:
+      raise Exception('Unsupported index version %r in %s. Delete the index '
+                      'to recreate it.' % (data.get('version'),
+                                           self._index_dir))
+    self._num_buckets = data['num_buckets']
+    self._num_keys = data['num_keys']
+    self._next_id = data['next_id']
+    self._SetBuilds([Build(**b) for b in data['builds']])
+
+  def _SetBuilds(self, builds):
+    self._builds = sorted(builds, key=lambda b: _NaturalSortKey(b.name))
+
+  def _WriteBuilds(self):
+    data = {
+      'version': _FORMAT_VERSION,
+      'num_buckets': self._num_buckets,
+      'num_keys': self._num_keys,
+      'next_id': self._next_id,
+      'builds': [b._asdict() for b in self._builds],
+    }
+    _WriteFileAtomically(self._BuildsPath(), json.dumps(data, indent=1))
+
+  def _ReadBucket(self, kind, bucket):
+    try:
+      with open(self._BucketPath(kind, bucket), 'rb') as f:
+        return marshal.load(f)
+    except IOError:
+      return {}
+
+  def GetBuilds(self):
+    """Returns all indexed builds, ordered by (natural sort of) path."""
+    return list(self._builds)
+
+  def Update(self, size_dir):
+    """Indexes new or changed .size files within |size_dir|.
+
+    Builds whose .size files no longer exist are removed from the index.
+
+    Returns:
+      A tuple of (number of builds added, number of builds removed).
+    """
+    found = _FindSizeFiles(size_dir)
+    kept = []
+    removed = []
+    for build in self._builds:
+      if found.get(build.name) == (build.file_size, build.mtime):
+        kept.append(build)
+      else:
+        removed.append(build)
+    kept_names = set(b.name for b in kept)
+    to_add = sorted(n for n in found if n not in kept_names)
+    if not to_add and not removed:
+      logging.info('Index is up-to-date (%d builds)', len(kept))
+      return 0, 0
+
+    logging.info('Indexing %d .size files (removing %d stale builds)',
+                 len(to_add), len(removed))
+    builds = kept
+    new_builds = []
+    new_sizes = {kind: {} for kind in KINDS}
+    # Postings of removed builds are dropped by rewriting every bucket in the
+    # first flush. Later flushes rewrite only the buckets of new keys.
+    rewrite_all = bool(removed)
+    # Results arrive in any order, so map them back to builds by path.
+    id_by_path = {}
+    for name in to_add:
+      id_by_path[os.path.join(size_dir, name)] = (self._next_id, name)
+      self._next_id += 1
+
+    results = concurrent.BulkCallOnPool(
+        _AggregateSizeFile, [(p,) for p in sorted(id_by_path)])
+    for path, encoded in results:
+      build_id, name = id_by_path[path]
+      sizes_by_kind, metadata, section_sizes = marshal.loads(encoded)
+      file_size, mtime = found[name]
+      new_builds.append(Build(build_id, name, file_size, mtime, metadata,
+                              section_sizes))
+      for kind, sizes in sizes_by_kind.iteritems():
+        kind_sizes = new_sizes[kind]
+        for key, pss in sizes.iteritems():
+          kind_sizes.setdefault(key, {})[build_id] = pss
+      logging.debug('Indexed %s', name)
+      if len(new_builds) == _BUILDS_PER_FLUSH:
+        builds = builds + new_builds
+        self._Flush(builds, new_sizes, rewrite_all)
+        rewrite_all = False
+        new_builds = []
+        new_sizes = {kind: {} for kind in KINDS}
+
+    if new_builds or rewrite_all:
+      builds = builds + new_builds
+      self._Flush(builds, new_sizes, rewrite_all)
+    return len(builds) - len(kept), len(removed)
+
+  def _Flush(self, builds, new_sizes, rewrite_all):
+    """Merges |new_sizes| into buckets, then records |builds| as indexed.
+
+    Builds are written last, so that an interrupted update leaves the index
+    consistent (postings for unknown build IDs are ignored, and are dropped
+    when their bucket is next rewritten).
+    """
+    valid_ids = set(b.id for b in builds)
+    for kind in KINDS:
+      self._WriteBuckets(kind, valid_ids, new_sizes[kind], rewrite_all)
+      if self._num_keys[kind] > (
+          self._num_buckets[kind] * _MAX_KEYS_PER_BUCKET):
+        self._SplitBuckets(kind, valid_ids)
+    self._SetBuilds(builds)
+    self._WriteBuilds()
+    # Buckets of previous (or interrupted) splits are no longer referenced.
+    for kind in KINDS:
+      kind_dir = os.path.join(self._index_dir, kind)
+      for name in os.listdir(kind_dir):
+        if name != str(self._num_buckets[kind]):
+          shutil.rmtree(os.path.join(kind_dir, name))
+
+  def _WriteBuckets(self, kind, valid_ids, new_sizes, rewrite_all):
+    bucket_dir = self._BucketDir(kind)
+    if not os.path.isdir(bucket_dir):
+      os.makedirs(bucket_dir)
+    new_by_bucket = collections.defaultdict(dict)
+    for key, sizes in new_sizes.iteritems():
+      new_by_bucket[self._BucketForKey(kind, key)][key] = sizes
+    if rewrite_all:
+      buckets = xrange(self._num_buckets[kind])
+    else:
+      buckets = sorted(new_by_bucket)
+    for bucket in buckets:
+      postings = self._ReadBucket(kind, bucket)
+      merged = _FilterPostings(postings, valid_ids)
+      for key, sizes in new_by_bucket.get(bucket, {}).iteritems():
+        merged.setdefault(key, {}).update(sizes)
+      self._num_keys[kind] += len(merged) - len(postings)
+      _WriteFileAtomically(self._BucketPath(kind, bucket),
+                           marshal.dumps(merged))
+
+  def _SplitBuckets(self, kind, valid_ids):
+    """Doubles the number of buckets of |kind| until they are small enough.
+
+    New buckets are written to a new directory, which builds.json refers to
+    only once it is complete.
+    """
+    old_num_buckets = self._num_buckets[kind]
+    num_buckets = old_num_buckets
+    while self._num_keys[kind] > num_buckets * _MAX_KEYS_PER_BUCKET:
+      num_buckets *= 2
+    logging.debug('Splitting %d %s buckets into %d', old_num_buckets, kind,
+                  num_buckets)
+    bucket_dir = self._BucketDir(kind, num_buckets)
+    if not os.path.isdir(bucket_dir):
+      os.makedirs(bucket_dir)
+    num_keys = 0
+    # Keys of old bucket b can only move to new buckets b + i * old_num_buckets,
+    # so one old bucket is held in memory at a time.
+    for bucket in xrange(old_num_buckets):
+      postings = _FilterPostings(self._ReadBucket(kind, bucket), valid_ids)
+      num_keys += len(postings)
+      split = collections.defaultdict(dict)
+      for key, sizes in postings.iteritems():
+        split[_HashKey(key) % num_buckets][key] = sizes
+      for new_bucket in xrange(bucket, num_buckets, old_num_buckets):
+        _WriteFileAtomically(
+            self._BucketPath(kind, new_bucket, num_buckets),
+            marshal.dumps(split.get(new_bucket, {})))
+    self._num_buckets[kind] = num_buckets
+    self._num_keys[kind] = num_keys
+
+  def Query(self, kind, key):
+    """Returns the size of |key| in every build.
+
+    Args:
+      kind: One of KINDS. For KIND_PATH, directories end with "/".
+      key: Symbol full_name, source path, or component.
+
+    Returns:
+      A list of (Build, pss) for every indexed build, in order. pss is 0 for
+      builds that do not contain |key|.
+    """
+    assert kind in KINDS, 'kind must be one of ' + ', '.join(KINDS)
+    sizes = self._ReadBucket(kind, self._BucketForKey(kind, key)).get(key, {})
+    return [(b, sizes.get(b.id, 0)) for b in self._builds]
+
+  def FindKeys(self, kind, pattern):
+    """Returns all keys of |kind| that match the regular expression |pattern|.
+
+    Reads every bucket, but does not open any .size files.
+    """
+    assert kind in KINDS, 'kind must be one of ' + ', '.join(KINDS)
+    regex = re.compile(pattern)
+    ret = []
+    for bucket in xrange(self._num_buckets[kind]):
+      ret.extend(k for k in self._ReadBucket(kind, bucket) if regex.search(k))
+    ret.sort()
+    return ret
+
+
+def AddArguments(parser):
+  parser.add_argument('size_dir',
+                      help='Directory containing .size files (searched '
+                           'recursively).')
+  parser.add_argument('--index-dir',
+                      help='Directory to store the index in. Defaults to '
+                           'SIZE_DIR/.size_index.')
+  parser.add_argument('--no-update', action='store_true',
+                      help='Query the index without first indexing new or '
+                           'changed .size files.')
+  query_group = parser.add_mutually_exclusive_group()
+  query_group.add_argument('--symbol', metavar='FULL_NAME',
+                           help='Print the size of a symbol in each build.')
+  query_group.add_argument('--path', metavar='SOURCE_PATH',
+                           help='Print the size of a source file or directory '
+                                'in each build.')
+  query_group.add_argument('--component', metavar='COMPONENT',
+                           help='Print the size of a component in each build.')
+  query_group.add_argument('--find-symbols', metavar='REGEX',
+                           help='Print symbol names in the index that match '
+                                'the given regular expression.')
+
+
+def _PrintTimeSeries(series):
+  width = max([len(b.name) for b, _ in series] or [0])
+  prev_pss = None
+  for build, pss in series:
+    delta = ''
+    if prev_pss is not None and pss != prev_pss:
+      delta = '%+.1f' % (pss - prev_pss)
+    print '%-*s %12.1f %12s' % (width, build.name, pss, delta)
+    prev_pss = pss
+
+
+def Run(args, parser):
+  if not os.path.isdir(args.size_dir):
+    parser.error('Not a directory: ' + args.size_dir)
+  index_dir = args.index_dir or os.path.join(args.size_dir, '.size_index')
+  if not os.path.isdir(index_dir):
+    os.makedirs(index_dir)
+  index = SizeIndex(index_dir)
+  if not args.no_update:
+    added, removed = index.Update(args.size_dir)
+    logging.info('Added %d builds, removed %d builds', added, removed)
+
+  if args.find_symbols:
+    for key in index.FindKeys(KIND_SYMBOL, args.find_symbols):
+      print key
+    return
+  for kind, key in ((KIND_SYMBOL, args.symbol), (KIND_PATH, args.path),
+                    (KIND_COMPONENT, args.component)):
+    if key is not None:
+      _PrintTimeSeries(index.Query(kind, key))
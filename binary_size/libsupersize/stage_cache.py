@@ -0,0 +1,193 @@
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""On-disk cache of intermediate "supersize archive" results.
+
+StageCache:
+  Stores the results of expensive per-input stages (nm output, string literal
+  positions, demangled names, OWNERS lookups) under a cache directory. Entries
+  are keyed by a hash of everything their result depends on (usually the
+  content of an input file), so re-running archive on a mostly unchanged build
+  only reprocesses inputs that actually changed. Stages whose keys change from
+  build to build bound their size with Prune(). A StageCache created without a
+  directory is a no-op, which allows callers to use it unconditionally.
+
+StageTimer:
+  Records wall-clock time spent in each stage of the pipeline, for logging a
+  summary at the end of a run.
+"""
+
+import cPickle
+import contextlib
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+
+# Bump whenever the format of any cached value changes.
+_CACHE_VERSION = '1'
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def HashFile(path):
+  """Returns the hex SHA-1 of the contents of |path|."""
+  h = hashlib.sha1()
+  with open(path, 'rb') as f:
+    while True:
+      chunk = f.read(_HASH_CHUNK_SIZE)
+      if not chunk:
+        break
+      h.update(chunk)
+  return h.hexdigest()
+
+
+def StatSignature(path):
+  """Returns (size, mtime) of |path|, or None if it does not exist."""
+  try:
+    st = os.stat(path)
+  except OSError:
+    return None
+  return st.st_size, st.st_mtime
+
+
+def ToolFingerprint(tool_path):
+  """Returns a string that changes whenever |tool_path| is updated.
+
+  Results produced by a tool (e.g. nm) must be keyed by this as well as by their
+  inputs. Tools are identified by stat() rather than content for speed.
+  """
+  return '%s:%r' % (os.path.realpath(tool_path), StatSignature(tool_path))
+
+
+def MakeKey(*parts):
+  """Returns a cache key that covers all of |parts| (strings)."""
+  h = hashlib.sha1(_CACHE_VERSION)
+  for part in parts:
+    # Prefix with the length so that ('ab', 'c') != ('a', 'bc').
+    h.update('%d:' % len(part))
+    h.update(part)
+  return h.hexdigest()
+
+
+class StageCache(object):
+  """A directory of pickled results, grouped by stage and keyed by hash.
+
+  Safe to use from multiple processes: entries are written to a temporary file
+  and then renamed into place, so readers never see partial entries, and
+  concurrent writers of the same key simply race to write identical data.
+  """
+
+  def __init__(self, cache_dir=None):
+    self.cache_dir = cache_dir
+    self.hits = 0
+    self.misses = 0
+
+  def __nonzero__(self):
+    return bool(self.cache_dir)
+
+  def _EntryPath(self, stage, key):
+    return os.path.join(self.cache_dir, stage, key[:2], key)
+
+  def Get(self, stage, key):
+    """Returns the value stored for |key|, or None if there is none."""
+    if not self.cache_dir:
+      return None
+    path = self._EntryPath(stage, key)
+    try:
+      with open(path, 'rb') as f:
+        ret = cPickle.load(f)
+    except IOError:
+      self.misses += 1
+      return None
+    except Exception:  # pylint: disable=broad-except
+      # Corrupt entries are treated as missing, and get overwritten.
+      logging.warning('Ignoring corrupt cache entry: %s/%s', stage, key)
+      self.misses += 1
+      return None
+    self.hits += 1
+    # Record the access for Prune().
+    try:
+      os.utime(path, None)
+    except OSError:
+      pass
+    return ret
+
+  def Put(self, stage, key, value):
+    """Stores |value| (anything picklable) for |key|."""
+    if not self.cache_dir:
+      return
+    path = self._EntryPath(stage, key)
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+      try:
+        os.makedirs(dirname)
+      except OSError:
+        # Another process may have created it.
+        if not os.path.isdir(dirname):
+          raise
+    fd, tmp_path = tempfile.mkstemp(dir=dirname)
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        cPickle.dump(value, f, cPickle.HIGHEST_PROTOCOL)
+      os.rename(tmp_path, path)
+    except:  # pylint: disable=bare-except
+      os.unlink(tmp_path)
+      raise
+
+  def Prune(self, stage, max_entries):
+    """Deletes the least recently used entries of |stage| beyond |max_entries|.
+    """
+    if not self.cache_dir:
+      return
+    entries = []
+    for dirpath, _, filenames in os.walk(os.path.join(self.cache_dir, stage)):
+      for filename in filenames:
+        path = os.path.join(dirpath, filename)
+        try:
+          entries.append((os.path.getmtime(path), path))
+        except OSError:
+          # Deleted by another process.
+          pass
+    if len(entries) <= max_entries:
+      return
+    entries.sort(reverse=True)
+    for _, path in entries[max_entries:]:
+      try:
+        os.unlink(path)
+      except OSError:
+        pass
+    logging.debug('Pruned %d entries from cache stage %s',
+                  len(entries) - max_entries, stage)
+
+
+class StageTimer(object):
+  """Accumulates the time spent within named stages."""
+
+  def __init__(self):
+    self._durations = []
+
+  @contextlib.contextmanager
+  def Measure(self, name):
+    start = time.time()
+    try:
+      yield
+    finally:
+      self._durations.append((name, time.time() - start))
+
+  def GetDurations(self):
+    """Returns a list of (stage name, seconds) in the order they finished."""
+    return list(self._durations)
+
+  def Describe(self):
+    """Returns lines summarizing where time was spent."""
+    total = sum(d for _, d in self._durations)
+    width = max([len(n) for n, _ in self._durations] or [0])
+    lines = []
+    for name, duration in self._durations:
+      percent = 100.0 * duration / total if total else 0
+      lines.append('%-*s %7.2fs (%4.1f%%)' % (width, name, duration, percent))
+    lines.append('%-*s %7.2fs' % (width, 'Total', total))
+    return lines
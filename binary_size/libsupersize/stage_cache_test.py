@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import stage_cache
+
+
+class StageCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.cache_dir)
+
+  def testMakeKey_Boundaries(self):
+    self.assertNotEquals(stage_cache.MakeKey('ab', 'c'),
+                         stage_cache.MakeKey('a', 'bc'))
+    self.assertEquals(stage_cache.MakeKey('a', 'bc'),
+                      stage_cache.MakeKey('a', 'bc'))
+
+  def testHashFile(self):
+    path = os.path.join(self.cache_dir, 'file')
+    with open(path, 'wb') as f:
+      f.write('contents')
+    first = stage_cache.HashFile(path)
+    with open(path, 'wb') as f:
+      f.write('Contents')
+    self.assertNotEquals(first, stage_cache.HashFile(path))
+
+  def testGetPut(self):
+    cache = stage_cache.StageCache(self.cache_dir)
+    key = stage_cache.MakeKey('foo')
+    self.assertIsNone(cache.Get('stage', key))
+    cache.Put('stage', key, {'a': ['b', 'c']})
+    self.assertEquals({'a': ['b', 'c']}, cache.Get('stage', key))
+    # Stages are independent.
+    self.assertIsNone(cache.Get('other_stage', key))
+    self.assertEquals((1, 2), (cache.hits, cache.misses))
+
+  def testGetPut_Disabled(self):
+    cache = stage_cache.StageCache()
+    self.assertFalse(cache)
+    cache.Put('stage', 'key', 1)
+    self.assertIsNone(cache.Get('stage', 'key'))
+
+  def testGet_Corrupt(self):
+    cache = stage_cache.StageCache(self.cache_dir)
+    key = stage_cache.MakeKey('foo')
+    cache.Put('stage', key, 1)
+    with open(cache._EntryPath('stage', key), 'wb') as f:
+      f.write('not a pickle')
+    self.assertIsNone(cache.Get('stage', key))
+
+  def testPrune(self):
+    cache = stage_cache.StageCache(self.cache_dir)
+    keys = [stage_cache.MakeKey(str(i)) for i in xrange(4)]
+    for i, key in enumerate(keys):
+      cache.Put('stage', key, i)
+      os.utime(cache._EntryPath('stage', key), (i, i))
+    cache.Put('other_stage', keys[0], 0)
+    # Reading an entry makes it the most recently used.
+    self.assertEquals(0, cache.Get('stage', keys[0]))
+    cache.Prune('stage', 2)
+    self.assertEquals(0, cache.Get('stage', keys[0]))
+    self.assertIsNone(cache.Get('stage', keys[1]))
+    self.assertIsNone(cache.Get('stage', keys[2]))
+    self.assertEquals(3, cache.Get('stage', keys[3]))
+    self.assertEquals(0, cache.Get('other_stage', keys[0]))
+
+  def testStageTimer(self):
+    timer = stage_cache.StageTimer()
+    with timer.Measure('foo'):
+      pass
+    with timer.Measure('barbaz'):
+      pass
+    self.assertEquals(['foo', 'barbaz'],
+                      [n for n, _ in timer.GetDurations()])
+    lines = timer.Describe()
+    self.assertEquals(3, len(lines))
+    self.assertTrue(lines[-1].startswith('Total'))
+
+
+if __name__ == '__main__':
+  unittest.main()
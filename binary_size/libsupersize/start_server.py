@@ -7,18 +7,46 @@
 import BaseHTTPServer
 import logging
 import os
+import posixpath
 import SimpleHTTPServer
 
 
+# Shards written by "html_report --report-dir" are named by the hash of their
+# contents, so they never change once written.
+_IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Everything else (notably the index of shards) must be revalidated.
+_REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
 class SupersizeHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler,
                                   object):
   # Directory to serve files from
   serve_from = None
   # Path to data file
   data_file_path = None
+  # Path to a sharded report directory (from "html_report --report-dir")
+  data_dir_path = None
+
+  def _DataDirRelativePath(self):
+    """Returns the requested path within |data_dir_path|, or None."""
+    if not SupersizeHTTPRequestHandler.data_dir_path:
+      return None
+    path = posixpath.normpath(self.path.split('?', 1)[0].split('#', 1)[0])
+    prefix = '/data/'
+    if not path.startswith(prefix):
+      return None
+    return path[len(prefix):]
+
+  def _ETag(self, path):
+    st = os.stat(path)
+    return '"%x-%x"' % (st.st_size, int(st.st_mtime * 1000))
 
   #override
   def translate_path(self, path):
+    rel_data_path = self._DataDirRelativePath()
+    if rel_data_path is not None:
+      return os.path.join(SupersizeHTTPRequestHandler.data_dir_path,
+                          *rel_data_path.split('/'))
     f = super(SupersizeHTTPRequestHandler, self).translate_path(path)
     relative_path = os.path.relpath(f, os.getcwd())
     if relative_path == 'data.ndjson':
@@ -26,10 +54,39 @@ class SupersizeHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler,
     else:
       return os.path.join(SupersizeHTTPRequestHandler.serve_from, relative_path)
 
+  #override
+  def send_head(self):
+    rel_data_path = self._DataDirRelativePath()
+    if rel_data_path is not None and not rel_data_path.startswith('shards/'):
+      # Allow the index to be revalidated without being re-sent.
+      path = self.translate_path(self.path)
+      if os.path.isfile(path):
+        etag = self._ETag(path)
+        if etag == self.headers.get('If-None-Match'):
+          self.send_response(304)
+          self.end_headers()  # Adds the ETag.
+          return None
+    return super(SupersizeHTTPRequestHandler, self).send_head()
+
+  #override
+  def end_headers(self):
+    rel_data_path = self._DataDirRelativePath()
+    if rel_data_path is not None:
+      if rel_data_path.startswith('shards/'):
+        self.send_header('Cache-Control', _IMMUTABLE_CACHE_CONTROL)
+      else:
+        self.send_header('Cache-Control', _REVALIDATE_CACHE_CONTROL)
+        path = self.translate_path(self.path)
+        if os.path.isfile(path):
+          self.send_header('ETag', self._ETag(path))
+    super(SupersizeHTTPRequestHandler, self).end_headers()
+
 
 def AddArguments(parser):
   parser.add_argument('report_file',
-                      help='Path to a custom html_report data file to load.')
+                      help='Path to a custom html_report data file to load, '
+                           'or to a directory created by '
+                           '"html_report --report-dir".')
   parser.add_argument('-p', '--port', type=int, default=8000,
                       help='Port for the HTTP server')
   parser.add_argument('-a', '--address', default='localhost',
@@ -43,10 +100,15 @@ def Run(args, _parser):
   static_files = os.path.join(os.path.dirname(__file__), 'static')
 
   SupersizeHTTPRequestHandler.serve_from = static_files
-  SupersizeHTTPRequestHandler.data_file_path = args.report_file
+  if os.path.isdir(args.report_file):
+    SupersizeHTTPRequestHandler.data_dir_path = args.report_file
+    data_url = 'data/index.json'
+  else:
+    SupersizeHTTPRequestHandler.data_file_path = args.report_file
+    data_url = 'data.ndjson'
   httpd = BaseHTTPServer.HTTPServer(server_addr, SupersizeHTTPRequestHandler)
 
   sa = httpd.socket.getsockname()
-  logging.warning('Server ready at http://%s:%d?data_url=data.ndjson',
-                  sa[0], sa[1])
+  logging.warning('Server ready at http://%s:%d?data_url=%s',
+                  sa[0], sa[1], data_url)
   httpd.serve_forever()
@@ -26,6 +26,8 @@
  * @prop {number} flags
  * @prop {{[type: string]: TreeNodeChildStats}} childStats Stats about this
  * node's descendants, organized by symbol type.
+ * @prop {object} [pendingShard] Only used by the worker. Set on directories of
+ * sharded reports whose contents have not been loaded yet.
  */
 /**
  * @typedef {object} TreeNodeChildStats Stats about a node's descendants of
@@ -33,6 +33,29 @@
  * @prop {number} c Index of the file's component in meta (component_index).
  * @prop {SymbolEntry[]} s - Symbols belonging to this node. Array of objects.
  */
+/**
+ * @typedef {object} ShardEntry JSON object describing one shard of a sharded
+ * report (created with `html_report --report-dir`).
+ * @prop {string} d Directory that the shard's files belong to.
+ * @prop {string} h Path to the shard's .ndjson file, relative to the index.
+ * @prop {{[type: string]: {b: number, u: number}}} s Total size and count of
+ * the shard's symbols, by symbol type.
+ */
+/**
+ * @typedef {object} ShardIndex JSON object stored in a sharded report's
+ * index.json. Contains meta information and the list of shards.
+ * @prop {Meta} meta
+ * @prop {ShardEntry[]} shards
+ */
+/**
+ * @typedef {object} PendingShard Data for a directory whose shard has not been
+ * loaded yet.
+ * @prop {string} url URL of the shard's .ndjson file.
+ * @prop {number} size Size of the shard's symbols included in the tree.
+ * @prop {{[type: string]: TreeNodeChildStats}} childStats Stats of the shard's
+ * symbols included in the tree.
+ * @prop {Promise<void> | null} [loading] Set while the shard is being fetched.
+ */
 
 importScripts('./shared.js');
 
@@ -159,44 +182,57 @@ class TreeBuilder {
     directParent.children.push(node);
     node.parent = directParent;
 
-    const additionalSize = node.size;
-    const additionalStats = Object.entries(node.childStats);
-    const additionalFlags = node.flags;
+    this._addToAncestors(
+      directParent,
+      node.size,
+      node.childStats,
+      node.flags
+    );
+  }
 
-    // Update the size and childStats of all ancestors
-    while (node.parent != null) {
-      const {parent} = node;
+  /**
+   * Adds sizes and childStats to a node and all of its ancestors.
+   * @param {TreeNode} node First node to update.
+   * @param {number} additionalSize
+   * @param {{[type: string]: TreeNodeChildStats}} childStats
+   * @param {number} additionalFlags
+   * @param {number} sign Use -1 to subtract the sizes and stats instead.
+   */
+  _addToAncestors(node, additionalSize, childStats, additionalFlags, sign = 1) {
+    const additionalStats = Object.entries(childStats);
 
+    // Update the size and childStats of all ancestors
+    while (node != null) {
       // Track the size of `lastBiggestType` for comparisons.
-      let [containerType, lastBiggestType] = parent.type;
+      let [containerType, lastBiggestType] = node.type;
       let lastBiggestSize = 0;
-      const lastBiggestStats = parent.childStats[lastBiggestType];
+      const lastBiggestStats = node.childStats[lastBiggestType];
       if (lastBiggestStats) {
         lastBiggestSize = lastBiggestStats.size;
       }
 
       for (const [type, stat] of additionalStats) {
-        let parentStat = parent.childStats[type];
-        if (parentStat == null) {
-          parentStat = {size: 0, count: 0, highlight: 0};
-          parent.childStats[type] = parentStat;
+        let nodeStat = node.childStats[type];
+        if (nodeStat == null) {
+          nodeStat = {size: 0, count: 0, highlight: 0};
+          node.childStats[type] = nodeStat;
         }
 
-        parentStat.size += stat.size;
-        parentStat.count += stat.count;
-        parentStat.highlight += stat.highlight;
+        nodeStat.size += sign * stat.size;
+        nodeStat.count += sign * stat.count;
+        nodeStat.highlight += sign * stat.highlight;
 
-        const absSize = Math.abs(parentStat.size);
+        const absSize = Math.abs(nodeStat.size);
         if (absSize > lastBiggestSize) {
           lastBiggestType = type;
           lastBiggestSize = absSize;
         }
       }
 
-      parent.type = `${containerType}${lastBiggestType}`;
-      parent.size += additionalSize;
-      parent.flags |= additionalFlags;
-      node = parent;
+      node.type = `${containerType}${lastBiggestType}`;
+      node.size += sign * additionalSize;
+      node.flags |= additionalFlags;
+      node = node.parent;
     }
   }
 
@@ -283,7 +319,9 @@ class TreeBuilder {
     const childDepth = depth - 1;
     // `null` represents that the children have not been loaded yet
     let children = null;
-    if (depth > 0 || node.children.length <= 1) {
+    if (node.pendingShard) {
+      // Children are not known until the directory's shard is loaded.
+    } else if (depth > 0 || node.children.length <= 1) {
       // If depth is larger than 0, include the children.
       // If there are 0 children, include the empty array to indicate the node
       // is a leaf.
@@ -298,6 +336,7 @@ class TreeBuilder {
       Object.assign({}, node, {
         children,
         parent: null,
+        pendingShard: undefined,
       })
     );
   }
@@ -408,6 +447,71 @@ class TreeBuilder {
     }
   }
 
+  /**
+   * Add a directory node whose contents are stored in a shard which has not
+   * been loaded yet. The directory (and its ancestors) immediately include the
+   * sizes of the shard's symbols, and `loadPendingShard` replaces them with the
+   * actual symbols once the directory is opened.
+   * @param {string} idPath Path of the directory.
+   * @param {PendingShard} pendingShard
+   */
+  addPendingDirectory(idPath, pendingShard) {
+    let dirNode = this._parents.get(idPath);
+    if (dirNode == null) {
+      dirNode = createNode({
+        idPath,
+        shortNameIndex: lastIndexOf(idPath, this._sep) + 1,
+        type: _CONTAINER_TYPES.DIRECTORY,
+      });
+      this._parents.set(idPath, dirNode);
+      let orphanNode = dirNode;
+      while (orphanNode.parent == null && orphanNode !== this.rootNode) {
+        orphanNode = this._getOrMakeParentNode(orphanNode);
+      }
+    }
+    dirNode.pendingShard = pendingShard;
+    this._addToAncestors(dirNode, pendingShard.size, pendingShard.childStats, 0);
+  }
+
+  /**
+   * Fetch the shard of a directory added with `addPendingDirectory`, and add
+   * its file entries to the tree. Concurrent calls share the same request.
+   * @param {TreeNode} dirNode
+   * @returns {Promise<void>}
+   */
+  loadPendingShard(dirNode) {
+    const {pendingShard} = dirNode;
+    if (!pendingShard) return Promise.resolve();
+    if (pendingShard.loading == null) {
+      pendingShard.loading = (async () => {
+        const shardFetcher = new DataFetcher(pendingShard.url);
+        /** @type {FileEntry[]} */
+        const fileEntries = [];
+        for await (const fileEntry of shardFetcher.newlineDelimtedJsonStream()) {
+          fileEntries.push(/** @type {FileEntry} */ (fileEntry));
+        }
+        // Swap the estimated stats for the real symbols all at once, so that
+        // a failed fetch leaves the tree unchanged.
+        dirNode.pendingShard = null;
+        this._addToAncestors(
+          dirNode,
+          pendingShard.size,
+          pendingShard.childStats,
+          0,
+          -1
+        );
+        for (const fileEntry of fileEntries) {
+          this.addFileEntry(fileEntry);
+        }
+      })();
+      // Allow retrying if the fetch failed.
+      pendingShard.loading.catch(() => {
+        pendingShard.loading = null;
+      });
+    }
+    return pendingShard.loading;
+  }
+
   /**
    * Finalize the creation of the tree and return the root node.
    */
@@ -495,6 +599,14 @@ class DataFetcher {
     this._input = input;
   }
 
+  /**
+   * Resolves a URL relative to the resource being fetched.
+   * @param {string} url
+   */
+  resolve(url) {
+    return new URL(url, new URL(String(this._input), self.location.href)).href;
+  }
+
   /**
    * Starts a new request and aborts the previous one.
    * @param {string | Request} url
@@ -624,8 +736,17 @@ function parseOptions(options) {
    */
   const filters = [];
 
+  /**
+   * Whether the shards of a sharded report can be loaded as directories are
+   * opened. The sizes shown for unopened directories come from the shard index,
+   * which only has totals by symbol type, so all shards must be loaded up-front
+   * to apply other filters or to group by something other than path.
+   */
+  let lazyShards = groupBy === 'source_path' && !flagToHighlight;
+
   // Ensure symbol size is past the minimum
   if (minSymbolSize > 0) {
+    lazyShards = false;
     filters.push(s => Math.abs(s.size) >= minSymbolSize);
   }
 
@@ -636,11 +757,13 @@ function parseOptions(options) {
 
   // Only show generated files
   if (filterGeneratedFiles) {
+    lazyShards = false;
     filters.push(s => hasFlag(_FLAGS.GENERATED_SOURCE, s));
   }
 
   // Search symbol names using regex
   if (includeRegex) {
+    lazyShards = false;
     try {
       const regex = new RegExp(includeRegex);
       filters.push(s => regex.test(s.idPath));
@@ -649,6 +772,7 @@ function parseOptions(options) {
     }
   }
   if (excludeRegex) {
+    lazyShards = false;
     try {
       const regex = new RegExp(excludeRegex);
       filters.push(s => !regex.test(s.idPath));
@@ -673,7 +797,15 @@ function parseOptions(options) {
     highlightTest = () => false;
   }
 
-  return {groupBy, filterTest, highlightTest, url};
+  /**
+   * Check that a symbol type passes the type filter.
+   * @param {string} type
+   */
+  function typeTest(type) {
+    return typeFilter.has(type);
+  }
+
+  return {groupBy, filterTest, highlightTest, typeTest, lazyShards, url};
 }
 
 /** @type {TreeBuilder | null} */
@@ -688,9 +820,20 @@ const fetcher = new DataFetcher('data.ndjson');
  * @param {(symbolNode: TreeNode) => boolean} highlightTest Filter function that
  * each symbol's flags are tested against
  * @param {(msg: TreeProgress) => void} onProgress
+ * @param {object} shardOptions Options for sharded reports.
+ * @param {(type: string) => boolean} shardOptions.typeTest Filter function that
+ * each symbol type is tested against.
+ * @param {boolean} shardOptions.lazyShards If true, shards are loaded when
+ * their directory is opened. Otherwise all shards are loaded immediately.
  * @returns {Promise<TreeProgress>}
  */
-async function buildTree(groupBy, filterTest, highlightTest, onProgress) {
+async function buildTree(
+  groupBy,
+  filterTest,
+  highlightTest,
+  onProgress,
+  {typeTest, lazyShards}
+) {
   /** @type {Meta | null} Object from the first line of the data file */
   let meta = null;
 
@@ -748,22 +891,76 @@ async function buildTree(groupBy, filterTest, highlightTest, onProgress) {
     onProgress(message);
   }
 
+  let lastBatchSent = Date.now();
+  /**
+   * Post partial state to the UI thread if enough time has passed since the
+   * last update, and let the worker check for messages.
+   */
+  async function postBatchToUi() {
+    const currentTime = Date.now();
+    if (currentTime - lastBatchSent > 500) {
+      postToUi();
+      await Promise.resolve(); // Pause loop to check for worker messages
+      lastBatchSent = currentTime;
+    }
+  }
+
+  /**
+   * Add the contents of a sharded report, given its index. Shards for the top
+   * level directory are always loaded.
+   * @param {ShardIndex} shardIndex
+   */
+  async function addShards(shardIndex) {
+    for (const shard of shardIndex.shards) {
+      const url = fetcher.resolve(shard.h);
+      if (lazyShards && shard.d !== '') {
+        /** @type {{[type: string]: TreeNodeChildStats}} */
+        const childStats = {};
+        let size = 0;
+        for (const [type, stat] of Object.entries(shard.s)) {
+          if (typeTest(type)) {
+            childStats[type] = {size: stat.b, count: stat.u, highlight: 0};
+            size += stat.b;
+          }
+        }
+        if (size !== 0 || Object.keys(childStats).length > 0) {
+          builder.addPendingDirectory(shard.d, {url, size, childStats});
+        }
+      } else {
+        const shardFetcher = new DataFetcher(url);
+        for await (const fileEntry of shardFetcher.newlineDelimtedJsonStream()) {
+          builder.addFileEntry(/** @type {FileEntry} */ (fileEntry));
+        }
+        await postBatchToUi();
+      }
+    }
+  }
+
   try {
-    // Post partial state every second
-    let lastBatchSent = Date.now();
+    /** @type {ShardIndex | null} */
+    let shardIndex = null;
     for await (const dataObj of fetcher.newlineDelimtedJsonStream()) {
       if (meta == null) {
-        // First line of data is used to store meta information.
-        meta = /** @type {Meta} */ (dataObj);
+        if (dataObj.shards) {
+          // Sharded reports start with an index instead of meta information.
+          shardIndex = /** @type {ShardIndex} */ (dataObj);
+          meta = shardIndex.meta;
+        } else {
+          // First line of data is used to store meta information.
+          meta = /** @type {Meta} */ (dataObj);
+        }
         postToUi();
       } else {
         builder.addFileEntry(/** @type {FileEntry} */ (dataObj));
-        const currentTime = Date.now();
-        if (currentTime - lastBatchSent > 500) {
-          postToUi();
-          await Promise.resolve(); // Pause loop to check for worker messages
-          lastBatchSent = currentTime;
-        }
+        await postBatchToUi();
+      }
+    }
+
+    if (shardIndex) {
+      await addShards(shardIndex);
+      if (lazyShards) {
+        // Keep the builder's state so that shards can be added when opened.
+        return createProgressMessage({percent: 1});
       }
     }
 
@@ -784,7 +981,14 @@ async function buildTree(groupBy, filterTest, highlightTest, onProgress) {
 const actions = {
   /** @param {{input:string|null,options:string}} param0 */
   load({input, options}) {
-    const {groupBy, filterTest, highlightTest, url} = parseOptions(options);
+    const {
+      groupBy,
+      filterTest,
+      highlightTest,
+      typeTest,
+      lazyShards,
+      url,
+    } = parseOptions(options);
     if (input === 'from-url://') {
       if (url) {
         // Display the data from the `data_url` query parameter
@@ -803,15 +1007,24 @@ const actions = {
       fetcher.setInput(input);
     }
 
-    return buildTree(groupBy, filterTest, highlightTest, progress => {
-      // @ts-ignore
-      self.postMessage(progress);
-    });
+    return buildTree(
+      groupBy,
+      filterTest,
+      highlightTest,
+      progress => {
+        // @ts-ignore
+        self.postMessage(progress);
+      },
+      {typeTest, lazyShards}
+    );
   },
   /** @param {string} path */
   async open(path) {
     if (!builder) throw new Error('Called open before load');
     const node = builder.find(path);
+    if (node.pendingShard) {
+      await builder.loadPendingShard(node);
+    }
     return builder.formatNode(node);
   },
 };
@@ -6,6 +6,9 @@
 """Lists all the reached symbols from an instrumentation dump."""
 
 import argparse
+import array
+import bisect
+import itertools
 import logging
 import operator
 import os
@@ -29,6 +32,91 @@ def _Median(items):
             sorted_items[len(sorted_items)/2]) / 2
 
 
+class _SymbolIntervalIndex(object):
+  """Maps dump offsets to the symbols containing them.
+
+  Equivalent to a table with one entry for every 4 bytes of .text, each either
+  a symbol or None, but only stores one interval per symbol. Intervals are
+  sorted and disjoint, so that lookups are binary searches.
+  """
+
+  def __init__(self, symbol_infos):
+    """Builds the index.
+
+    Args:
+      symbol_infos: ([symbol_extractor.SymbolInfo]) Symbols, sorted by offset.
+        When several symbols cover the same words, the last one wins.
+    """
+    min_offset = min(s.offset for s in symbol_infos)
+    max_offset = max(s.offset + s.size for s in symbol_infos)
+    self._length_words = (max_offset - min_offset) / 4
+    # Disjoint [start word, end word, symbol] intervals, sorted by start.
+    intervals = []
+    for s in symbol_infos:
+      offset = s.offset - min_offset
+      start, end = offset / 4, (offset + s.size) / 4
+      if start >= end:
+        continue
+      # Symbols are sorted by offset, so only the last intervals can overlap
+      # with this symbol. Cut them around it.
+      overlapping = []
+      while intervals and intervals[-1][1] > start:
+        overlapping.append(intervals.pop())
+      overlapping.reverse()
+      for interval in overlapping:
+        if interval[0] < start:
+          intervals.append([interval[0], start, interval[2]])
+      intervals.append([start, end, s])
+      for interval in overlapping:
+        if interval[1] > end:
+          intervals.append([max(interval[0], end), interval[1], interval[2]])
+    self._starts = array.array('l', (i[0] for i in intervals))
+    self._ends = array.array('l', (i[1] for i in intervals))
+    self._symbols = [i[2] for i in intervals]
+
+  def __len__(self):
+    """The number of 4-byte words of .text covered by the index."""
+    return self._length_words
+
+  def _CheckWord(self, word):
+    assert 0 <= word < self._length_words, 'Dump offset out of binary range'
+
+  def Lookup(self, dump_offset):
+    """Returns the symbol containing |dump_offset|, or None."""
+    word = dump_offset / 4
+    self._CheckWord(word)
+    i = bisect.bisect_right(self._starts, word) - 1
+    if i >= 0 and word < self._ends[i]:
+      return self._symbols[i]
+    return None
+
+  def LookupMany(self, dump_offsets):
+    """Like Lookup(), for a list of offsets.
+
+    Sorts the offsets and walks the intervals once, which is faster than one
+    binary search per offset for whole dumps.
+
+    Returns:
+      [symbol_extractor.SymbolInfo or None] The symbol containing each offset.
+    """
+    words = sorted(set(o / 4 for o in dump_offsets))
+    if not words:
+      return []
+    self._CheckWord(words[0])
+    self._CheckWord(words[-1])
+    word_to_symbol = {}
+    i = 0
+    num_intervals = len(self._symbols)
+    for word in words:
+      while i < num_intervals and self._ends[i] <= word:
+        i += 1
+      if i < num_intervals and self._starts[i] <= word:
+        word_to_symbol[word] = self._symbols[i]
+      else:
+        word_to_symbol[word] = None
+    return [word_to_symbol[o / 4] for o in dump_offsets]
+
+
 class SymbolOffsetProcessor(object):
   """Utility for processing symbols in binaries.
 
@@ -56,7 +144,7 @@ class SymbolOffsetProcessor(object):
     self._name_to_symbol = None
     self._offset_to_primary = None
     self._offset_to_symbols = None
-    self._offset_to_symbol_info = None
+    self._dump_offset_to_symbol_index = None
 
   def SymbolInfos(self):
     """The symbols associated with this processor's binary.
@@ -204,15 +292,13 @@ class SymbolOffsetProcessor(object):
       get: (lambda item) As described above.
       update: (lambda item, int) As described above.
     """
-    dump_offset_to_symbol_info = self._GetDumpOffsetToSymbolInfo()
-    logging.info('Offset to Symbol size = %d', len(dump_offset_to_symbol_info))
+    dump_offset_to_symbol_index = self._GetDumpOffsetToSymbolIndex()
+    logging.info('Offset to Symbol size = %d', len(dump_offset_to_symbol_index))
+    items = list(items)
+    symbol_infos = dump_offset_to_symbol_index.LookupMany(
+        [get(i) for i in items])
     reached_return_addresses_not_found = 0
-    for i in items:
-      dump_offset = get(i)
-      idx = dump_offset / 4
-      assert idx < len(dump_offset_to_symbol_info), (
-          'Dump offset out of binary range')
-      symbol_info = dump_offset_to_symbol_info[idx]
+    for i, symbol_info in itertools.izip(items, symbol_infos):
       if symbol_info is None:
         reached_return_addresses_not_found += 1
         update(i, None)
@@ -222,23 +308,17 @@ class SymbolOffsetProcessor(object):
       logging.warning('%d return addresses don\'t map to any symbol',
                       reached_return_addresses_not_found)
 
-  def _GetDumpOffsetToSymbolInfo(self):
-    """Computes an array mapping each word in .text to a symbol.
+  def _GetDumpOffsetToSymbolIndex(self):
+    """Computes an index mapping each word in .text to a symbol.
 
     Returns:
-      [symbol_extractor.SymbolInfo or None] For every 4 bytes of the .text
-        section, maps it to a symbol, or None.
+      _SymbolIntervalIndex For every 4 bytes of the .text section, maps it to a
+        symbol, or None.
     """
-    if self._offset_to_symbol_info is None:
-      min_offset = min(s.offset for s in self.SymbolInfos())
-      max_offset = max(s.offset + s.size for s in self.SymbolInfos())
-      text_length_words = (max_offset - min_offset) / 4
-      self._offset_to_symbol_info = [None for _ in xrange(text_length_words)]
-      for s in self.SymbolInfos():
-        offset = s.offset - min_offset
-        for i in range(offset / 4, (offset + s.size) / 4):
-          self._offset_to_symbol_info[i] = s
-    return self._offset_to_symbol_info
+    if self._dump_offset_to_symbol_index is None:
+      self._dump_offset_to_symbol_index = _SymbolIntervalIndex(
+          self.SymbolInfos())
+    return self._dump_offset_to_symbol_index
 
 
 class ProfileManager(object):
@@ -36,8 +36,34 @@ class ProcessProfilesTestCase(unittest.TestCase):
 
   def testGetOffsetToSymbolInfo(self):
     processor = TestSymbolOffsetProcessor(self.symbol_infos)
-    offset_to_symbol_info = processor._GetDumpOffsetToSymbolInfo()
-    self.assertListEqual(self.offset_to_symbol_info, offset_to_symbol_info)
+    index = processor._GetDumpOffsetToSymbolIndex()
+    self.assertEqual(len(self.offset_to_symbol_info), len(index))
+    dump = range(0, 4 * len(index), 2)
+    self.assertListEqual(self.offset_to_symbol_info,
+                         [index.Lookup(4 * i) for i in xrange(len(index))])
+    self.assertListEqual([index.Lookup(o) for o in dump],
+                         index.LookupMany(dump))
+    with self.assertRaises(AssertionError):
+      index.Lookup(4 * len(index))
+    with self.assertRaises(AssertionError):
+      index.LookupMany([0, 4 * len(index)])
+
+  def testOverlappingSymbols(self):
+    # Like the table of each word of .text that used to be built, later
+    # symbols win where symbols overlap.
+    symbol_infos = [SimpleTestSymbol('Outer', 0, 40),
+                    SimpleTestSymbol('Alias', 8, 8),
+                    SimpleTestSymbol('Inner', 8, 8),
+                    SimpleTestSymbol('Tail', 12, 16),
+                    SimpleTestSymbol('Odd', 30, 5)]
+    table = [None] * 10
+    for s in symbol_infos:
+      for i in range(s.offset / 4, (s.offset + s.size) / 4):
+        table[i] = s
+    processor = TestSymbolOffsetProcessor(symbol_infos)
+    index = processor._GetDumpOffsetToSymbolIndex()
+    self.assertListEqual(table, index.LookupMany(range(0, 40, 4)))
+    self.assertListEqual(table, [index.Lookup(o) for o in range(0, 40, 4)])
 
   def testGetReachedOffsetsFromDump(self):
     processor = TestSymbolOffsetProcessor(self.symbol_infos)
@@ -7,7 +7,12 @@
 
 import ast
 import difflib
+import hashlib
+import itertools
 import json
+import mmap
+import multiprocessing
+import operator
 import optparse
 import os
 import re
@@ -15,10 +20,14 @@ import shutil
 import struct
 import subprocess
 import sys
+import tempfile
 import time
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Bump whenever the format of the digest cache changes.
+DIGEST_CACHE_VERSION = 2
+
 
 def get_files_to_compare(build_dir, recursive=False):
   """Get the list of files to compare."""
@@ -70,7 +79,6 @@ def diff_binary(first_filepath, second_filepath, file_len):
   """Returns a compact binary diff if the diff is small enough."""
   BLOCK_SIZE = 8192
   CHUNK_SIZE = 32
-  NUM_CHUNKS_IN_BLOCK = BLOCK_SIZE / CHUNK_SIZE
   MAX_STREAMS = 10
   diffs = 0
   streams = []
@@ -113,14 +121,18 @@ def diff_binary(first_filepath, second_filepath, file_len):
         if not lhs_data:
           break
         if lhs_data != rhs_data:
-          diffs += sum(l != r for l, r in zip(lhs_data, rhs_data))
-          for idx in xrange(NUM_CHUNKS_IN_BLOCK):
-            lhs_chunk = lhs_data[idx * CHUNK_SIZE:(idx + 1) * CHUNK_SIZE]
-            rhs_chunk = rhs_data[idx * CHUNK_SIZE:(idx + 1) * CHUNK_SIZE]
-            if streams is not None and lhs_chunk != rhs_chunk:
+          # Equal chunks are skipped with a plain string comparison, and bytes
+          # are only counted in the differing chunks, without a Python-level
+          # loop.
+          for idx in xrange(0, len(lhs_data), CHUNK_SIZE):
+            lhs_chunk = lhs_data[idx:idx + CHUNK_SIZE]
+            rhs_chunk = rhs_data[idx:idx + CHUNK_SIZE]
+            if lhs_chunk == rhs_chunk:
+              continue
+            diffs += sum(itertools.imap(operator.ne, lhs_chunk, rhs_chunk))
+            if streams is not None:
               if len(streams) < MAX_STREAMS:
-                streams.append((offset + CHUNK_SIZE * idx,
-                                lhs_chunk, rhs_chunk))
+                streams.append((offset + idx, lhs_chunk, rhs_chunk))
               else:
                 streams = None
         offset += len(lhs_data)
@@ -164,6 +176,145 @@ def compare_files(first_filepath, second_filepath):
   return diff_binary(first_filepath, second_filepath, file_len)
 
 
+def _compare_file_pair(filepaths):
+  return compare_files(*filepaths)
+
+
+def get_file_digest(filepath):
+  """Returns the SHA-1 hex digest of a file, reading it through mmap."""
+  with open(filepath, 'rb') as f:
+    # Empty files cannot be mapped.
+    if not os.fstat(f.fileno()).st_size:
+      return hashlib.sha1().hexdigest()
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      return hashlib.sha1(data).hexdigest()
+    finally:
+      data.close()
+
+
+class DigestCache(object):
+  """Caches file digests across runs, keyed by (absolute path, size, mtime).
+
+  Absolute paths keep the entries of different build directories apart,
+  whatever directory the runs were started from.
+  """
+
+  def __init__(self, cache_path):
+    self._cache_path = cache_path
+    self._entries = {}
+    self._dirty = False
+    if not os.path.exists(cache_path):
+      return
+    try:
+      with open(cache_path, 'rb') as f:
+        cache = json.load(f)
+    except ValueError:
+      print >> sys.stderr, 'Ignoring invalid digest cache %s' % cache_path
+      return
+    if cache.get('version') == DIGEST_CACHE_VERSION:
+      self._entries = cache['entries']
+
+  def get(self, filepath, stat):
+    entry = self._entries.get(os.path.abspath(filepath))
+    if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+      return entry[2]
+    return None
+
+  def set(self, filepath, stat, digest):
+    self._entries[os.path.abspath(filepath)] = [
+        stat.st_size, stat.st_mtime, digest]
+    self._dirty = True
+
+  def save(self):
+    if not self._dirty:
+      return
+    # Write to a temporary file first, so that an interrupted run never leaves
+    # a truncated cache behind.
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(self._cache_path)))
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        json.dump({'version': DIGEST_CACHE_VERSION, 'entries': self._entries},
+                  f)
+      os.rename(tmp_path, self._cache_path)
+    except:
+      os.unlink(tmp_path)
+      raise
+    self._dirty = False
+
+
+def _imap(pool, func, iterable):
+  if pool:
+    return pool.imap(func, iterable, chunksize=8)
+  return itertools.imap(func, iterable)
+
+
+def get_file_digests(filepaths, pool=None, digest_cache=None):
+  """Returns a dict mapping each of |filepaths| to its digest.
+
+  Files are hashed in |pool| if given, and unchanged files are read from
+  |digest_cache| if given.
+  """
+  digests = {}
+  to_hash = []
+  for filepath in filepaths:
+    stat = os.stat(filepath)
+    digest = digest_cache.get(filepath, stat) if digest_cache else None
+    if digest:
+      digests[filepath] = digest
+    else:
+      to_hash.append((filepath, stat))
+  hashed = _imap(pool, get_file_digest, [filepath for filepath, _ in to_hash])
+  for (filepath, stat), digest in itertools.izip(to_hash, hashed):
+    digests[filepath] = digest
+    if digest_cache:
+      digest_cache.set(filepath, stat, digest)
+  return digests
+
+
+def compare_all_files(first_dir, second_dir, files, pool=None,
+                      digest_cache=None):
+  """Compares |files| in two directories.
+
+  Files of the same size are hashed first, and only the files whose digests
+  differ are compared in detail with compare_files().
+
+  Args:
+    first_dir: The first build directory.
+    second_dir: The second build directory.
+    files: The paths of the files to compare, relative to both directories.
+    pool: If set, a multiprocessing.Pool to hash and compare files in.
+    digest_cache: If set, a DigestCache of the digests of both directories.
+
+  Returns:
+    A dict mapping each of |files| to the result of compare_files().
+  """
+  filepaths = dict(
+      (f, (os.path.join(first_dir, f), os.path.join(second_dir, f)))
+      for f in files)
+  same_size = [
+      f for f, (first_file, second_file) in filepaths.iteritems()
+      if os.path.getsize(first_file) == os.path.getsize(second_file)]
+  digests = get_file_digests(
+      [filepath for f in same_size for filepath in filepaths[f]],
+      pool, digest_cache)
+
+  results = {}
+  to_compare = []
+  for f in files:
+    first_file, second_file = filepaths[f]
+    first_digest = digests.get(first_file)
+    if first_digest and first_digest == digests.get(second_file):
+      results[f] = None
+    else:
+      to_compare.append(f)
+  results.update(itertools.izip(
+      to_compare,
+      _imap(pool, _compare_file_pair, [filepaths[f] for f in to_compare])))
+  return results
+
+
 def get_deps(ninja_path, build_dir, target):
   """Returns list of object files needed to build target."""
   NODE_PATTERN = re.compile(r'label="([a-zA-Z0-9_\\/.-]+)"')
@@ -207,7 +358,8 @@ def get_deps(ninja_path, build_dir, target):
   return files
 
 
-def compare_deps(first_dir, second_dir, ninja_path, targets):
+def compare_deps(first_dir, second_dir, ninja_path, targets, pool=None,
+                 digest_cache=None):
   """Print difference of dependent files."""
   diffs = set()
   for target in targets:
@@ -221,10 +373,10 @@ def compare_deps(first_dir, second_dir, ninja_path, targets):
           target, set(first_deps).symmetric_difference(set(second_deps)))
       continue
     max_filepath_len = max(len(n) for n in first_deps)
+    results = compare_all_files(first_dir, second_dir, first_deps, pool,
+                                digest_cache)
     for d in first_deps:
-      first_file = os.path.join(first_dir, d)
-      second_file = os.path.join(second_dir, d)
-      result = compare_files(first_file, second_file)
+      result = results[d]
       if result:
         print('  %-*s: %s' % (max_filepath_len, d, result))
         diffs.add(d)
@@ -232,7 +384,8 @@ def compare_deps(first_dir, second_dir, ninja_path, targets):
 
 
 def compare_build_artifacts(first_dir, second_dir, ninja_path, target_platform,
-                            json_output, recursive=False):
+                            json_output, recursive=False, jobs=1,
+                            digest_cache_path=None):
   """Compares the artifacts from two distinct builds."""
   if not os.path.isdir(first_dir):
     print >> sys.stderr, '%s isn\'t a valid directory.' % first_dir
@@ -265,11 +418,13 @@ def compare_build_artifacts(first_dir, second_dir, ninja_path, target_platform,
     print >> sys.stderr, '\n'.join('  ' + i for i in missing_files)
     unexpected_diffs.extend(missing_files)
 
+  pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+  digest_cache = DigestCache(digest_cache_path) if digest_cache_path else None
   max_filepath_len = max(len(n) for n in all_files)
+  results = compare_all_files(first_dir, second_dir, all_files, pool,
+                              digest_cache)
   for f in all_files:
-    first_file = os.path.join(first_dir, f)
-    second_file = os.path.join(second_dir, f)
-    result = compare_files(first_file, second_file)
+    result = results[f]
     if not result:
       tag = 'equal'
       equals.append(f)
@@ -301,7 +456,13 @@ def compare_build_artifacts(first_dir, second_dir, ninja_path, target_platform,
   all_diffs = expected_diffs + unexpected_diffs
   diffs_to_investigate = sorted(set(all_diffs).difference(missing_files))
   deps_diff = compare_deps(first_dir, second_dir,
-                           ninja_path, diffs_to_investigate)
+                           ninja_path, diffs_to_investigate, pool,
+                           digest_cache)
+  if pool:
+    pool.close()
+    pool.join()
+  if digest_cache:
+    digest_cache.save()
 
   if json_output:
     try:
@@ -329,6 +490,13 @@ def main():
   parser.add_option('--json-output', help='JSON file to output differences')
   parser.add_option('--ninja-path', help='path to ninja command.',
                     default='ninja')
+  parser.add_option('-j', '--jobs', type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='Number of processes to hash and compare files in.')
+  parser.add_option('--digest-cache',
+                    help='File in which to cache the digests of files across '
+                         'runs. Files whose size and modification time did '
+                         'not change are not hashed again.')
   target = {
       'darwin': 'mac', 'linux2': 'linux', 'win32': 'win'
   }.get(sys.platform, sys.platform)
@@ -348,7 +516,9 @@ def main():
                                  options.ninja_path,
                                  options.target_platform,
                                  options.json_output,
-                                 options.recursive)
+                                 options.recursive,
+                                 options.jobs,
+                                 options.digest_cache)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import compare_build_artifacts
+
+
+_LHS = 'abcdefghijklmnopqrstuvwxyz012345' * 2
+_RHS = _LHS[:2] + 'C' + _LHS[3:40] + '\x00' + _LHS[41:]
+
+# The output of diff_binary(_LHS, _RHS) before files were compared by chunks.
+_EXPECTED_DIFF = (
+    '2 out of 64 bytes are different (3.12%)\n'
+    '  0x0       : 6162636465666768696a6b6c6d6e6f707172737475767778797a'
+    "303132333435 'abcdefghijklmnopqrstuvwxyz012345'\n"
+    '              6162436465666768696a6b6c6d6e6f707172737475767778797a'
+    "303132333435 'abCdefghijklmnopqrstuvwxyz012345'\n"
+    '                  ^                                               '
+    '                ^\n'
+    '  0x20      : 6162636465666768696a6b6c6d6e6f707172737475767778797a'
+    "303132333435 'abcdefghijklmnopqrstuvwxyz012345'\n"
+    '              6162636465666768006a6b6c6d6e6f707172737475767778797a'
+    "303132333435 'abcdefgh.jklmnopqrstuvwxyz012345'\n"
+    '                              ^^                                  '
+    '                      ^')
+
+
+class CompareBuildArtifactsTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.first_dir = os.path.join(self.temp_dir, 'first')
+    self.second_dir = os.path.join(self.temp_dir, 'second')
+    os.mkdir(self.first_dir)
+    os.mkdir(self.second_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _WriteFile(self, dirname, name, contents):
+    path = os.path.join(dirname, name)
+    with open(path, 'wb') as f:
+      f.write(contents)
+    return path
+
+  def _WriteFiles(self):
+    for dirname, contents in ((self.first_dir, _LHS), (self.second_dir, _RHS)):
+      self._WriteFile(dirname, 'equal', 'equal' * 10000)
+      self._WriteFile(dirname, 'sparse', contents)
+      self._WriteFile(dirname, 'empty', '')
+    self._WriteFile(self.first_dir, 'size', 'abc')
+    self._WriteFile(self.second_dir, 'size', 'abcd')
+    return ['empty', 'equal', 'size', 'sparse']
+
+  def testDiffBinary(self):
+    lhs = self._WriteFile(self.first_dir, 'sparse', _LHS)
+    rhs = self._WriteFile(self.second_dir, 'sparse', _RHS)
+    self.assertEqual(_EXPECTED_DIFF,
+                     compare_build_artifacts.diff_binary(lhs, rhs, len(_LHS)))
+    self.assertEqual(None,
+                     compare_build_artifacts.diff_binary(lhs, lhs, len(_LHS)))
+
+  def testDiffBinary_ManyBlocks(self):
+    # Too many differing chunks to list, across several blocks.
+    contents = '\0' * 8192 * 2
+    changed = list(contents)
+    for i in xrange(0, len(contents), 1000):
+      changed[i] = 'z'
+    lhs = self._WriteFile(self.first_dir, 'large', contents)
+    rhs = self._WriteFile(self.second_dir, 'large', ''.join(changed))
+    self.assertEqual(
+        '17 out of 16384 bytes are different (0.10%)',
+        compare_build_artifacts.diff_binary(lhs, rhs, len(contents)))
+
+  def testCompareAllFiles(self):
+    files = self._WriteFiles()
+    expected = {
+        'empty': None,
+        'equal': None,
+        'size': 'different size: 3 != 4',
+        'sparse': _EXPECTED_DIFF,
+    }
+    self.assertEqual(expected, compare_build_artifacts.compare_all_files(
+        self.first_dir, self.second_dir, files))
+
+    pool = multiprocessing.Pool(2)
+    try:
+      self.assertEqual(expected, compare_build_artifacts.compare_all_files(
+          self.first_dir, self.second_dir, files, pool))
+    finally:
+      pool.close()
+      pool.join()
+
+  def testCompareAllFiles_DigestCache(self):
+    files = self._WriteFiles()
+    cache_path = os.path.join(self.temp_dir, 'digests.json')
+    digest_cache = compare_build_artifacts.DigestCache(cache_path)
+    expected = compare_build_artifacts.compare_all_files(
+        self.first_dir, self.second_dir, files, digest_cache=digest_cache)
+    digest_cache.save()
+
+    hashed = []
+    get_file_digest = compare_build_artifacts.get_file_digest
+    def GetFileDigest(filepath):
+      hashed.append(filepath)
+      return get_file_digest(filepath)
+    compare_build_artifacts.get_file_digest = GetFileDigest
+    try:
+      # A new run only hashes the files that changed since the last one.
+      digest_cache = compare_build_artifacts.DigestCache(cache_path)
+      self.assertEqual(expected, compare_build_artifacts.compare_all_files(
+          self.first_dir, self.second_dir, files, digest_cache=digest_cache))
+      self.assertEqual([], hashed)
+
+      changed = self._WriteFile(self.second_dir, 'equal', 'other' * 10001)
+      results = compare_build_artifacts.compare_all_files(
+          self.first_dir, self.second_dir, files, digest_cache=digest_cache)
+      self.assertEqual([], hashed)
+      self.assertEqual('different size: 50000 != 50005', results['equal'])
+
+      self._WriteFile(self.second_dir, 'equal', 'other' * 10000)
+      # Make sure the modification time changed too.
+      os.utime(changed, (0, 0))
+      results = compare_build_artifacts.compare_all_files(
+          self.first_dir, self.second_dir, files, digest_cache=digest_cache)
+      self.assertEqual([changed], hashed)
+      self.assertEqual('50000 out of 50000 bytes are different (100.00%)',
+                       results['equal'])
+    finally:
+      compare_build_artifacts.get_file_digest = get_file_digest
+
+  def testDigestCache_AbsolutePaths(self):
+    path = self._WriteFile(self.first_dir, 'file', 'contents')
+    stat = os.stat(path)
+    digest_cache = compare_build_artifacts.DigestCache(
+        os.path.join(self.temp_dir, 'digests.json'))
+    digest_cache.set(path, stat, 'digest')
+
+    cwd = os.getcwd()
+    os.chdir(self.first_dir)
+    try:
+      self.assertEqual('digest', digest_cache.get('file', stat))
+      # The same relative path in another directory is another file.
+      os.chdir(self.second_dir)
+      self.assertEqual(None, digest_cache.get('file', stat))
+    finally:
+      os.chdir(cwd)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -8,6 +8,8 @@ Note that source file names are treated as symbols in this script while they
 are actually not.
 """
 
+import bisect
+import itertools
 import json
 import logging
 import os
@@ -39,6 +41,8 @@ TYPEINFO_SYMBOLS = 2
 _MAPS_FILENAME = 'maps'
 _FILES_FILENAME = 'files.json'
 
+LOGGER = logging.getLogger('find_runtime_symbols')
+
 
 class RuntimeSymbolsInProcess(object):
   def __init__(self):
@@ -78,6 +82,56 @@ class RuntimeSymbolsInProcess(object):
           return None
     return None
 
+  def _find_many(self, addresses, condition, find_method_name):
+    sorted_addresses = sorted(set(addresses))
+    found_dict = {}
+    index = 0
+    for vma in self._maps.iter(condition):
+      begin = bisect.bisect_left(sorted_addresses, vma.begin, index)
+      end = bisect.bisect_left(sorted_addresses, vma.end, begin)
+      index = end
+      static_symbols = self._static_symbols_in_filse.get(vma.name)
+      if begin == end or not static_symbols:
+        continue
+      vma_addresses = sorted_addresses[begin:end]
+      found_dict.update(itertools.izip(
+          vma_addresses,
+          getattr(static_symbols, find_method_name)(vma_addresses, vma)))
+    return found_dict
+
+  def find_procedures(self, addresses):
+    """Finds procedures for many runtime addresses at once.
+
+    It is much faster than calling find_procedure() for each address since
+    addresses are resolved in a single pass over sorted symbols.
+
+    Returns:
+        A dict mapping each of |addresses| to a Procedure, or to None if not
+        found.
+    """
+    return self._find_many(addresses, ProcMaps.executable,
+                           'find_procedures_by_runtime_addresses')
+
+  def find_sourcefiles(self, addresses):
+    return self._find_many(addresses, ProcMaps.executable,
+                           'find_sourcefiles_by_runtime_addresses')
+
+  def find_typeinfos(self, addresses):
+    return self._find_many(addresses, ProcMaps.constants,
+                           'find_typeinfos_by_runtime_addresses')
+
+  @staticmethod
+  def _load_symbol_table(prepared_data_dir, name, symbol_table_entry):
+    try:
+      with open(os.path.join(prepared_data_dir, symbol_table_entry['file']),
+                'rb') as f:
+        return StaticSymbolsInFile.load_symbol_table(
+            name, f, symbol_table_entry.get('build-id'))
+    except Exception as e:  # pylint: disable=W0703
+      # Fall back to the outputs of nm and readelf.
+      LOGGER.warn('Failed to load a symbol table for %s: %s' % (name, e))
+      return None
+
   @staticmethod
   def load(prepared_data_dir):
     symbols_in_process = RuntimeSymbolsInProcess()
@@ -93,6 +147,14 @@ class RuntimeSymbolsInProcess(object):
       if not file_entry:
         continue
 
+      symbol_table_entry = file_entry.get('symbol-table')
+      if symbol_table_entry:
+        static_symbols = RuntimeSymbolsInProcess._load_symbol_table(
+            prepared_data_dir, vma.name, symbol_table_entry)
+        if static_symbols:
+          symbols_in_process._static_symbols_in_filse[vma.name] = static_symbols
+          continue
+
       static_symbols = StaticSymbolsInFile(vma.name)
 
       nm_entry = file_entry.get('nm')
@@ -117,12 +179,21 @@ class RuntimeSymbolsInProcess(object):
     return symbols_in_process
 
 
-def _find_runtime_function_symbols(symbols_in_process, addresses):
-  result = OrderedDict()
+def _parse_addresses(addresses):
+  parsed = []
   for address in addresses:
     if isinstance(address, basestring):
       address = int(address, 16)
-    found = symbols_in_process.find_procedure(address)
+    parsed.append(address)
+  return parsed
+
+
+def _find_runtime_function_symbols(symbols_in_process, addresses):
+  addresses = _parse_addresses(addresses)
+  found_dict = symbols_in_process.find_procedures(addresses)
+  result = OrderedDict()
+  for address in addresses:
+    found = found_dict.get(address)
     if found:
       result[address] = found.name
     else:
@@ -131,11 +202,11 @@ def _find_runtime_function_symbols(symbols_in_process, addresses):
 
 
 def _find_runtime_sourcefile_symbols(symbols_in_process, addresses):
+  addresses = _parse_addresses(addresses)
+  found_dict = symbols_in_process.find_sourcefiles(addresses)
   result = OrderedDict()
   for address in addresses:
-    if isinstance(address, basestring):
-      address = int(address, 16)
-    found = symbols_in_process.find_sourcefile(address)
+    found = found_dict.get(address)
     if found:
       result[address] = found
     else:
@@ -144,14 +215,15 @@ def _find_runtime_sourcefile_symbols(symbols_in_process, addresses):
 
 
 def _find_runtime_typeinfo_symbols(symbols_in_process, addresses):
+  addresses = _parse_addresses(addresses)
+  found_dict = symbols_in_process.find_typeinfos(
+      [address for address in addresses if address != 0])
   result = OrderedDict()
   for address in addresses:
-    if isinstance(address, basestring):
-      address = int(address, 16)
     if address == 0:
       result[address] = 'no typeinfo'
     else:
-      found = symbols_in_process.find_typeinfo(address)
+      found = found_dict.get(address)
       if found:
         if found.startswith('typeinfo for '):
           result[address] = found[13:]
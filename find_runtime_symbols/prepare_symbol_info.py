@@ -22,10 +22,13 @@ sys.path.insert(0, _TOOLS_LINUX_PATH)
 
 
 from procfs import ProcMaps  # pylint: disable=F0401
+from static_symbols import StaticSymbolsInFile
 
 
 LOGGER = logging.getLogger('prepare_symbol_info')
 
+_BUILD_ID_PATTERN = re.compile(r'^\s*Build ID: ([0-9a-fA-F]+)\s*$', re.M)
+
 
 def _dump_command_result(command, output_dir_path, basename, suffix):
   handle_out, filename_out = tempfile.mkstemp(
@@ -60,11 +63,65 @@ def _dump_command_result(command, output_dir_path, basename, suffix):
   return filename_out
 
 
+def _get_build_id(binary_path):
+  """Returns the GNU build-id of |binary_path|, or None if it has none."""
+  try:
+    with open(os.devnull, 'w') as devnull:
+      notes = subprocess.check_output(['readelf', '-n', binary_path],
+                                      stderr=devnull)
+  except (OSError, subprocess.CalledProcessError):
+    return None
+  matched = _BUILD_ID_PATTERN.search(notes)
+  if not matched:
+    return None
+  return matched.group(1).lower()
+
+
+def _dump_symbol_table(name, build_id, output_dir_path, basename,
+                       nm_filename, readelf_e_filename,
+                       readelf_debug_decodedline_file):
+  """Parses the outputs of nm and readelf once into a binary symbol table."""
+  static_symbols = StaticSymbolsInFile(name)
+  with open(nm_filename, 'r') as f:
+    static_symbols.load_nm_bsd(f, False)
+  with open(readelf_e_filename, 'r') as f:
+    static_symbols.load_readelf_ew(f)
+  if readelf_debug_decodedline_file:
+    with open(readelf_debug_decodedline_file, 'r') as f:
+      static_symbols.load_readelf_debug_decodedline_file(f)
+
+  handle, filename = tempfile.mkstemp(
+      suffix='.symtab', prefix=basename + '.', dir=output_dir_path)
+  with os.fdopen(handle, 'wb') as f:
+    static_symbols.dump_symbol_table(f, build_id)
+  return filename
+
+
+def _copy_atomically(source_path, dest_path):
+  dest_dir = os.path.dirname(dest_path)
+  if not os.path.isdir(dest_dir):
+    try:
+      os.makedirs(dest_dir)
+    except OSError:
+      # Another process may have created it.
+      if not os.path.isdir(dest_dir):
+        raise
+  handle, tmp_path = tempfile.mkstemp(dir=dest_dir)
+  os.close(handle)
+  try:
+    shutil.copyfile(source_path, tmp_path)
+    os.rename(tmp_path, dest_path)
+  except:
+    os.unlink(tmp_path)
+    raise
+
+
 def prepare_symbol_info(maps_path,
                         output_dir_path=None,
                         alternative_dirs=None,
                         use_tempdir=False,
-                        use_source_file_name=False):
+                        use_source_file_name=False,
+                        symbol_cache_dir=None):
   """Prepares (collects) symbol information files for find_runtime_symbols.
 
   1) If |output_dir_path| is specified, it tries collecting symbol information
@@ -91,6 +148,9 @@ def prepare_symbol_info(maps_path,
           create a new directory.
       use_source_file_name: If True, it adds reduced result of 'readelf -wL'
           to find source file names.
+      symbol_cache_dir: A path to a directory where binary symbol tables are
+          cached by build-id.  Binaries whose symbol table is cached there
+          are not processed by nm and readelf again.
 
   Returns:
       A pair of a path to the prepared directory and a boolean representing
@@ -158,32 +218,58 @@ def prepare_symbol_info(maps_path,
     if not (ProcMaps.EXECUTABLE_PATTERN.match(binary_path) or
             (os.path.isfile(binary_path) and os.access(binary_path, os.X_OK))):
       continue
-    nm_filename = _dump_command_result(
-        'nm -n --format bsd %s | c++filt' % binary_path,
-        output_dir_path, os.path.basename(binary_path), '.nm')
-    if not nm_filename:
-      continue
-    readelf_e_filename = _dump_command_result(
-        'readelf -eW %s' % binary_path,
-        output_dir_path, os.path.basename(binary_path), '.readelf-e')
-    if not readelf_e_filename:
-      continue
-    readelf_debug_decodedline_file = None
-    if use_source_file_name:
-      readelf_debug_decodedline_file = _dump_command_result(
-          'readelf -wL %s | %s' % (binary_path, REDUCE_DEBUGLINE_PATH),
-          output_dir_path, os.path.basename(binary_path), '.readelf-wL')
-
-    files[entry.name] = {}
-    files[entry.name]['nm'] = {
-        'file': os.path.basename(nm_filename),
-        'format': 'bsd',
-        'mangled': False}
-    files[entry.name]['readelf-e'] = {
-        'file': os.path.basename(readelf_e_filename)}
-    if readelf_debug_decodedline_file:
-      files[entry.name]['readelf-debug-decodedline-file'] = {
-          'file': os.path.basename(readelf_debug_decodedline_file)}
+    basename = os.path.basename(binary_path)
+
+    build_id = _get_build_id(binary_path)
+    cache_path = None
+    if symbol_cache_dir and build_id:
+      cache_path = os.path.join(symbol_cache_dir, '%s%s.symtab' % (
+          build_id, '.wL' if use_source_file_name else ''))
+
+    if cache_path and os.path.exists(cache_path):
+      LOGGER.debug('  Using the cached symbol table "%s".' % cache_path)
+      handle, symbol_table_filename = tempfile.mkstemp(
+          suffix='.symtab', prefix=basename + '.', dir=output_dir_path)
+      os.close(handle)
+      shutil.copyfile(cache_path, symbol_table_filename)
+      files[entry.name] = {}
+    else:
+      nm_filename = _dump_command_result(
+          'nm -n --format bsd %s | c++filt' % binary_path,
+          output_dir_path, basename, '.nm')
+      if not nm_filename:
+        continue
+      readelf_e_filename = _dump_command_result(
+          'readelf -eW %s' % binary_path,
+          output_dir_path, basename, '.readelf-e')
+      if not readelf_e_filename:
+        continue
+      readelf_debug_decodedline_file = None
+      if use_source_file_name:
+        readelf_debug_decodedline_file = _dump_command_result(
+            'readelf -wL %s | %s' % (binary_path, REDUCE_DEBUGLINE_PATH),
+            output_dir_path, basename, '.readelf-wL')
+
+      files[entry.name] = {}
+      files[entry.name]['nm'] = {
+          'file': os.path.basename(nm_filename),
+          'format': 'bsd',
+          'mangled': False}
+      files[entry.name]['readelf-e'] = {
+          'file': os.path.basename(readelf_e_filename)}
+      if readelf_debug_decodedline_file:
+        files[entry.name]['readelf-debug-decodedline-file'] = {
+            'file': os.path.basename(readelf_debug_decodedline_file)}
+
+      symbol_table_filename = _dump_symbol_table(
+          entry.name, build_id, output_dir_path, basename, nm_filename,
+          readelf_e_filename, readelf_debug_decodedline_file)
+      if cache_path:
+        _copy_atomically(symbol_table_filename, cache_path)
+
+    files[entry.name]['symbol-table'] = {
+        'file': os.path.basename(symbol_table_filename),
+        'build-id': build_id}
 
     files[entry.name]['size'] = os.stat(binary_path).st_size
 
@@ -216,6 +302,10 @@ def main():
                            metavar='/path/on/target@/path/on/host[:...]',
                            help='Read files in /path/on/host/ instead of '
                            'files in /path/on/target/.')
+  option_parser.add_option('--symbol-cache-dir', dest='symbol_cache_dir',
+                           metavar='/path/to/cache_dir',
+                           help='Cache symbol tables of binaries by build-id '
+                           'in the directory.')
   option_parser.add_option('--verbose', dest='verbose', action='store_true',
                            help='Enable verbose mode.')
   options, args = option_parser.parse_args(sys.argv)
@@ -240,10 +330,12 @@ def main():
     return 1
   elif len(args) == 2:
     result, _ = prepare_symbol_info(args[1],
-                                    alternative_dirs=alternative_dirs_dict)
+                                    alternative_dirs=alternative_dirs_dict,
+                                    symbol_cache_dir=options.symbol_cache_dir)
   else:
     result, _ = prepare_symbol_info(args[1], args[2],
-                                    alternative_dirs=alternative_dirs_dict)
+                                    alternative_dirs=alternative_dirs_dict,
+                                    symbol_cache_dir=options.symbol_cache_dir)
 
   return not result
 
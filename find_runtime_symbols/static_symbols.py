@@ -3,6 +3,8 @@
 # found in the LICENSE file.
 
 import bisect
+import cPickle
+import itertools
 import re
 
 
@@ -14,6 +16,9 @@ _READELF_SECTION_HEADER_PATTER = re.compile(
     '([0-9a-f]+)\s+([0-9a-f]+)\s+([0-9]+)\s+([WAXMSILGxOop]*)\s+'
     '([0-9]+)\s+([0-9]+)\s+([0-9]+)')
 
+# Bump whenever the format of dumped symbol tables changes.
+_SYMBOL_TABLE_VERSION = 1
+
 
 class ParsingException(Exception):
   def __str__(self):
@@ -30,13 +35,30 @@ class AddressMapping(object):
   def find(self, address):
     return self._symbol_map.get(address)
 
+  def find_many(self, addresses):
+    get = self._symbol_map.get
+    return [get(address) for address in addresses]
+
+  def items(self):
+    return self._symbol_map.items()
+
 
 class RangeAddressMapping(AddressMapping):
   def __init__(self):
     super(RangeAddressMapping, self).__init__()
     self._sorted_start_list = []
+    self._sorted_entry_list = None
     self._is_sorted = True
 
+  @staticmethod
+  def from_sorted(sorted_start_list, entry_list):
+    """Creates a mapping from starts which are already sorted and unique."""
+    mapping = RangeAddressMapping()
+    mapping._sorted_start_list = list(sorted_start_list)
+    mapping._sorted_entry_list = list(entry_list)
+    mapping._symbol_map = dict(itertools.izip(sorted_start_list, entry_list))
+    return mapping
+
   def append(self, start, entry):
     if self._sorted_start_list:
       if self._sorted_start_list[-1] > start:
@@ -44,8 +66,17 @@ class RangeAddressMapping(AddressMapping):
       elif self._sorted_start_list[-1] == start:
         return
     self._sorted_start_list.append(start)
+    self._sorted_entry_list = None
     self._symbol_map[start] = entry
 
+  def _sort(self):
+    if not self._is_sorted:
+      self._sorted_start_list.sort()
+      self._is_sorted = True
+    if self._sorted_entry_list is None:
+      self._sorted_entry_list = [
+          self._symbol_map[start] for start in self._sorted_start_list]
+
   def find(self, address):
     if not self._sorted_start_list:
       return None
@@ -56,6 +87,37 @@ class RangeAddressMapping(AddressMapping):
     found_start_address = self._sorted_start_list[found_index - 1]
     return self._symbol_map[found_start_address]
 
+  def find_many(self, sorted_addresses):
+    """Finds entries for many addresses at once.
+
+    Walks |sorted_addresses| and the sorted starts together, so that each
+    start is visited at most once.
+
+    Args:
+        sorted_addresses: A list of addresses sorted in ascending order.
+
+    Returns:
+        A list of the entries which find() returns for each address.
+    """
+    if not self._sorted_start_list:
+      return [None] * len(sorted_addresses)
+    self._sort()
+    starts = self._sorted_start_list
+    entries = self._sorted_entry_list
+    count = len(starts)
+    found = []
+    index = 0
+    for address in sorted_addresses:
+      if index < count and starts[index] < address:
+        # Skip the starts below |address|, which are never needed again.
+        index = bisect.bisect_left(starts, address, index + 1)
+      found.append(entries[index - 1])
+    return found
+
+  def items(self):
+    self._sort()
+    return zip(self._sorted_start_list, self._sorted_entry_list)
+
 
 class Procedure(object):
   """A class for a procedure symbol and an address range for the symbol."""
@@ -120,12 +182,14 @@ class StaticSymbolsInFile(object):
   def __init__(self, my_name):
     self.my_name = my_name
     self._elf_sections = []
+    self._elf_section_segments = None
     self._procedures = RangeAddressMapping()
     self._sourcefiles = RangeAddressMapping()
     self._typeinfos = AddressMapping()
 
   def _append_elf_section(self, elf_section):
     self._elf_sections.append(elf_section)
+    self._elf_section_segments = None
 
   def _append_procedure(self, start, procedure):
     self._procedures.append(start, procedure)
@@ -153,6 +217,74 @@ class StaticSymbolsInFile(object):
 
     return target.find(elf_address)
 
+  def _get_elf_section_segments(self):
+    """Returns sorted, disjoint (begin, end, section) file offset ranges.
+
+    Where sections overlap, the later section wins as it does in
+    _find_symbol_by_runtime_address.
+    """
+    if self._elf_section_segments is not None:
+      return self._elf_section_segments
+    boundaries = set()
+    for section in self._elf_sections:
+      if section.size:
+        boundaries.add(section.offset)
+        boundaries.add(section.offset + section.size)
+    boundaries = sorted(boundaries)
+    segments = []
+    for begin, end in itertools.izip(boundaries, boundaries[1:]):
+      found = None
+      for section in self._elf_sections:
+        if section.offset <= begin < (section.offset + section.size):
+          found = section
+      if not found:
+        continue
+      if segments and segments[-1][1] == begin and segments[-1][2] is found:
+        segments[-1] = (segments[-1][0], end, found)
+      else:
+        segments.append((begin, end, found))
+    self._elf_section_segments = segments
+    return segments
+
+  def _find_symbols_by_runtime_addresses(self, sorted_addresses, vma, target):
+    found = [None] * len(sorted_addresses)
+    if vma.name != self.my_name:
+      return found
+
+    segments = self._get_elf_section_segments()
+    segment_count = len(segments)
+    segment_index = 0
+    base = vma.begin - vma.offset
+    elf_addresses = []
+    indexes = []
+    for index, address in enumerate(sorted_addresses):
+      if address < vma.begin:
+        continue
+      if address >= vma.end:
+        break
+      file_offset = address - base
+      while (segment_index < segment_count and
+             segments[segment_index][1] <= file_offset):
+        segment_index += 1
+      if segment_index == segment_count:
+        break
+      begin, _, section = segments[segment_index]
+      if file_offset < begin:
+        continue
+      elf_address = section.address + file_offset - section.offset
+      if not elf_address:
+        continue
+      elf_addresses.append(elf_address)
+      indexes.append(index)
+
+    # Sections are usually laid out in the same order in the file and in
+    # memory, so this is almost always already sorted.
+    order = sorted(xrange(len(elf_addresses)), key=elf_addresses.__getitem__)
+    found_symbols = target.find_many([elf_addresses[i] for i in order])
+    for i, symbol in itertools.izip(order, found_symbols):
+      found[indexes[i]] = symbol
+    return found
+
   def find_procedure_by_runtime_address(self, address, vma):
     return self._find_symbol_by_runtime_address(address, vma, self._procedures)
 
@@ -162,6 +294,83 @@ class StaticSymbolsInFile(object):
   def find_typeinfo_by_runtime_address(self, address, vma):
     return self._find_symbol_by_runtime_address(address, vma, self._typeinfos)
 
+  def find_procedures_by_runtime_addresses(self, sorted_addresses, vma):
+    """Batch version of find_procedure_by_runtime_address.
+
+    Args:
+        sorted_addresses: A list of runtime addresses in ascending order.
+        vma: A ProcMapsEntry in which the addresses are mapped.
+
+    Returns:
+        A list of the found Procedures (or None) for each address.
+    """
+    return self._find_symbols_by_runtime_addresses(
+        sorted_addresses, vma, self._procedures)
+
+  def find_sourcefiles_by_runtime_addresses(self, sorted_addresses, vma):
+    return self._find_symbols_by_runtime_addresses(
+        sorted_addresses, vma, self._sourcefiles)
+
+  def find_typeinfos_by_runtime_addresses(self, sorted_addresses, vma):
+    return self._find_symbols_by_runtime_addresses(
+        sorted_addresses, vma, self._typeinfos)
+
+  def dump_symbol_table(self, f, build_id=None):
+    """Writes symbols loaded so far into |f| in a binary format.
+
+    Loading the result with load_symbol_table() is much faster than parsing
+    the outputs of nm and readelf again.
+
+    Args:
+        f: A file object opened in binary mode.
+        build_id: The build-id of the binary, checked by load_symbol_table().
+    """
+    procedures = self._procedures.items()
+    sourcefiles = self._sourcefiles.items()
+    cPickle.dump({
+        'version': _SYMBOL_TABLE_VERSION,
+        'build_id': build_id,
+        'elf_sections': [
+            (s.number, s.name, s.stype, s.address, s.offset, s.size, s.es,
+             s.flg, s.lk, s.inf, s.al) for s in self._elf_sections],
+        'procedure_starts': [start for start, _ in procedures],
+        'procedure_ends': [procedure.end for _, procedure in procedures],
+        'procedure_names': [procedure.name for _, procedure in procedures],
+        'sourcefile_starts': [start for start, _ in sourcefiles],
+        'sourcefile_names': [name for _, name in sourcefiles],
+        'typeinfos': self._typeinfos.items(),
+        }, f, cPickle.HIGHEST_PROTOCOL)
+
+  @staticmethod
+  def load_symbol_table(my_name, f, build_id=None):
+    """Loads symbols written by dump_symbol_table().
+
+    Raises:
+        ParsingException: if the table has another version, or |build_id| is
+            given and the table is for another build.
+    """
+    table = cPickle.load(f)
+    if table.get('version') != _SYMBOL_TABLE_VERSION:
+      raise ParsingException('Incompatible symbol table version.')
+    if build_id and table['build_id'] != build_id:
+      raise ParsingException('Symbol table is for build-id %s, not %s.' % (
+          table['build_id'], build_id))
+
+    static_symbols = StaticSymbolsInFile(my_name)
+    # pylint: disable=W0212
+    static_symbols._elf_sections = [
+        ElfSection(*section) for section in table['elf_sections']]
+    starts = table['procedure_starts']
+    static_symbols._procedures = RangeAddressMapping.from_sorted(
+        starts,
+        [Procedure(start, end, name) for start, end, name in itertools.izip(
+            starts, table['procedure_ends'], table['procedure_names'])])
+    static_symbols._sourcefiles = RangeAddressMapping.from_sorted(
+        table['sourcefile_starts'], table['sourcefile_names'])
+    for start, typeinfo in table['typeinfos']:
+      static_symbols._append_typeinfo(start, typeinfo)
+    return static_symbols
+
   def load_readelf_ew(self, f):
     found_header = False
     for line in f:
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import cStringIO
+import logging
+import os
+import sys
+import textwrap
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, os.pardir, 'linux'))
+
+from procfs import ProcMaps  # pylint: disable=F0401
+import static_symbols
+
+
+class StaticSymbolsInFileTest(unittest.TestCase):
+  _READELF_EW = textwrap.dedent("""\
+      Section Headers:
+        [Nr] Name              Type            Address          Off    Size   ES Flg Lk Inf Al
+        [ 0]                   NULL            0000000000000000 000000 000000 00      0   0  0
+        [ 1] .rodata           PROGBITS        0000000000400200 000200 000100 00   A  0   0 16
+        [ 2] .text             PROGBITS        0000000000401000 001000 001000 00  AX  0   0 16
+      Key to Flags:
+      """)
+
+  _NM_BSD = textwrap.dedent("""\
+      0000000000400200 r typeinfo for Foo
+      0000000000401000 T _start
+      0000000000401100 t Foo::Bar(int)
+      0000000000401100 W Foo::BarAlias(int)
+      0000000000401400 T main
+      0000000000401800 T Baz()
+      """)
+
+  _DECODEDLINE = textwrap.dedent("""\
+      401000 ../../start.cc
+      401400 ../../main.cc
+      """)
+
+  _MAPS = (
+      '7f0000400000-7f0000402000 r-xp 00000000 fd:01 1 /usr/bin/foo\n')
+
+  def setUp(self):
+    self._symbols = static_symbols.StaticSymbolsInFile('/usr/bin/foo')
+    self._symbols.load_readelf_ew(cStringIO.StringIO(self._READELF_EW))
+    self._symbols.load_nm_bsd(cStringIO.StringIO(self._NM_BSD))
+    self._symbols.load_readelf_debug_decodedline_file(
+        cStringIO.StringIO(self._DECODEDLINE))
+    self._vma = ProcMaps.parse_line(self._MAPS)
+    self._addresses = sorted(
+        [0x7f0000400000, 0x7f0000400200, 0x7f0000400210, 0x7f0000401000,
+         0x7f0000401001, 0x7f0000401100, 0x7f0000401101, 0x7f0000401500,
+         0x7f0000401801, 0x7f0000401fff, 0x7f0000402000])
+
+  def _assertBatchMatches(self, symbols):
+    vma = self._vma
+    self.assertEqual(
+        [symbols.find_procedure_by_runtime_address(a, vma)
+         for a in self._addresses],
+        symbols.find_procedures_by_runtime_addresses(self._addresses, vma))
+    self.assertEqual(
+        [symbols.find_sourcefile_by_runtime_address(a, vma)
+         for a in self._addresses],
+        symbols.find_sourcefiles_by_runtime_addresses(self._addresses, vma))
+    self.assertEqual(
+        [symbols.find_typeinfo_by_runtime_address(a, vma)
+         for a in self._addresses],
+        symbols.find_typeinfos_by_runtime_addresses(self._addresses, vma))
+
+  def testFindByRuntimeAddresses(self):
+    found = self._symbols.find_procedures_by_runtime_addresses(
+        [0x7f0000401101, 0x7f0000401500], self._vma)
+    self.assertEqual(['Foo::Bar', 'main'], [p.name for p in found])
+    self._assertBatchMatches(self._symbols)
+
+  def testSymbolTable(self):
+    f = cStringIO.StringIO()
+    self._symbols.dump_symbol_table(f, 'abcdef')
+    f.seek(0)
+    loaded = static_symbols.StaticSymbolsInFile.load_symbol_table(
+        '/usr/bin/foo', f, 'abcdef')
+    self._assertBatchMatches(loaded)
+    self.assertEqual(
+        self._symbols.find_procedures_by_runtime_addresses(
+            self._addresses, self._vma),
+        loaded.find_procedures_by_runtime_addresses(
+            self._addresses, self._vma))
+
+  def testSymbolTableForAnotherBuild(self):
+    f = cStringIO.StringIO()
+    self._symbols.dump_symbol_table(f, 'abcdef')
+    f.seek(0)
+    self.assertRaises(
+        static_symbols.ParsingException,
+        static_symbols.StaticSymbolsInFile.load_symbol_table,
+        '/usr/bin/foo', f, '012345')
+
+
+if __name__ == '__main__':
+  logging.basicConfig(
+      level=logging.DEBUG if '-v' in sys.argv else logging.ERROR,
+      format='%(levelname)5s %(filename)15s(%(lineno)3d): %(message)s')
+  unittest.main()
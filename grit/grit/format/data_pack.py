@@ -9,6 +9,9 @@ files.
 
 import collections
 import exceptions
+import hashlib
+import mmap
+import multiprocessing.pool
 import os
 import struct
 import sys
@@ -76,19 +79,43 @@ def Format(root, lang='en', output_dir='.'):
   id_map = root.GetIdMap()
   data = {}
   root.info = []
-  for node in root.ActiveDescendants():
-    with node:
-      if isinstance(node, (include.IncludeNode, message.MessageNode,
-                           structure.StructureNode)):
-        value = node.GetDataPackValue(lang, UTF8)
-        if value is not None:
-          resource_id = id_map[node.GetTextualIds()[0]]
-          data[resource_id] = value
-          root.info.append('{},{},{}'.format(
-              node.attrs.get('name'), resource_id, node.source))
+  nodes = [n for n in root.ActiveDescendants()
+           if isinstance(n, (include.IncludeNode, message.MessageNode,
+                             structure.StructureNode))]
+  for node, value in zip(nodes, _GetDataPackValues(nodes, lang)):
+    if value is not None:
+      resource_id = id_map[node.GetTextualIds()[0]]
+      data[resource_id] = value
+      root.info.append('{},{},{}'.format(
+          node.attrs.get('name'), resource_id, node.source))
   return WriteDataPackToString(data, UTF8)
 
 
+def _GetDataPackValues(nodes, lang):
+  """Returns the data pack values of |nodes|, in the same order.
+
+  Compression is by far the most expensive part of generating most data packs,
+  and does not hold the GIL, so the values of compressed resources are computed
+  by several threads at once.
+  """
+  def GetValue(node):
+    with node:
+      return node.GetDataPackValue(lang, UTF8)
+
+  compressed = [n for n in nodes if n.attrs.get('compress') == 'gzip']
+  values = {}
+  if len(compressed) > 1:
+    pool = multiprocessing.pool.ThreadPool(
+        min(len(compressed), multiprocessing.cpu_count()))
+    try:
+      for node, value in zip(compressed, pool.map(GetValue, compressed)):
+        values[id(node)] = value
+    finally:
+      pool.close()
+      pool.join()
+  return [values[id(n)] if id(n) in values else GetValue(n) for n in nodes]
+
+
 def ReadDataPack(input_file):
   return ReadDataPackFromString(util.ReadFile(input_file, util.BINARY))
 
@@ -142,20 +169,171 @@ def ReadDataPackFromString(data):
   return DataPackContents(resources, encoding, version, aliases, sizes)
 
 
-def WriteDataPackToString(resources, encoding):
-  """Returns a string with a map of id=>data in the data pack format."""
-  ret = []
+class DataPack(object):
+  """Read-only access to a data pack file, without reading it into memory.
 
-  # Compute alias map.
-  resource_ids = sorted(resources)
-  # Use reversed() so that for duplicates lower IDs clobber higher ones.
-  id_by_data = {resources[k]: k for k in reversed(resource_ids)}
-  # Map of resource_id -> resource_id, where value < key.
-  alias_map = {k: id_by_data[v] for k, v in resources.iteritems()
-               if id_by_data[v] != k}
+  Unlike ReadDataPack(), which copies every resource into a dict, this maps the
+  file into memory and looks up resources in its tables only when asked.
+  Resources are returned as buffer objects that refer to the mapped file, so
+  they are only valid until the pack is closed.
+  """
+
+  _INDEX_ENTRY_SIZE = 2 + 4  # Each entry is a uint16 and a uint32.
+  _ALIAS_ENTRY_SIZE = 2 + 2  # uint16, uint16
+
+  def __init__(self, path):
+    with open(path, 'rb') as f:
+      try:
+        self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      except (ValueError, mmap.error):
+        # Empty files cannot be mapped.
+        raise CorruptDataPack('Empty data pack: ' + path)
+    try:
+      self._ReadHeader(path)
+    except:
+      self._data.close()
+      raise
+    self._aliases = None
+
+  def _ReadHeader(self, path):
+    if len(self._data) < 12:
+      raise CorruptDataPack('Truncated data pack: ' + path)
+    self.version = struct.unpack_from('<I', self._data)[0]
+    if self.version == 4:
+      self.resource_count, self.encoding = struct.unpack_from(
+          '<IB', self._data, 4)
+      self.alias_count = 0
+      header_size = 9
+    elif self.version == 5:
+      self.encoding, self.resource_count, self.alias_count = (
+          struct.unpack_from('<BxxxHH', self._data, 4))
+      header_size = 12
+    else:
+      raise WrongFileVersion('Found version: ' + str(self.version))
+    id_table_size = (self.resource_count + 1) * self._INDEX_ENTRY_SIZE
+    alias_table_size = self.alias_count * self._ALIAS_ENTRY_SIZE
+    self._id_table_offset = header_size
+    self._alias_table_offset = header_size + id_table_size
+    data_offset = self._alias_table_offset + alias_table_size
+    if data_offset > len(self._data):
+      raise CorruptDataPack('Truncated data pack: ' + path)
+    self.sizes = DataPackSizes(header_size, id_table_size, alias_table_size,
+                               len(self._data) - data_offset)
+
+  def close(self):
+    self._data.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *_):
+    self.close()
+
+  def __len__(self):
+    return self.resource_count + self.alias_count
+
+  def _EntryAt(self, index):
+    """Returns (resource_id, offset) of the |index|th main table entry."""
+    return struct.unpack_from(
+        '<HI', self._data,
+        self._id_table_offset + index * self._INDEX_ENTRY_SIZE)
+
+  def _AliasAt(self, index):
+    """Returns (resource_id, main table index) of the |index|th alias."""
+    return struct.unpack_from(
+        '<HH', self._data,
+        self._alias_table_offset + index * self._ALIAS_ENTRY_SIZE)
+
+  def _ViewAt(self, index):
+    start = self._EntryAt(index)[1]
+    end = self._EntryAt(index + 1)[1]
+    if not start <= end <= len(self._data):
+      raise CorruptDataPack('Bad offsets for entry %d' % index)
+    return buffer(self._data, start, end - start)
+
+  @staticmethod
+  def _BinarySearch(entry_at, count, resource_id):
+    # Both tables are sorted by resource ID.
+    lo, hi = 0, count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      mid_id, value = entry_at(mid)
+      if mid_id == resource_id:
+        return mid, value
+      if mid_id < resource_id:
+        lo = mid + 1
+      else:
+        hi = mid
+    return None, None
+
+  def _FindIndex(self, resource_id):
+    """Returns the main table index holding |resource_id|'s data, or None."""
+    index, _ = self._BinarySearch(self._EntryAt, self.resource_count,
+                                  resource_id)
+    if index is None:
+      _, index = self._BinarySearch(self._AliasAt, self.alias_count,
+                                    resource_id)
+    return index
+
+  def __contains__(self, resource_id):
+    return self._FindIndex(resource_id) is not None
+
+  def __getitem__(self, resource_id):
+    index = self._FindIndex(resource_id)
+    if index is None:
+      raise KeyError(resource_id)
+    return self._ViewAt(index)
+
+  def get(self, resource_id, default=None):
+    index = self._FindIndex(resource_id)
+    return default if index is None else self._ViewAt(index)
+
+  @property
+  def aliases(self):
+    """Map of resource_id->canonical_resource_id."""
+    if self._aliases is None:
+      self._aliases = {}
+      for i in xrange(self.alias_count):
+        resource_id, index = self._AliasAt(i)
+        self._aliases[resource_id] = self._EntryAt(index)[0]
+    return self._aliases
+
+  def ResourceIds(self):
+    """Returns the sorted IDs of all resources, including aliases."""
+    ids = [self._EntryAt(i)[0] for i in xrange(self.resource_count)]
+    ids.extend(self.aliases)
+    ids.sort()
+    return ids
+
+  def iteritems(self):
+    """Yields (resource_id, buffer) for all resources, sorted by ID."""
+    for resource_id in self.ResourceIds():
+      yield resource_id, self[resource_id]
+
+
+def _ComputeAliases(resource_ids, content_key_by_id):
+  """Returns a map of resource_id -> resource_id, where value < key, for
+  resources with the same content as a resource with a lower ID."""
+  canonical_by_key = {}
+  alias_map = {}
+  for resource_id in resource_ids:
+    canonical_id = canonical_by_key.setdefault(
+        content_key_by_id(resource_id), resource_id)
+    if canonical_id != resource_id:
+      alias_map[resource_id] = canonical_id
+  return alias_map
+
+
+def _WriteDataPackTables(resource_ids, alias_map, size_by_id, encoding):
+  """Returns the header and tables of a data pack, as a list of strings.
+
+  The resource data must follow, for each ID of |resource_ids| that is not in
+  |alias_map|, in order.
+  """
+  ret = []
 
   # Write file header.
-  resource_count = len(resources) - len(alias_map)
+  resource_count = len(resource_ids) - len(alias_map)
   # Padding bytes added for alignment.
   ret.append(struct.pack('<IBxxxHH', PACK_FILE_VERSION, encoding,
                          resource_count, len(alias_map)))
@@ -167,16 +345,13 @@ def WriteDataPackToString(resources, encoding):
 
   # Write main table.
   index_by_id = {}
-  deduped_data = []
   index = 0
   for resource_id in resource_ids:
     if resource_id in alias_map:
       continue
-    data = resources[resource_id]
     index_by_id[resource_id] = index
     ret.append(struct.pack('<HI', resource_id, data_offset))
-    data_offset += len(data)
-    deduped_data.append(data)
+    data_offset += size_by_id(resource_id)
     index += 1
 
   assert index == resource_count
@@ -187,9 +362,19 @@ def WriteDataPackToString(resources, encoding):
   for resource_id in sorted(alias_map):
     index = index_by_id[alias_map[resource_id]]
     ret.append(struct.pack('<HH', resource_id, index))
+  return ret
+
+
+def WriteDataPackToString(resources, encoding):
+  """Returns a string with a map of id=>data in the data pack format."""
+  resource_ids = sorted(resources)
+  # Identical data is stored only once, under the lowest ID.
+  alias_map = _ComputeAliases(resource_ids, resources.__getitem__)
+  ret = _WriteDataPackTables(resource_ids, alias_map,
+                             lambda i: len(resources[i]), encoding)
 
   # Write data.
-  ret.extend(deduped_data)
+  ret.extend(resources[i] for i in resource_ids if i not in alias_map)
   return ''.join(ret)
 
 
@@ -217,22 +402,82 @@ def RePack(output_file, input_files, whitelist_file=None,
       KeyError: if there are duplicate keys or resource encoding is
       inconsistent.
   """
-  input_data_packs = [ReadDataPack(filename) for filename in input_files]
   input_info_files = [filename + '.info' for filename in input_files]
   whitelist = None
   if whitelist_file:
     whitelist = util.ReadFile(whitelist_file, util.RAW_TEXT).strip().split('\n')
     whitelist = set(map(int, whitelist))
-  inputs = [(p.resources, p.encoding) for p in input_data_packs]
-  resources, encoding = RePackFromDataPackStrings(
-      inputs, whitelist, suppress_removed_key_output)
-  WriteDataPack(resources, output_file, encoding)
+  input_data_packs = []
+  try:
+    for filename in input_files:
+      input_data_packs.append(DataPack(filename))
+    _StreamRePack(output_file, input_data_packs, whitelist,
+                  suppress_removed_key_output)
+  finally:
+    for pack in input_data_packs:
+      pack.close()
   with open(output_file + '.info', 'w') as output_info_file:
     for filename in input_info_files:
       with open(filename, 'r') as info_file:
         output_info_file.writelines(info_file.readlines())
 
 
+def _StreamRePack(output_file, input_data_packs, whitelist,
+                  suppress_removed_key_output):
+  """Writes the combination of |input_data_packs| to |output_file|.
+
+  Produces the same output as RePackFromDataPackStrings() followed by
+  WriteDataPack(), but copies resources straight from the mapped input files
+  rather than holding all of them in memory at once.
+  """
+  views = {}
+  encoding = None
+  for pack in input_data_packs:
+    input_views = dict(pack.iteritems())
+    # Make sure we have no dups.
+    duplicate_keys = input_views.viewkeys() & views.viewkeys()
+    if duplicate_keys:
+      raise exceptions.KeyError('Duplicate keys: ' + str(list(duplicate_keys)))
+
+    # Make sure encoding is consistent.
+    if encoding in (None, BINARY):
+      encoding = pack.encoding
+    elif pack.encoding not in (BINARY, encoding):
+      raise exceptions.KeyError('Inconsistent encodings: ' + str(encoding) +
+                                ' vs ' + str(pack.encoding))
+
+    if whitelist:
+      for key in sorted(input_views):
+        if key in whitelist:
+          views[key] = input_views[key]
+        elif not suppress_removed_key_output:
+          print 'RePackFromDataPackStrings Removed Key:', key
+    else:
+      views.update(input_views)
+
+  if encoding is None:
+    encoding = BINARY
+
+  resource_ids = sorted(views)
+  # Only resources whose size is shared with another need to be hashed to
+  # find duplicates.
+  count_by_size = collections.Counter(len(v) for v in views.itervalues())
+  def ContentKey(resource_id):
+    view = views[resource_id]
+    if count_by_size[len(view)] == 1:
+      return resource_id, None
+    return len(view), hashlib.sha1(view).digest()
+  alias_map = _ComputeAliases(resource_ids, ContentKey)
+
+  tables = _WriteDataPackTables(resource_ids, alias_map,
+                                lambda i: len(views[i]), encoding)
+  with open(output_file, 'wb') as f:
+    f.write(''.join(tables))
+    for resource_id in resource_ids:
+      if resource_id not in alias_map:
+        f.write(views[resource_id])
+
+
 def RePackFromDataPackStrings(inputs, whitelist,
                               suppress_removed_key_output=False):
   """Combines all inputs into one.
@@ -7,7 +7,9 @@
 
 
 import os
+import shutil
 import sys
+import tempfile
 if __name__ == '__main__':
   sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 
@@ -97,6 +99,69 @@ class FormatDataPackUnittest(unittest.TestCase):
     self.assertDictEqual(expected_without_whitelist, output,
                          'Incorrect resource output')
 
+  def testDataPack(self):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(tmp_dir, 'test.pak')
+      resources = {1: '', 4: 'this is id 4', 6: 'this is id 6',
+                   10: 'this is id 4'}
+      data_pack.WriteDataPack(resources, path, data_pack.UTF8)
+      expected = data_pack.ReadDataPack(path)
+      with data_pack.DataPack(path) as pack:
+        self.assertEqual(data_pack.UTF8, pack.encoding)
+        self.assertEqual(5, pack.version)
+        self.assertEqual(4, len(pack))
+        self.assertEqual(expected.aliases, pack.aliases)
+        self.assertEqual(expected.sizes.__dict__, pack.sizes.__dict__)
+        self.assertEqual([1, 4, 6, 10], pack.ResourceIds())
+        self.assertEqual(resources, {k: str(v) for k, v in pack.iteritems()})
+        self.assertEqual('this is id 4', str(pack[10]))
+        self.assertTrue(6 in pack)
+        self.assertFalse(5 in pack)
+        self.assertIsNone(pack.get(5))
+        self.assertRaises(KeyError, lambda: pack[11])
+    finally:
+      shutil.rmtree(tmp_dir)
+
+  def testRePack(self):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+      inputs = [{1: 'same', 4: '', 6: 'chirr', 10: 'same'},
+                {20: 'chirr', 30: '', 32: 'oops'},
+                {40: 'Never', 50: 'gonna'}]
+      input_files = []
+      for i, resources in enumerate(inputs):
+        path = os.path.join(tmp_dir, '%d.pak' % i)
+        data_pack.WriteDataPack(resources, path, data_pack.UTF8)
+        with open(path + '.info', 'w') as f:
+          f.write('info %d\n' % i)
+        input_files.append(path)
+      whitelist_file = os.path.join(tmp_dir, 'whitelist.txt')
+      with open(whitelist_file, 'w') as f:
+        f.write('1\n6\n10\n20\n30\n40\n')
+
+      for whitelist in (None, [1, 6, 10, 20, 30, 40]):
+        output_file = os.path.join(tmp_dir, 'out.pak')
+        data_pack.RePack(output_file, input_files,
+                         whitelist_file if whitelist else None,
+                         suppress_removed_key_output=True)
+        # Same as repacking in memory.
+        resources, encoding = data_pack.RePackFromDataPackStrings(
+            [(i, data_pack.UTF8) for i in inputs], whitelist,
+            suppress_removed_key_output=True)
+        with open(output_file, 'rb') as f:
+          self.assertEqual(
+              data_pack.WriteDataPackToString(resources, encoding), f.read())
+        with open(output_file + '.info') as f:
+          self.assertEqual('info 0\ninfo 1\ninfo 2\n', f.read())
+
+      duplicate_file = os.path.join(tmp_dir, 'duplicate.pak')
+      data_pack.WriteDataPack({6: 'dup'}, duplicate_file, data_pack.UTF8)
+      self.assertRaises(KeyError, data_pack.RePack, output_file,
+                        input_files + [duplicate_file])
+    finally:
+      shutil.rmtree(tmp_dir)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -2,19 +2,104 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 """Provides gzip utilities for strings.
+
+Compressing the same resource more than once (e.g. for several outputs, or in
+consecutive builds) is avoided by caching results in memory, and optionally on
+disk (see SetCacheDir()), keyed by the hash of the uncompressed data.  All
+functions are safe to call from several threads at once, and do not hold the
+GIL while compressing.
 """
-import cStringIO
-import gzip
+import hashlib
+import os
+import struct
 import subprocess
+import threading
+import zlib
 
+from grit import util
 
-def GzipStringRsyncable(data):
-  # Make call to host system's gzip to get access to --rsyncable option. This
-  # option makes updates much smaller - if one line is changed in the resource,
-  # it won't have to push the entire compressed resource with the update.
-  # Instead, --rsyncable breaks the file into small chunks, so that one doesn't
-  # affect the other in compression, and then only that chunk will have to be
-  # updated.
+
+# Bump whenever the format of cached values changes.
+_CACHE_VERSION = '1'
+
+# Compressed data of this process, keyed by the result of _CacheKey().
+_cache = {}
+
+# Directory in which compressed data is also stored, so that it can be shared
+# across processes and builds.  See SetCacheDir().
+_cache_dir = None
+
+# Number of entries kept in _cache_dir.  Least recently used entries beyond
+# this are deleted whenever a build starts using the directory.
+_MAX_CACHE_ENTRIES = 20000
+
+_gzip_version = None
+_gzip_version_lock = threading.Lock()
+
+
+def SetCacheDir(cache_dir):
+  """Sets a directory in which to cache compressed data across builds.
+
+  Least recently used entries are deleted once there are more than
+  _MAX_CACHE_ENTRIES.
+  """
+  global _cache_dir
+  _cache_dir = cache_dir
+  if cache_dir:
+    util.PruneCacheDir(_CacheDir(), _MAX_CACHE_ENTRIES)
+
+
+def _GetGzipVersion():
+  """Returns the version of the host's gzip, which determines its output."""
+  global _gzip_version
+  with _gzip_version_lock:
+    if _gzip_version is None:
+      _gzip_version = subprocess.check_output(['gzip', '--version'])
+    return _gzip_version
+
+
+def _CacheKey(method, data):
+  return hashlib.sha1('%s:%s:%s' % (_CACHE_VERSION, method, data)).hexdigest()
+
+
+def _CacheDir():
+  return os.path.join(_cache_dir, 'gzip')
+
+
+def _CachePath(key):
+  return os.path.join(_CacheDir(), key[:2], key)
+
+
+def _ReadCache(key):
+  data = _cache.get(key)
+  if data is not None or not _cache_dir:
+    return data
+  try:
+    data = util.ReadCacheEntry(_CachePath(key))
+  except Exception:
+    # Missing or corrupt entries are simply recompressed.
+    return None
+  _cache[key] = data
+  return data
+
+
+def _WriteCache(key, data):
+  _cache[key] = data
+  if not _cache_dir:
+    return
+  util.WriteCacheEntry(_CachePath(key), data)
+
+
+def _Cached(method, compress_func, data):
+  key = _CacheKey(method, data)
+  ret = _ReadCache(key)
+  if ret is None:
+    ret = compress_func(data)
+    _WriteCache(key, ret)
+  return ret
+
+
+def _GzipRsyncable(data):
   gzip_proc = subprocess.Popen(['gzip', '--stdout', '--rsyncable',
                                 '--best', '--no-name'],
                                stdin=subprocess.PIPE,
@@ -27,6 +112,34 @@ def GzipStringRsyncable(data):
   return data
 
 
+def GzipStringRsyncable(data):
+  # Make call to host system's gzip to get access to --rsyncable option. This
+  # option makes updates much smaller - if one line is changed in the resource,
+  # it won't have to push the entire compressed resource with the update.
+  # Instead, --rsyncable breaks the file into small chunks, so that one doesn't
+  # affect the other in compression, and then only that chunk will have to be
+  # updated.
+  # The exact output depends on gzip's own deflate implementation (zlib does
+  # not produce the same bytes), and on its version, hence the cache key.
+  return _Cached('rsyncable:' + _GetGzipVersion(), _GzipRsyncable, data)
+
+
+def _Gzip(data):
+  # Equivalent to, and produces the same bytes as:
+  #   gzip.GzipFile(mode='wb', compresslevel=9, fileobj=f, mtime=0).write(data)
+  # but without copying |data| around, and without holding the GIL while
+  # compressing.
+  compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                zlib.DEF_MEM_LEVEL, 0)
+  # Magic, method (deflate), flags (none), mtime (0), extra flags (max
+  # compression), OS (unknown).
+  header = '\x1f\x8b\x08\x00' + struct.pack('<I', 0) + '\x02\xff'
+  trailer = struct.pack('<II', zlib.crc32(data) & 0xffffffff,
+                        len(data) & 0xffffffff)
+  return ''.join((header, compressor.compress(data), compressor.flush(),
+                  trailer))
+
+
 def GzipString(data):
   # Gzipping using Python's built in gzip: Windows doesn't ship with gzip, and
   # OSX's gzip does not have an --rsyncable option built in. Although this is
@@ -34,10 +147,4 @@ def GzipString(data):
   # not have --rsyncable. If used over GzipStringRsyncable, the primary
   # difference of this function's compression will be larger updates every time
   # a compressed resource is changed.
-  gzip_output = cStringIO.StringIO()
-  with gzip.GzipFile(mode='wb', compresslevel=9, fileobj=gzip_output,
-                     mtime=0) as gzip_file:
-    gzip_file.write(data)
-  data = gzip_output.getvalue()
-  gzip_output.close()
-  return data
+  return _Cached('gzip:' + zlib.ZLIB_VERSION, _Gzip, data)
@@ -8,7 +8,9 @@
 import gzip
 import io
 import os
+import shutil
 import sys
+import tempfile
 if __name__ == '__main__':
   sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 
@@ -58,6 +60,50 @@ class FormatGzipStringUnittest(unittest.TestCase):
       output = f.read()
     self.failUnless(output == input)
 
+  def testGzipStringMatchesGzipFile(self):
+    for input in ('', 'x', 'TEST STRING ' * 10000, os.urandom(100000)):
+      expected = io.BytesIO()
+      with gzip.GzipFile(mode='wb', compresslevel=9, fileobj=expected,
+                         mtime=0) as f:
+        f.write(input)
+      self.assertEqual(expected.getvalue(), gzip_string.GzipString(input))
+
+  def testCacheDir(self):
+    cache_dir = tempfile.mkdtemp()
+    input = 'CACHED STRING ' * 100
+    gzip_string.SetCacheDir(cache_dir)
+    try:
+      gzip_string._cache.clear()
+      compressed = gzip_string.GzipString(input)
+      self.assertTrue(os.listdir(os.path.join(cache_dir, 'gzip')))
+
+      # Results are read back from disk by later builds.
+      gzip_string._cache.clear()
+      key = gzip_string._CacheKey('gzip:' + gzip_string.zlib.ZLIB_VERSION,
+                                  input)
+      self.assertEqual(compressed, gzip_string._ReadCache(key))
+      self.assertEqual(compressed, gzip_string.GzipString(input))
+
+      # Least recently used entries are pruned once a build uses the
+      # directory again.
+      gzip_string.GzipString('OTHER STRING')
+      os.utime(gzip_string._CachePath(key), (0, 0))
+      max_entries = gzip_string._MAX_CACHE_ENTRIES
+      gzip_string._MAX_CACHE_ENTRIES = 1
+      try:
+        gzip_string.SetCacheDir(cache_dir)
+      finally:
+        gzip_string._MAX_CACHE_ENTRIES = max_entries
+      gzip_string._cache.clear()
+      self.assertEqual(None, gzip_string._ReadCache(key))
+      other_key = gzip_string._CacheKey(
+          'gzip:' + gzip_string.zlib.ZLIB_VERSION, 'OTHER STRING')
+      self.assertTrue(gzip_string._ReadCache(other_key))
+    finally:
+      gzip_string.SetCacheDir(None)
+      gzip_string._cache.clear()
+      shutil.rmtree(cache_dir)
+
 
 if __name__ == '__main__':
   unittest.main()
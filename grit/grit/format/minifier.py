@@ -15,6 +15,11 @@ def SetJsMinifier(minifier):
   __js_minifier = minifier.split()
 
 
+def GetJsMinifier():
+  """Returns the minifier command as a list, or None if none has been set."""
+  return __js_minifier
+
+
 def Minify(source, filename):
   file_type = path.splitext(filename)[1]
   if not file_type == '.js' or not __js_minifier:
@@ -6,7 +6,9 @@
 """Handling of the <include> element.
 """
 
+import hashlib
 import os
+import sys
 
 from grit import exception
 from grit import util
@@ -15,6 +17,76 @@ import grit.format.rc
 from grit.format import minifier
 from grit.node import base
 
+
+# Bump whenever GetDataPackValue() changes in a way that affects its result.
+_DATA_CACHE_VERSION = '1'
+
+# Results of GetDataPackValue() for this process, keyed by the hash returned
+# by IncludeNode._GetDataCacheKey().  Shared by all outputs of a build.
+_data_cache = {}
+
+# Directory in which results of GetDataPackValue() are also stored, so that
+# they can be shared across processes and builds.  See SetDataCacheDir().
+_data_cache_dir = None
+
+# Number of entries kept in _data_cache_dir.  Least recently used entries
+# beyond this are deleted whenever a build starts using the directory.
+_MAX_DATA_CACHE_ENTRIES = 20000
+
+
+def SetDataCacheDir(cache_dir):
+  """Sets a directory in which flattened, minified and compressed <include>
+  data is cached across builds.  Entries are keyed by the contents of the
+  included file along with everything else that affects the result, and
+  record the contents of every file that was inlined into them, so stale
+  entries are never used.  Least recently used entries are deleted once there
+  are more than _MAX_DATA_CACHE_ENTRIES.
+  """
+  global _data_cache_dir
+  _data_cache_dir = cache_dir
+  if cache_dir:
+    util.PruneCacheDir(_DataCacheDir(), _MAX_DATA_CACHE_ENTRIES)
+
+
+def _HashFile(path):
+  with open(path, 'rb') as f:
+    return hashlib.sha1(f.read()).hexdigest()
+
+
+def _DataCacheDir():
+  return os.path.join(_data_cache_dir, 'include_data')
+
+
+def _DataCachePath(key):
+  return os.path.join(_DataCacheDir(), key[:2], key)
+
+
+def _ReadDataCache(key):
+  """Returns the cached data for |key|, or None if there is no valid entry."""
+  data = _data_cache.get(key)
+  if data is not None or not _data_cache_dir:
+    return data
+  try:
+    deps, data = util.ReadCacheEntry(_DataCachePath(key))
+    # Inlined files are not part of the key, so check they are unchanged.
+    for path, digest in deps:
+      if _HashFile(path) != digest:
+        return None
+  except Exception:
+    # Missing, corrupt or out of date entries are simply rebuilt.
+    return None
+  _data_cache[key] = data
+  return data
+
+
+def _WriteDataCache(key, data, dep_filenames):
+  _data_cache[key] = data
+  if not _data_cache_dir:
+    return
+  deps = [(path, _HashFile(path)) for path in sorted(dep_filenames)]
+  util.WriteCacheEntry(_DataCachePath(key), (deps, data))
+
+
 class IncludeNode(base.Node):
   """An <include> element."""
 
@@ -24,6 +96,8 @@ class IncludeNode(base.Node):
     # Cache flattened data so that we don't flatten the same file
     # multiple times.
     self._flattened_data = None
+    # The set of files that were inlined into self._flattened_data.
+    self._inlined_files = set()
     # Also keep track of the last filename we flattened to, so we can
     # avoid doing it more than once.
     self._last_flat_filename = None
@@ -34,11 +108,49 @@ class IncludeNode(base.Node):
   def _GetFlattenedData(self, allow_external_script=False):
     if not self._flattened_data:
       filename = self.ToRealPath(self.GetInputPath())
-      self._flattened_data = (
-          grit.format.html_inline.InlineToString(filename, self,
-              preprocess_only=False,
-              allow_external_script=allow_external_script))
+      try:
+        inlined = grit.format.html_inline.DoInline(filename, self,
+            preprocess_only=False,
+            allow_external_script=allow_external_script)
+      except IOError, e:
+        raise Exception("Failed to open %s while trying to flatten %s. (%s)" %
+                        (e.filename, filename, e.strerror))
+      self._flattened_data = inlined.inlined_data
+      self._inlined_files = inlined.inlined_files
     return self._flattened_data
+
+  def _GetDataCacheKey(self, filename, contents):
+    """Returns a hash of everything that GetDataPackValue() depends on, other
+    than the contents of files inlined into |filename|.
+    """
+    root = self.GetRoot()
+    parts = [
+        _DATA_CACHE_VERSION,
+        filename,
+        contents,
+        repr([(k, self.attrs[k]) for k in ('flattenhtml', 'allowexternalscript',
+                                           'skip_minify', 'compress')]),
+        repr(minifier.GetJsMinifier()),
+        sys.platform,
+    ]
+    if self.attrs['flattenhtml'] == 'true':
+      # <if> expressions in flattened files can refer to all of these.
+      parts += [
+          repr(sorted(getattr(root, 'defines', {}).items())),
+          repr(getattr(root, 'target_platform', '')),
+          repr(getattr(root, 'output_language', '')),
+          repr(getattr(root, 'output_context', '')),
+      ]
+    elif self.attrs['compress'] == 'gzip':
+      # The defines choose between compression methods.
+      parts.append(repr(sorted(getattr(root, 'defines', {}).items())))
+    h = hashlib.sha1()
+    for part in parts:
+      # Prefix with the length so that ('ab', 'c') != ('a', 'bc').
+      h.update('%d:' % len(part))
+      h.update(part)
+    return h.hexdigest()
+
   def MandatoryAttributes(self):
     return ['name', 'type', 'file']
 
@@ -80,11 +192,21 @@ class IncludeNode(base.Node):
   def GetDataPackValue(self, lang, encoding):
     '''Returns a str represenation for a data_pack entry.'''
     filename = self.ToRealPath(self.GetInputPath())
+    contents = util.ReadFile(filename, util.BINARY)
+    # Flattening, minifying and compressing are expensive, and the same
+    # <include> is often part of several outputs.
+    key = self._GetDataCacheKey(filename, contents)
+    cached = _ReadDataCache(key)
+    if cached is not None:
+      return cached
+
     if self.attrs['flattenhtml'] == 'true':
       allow_external_script = self.attrs['allowexternalscript'] == 'true'
       data = self._GetFlattenedData(allow_external_script=allow_external_script)
+      dep_filenames = self._inlined_files
     else:
-      data = util.ReadFile(filename, util.BINARY)
+      data = contents
+      dep_filenames = ()
 
     if self.attrs['skip_minify'] != 'true':
       # Note that the minifier will only do anything if a minifier command
@@ -93,7 +215,9 @@ class IncludeNode(base.Node):
 
     # Include does not care about the encoding, because it only returns binary
     # data.
-    return self.CompressDataIfNeeded(data)
+    data = self.CompressDataIfNeeded(data)
+    _WriteDataCache(key, data, dep_filenames)
+    return data
 
   def Process(self, output_dir):
     """Rewrite file references to be base64 encoded data URLs.  The new file
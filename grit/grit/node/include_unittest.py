@@ -11,6 +11,8 @@ if __name__ == '__main__':
   sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 
 import os
+import shutil
+import tempfile
 import unittest
 import zlib
 
@@ -83,6 +85,55 @@ class IncludeNodeUnittest(unittest.TestCase):
                                    + "/test_text.txt", util.BINARY),
                      decompressed_data)
 
+  def testDataCacheChecksInlinedFiles(self):
+    tmp_dir = tempfile.mkdtemp()
+    cache_dir = os.path.join(tmp_dir, 'cache')
+    with open(os.path.join(tmp_dir, 'index.html'), 'w') as f:
+      f.write('<include src="inner.html">')
+    def GetValue():
+      # Start each build with an empty in-memory cache.
+      include._data_cache.clear()
+      root = util.ParseGrdForUnittest('''
+          <includes>
+            <include name="INDEX_HTML" file="index.html"
+                     flattenhtml="true" type="BINDATA"/>
+          </includes>''', base_dir=tmp_dir)
+      inc, = root.GetChildrenOfType(include.IncludeNode)
+      return inc.GetDataPackValue(lang='en', encoding=1)
+
+    def CountEntries():
+      return sum(len(filenames) for _, _, filenames in
+                 os.walk(os.path.join(cache_dir, 'include_data')))
+
+    include.SetDataCacheDir(cache_dir)
+    try:
+      with open(os.path.join(tmp_dir, 'inner.html'), 'w') as f:
+        f.write('first')
+      self.assertEqual('first', GetValue())
+      self.assertTrue(os.listdir(os.path.join(cache_dir, 'include_data')))
+      self.assertEqual('first', GetValue())
+      with open(os.path.join(tmp_dir, 'inner.html'), 'w') as f:
+        f.write('second')
+      self.assertEqual('second', GetValue())
+
+      # Stale entries are pruned once a build uses the directory again.
+      self.assertEqual(1, CountEntries())
+      with open(os.path.join(tmp_dir, 'index.html'), 'w') as f:
+        f.write('<include src="inner.html">!')
+      self.assertEqual('second!', GetValue())
+      self.assertEqual(2, CountEntries())
+      max_entries = include._MAX_DATA_CACHE_ENTRIES
+      include._MAX_DATA_CACHE_ENTRIES = 1
+      try:
+        include.SetDataCacheDir(cache_dir)
+      finally:
+        include._MAX_DATA_CACHE_ENTRIES = max_entries
+      self.assertEqual(1, CountEntries())
+    finally:
+      include.SetDataCacheDir(None)
+      include._data_cache.clear()
+      shutil.rmtree(tmp_dir)
+
 
 if __name__ == '__main__':
   unittest.main()
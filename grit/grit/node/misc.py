@@ -432,8 +432,14 @@ class GritNode(base.Node):
   def AssignRcHeaderFormat(self, rc_header_format):
     self.attrs['rc_header_format'] = rc_header_format
 
-  def GetInputFiles(self):
-    """Returns the list of files that are read to produce the output."""
+  def GetInputFiles(self, configurations=None):
+    """Returns the list of files that are read to produce the output.
+
+    Args:
+      configurations: Optional iterable of (language, context,
+          fallback_to_default_layout) triples to restrict the result to.
+          Defaults to GetConfigurations(), i.e. to all outputs.
+    """
 
     # Importing this here avoids a circular dependency in the imports.
     # pylint: disable-msg=C6204
@@ -449,8 +455,10 @@ class GritNode(base.Node):
       if isinstance(node, misc.PartNode):
         input_files.add(self.ToRealPath(node.GetInputPath()))
 
+    if configurations is None:
+      configurations = self.GetConfigurations()
     old_output_language = self.output_language
-    for lang, ctx, fallback in self.GetConfigurations():
+    for lang, ctx, fallback in configurations:
       self.SetOutputLanguage(lang or self.GetSourceLanguage())
       self.SetOutputContext(ctx)
       self.SetFallbackToDefaultLayout(fallback)
@@ -10,6 +10,8 @@ SCons build system.
 import codecs
 import filecmp
 import getopt
+import hashlib
+import multiprocessing
 import os
 import shutil
 import sys
@@ -17,6 +19,7 @@ import sys
 from grit import grd_reader
 from grit import shortcuts
 from grit import util
+from grit.format import gzip_string
 from grit.format import minifier
 from grit.node import include
 from grit.node import message
@@ -45,6 +48,39 @@ _format_modules = {
   'resource_map_source': 'resource_map',
 }
 
+# Bump whenever the fingerprint of an output changes in meaning.
+_FINGERPRINT_VERSION = '1'
+
+# The RcBuilder whose outputs are being generated by worker processes.  Workers
+# are forked, so they share the parent's parsed resource tree.
+_worker_builder = None
+
+
+def _ProcessOutputInWorker(index):
+  """Generates the |index|th output of _worker_builder in a worker process.
+
+  Returns:
+    A tuple of (exit code or None, missing translations, fallback
+    translations).  Translation warnings are recorded while formatting, so they
+    must be sent back to the parent to be reported.
+  """
+  builder = _worker_builder
+  output = builder.res.GetOutputFiles()[index]
+  try:
+    builder.ProcessOutput(output)
+  except SystemExit, e:
+    # Exiting would kill the worker without notifying the parent.
+    return e.code, {}, {}
+  uberclique = builder.res.UberClique()
+  return (None, uberclique.missing_translations_,
+          uberclique.fallback_translations_)
+
+
+def _MergeTranslationReports(target, source):
+  for id, langs in source.iteritems():
+    target.setdefault(id, {}).update(langs)
+
+
 def GetFormatter(type):
   modulename = 'grit.format.' + _format_modules[type]
   __import__(modulename)
@@ -131,6 +167,20 @@ Options:
                     generated will depend on a stampfile instead of the first
                     output in the input .grd file.
 
+  -j JOBS           Generate up to JOBS outputs at once, in separate processes.
+                    Defaults to 1.  All outputs are generated from a single
+                    parsed resource tree, so resource IDs are the same as for a
+                    serial build.
+
+  --cache-dir DIR   Cache flattened, minified and compressed <include> data,
+                    and all other compressed resources, in DIR, so that they
+                    are computed once for all outputs and reused by later
+                    builds.  Also record a fingerprint of the inputs of each
+                    output, and skip generating outputs whose inputs have not
+                    changed since the last successful build (this implies
+                    --write-only-new for them).  DIR can be shared by several
+                    .grd files and builds.
+
   --js-minifier     A command to run the Javascript minifier. If not set then
                     Javascript won't be minified. The command should read the
                     original Javascript from standard input, and output the
@@ -162,8 +212,9 @@ are exported to translation interchange files (e.g. XMB files), etc.
     depend_on_stamp = False
     js_minifier = None
     replace_ellipsis = True
-    (own_opts, args) = getopt.getopt(args, 'a:p:o:D:E:f:w:t:h:',
-        ('depdir=','depfile=','assert-file-list=',
+    cache_dir = None
+    (own_opts, args) = getopt.getopt(args, 'a:p:o:D:E:f:w:t:h:j:',
+        ('depdir=','depfile=','assert-file-list=','cache-dir=',
          'output-all-resource-defines',
          'no-output-all-resource-defines',
          'no-replace-ellipsis',
@@ -209,6 +260,10 @@ are exported to translation interchange files (e.g. XMB files), etc.
         depend_on_stamp = True
       elif key == '--js-minifier':
         js_minifier = val
+      elif key == '-j':
+        self.jobs = int(val)
+      elif key == '--cache-dir':
+        cache_dir = val
 
     if len(args):
       print 'This tool takes no tool-specific arguments.'
@@ -233,6 +288,19 @@ are exported to translation interchange files (e.g. XMB files), etc.
 
     self.write_only_new = write_only_new
 
+    if cache_dir:
+      self.cache_dir = os.path.abspath(cache_dir)
+      include.SetDataCacheDir(self.cache_dir)
+      gzip_string.SetCacheDir(self.cache_dir)
+      # Everything outside of the .grd that affects all outputs.
+      self.fingerprint_inputs = [
+          opts.input, first_ids_file, predetermined_ids_file, target_platform,
+          rc_header_format, replace_ellipsis, js_minifier,
+          sorted(self.whitelist_names or [])]
+      self.fingerprint_files = [
+          f for f in [opts.input, first_ids_file, predetermined_ids_file] +
+          whitelist_filenames if f]
+
     self.res = grd_reader.Parse(opts.input,
                                 debug=opts.extra_verbose,
                                 first_ids_file=first_ids_file,
@@ -290,6 +358,18 @@ are exported to translation interchange files (e.g. XMB files), etc.
     # Whether to compare outputs to their old contents before writing.
     self.write_only_new = False
 
+    # The number of outputs to generate at once.
+    self.jobs = 1
+
+    # If set, the directory in which to record the fingerprint of each output,
+    # so that unchanged outputs can be skipped.
+    self.cache_dir = None
+
+    # Options and files, other than the resource tree and the files it refers
+    # to, that affect the contents of every output.
+    self.fingerprint_inputs = []
+    self.fingerprint_files = []
+
   @staticmethod
   def AddWhitelistTags(start_node, whitelist_names):
     # Walk the tree of nodes added attributes for the nodes that shouldn't
@@ -366,59 +446,31 @@ are exported to translation interchange files (e.g. XMB files), etc.
     if self.whitelist_names:
       self.AddWhitelistTags(self.res, self.whitelist_names)
 
-    for output in self.res.GetOutputFiles():
-      self.VerboseOut('Creating %s...' % output.GetOutputFilename())
-
-      # Set the context, for conditional inclusion of resources
-      self.res.SetOutputLanguage(output.GetLanguage())
-      self.res.SetOutputContext(output.GetContext())
-      self.res.SetFallbackToDefaultLayout(output.GetFallbackToDefaultLayout())
-      self.res.SetDefines(self.defines)
-
-      # Assign IDs only once to ensure that all outputs use the same IDs.
-      if self.res.GetIdMap() is None:
-        self.res.InitializeIds()
-
-      # Make the output directory if it doesn't exist.
-      self.MakeDirectoriesTo(output.GetOutputFilename())
-
-      # Write the results to a temporary file and only overwrite the original
-      # if the file changed.  This avoids unnecessary rebuilds.
-      outfile = self.fo_create(output.GetOutputFilename() + '.tmp', 'wb')
-
-      if output.GetType() != 'data_package':
-        encoding = self._EncodingForOutputType(output.GetType())
-        outfile = util.WrapOutputStream(outfile, encoding)
-
-      # Iterate in-order through entire resource tree, calling formatters on
-      # the entry into a node and on exit out of it.
-      with outfile:
-        self.ProcessNode(self.res, output, outfile)
-
-      # Now copy from the temp file back to the real output, but on Windows,
-      # only if the real output doesn't exist or the contents of the file
-      # changed.  This prevents identical headers from being written and .cc
-      # files from recompiling (which is painful on Windows).
-      if not os.path.exists(output.GetOutputFilename()):
-        os.rename(output.GetOutputFilename() + '.tmp',
-                  output.GetOutputFilename())
-      else:
-        # CHROMIUM SPECIFIC CHANGE.
-        # This clashes with gyp + vstudio, which expect the output timestamp
-        # to change on a rebuild, even if nothing has changed, so only do
-        # it when opted in.
-        if not self.write_only_new:
-          write_file = True
-        else:
-          files_match = filecmp.cmp(output.GetOutputFilename(),
-              output.GetOutputFilename() + '.tmp')
-          write_file = not files_match
-        if write_file:
-          shutil.copy2(output.GetOutputFilename() + '.tmp',
-                       output.GetOutputFilename())
-        os.remove(output.GetOutputFilename() + '.tmp')
-
-      self.VerboseOut(' done.\n')
+    outputs = self.res.GetOutputFiles()
+    # Assign IDs only once, before any output is generated, to ensure that all
+    # outputs use the same IDs.
+    if outputs and self.res.GetIdMap() is None:
+      self._SetOutputContext(outputs[0])
+      self.res.InitializeIds()
+
+    fingerprints = {}
+    pending = []
+    for index, output in enumerate(outputs):
+      if self.cache_dir:
+        fingerprint = self._GetOutputFingerprint(output)
+        if self._IsOutputUpToDate(output, fingerprint):
+          self.VerboseOut('Skipping %s (up to date).\n' %
+                          output.GetOutputFilename())
+          continue
+        fingerprints[output.GetOutputFilename()] = fingerprint
+      pending.append(index)
+
+    jobs = min(self.jobs, len(pending))
+    if jobs > 1 and hasattr(os, 'fork'):
+      self._ProcessOutputsInParallel(pending, jobs)
+    else:
+      for index in pending:
+        self.ProcessOutput(outputs[index])
 
     # Print warnings if there are any duplicate shortcuts.
     warnings = shortcuts.GenerateDuplicateShortcutsWarnings(
@@ -437,6 +489,142 @@ are exported to translation interchange files (e.g. XMB files), etc.
       print self.res.UberClique().missing_translations_
       sys.exit(-1)
 
+    # Only now that the outputs are known to be good can they be skipped by
+    # later builds.
+    for filename, fingerprint in fingerprints.iteritems():
+      self._WriteOutputFingerprint(filename, fingerprint)
+
+  def _SetOutputContext(self, output):
+    '''Sets the context for conditional inclusion of resources in |output|.'''
+    self.res.SetOutputLanguage(output.GetLanguage())
+    self.res.SetOutputContext(output.GetContext())
+    self.res.SetFallbackToDefaultLayout(output.GetFallbackToDefaultLayout())
+    self.res.SetDefines(self.defines)
+
+  def ProcessOutput(self, output):
+    '''Generates a single output file from the resource tree.
+
+    Args:
+      output: grit.node.io.OutputNode
+    '''
+    self.VerboseOut('Creating %s...' % output.GetOutputFilename())
+
+    self._SetOutputContext(output)
+
+    # Make the output directory if it doesn't exist.
+    self.MakeDirectoriesTo(output.GetOutputFilename())
+
+    # Write the results to a temporary file and only overwrite the original
+    # if the file changed.  This avoids unnecessary rebuilds.
+    outfile = self.fo_create(output.GetOutputFilename() + '.tmp', 'wb')
+
+    if output.GetType() != 'data_package':
+      encoding = self._EncodingForOutputType(output.GetType())
+      outfile = util.WrapOutputStream(outfile, encoding)
+
+    # Iterate in-order through entire resource tree, calling formatters on
+    # the entry into a node and on exit out of it.
+    with outfile:
+      self.ProcessNode(self.res, output, outfile)
+
+    # Now copy from the temp file back to the real output, but on Windows,
+    # only if the real output doesn't exist or the contents of the file
+    # changed.  This prevents identical headers from being written and .cc
+    # files from recompiling (which is painful on Windows).
+    if not os.path.exists(output.GetOutputFilename()):
+      os.rename(output.GetOutputFilename() + '.tmp',
+                output.GetOutputFilename())
+    else:
+      # CHROMIUM SPECIFIC CHANGE.
+      # This clashes with gyp + vstudio, which expect the output timestamp
+      # to change on a rebuild, even if nothing has changed, so only do
+      # it when opted in.
+      if not self.write_only_new:
+        write_file = True
+      else:
+        files_match = filecmp.cmp(output.GetOutputFilename(),
+            output.GetOutputFilename() + '.tmp')
+        write_file = not files_match
+      if write_file:
+        shutil.copy2(output.GetOutputFilename() + '.tmp',
+                     output.GetOutputFilename())
+      os.remove(output.GetOutputFilename() + '.tmp')
+
+    self.VerboseOut(' done.\n')
+
+  def _ProcessOutputsInParallel(self, indices, jobs):
+    '''Generates the outputs at |indices| using |jobs| worker processes.'''
+    global _worker_builder
+    _worker_builder = self
+    pool = multiprocessing.Pool(jobs)
+    try:
+      results = pool.map(_ProcessOutputInWorker, indices, chunksize=1)
+    finally:
+      pool.terminate()
+      pool.join()
+      _worker_builder = None
+
+    uberclique = self.res.UberClique()
+    for exit_code, missing, fallback in results:
+      if exit_code is not None:
+        sys.exit(exit_code)
+      _MergeTranslationReports(uberclique.missing_translations_, missing)
+      _MergeTranslationReports(uberclique.fallback_translations_, fallback)
+
+  def _GetOutputFingerprint(self, output):
+    '''Returns a hash of everything that |output| is generated from.
+
+    Input files are identified by their size and modification time rather than
+    by their contents, for speed.
+    '''
+    self._SetOutputContext(output)
+    configuration = (output.GetLanguage(), output.GetContext(),
+                     output.GetFallbackToDefaultLayout())
+    filenames = set(self.res.GetInputFiles(configurations=[configuration]))
+    filenames.update(self.fingerprint_files)
+    # GRIT itself.
+    filenames.update(m.__file__ for n, m in sys.modules.items()
+                     if n.startswith('grit.') and getattr(m, '__file__', None))
+
+    parts = [
+        _FINGERPRINT_VERSION,
+        output.GetType(),
+        output.GetOutputFilename(),
+        configuration,
+        sorted(self.defines.items()),
+        self.fingerprint_inputs,
+    ]
+    for filename in sorted(filenames):
+      try:
+        st = os.stat(filename)
+        parts.append((filename, st.st_size, st.st_mtime))
+      except OSError:
+        parts.append((filename, None))
+    return hashlib.sha1(repr(parts)).hexdigest()
+
+  def _GetFingerprintPath(self, filename):
+    return os.path.join(self.cache_dir, 'outputs',
+                        hashlib.sha1(os.path.abspath(filename)).hexdigest())
+
+  def _IsOutputUpToDate(self, output, fingerprint):
+    filename = output.GetOutputFilename()
+    if not os.path.exists(filename):
+      return False
+    if (output.GetType() == 'data_package' and
+        not os.path.exists(filename + '.info')):
+      return False
+    try:
+      with open(self._GetFingerprintPath(filename)) as f:
+        return f.read() == fingerprint
+    except IOError:
+      return False
+
+  def _WriteOutputFingerprint(self, filename, fingerprint):
+    path = self._GetFingerprintPath(filename)
+    self.MakeDirectoriesTo(path)
+    with open(path, 'w') as f:
+      f.write(fingerprint)
+
 
   def CheckAssertedOutputFiles(self, assert_output_files):
     '''Checks that the asserted output files are specified in the given list.
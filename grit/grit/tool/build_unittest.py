@@ -7,6 +7,7 @@
 '''
 
 import codecs
+import filecmp
 import os
 import sys
 import tempfile
@@ -282,6 +283,64 @@ class BuildUnittest(unittest.TestCase):
     self.assertTrue(abs(second_mtime - UNCHANGED) > 5)
     self.assertTrue(abs(third_mtime - UNCHANGED) < 5)
 
+  def testParallelOutputs(self):
+    class DummyOpts(object):
+      def __init__(self):
+        self.input = util.PathFromRoot('grit/testdata/whitelist_resources.grd')
+        self.verbose = False
+        self.extra_verbose = False
+    whitelist_file = util.PathFromRoot('grit/testdata/whitelist.txt')
+    serial_dir = tempfile.mkdtemp()
+    parallel_dir = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    build.RcBuilder().Run(DummyOpts(), ['-o', serial_dir,
+                                        '-w', whitelist_file])
+    build.RcBuilder().Run(DummyOpts(), ['-o', parallel_dir,
+                                        '-w', whitelist_file,
+                                        '-j', '4',
+                                        '--cache-dir', cache_dir])
+
+    filenames = sorted(os.listdir(serial_dir))
+    self.assertEqual(filenames, sorted(os.listdir(parallel_dir)))
+    for filename in filenames:
+      self.failUnless(filecmp.cmp(os.path.join(serial_dir, filename),
+                                  os.path.join(parallel_dir, filename),
+                                  shallow=False), filename)
+
+  def testCacheDirSkipsUnchangedOutputs(self):
+    output_dir = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    class DummyOpts(object):
+      def __init__(self):
+        self.input = util.PathFromRoot('grit/testdata/substitute.grd')
+        self.verbose = False
+        self.extra_verbose = False
+    UNCHANGED = 10
+    header = os.path.join(output_dir, 'resource.h')
+
+    build.RcBuilder().Run(DummyOpts(), ['-o', output_dir,
+                                        '--cache-dir', cache_dir])
+    self.failUnless(os.path.exists(header))
+
+    # Nothing changed, so the header is not even regenerated.
+    os.utime(header, (UNCHANGED, UNCHANGED))
+    build.RcBuilder().Run(DummyOpts(), ['-o', output_dir,
+                                        '--cache-dir', cache_dir])
+    self.assertTrue(abs(os.stat(header).st_mtime - UNCHANGED) < 5)
+
+    # Defines affect all outputs.
+    build.RcBuilder().Run(DummyOpts(), ['-o', output_dir,
+                                        '--cache-dir', cache_dir,
+                                        '-D', 'foo'])
+    self.assertTrue(abs(os.stat(header).st_mtime - UNCHANGED) > 5)
+
+    # Deleted outputs are always regenerated.
+    os.remove(header)
+    build.RcBuilder().Run(DummyOpts(), ['-o', output_dir,
+                                        '--cache-dir', cache_dir,
+                                        '-D', 'foo'])
+    self.failUnless(os.path.exists(header))
+
   def testGenerateDepFileWithDependOnStamp(self):
     output_dir = tempfile.mkdtemp()
     builder = build.RcBuilder()
@@ -7,6 +7,7 @@
 '''
 
 import codecs
+import cPickle
 import htmlentitydefs
 import os
 import re
@@ -513,6 +514,74 @@ def ParseDefine(define):
   return (name, val)
 
 
+# Suffix of the temporary files written by WriteCacheEntry().
+_CACHE_TMP_SUFFIX = '.tmp'
+
+
+def ReadCacheEntry(path):
+  '''Returns the value stored in |path| by WriteCacheEntry().
+
+  Also marks the entry as recently used, for PruneCacheDir().  Raises if
+  the entry is missing or corrupt.
+  '''
+  with open(path, 'rb') as f:
+    value = cPickle.load(f)
+  try:
+    os.utime(path, None)
+  except OSError:
+    # The entry may have been pruned by another process.
+    pass
+  return value
+
+
+def WriteCacheEntry(path, value):
+  '''Pickles |value| to |path|, creating its directory if needed.
+
+  The value is written to a temporary file first, so that concurrent
+  processes never see partial entries.
+  '''
+  dirname = os.path.dirname(path)
+  if not os.path.isdir(dirname):
+    try:
+      os.makedirs(dirname)
+    except OSError:
+      # Another process may have created it.
+      if not os.path.isdir(dirname):
+        raise
+  fd, tmp_path = tempfile.mkstemp(suffix=_CACHE_TMP_SUFFIX, dir=dirname)
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      cPickle.dump(value, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, path)
+  except:
+    os.unlink(tmp_path)
+    raise
+
+
+def PruneCacheDir(cache_dir, max_entries):
+  '''Deletes all but the |max_entries| most recently used entries that
+  WriteCacheEntry() wrote within |cache_dir|.
+  '''
+  entries = []
+  for dirpath, _, filenames in os.walk(cache_dir):
+    for filename in filenames:
+      # Leave entries that are being written alone.
+      if filename.endswith(_CACHE_TMP_SUFFIX):
+        continue
+      path = os.path.join(dirpath, filename)
+      try:
+        entries.append((os.path.getmtime(path), path))
+      except OSError:
+        # Pruned concurrently by another process.
+        pass
+  entries.sort(reverse=True)
+  for _, path in entries[max_entries:]:
+    try:
+      os.unlink(path)
+    except OSError:
+      pass
+
+
 class Substituter(object):
   '''Finds and substitutes variable names in text strings.
 
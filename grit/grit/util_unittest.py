@@ -103,6 +103,26 @@ class UtilUnittest(unittest.TestCase):
           Test(test, 'cp1252', test_std_newline.decode('cp1252'))
         self.assertRaises(UnicodeDecodeError, Test, '\x80', 'utf-8', None)
 
+  def testCacheEntries(self):
+    with util.TempDir({}) as tmp_dir:
+      paths = [tmp_dir.GetPath(os.path.join('cache', 'a', name))
+               for name in ('first', 'second', 'third')]
+      for i, path in enumerate(paths):
+        util.WriteCacheEntry(path, ('value', i))
+        os.utime(path, (i, i))
+      self.assertEqual(('value', 0), util.ReadCacheEntry(paths[0]))
+      # Entries being written are left alone.
+      tmp_path = tmp_dir.GetPath(os.path.join('cache', 'a', 'entry.tmp'))
+      with open(tmp_path, 'w') as f:
+        f.write('partial')
+      os.utime(tmp_path, (0, 0))
+
+      # Reading "first" made it the most recently used.
+      util.PruneCacheDir(tmp_dir.GetPath('cache'), 2)
+      self.assertEqual(['entry.tmp', 'first', 'third'],
+                       sorted(os.listdir(tmp_dir.GetPath('cache/a'))))
+      self.assertRaises(IOError, util.ReadCacheEntry, paths[1])
+
 
 class TestBaseClassToLoad(object):
   pass
@@ -7,9 +7,16 @@
 json.loads.
 '''
 
+import re
 import sys
 
 
+# Tokens starting a string or a comment, tried in this order at each position.
+_NOM_TOKENS_RE = re.compile(r'"|//|/\*')
+# Tokens ending a single line comment.
+_EOL_TOKENS_RE = re.compile(r'[\n\r]')
+
+
 def _Rcount(string, chars):
   '''Returns the number of consecutive characters from |chars| that occur at the
   end of |string|.
@@ -17,16 +24,14 @@ def _Rcount(string, chars):
   return len(string) - len(string.rstrip(chars))
 
 
-def _FindNextToken(string, tokens, start):
-  '''Finds the next token in |tokens| that occurs in |string| from |start|.
-  Returns a tuple (index, token key).
+def _FindNextToken(string, tokens_re, start):
+  '''Finds the next token matched by |tokens_re| that occurs in |string| from
+  |start|. Returns a tuple (index, token key).
   '''
-  for index, item in enumerate(string, start):
-    for k in tokens:
-      if (string[index:index + len(k)] == k):
-        return (index, k)
-
-  return (-1, None)
+  match = tokens_re.search(string, start)
+  if match is None:
+    return (-1, None)
+  return (match.start(), match.group())
 
 def _ReadString(input, start, output):
   output.append('"')
@@ -42,19 +47,17 @@ def _ReadString(input, start, output):
 
 
 def _ReadComment(input, start, output):
-  eol_tokens = ('\n', '\r')
-  eol_token_index, eol_token = _FindNextToken(input, eol_tokens, start)
+  eol_token_index, eol_token = _FindNextToken(input, _EOL_TOKENS_RE, start)
   if eol_token is None:
     return len(input)
   output.append(eol_token)
   return eol_token_index + len(eol_token)
 
 def _ReadMultilineComment(input, start, output):
-  end_tokens = ('*/',)
-  end_token_index, end_token = _FindNextToken(input, end_tokens, start)
-  if end_token is None:
+  end_token_index = input.find('*/', start)
+  if end_token_index == -1:
     raise Exception("Multiline comment end token (*/) not found")
-  return end_token_index + len(end_token)
+  return end_token_index + len('*/')
 
 def Nom(input):
   token_actions = {
@@ -65,7 +68,7 @@ def Nom(input):
   output = []
   pos = 0
   while pos < len(input):
-    token_index, token = _FindNextToken(input, token_actions.keys(), pos)
+    token_index, token = _FindNextToken(input, _NOM_TOKENS_RE, pos)
     if token is None:
       output.append(input[pos:])
       break
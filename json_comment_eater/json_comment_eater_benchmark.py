@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# Copyright 2016 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+'''Times json_comment_eater.Nom over the extension feature files, next to the
+previous implementation which searched for tokens character by character.
+
+Usage: json_comment_eater_benchmark.py [--repeat N] [file ...]
+
+Without arguments, the _*_features.json files of a Chromium checkout containing
+this tools/ directory are used.
+'''
+
+import glob
+import optparse
+import os
+import sys
+import time
+
+import json_comment_eater
+
+
+_SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, os.pardir)
+_FEATURE_FILE_PATTERNS = (
+  'chrome/common/extensions/api/_*_features.json',
+  'extensions/common/api/_*_features.json',
+)
+
+
+def _DefaultFiles():
+  files = []
+  for pattern in _FEATURE_FILE_PATTERNS:
+    files.extend(glob.glob(os.path.join(_SRC_DIR, pattern)))
+  return sorted(files)
+
+
+def _FindNextTokenByChar(string, tokens, start):
+  '''The previous json_comment_eater._FindNextToken, which takes a sequence of
+  |tokens| instead of a regular expression.
+  '''
+  for index, item in enumerate(string, start):
+    for k in tokens:
+      if (string[index:index + len(k)] == k):
+        return (index, k)
+
+  return (-1, None)
+
+
+def _ReadCommentByChar(input, start, output):
+  eol_token_index, eol_token = _FindNextTokenByChar(input, ('\n', '\r'), start)
+  if eol_token is None:
+    return len(input)
+  output.append(eol_token)
+  return eol_token_index + len(eol_token)
+
+
+def _ReadMultilineCommentByChar(input, start, output):
+  end_token_index, end_token = _FindNextTokenByChar(input, ('*/',), start)
+  if end_token is None:
+    raise Exception("Multiline comment end token (*/) not found")
+  return end_token_index + len(end_token)
+
+
+def _NomByChar(input):
+  '''The previous json_comment_eater.Nom, for comparison.'''
+  token_actions = {
+    '"': json_comment_eater._ReadString,
+    '//': _ReadCommentByChar,
+    '/*': _ReadMultilineCommentByChar,
+  }
+  output = []
+  pos = 0
+  while pos < len(input):
+    token_index, token = _FindNextTokenByChar(input, token_actions.keys(), pos)
+    if token is None:
+      output.append(input[pos:])
+      break
+    output.append(input[pos:token_index])
+    pos = token_actions[token](input, token_index + len(token), output)
+  return ''.join(output)
+
+
+def _TimeNom(nom, contents, repeat):
+  '''Returns the fastest of |repeat| runs of |nom| over |contents|, in
+  seconds.
+  '''
+  best = None
+  for _ in xrange(repeat):
+    start = time.time()
+    nom(contents)
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+
+def main(argv):
+  parser = optparse.OptionParser(usage='%prog [--repeat N] [file ...]')
+  parser.add_option('--repeat', type='int', default=10,
+                    help='Number of runs per file, the fastest is reported.')
+  options, files = parser.parse_args(argv)
+  files = files or _DefaultFiles()
+  if not files:
+    parser.error('No feature files found, pass the files to benchmark.')
+
+  print '%-50s %14s %11s %11s' % ('', 'size', 'Nom', 'previous')
+  total_size = 0
+  total_time = 0
+  total_previous_time = 0
+  for path in files:
+    with open(path, 'r') as f:
+      contents = f.read()
+    if json_comment_eater.Nom(contents) != _NomByChar(contents):
+      print >> sys.stderr, 'Nom and its previous version differ on %s' % path
+      return 1
+    elapsed = _TimeNom(json_comment_eater.Nom, contents, options.repeat)
+    previous_elapsed = _TimeNom(_NomByChar, contents, options.repeat)
+    total_size += len(contents)
+    total_time += elapsed
+    total_previous_time += previous_elapsed
+    print '%-50s %8d bytes %8.2f ms %8.2f ms' % (
+        os.path.basename(path), len(contents), elapsed * 1000,
+        previous_elapsed * 1000)
+  print '%-50s %8d bytes %8.2f ms %8.2f ms' % (
+      'total', total_size, total_time * 1000, total_previous_time * 1000)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -24,5 +24,13 @@ class JsonCommentEaterTest(unittest.TestCase):
     json, expected_json = self._Load('everything')
     self.assertEqual(expected_json, Nom(json))
 
+  def testEdgeCases(self):
+    self.assertEqual('{"a\\\\"\n}', Nom('{"a\\\\"// x\n}'))
+    self.assertEqual('"a\\"/* b */"', Nom('"a\\"/* b */"'))
+    self.assertEqual('a\r\nb', Nom('a// x\r\nb'))
+    self.assertEqual('a', Nom('a// x'))
+    self.assertEqual('ab*/', Nom('a/* // " */b*/'))
+    self.assertRaises(Exception, Nom, 'a /* b')
+
 if __name__ == '__main__':
   unittest.main()
@@ -30,6 +30,7 @@ import json_schema
 from cpp_namespace_environment import CppNamespaceEnvironment
 from model import Model
 from namespace_resolver import NamespaceResolver
+import schema_loader
 from schema_loader import SchemaLoader
 
 # Names of supported code generators, as specified on the command-line.
@@ -183,6 +184,9 @@ if __name__ == '__main__':
       help='A list of paths to include when searching for referenced objects,'
       ' with the namespace separated by a \':\'. Example: '
       '/foo/bar:Foo::Bar::%(namespace)s')
+  parser.add_option('--cache-dir',
+      help='directory in which to cache parsed schemas, shared by all the '
+      'compiler invocations of a build.')
 
   (opts, file_paths) = parser.parse_args()
 
@@ -202,6 +206,9 @@ if __name__ == '__main__':
                        'the form path:namespace' % path_and_namespace)
     return path_and_namespace.split(':', 1)
 
+  if opts.cache_dir:
+    schema_loader.SetCacheDir(os.path.abspath(opts.cache_dir))
+
   include_rules = []
   if opts.include_rules:
     include_rules = map(split_path_and_namespace,
@@ -37,10 +37,16 @@ def DeleteNodes(item, delete_key=None, matcher=None):
 
 
 def Load(filename):
+  with open(filename, 'r') as handle:
+    return Process(handle.read(), filename)
+
+
+def Process(contents, filename):
+  """Parses the JSON schema |contents| of the file |filename|. (Separate from
+  Load so that callers which already read the file don't read it again.)
+  """
   try:
-    with open(filename, 'r') as handle:
-      schemas = json_parse.Parse(handle.read())
-    return schemas
+    return json_parse.Parse(contents)
   except:
     print('FAILED: Exception encountered while loading "%s"' % filename)
     raise
@@ -5,7 +5,7 @@
 import os
 
 from cpp_namespace_environment import CppNamespaceEnvironment
-from model import Model, UnixName
+from model import UnixName
 from schema_loader import SchemaLoader
 
 
@@ -55,9 +55,7 @@ class NamespaceResolver(object):
       for filename in reversed(filenames):
         filepath = os.path.join(path, filename);
         if os.path.exists(os.path.join(self._root, filepath)):
-          schema = SchemaLoader(self._root).LoadSchema(filepath)[0]
-          return Model().AddNamespace(
-              schema,
+          return SchemaLoader(self._root).LoadNamespace(
               filepath,
               environment=cpp_namespace_environment)
     return None
@@ -2,32 +2,218 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import cPickle
+import hashlib
 import os
 import sys
+import tempfile
 
+import cpp_namespace_environment
 import idl_schema
+import json_parse
 import json_schema
+import model
+
+# Bump whenever the format of cached values changes.
+_CACHE_VERSION = '1'
+
+# Pickled schemas of this process, keyed by the result of _CacheKey(). They are
+# kept pickled so that every caller gets its own copy to modify.
+_schemas = {}
+
+# model.Namespace objects of this process, keyed by the result of _CacheKey().
+_namespaces = {}
+
+# Directory in which parsed schemas and namespaces are also stored, so that
+# they can be shared across the compiler invocations of a build. See
+# SetCacheDir().
+_cache_dir = None
+
+# Number of entries kept in the cache directory. The least recently used
+# entries beyond this are deleted when an invocation first writes to it.
+_MAX_CACHE_ENTRIES = 4096
+
+# Suffix of files that are still being written to the cache directory.
+_CACHE_TMP_SUFFIX = '.tmp'
+
+# Whether this process has pruned the cache directory.
+_cache_pruned = False
+
+# Hash of the sources of the modules that parse schemas and build namespaces.
+# Cached values are only valid for the code which produced them.
+_compiler_hash = None
+
+
+def SetCacheDir(cache_dir):
+  '''Sets a directory in which to cache parsed schemas across invocations.'''
+  global _cache_dir
+  global _cache_pruned
+  _cache_dir = cache_dir
+  _cache_pruned = False
+
+
+def _GetCompilerHash():
+  global _compiler_hash
+  if _compiler_hash is None:
+    modules = [sys.modules[__name__], cpp_namespace_environment, idl_schema,
+               idl_schema.idl_parser, json_parse, json_parse.json_comment_eater,
+               json_schema, model]
+    if 'idl_lexer' in sys.modules:
+      modules.append(sys.modules['idl_lexer'])
+    md5 = hashlib.md5()
+    for module in modules:
+      with open(os.path.splitext(module.__file__)[0] + '.py', 'rb') as f:
+        md5.update(f.read())
+    _compiler_hash = md5.hexdigest()
+  return _compiler_hash
+
+
+def _CacheKey(*parts):
+  return hashlib.sha1('\0'.join(
+      (_CACHE_VERSION, _GetCompilerHash()) + parts)).hexdigest()
+
+
+def _CacheDir():
+  return os.path.join(_cache_dir, 'json_schema_compiler')
+
+
+def _CachePath(key):
+  return os.path.join(_CacheDir(), key[:2], key)
+
+
+def _ReadCacheFile(key):
+  if not _cache_dir:
+    return None
+  path = _CachePath(key)
+  try:
+    with open(path, 'rb') as f:
+      value = f.read()
+  except IOError:
+    return None
+  # Mark the entry as recently used, for _PruneCache().
+  try:
+    os.utime(path, None)
+  except OSError:
+    pass
+  return value
+
+
+def _PruneCache():
+  '''Deletes all but the _MAX_CACHE_ENTRIES most recently used entries of the
+  cache directory.
+  '''
+  entries = []
+  for dirpath, _, filenames in os.walk(_CacheDir()):
+    for filename in filenames:
+      if filename.endswith(_CACHE_TMP_SUFFIX):
+        continue
+      path = os.path.join(dirpath, filename)
+      try:
+        entries.append((os.path.getmtime(path), path))
+      except OSError:
+        # Pruned by another compiler invocation.
+        pass
+  entries.sort(reverse=True)
+  for _, path in entries[_MAX_CACHE_ENTRIES:]:
+    try:
+      os.unlink(path)
+    except OSError:
+      pass
+
+
+def _WriteCacheFile(key, value):
+  global _cache_pruned
+  if not _cache_dir:
+    return
+  # Entries are never overwritten, so prune once per invocation that adds
+  # some, rather than on every write.
+  if not _cache_pruned:
+    _PruneCache()
+    _cache_pruned = True
+  path = _CachePath(key)
+  dirname = os.path.dirname(path)
+  if not os.path.isdir(dirname):
+    try:
+      os.makedirs(dirname)
+    except OSError:
+      # Another compiler invocation may have created it.
+      if not os.path.isdir(dirname):
+        raise
+  # Write to a temporary file first, so that concurrent invocations never see
+  # partial entries.
+  fd, tmp_path = tempfile.mkstemp(suffix=_CACHE_TMP_SUFFIX, dir=dirname)
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      f.write(value)
+    os.rename(tmp_path, path)
+  except:
+    os.unlink(tmp_path)
+    raise
+
 
 class SchemaLoader(object):
   '''Loads a schema from a provided filename.
   |root|: path to the root directory.
+
+  Schemas are parsed once per content, and namespaces built once per content
+  and environment, for the whole process; and for all processes sharing the
+  directory given to SetCacheDir().
   '''
   def __init__(self, root):
     self._root = root
 
+  def _ReadSchema(self, schema):
+    '''Returns the extension and the contents of the file |schema|.'''
+    _, schema_extension = os.path.splitext(schema)
+    if schema_extension not in ('.json', '.idl'):
+      sys.exit('Did not recognize file extension %s for schema %s' %
+               (schema_extension, schema))
+    with open(os.path.join(self._root, schema), 'r') as f:
+      return schema_extension, f.read()
+
   def LoadSchema(self, schema):
     '''Load a schema definition. The schema parameter must be a file name
     with the full path relative to the root.'''
-    _, schema_extension = os.path.splitext(schema)
-
+    schema_extension, contents = self._ReadSchema(schema)
     schema_path = os.path.join(self._root, schema)
+    # The parsers are given the path too, so it is part of the key.
+    key = _CacheKey('schema', schema_path, schema_extension, contents)
+    pickled_api_defs = _schemas.get(key) or _ReadCacheFile(key)
+    if pickled_api_defs is not None:
+      _schemas[key] = pickled_api_defs
+      return cPickle.loads(pickled_api_defs)
+
     if schema_extension == '.json':
-      api_defs = json_schema.Load(schema_path)
-    elif schema_extension == '.idl':
-      api_defs = idl_schema.Load(schema_path)
+      api_defs = json_schema.Process(contents, schema_path)
     else:
-      sys.exit('Did not recognize file extension %s for schema %s' %
-               (schema_extension, schema))
+      api_defs = idl_schema.Process(contents, schema_path)
+    pickled_api_defs = cPickle.dumps(api_defs, cPickle.HIGHEST_PROTOCOL)
+    _schemas[key] = pickled_api_defs
+    _WriteCacheFile(key, pickled_api_defs)
 
     # TODO(devlin): This returns a list. Does it need to? Is it ever > 1?
     return api_defs
+
+  def LoadNamespace(self, schema, environment=None):
+    '''Returns the model.Namespace of the first API definition in |schema|, a
+    file name with the full path relative to the root. The namespace is shared
+    with other callers, and must not be modified.
+    '''
+    schema_extension, contents = self._ReadSchema(schema)
+    environment_key = repr(environment.namespace_pattern) if environment else ''
+    key = _CacheKey('namespace', schema, environment_key, schema_extension,
+                    contents)
+    namespace = _namespaces.get(key)
+    if namespace is not None:
+      return namespace
+
+    pickled_namespace = _ReadCacheFile(key)
+    if pickled_namespace is not None:
+      namespace = cPickle.loads(pickled_namespace)
+    else:
+      namespace = model.Model().AddNamespace(self.LoadSchema(schema)[0],
+                                             schema,
+                                             environment=environment)
+      _WriteCacheFile(key, cPickle.dumps(namespace, cPickle.HIGHEST_PROTOCOL))
+    _namespaces[key] = namespace
+    return namespace
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# Copyright 2016 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cpp_namespace_environment import CppNamespaceEnvironment
+import json_schema
+import schema_loader
+from schema_loader import SchemaLoader
+
+class SchemaLoaderTest(unittest.TestCase):
+  def setUp(self):
+    self._root = tempfile.mkdtemp()
+    shutil.copy(os.path.join(os.path.dirname(__file__), 'test', 'tabs.json'),
+                self._root)
+    schema_loader._schemas.clear()
+    schema_loader._namespaces.clear()
+
+  def tearDown(self):
+    schema_loader.SetCacheDir(None)
+    schema_loader._schemas.clear()
+    schema_loader._namespaces.clear()
+    shutil.rmtree(self._root)
+
+  def _WriteSchema(self, contents):
+    with open(os.path.join(self._root, 'tabs.json'), 'w') as f:
+      f.write(contents)
+
+  def testLoadSchemaReturnsCopies(self):
+    loader = SchemaLoader(self._root)
+    api_defs = loader.LoadSchema('tabs.json')
+    self.assertEquals(json_schema.Load(os.path.join(self._root, 'tabs.json')),
+                      api_defs)
+    del api_defs[0]['functions']
+    self.assertTrue('functions' in loader.LoadSchema('tabs.json')[0])
+
+  def testLoadSchemaFromCacheDir(self):
+    schema_loader.SetCacheDir(os.path.join(self._root, 'cache'))
+    expected = SchemaLoader(self._root).LoadSchema('tabs.json')
+    # Simulate a new compiler invocation, which must not parse the schema.
+    schema_loader._schemas.clear()
+    process = json_schema.Process
+    json_schema.Process = None
+    try:
+      self.assertEquals(expected,
+                        SchemaLoader(self._root).LoadSchema('tabs.json'))
+    finally:
+      json_schema.Process = process
+
+  def testLoadSchemaKeyedByPath(self):
+    # The parsers are given the path of the schema, so the same contents at
+    # another path are parsed again.
+    shutil.copy(os.path.join(self._root, 'tabs.json'),
+                os.path.join(self._root, 'other.json'))
+    process = json_schema.Process
+    processed = []
+    def Process(contents, filename):
+      processed.append(filename)
+      return process(contents, filename)
+    json_schema.Process = Process
+    try:
+      loader = SchemaLoader(self._root)
+      loader.LoadSchema('tabs.json')
+      loader.LoadSchema('other.json')
+      loader.LoadSchema('tabs.json')
+    finally:
+      json_schema.Process = process
+    self.assertEquals([os.path.join(self._root, 'tabs.json'),
+                       os.path.join(self._root, 'other.json')], processed)
+
+  def testCacheDirIsPruned(self):
+    for name in ('first.json', 'second.json', 'third.json'):
+      shutil.copy(os.path.join(self._root, 'tabs.json'),
+                  os.path.join(self._root, name))
+    cache_dir = os.path.join(self._root, 'cache')
+    def CachedPaths():
+      return sorted(os.path.join(dirpath, f)
+                    for dirpath, _, filenames in os.walk(cache_dir)
+                    for f in filenames)
+
+    max_entries = schema_loader._MAX_CACHE_ENTRIES
+    schema_loader._MAX_CACHE_ENTRIES = 1
+    try:
+      schema_loader.SetCacheDir(cache_dir)
+      SchemaLoader(self._root).LoadSchema('first.json')
+      first_path, = CachedPaths()
+      os.utime(first_path, (0, 0))
+      SchemaLoader(self._root).LoadSchema('second.json')
+      # Pruning happens once per invocation, so both entries remain.
+      self.assertEquals(2, len(CachedPaths()))
+
+      # The next invocation that adds an entry prunes the oldest one.
+      schema_loader._schemas.clear()
+      schema_loader.SetCacheDir(cache_dir)
+      SchemaLoader(self._root).LoadSchema('third.json')
+      self.assertEquals(2, len(CachedPaths()))
+      self.assertFalse(first_path in CachedPaths())
+    finally:
+      schema_loader._MAX_CACHE_ENTRIES = max_entries
+
+  def testLoadNamespace(self):
+    loader = SchemaLoader(self._root)
+    environment = CppNamespaceEnvironment('extensions::api::%(namespace)s')
+    namespace = loader.LoadNamespace('tabs.json', environment=environment)
+    self.assertEquals('tabs', namespace.name)
+    self.assertTrue('Tab' in namespace.types)
+    self.assertTrue(namespace is
+                    loader.LoadNamespace('tabs.json', environment=environment))
+    self.assertFalse(namespace is loader.LoadNamespace('tabs.json'))
+
+    self._WriteSchema('[{"namespace": "tabs", "description": "",'
+                      ' "types": []}]')
+    self.assertEquals({},
+        loader.LoadNamespace('tabs.json', environment=environment).types)
+
+  def testLoadNamespaceFromCacheDir(self):
+    schema_loader.SetCacheDir(os.path.join(self._root, 'cache'))
+    namespace = SchemaLoader(self._root).LoadNamespace('tabs.json')
+    schema_loader._schemas.clear()
+    schema_loader._namespaces.clear()
+    cached_namespace = SchemaLoader(self._root).LoadNamespace('tabs.json')
+    self.assertFalse(namespace is cached_namespace)
+    self.assertEquals(sorted(namespace.types), sorted(cached_namespace.types))
+    self.assertEquals(sorted(namespace.functions),
+                      sorted(cached_namespace.functions))
+    self.assertFalse(schema_loader._schemas)
+
+if __name__ == '__main__':
+  unittest.main()
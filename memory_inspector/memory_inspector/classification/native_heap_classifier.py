@@ -59,13 +59,32 @@ def Classify(nativeheap, rule_tree):
   assert(isinstance(nativeheap, native_heap.NativeHeap))
   assert(isinstance(rule_tree, rules.Rule))
 
-  res = results.AggreatedResults(rule_tree, _RESULT_KEYS)
+  # The rules look only at the stack traces. Hence, the allocations are first
+  # grouped by stack trace (frames are unique per address, see
+  # |NativeHeap|.GetStackFrame) and each distinct stack trace is classified
+  # only once, with the sizes of all its allocations.
+  values_by_stack = collections.OrderedDict()  # key -> [alloc, size, resid.]
   for allocation in nativeheap.allocations:
-    res.AddToMatchingNodes(allocation,
-                           [allocation.size, allocation.resident_size])
+    key = _GetStackTraceKey(allocation.stack_trace)
+    values = values_by_stack.get(key)
+    if values:
+      values[1] += allocation.size
+      values[2] += allocation.resident_size
+    else:
+      values_by_stack[key] = [
+          allocation, allocation.size, allocation.resident_size]
+
+  res = results.AggreatedResults(rule_tree, _RESULT_KEYS)
+  for allocation, size, resident_size in values_by_stack.itervalues():
+    res.AddToMatchingNodes(allocation, [size, resident_size])
   return res
 
 
+def _GetStackTraceKey(stack_trace):
+  """Returns a key which is equal for stack traces with the same frames."""
+  return tuple(id(frame) for frame in stack_trace.frames)
+
+
 def InferHeuristicRulesFromHeap(nheap, max_depth=3, threshold=0.02):
   """Infers the rules tree from a symbolized heap snapshot.
 
@@ -112,20 +131,28 @@ def InferHeuristicRulesFromHeap(nheap, max_depth=3, threshold=0.02):
   # associates, to each source path directory, the number of bytes allocated.
 
   blamed_dirs = collections.Counter()  # '/s/path' : bytes_from_this_path (int)
+  blamed_dir_by_stack = {}  # See _GetStackTraceKey.
   total_allocated = 0
   for alloc in nheap.allocations:
-    dir_histogram = collections.Counter()
-    for frame in alloc.stack_trace.frames[2:10]:
-      # Compute a histogram (for each allocation) of the top source dirs.
-      if not frame.symbol or not frame.symbol.source_info:
-        continue
-      src_file = frame.symbol.source_info[0].source_file_path
-      src_dir = posixpath.dirname(src_file.replace('\\', '/')) + '/'
-      dir_histogram.update([src_dir])
-    if not dir_histogram:
+    key = _GetStackTraceKey(alloc.stack_trace)
+    if key in blamed_dir_by_stack:
+      blamed_dir = blamed_dir_by_stack[key]
+    else:
+      dir_histogram = collections.Counter()
+      for frame in alloc.stack_trace.frames[2:10]:
+        # Compute a histogram (for each stack trace) of the top source dirs.
+        if not frame.symbol or not frame.symbol.source_info:
+          continue
+        src_file = frame.symbol.source_info[0].source_file_path
+        src_dir = posixpath.dirname(src_file.replace('\\', '/')) + '/'
+        dir_histogram.update([src_dir])
+      blamed_dir = None
+      if dir_histogram:
+        blamed_dir = dir_histogram.most_common()[0][0]
+      blamed_dir_by_stack[key] = blamed_dir
+    if not blamed_dir:
       continue
     # Add the blamed dir to the leaderboard.
-    blamed_dir = dir_histogram.most_common()[0][0]
     blamed_dirs.update({blamed_dir : alloc.size})
     total_allocated += alloc.size
 
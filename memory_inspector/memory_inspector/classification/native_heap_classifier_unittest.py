@@ -119,6 +119,30 @@ class NativeHeapClassifierTest(unittest.TestCase):
     res = native_heap_classifier.Classify(nheap, rule_tree)
     self._CheckResult(res.total, '', _EXPECTED_RESULTS)
 
+  def testAllocationsSharingStackTraces(self):
+    rule_tree = native_heap_classifier.LoadRules(_TEST_RULES)
+    nheap = native_heap.NativeHeap()
+    mock_addr = 0
+    for test_entry in _TEST_STACK_TRACES:
+      mock_strace = stacktrace.Stacktrace()
+      mock_strace_copy = stacktrace.Stacktrace()
+      for (mock_btstr, mock_source_path) in test_entry[1]:
+        mock_addr += 4  # Addr is irrelevant, just keep it distinct.
+        mock_frame = nheap.GetStackFrame(mock_addr)
+        mock_frame.SetSymbolInfo(symbol.Symbol(mock_btstr, mock_source_path))
+        mock_strace.Add(mock_frame)
+        mock_strace_copy.Add(mock_frame)
+      # The same stack trace object twice, and a copy with the same frames.
+      for strace in (mock_strace, mock_strace, mock_strace_copy):
+        nheap.Add(native_heap.Allocation(
+            size=test_entry[0], stack_trace=strace,
+            resident_size=test_entry[0]))
+
+    res = native_heap_classifier.Classify(nheap, rule_tree)
+    expected_results = dict((name, [3 * values[0], 3 * values[0]])
+                            for name, values in _EXPECTED_RESULTS.iteritems())
+    self._CheckResult(res.total, '', expected_results)
+
   def testInferHeuristicRules(self):
     nheap = native_heap.NativeHeap()
     mock_addr = 0
@@ -87,6 +87,29 @@ class MapEntry(object):
       return False
     return (self.resident_pages[arr_idx] & (1 << arr_bit)) != 0
 
+  def GetResidentRanges(self):
+    """Returns the resident pages as a sorted list of [start, end) ranges.
+
+    Adjacent resident pages are merged into a single range.
+    """
+    ranges = []
+    num_pages = self.num_pages
+    for arr_idx, bits in enumerate(self.resident_pages):
+      if not bits:
+        continue
+      for arr_bit in xrange(8):
+        page = arr_idx * 8 + arr_bit
+        if page >= num_pages:
+          break
+        if not bits & (1 << arr_bit):
+          continue
+        page_start = self.start + page * PAGE_SIZE
+        if ranges and ranges[-1][1] == page_start:
+          ranges[-1][1] = page_start + PAGE_SIZE
+        else:
+          ranges.append([page_start, page_start + PAGE_SIZE])
+    return ranges
+
   def Contains(self, abs_addr):
     """Determines whether a given absolute address belongs to the current mm."""
     return abs_addr >= self.start and abs_addr <= self.end
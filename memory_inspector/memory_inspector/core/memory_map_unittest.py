@@ -31,6 +31,10 @@ class MemoryMapTest(unittest.TestCase):
     self.assertTrue(map_entry2.IsPageResident(0))
     self.assertFalse(map_entry2.IsPageResident(1))
     self.assertTrue(map_entry2.IsPageResident(2))
+    self.assertEqual(map_entry2.GetResidentRanges(),
+                     [[65536, 69632], [73728, 77824]])
+    map_entry2.resident_pages = [6] # 6 -> 110b.
+    self.assertEqual(map_entry2.GetResidentRanges(), [[69632, 77824]])
 
     # Test the lookup logic.
     mmap.Add(map_entry1)
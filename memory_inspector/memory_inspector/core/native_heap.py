@@ -2,12 +2,13 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import bisect
+import itertools
+
 from memory_inspector.core import memory_map
 from memory_inspector.core import stacktrace
 from memory_inspector.core import symbol
 
-from memory_inspector.core.memory_map import PAGE_SIZE
-
 
 class NativeHeap(object):
   """A snapshot of outstanding (i.e. not freed) native allocations.
@@ -62,38 +63,51 @@ class NativeHeap(object):
     estimates the resident size of an allocation intersecting the mmaps dump.
     """
     assert(isinstance(mmap, memory_map.Map))
+    # Each allocation is attributed a resident size equal to the size of its
+    # intersection with the resident pages of the mmaps.
+    # The tricky part is that, in the general case, an allocation can span
+    # over multiple (contiguous) mmaps. See the chart below for a reference:
+    #
+    # VA space:  |0    |4k   |8k   |12k  |16k  |20k  |24k  |28k  |32k  |
+    # Mmaps:     [   mm 1   ][ mm2 ]           [          map 3        ]
+    # Allocs:      <a1>  <  a2  >                       <      a3      >
+    #
+    # Rather than looking up each page of each allocation, the resident pages
+    # are first merged into sorted, disjoint runs of resident bytes. The
+    # resident size of an allocation [start, end] is then the number of
+    # resident bytes below end + 1 minus the ones below start, which are both
+    # found by a binary search on the runs.
+    #
+    # Note: this accounting technique is not fully correct but is generally a
+    # good tradeoff between accuracy and speed of profiling. The OS provides
+    # resident information with the page granularity (typ. 4k). Finer values
+    # would require more fancy techniques based, for instance, on run-time
+    # instrumentation tools like Valgrind or *sanitizer.
+    run_starts = []
+    run_ends = []
+    for mm in mmap.entries:
+      for run_start, run_end in mm.GetResidentRanges():
+        if run_ends and run_ends[-1] == run_start:
+          run_ends[-1] = run_end
+        else:
+          run_starts.append(run_start)
+          run_ends.append(run_end)
+    # resident_bytes_before_run[i] = resident bytes in the runs before the i-th.
+    resident_bytes_before_run = [0]
+    for run_start, run_end in itertools.izip(run_starts, run_ends):
+      resident_bytes_before_run.append(
+          resident_bytes_before_run[-1] + run_end - run_start)
+
+    def ResidentBytesBelow(addr):
+      idx = bisect.bisect_right(run_starts, addr) - 1
+      if idx < 0:
+        return 0
+      return (resident_bytes_before_run[idx] +
+              min(addr, run_ends[idx]) - run_starts[idx])
+
     for alloc in self.allocations:
-      # This function loops over all the memory pages that intersect, partially
-      # or fully, with each allocation. For each of them, the allocation  is
-      # attributed a resident size equal to the size of intersecting range iff
-      # the page is resident.
-      # The tricky part is that, in the general case, an allocation can span
-      # over multiple (contiguous) mmaps. See the chart below for a reference:
-      #
-      # VA space:  |0    |4k   |8k   |12k  |16k  |20k  |24k  |28k  |32k  |
-      # Mmaps:     [   mm 1   ][ mm2 ]           [          map 3        ]
-      # Allocs:      <a1>  <  a2  >                       <      a3      >
-      #
-      # Note: this accounting technique is not fully correct but is generally a
-      # good tradeoff between accuracy and speed of profiling. The OS provides
-      # resident information with the page granularity (typ. 4k). Finer values
-      # would require more fancy techniques based, for instance, on run-time
-      # instrumentation tools like Valgrind or *sanitizer.
-      cur_start = alloc.start
-      mm = None
-      while cur_start < alloc.end:
-        if not mm or not mm.Contains(cur_start):
-          mm = mmap.Lookup(cur_start)
-        if mm:
-          page, page_off = mm.GetRelativeMMOffset(cur_start)
-          if mm.IsPageResident(page):
-            page_end = mm.start + page * PAGE_SIZE + PAGE_SIZE - 1
-            alloc_memory_in_current_page = PAGE_SIZE - page_off
-            if alloc.end < page_end:
-              alloc_memory_in_current_page -= page_end - alloc.end
-            alloc.resident_size += alloc_memory_in_current_page
-        # Move to the next page boundary.
-        cur_start = (cur_start + PAGE_SIZE) & ~(PAGE_SIZE - 1)
+      alloc.resident_size += (ResidentBytesBelow(alloc.end + 1) -
+                              ResidentBytesBelow(alloc.start))
 
 
 class Allocation(object):
@@ -130,6 +130,9 @@ class NativeHeapTest(unittest.TestCase):
     # [12k, 16k] is deliberately missing to check the fallback behavior.
     mmap.Add(
         memory_map.MapEntry(16384, 20479, 'rw--', '', 0, resident_pages=[1]))
+    # alloc4 [8191, 8192] ends on the first byte of a page.
+    alloc4 = native_heap.Allocation(start=8191, size=2, stack_trace=st1)
+    nheap.Add(alloc4)
     nheap.CalculateResidentSize(mmap)
 
     # alloc1 [4, 8] is fully resident because it lays in the first resident 4k.
@@ -145,3 +148,6 @@ class NativeHeapTest(unittest.TestCase):
     #  [12288, 16384]: the 4th page is fully covered as well, but not resident.
     # *[16384, 18190]: the 5th page is partially covered and resident.
     self.assertEqual(alloc3.resident_size, (12288 - 8192) + (18190 - 16384))
+
+    # alloc4 has only its last byte in the resident 3rd page.
+    self.assertEqual(alloc4.resident_size, 1)
@@ -33,8 +33,13 @@ def CheckChange(input_api, output_api):
           'histograms.xml is not formatted correctly; please run '
           'git cl format %s to fix.' % cwd))
 
+    # Skips validating files that already passed, e.g. when uploading again.
+    # out/ is ignored by git, and is private to the checkout.
+    cache_dir = input_api.os_path.join(
+        input_api.change.RepositoryRoot(), 'out', 'histograms_cache')
     exit_code = input_api.subprocess.call(
-        [input_api.python_executable, 'validate_format.py'], cwd=cwd)
+        [input_api.python_executable, 'validate_format.py',
+         '--cache_dir', cache_dir], cwd=cwd)
     if exit_code != 0:
       results.append(output_api.PresubmitError(
           'histograms.xml is not well formatted; run %s/validate_format.py '
@@ -55,10 +55,16 @@ XML below will generate the following five histograms:
 
 import bisect
 import copy
+import cPickle
 import datetime
+import hashlib
 import logging
+import os
 import re
+import struct
+import tempfile
 import xml.dom.minidom
+import xml.etree.cElementTree as ElementTree
 
 OWNER_FIELD_PLACEHOLDER = (
     'Please list the metric\'s owners. Add more owner tags as needed.')
@@ -71,6 +77,15 @@ DEFAULT_BASE_HISTOGRAM_OBSOLETE_REASON = (
 EXPIRY_DATE_PATTERN = "%Y-%m-%d"
 EXPIRY_MILESTONE_RE = re.compile(r'M[0-9]{2,3}\Z')
 
+# The modules besides this one that validate_format.py validates with. A
+# change to any of them invalidates the results recorded by MarkValidated().
+_VALIDATION_MODULES = ('merge_xml.py', 'validate_format.py')
+
+# The number of files of each kind (indexes and validation results) kept in a
+# cache directory. Each is for a different version of the XML files, so only
+# the most recently used ones are kept.
+_MAX_CACHE_FILES_PER_SUFFIX = 4
+
 class Error(Exception):
   pass
 
@@ -137,14 +152,28 @@ def _ExpandHistogramNameWithSuffixes(suffix_name, histogram_name,
   Raises:
     Error: if the expansion can't be done.
   """
+  separator = None
   if histogram_suffixes_node.hasAttribute('separator'):
     separator = histogram_suffixes_node.getAttribute('separator')
-  else:
-    separator = '_'
-
+  ordering = None
   if histogram_suffixes_node.hasAttribute('ordering'):
     ordering = histogram_suffixes_node.getAttribute('ordering')
-  else:
+  return _ExpandHistogramName(suffix_name, histogram_name, separator, ordering,
+                              histogram_suffixes_node.getAttribute('name'))
+
+
+def _ExpandHistogramName(suffix_name, histogram_name, separator, ordering,
+                         histogram_suffixes_name):
+  """Implements _ExpandHistogramNameWithSuffixes().
+
+  Args:
+    separator: The separator attribute of the histogram_suffixes, or None.
+    ordering: The ordering attribute of the histogram_suffixes, or None.
+    histogram_suffixes_name: The name of the histogram_suffixes.
+  """
+  if separator is None:
+    separator = '_'
+  if ordering is None:
     ordering = 'suffix'
   parts = ordering.split(',')
   ordering = parts[0]
@@ -170,8 +199,8 @@ def _ExpandHistogramNameWithSuffixes(suffix_name, histogram_name,
     logging.error(
         'Prefix histogram_suffixes expansions require histogram names which '
         'include a dot separator. Histogram name is %s, histogram_suffixes is '
-        '%s, and placment is %d', histogram_name,
-        histogram_suffixes_node.getAttribute('name'), placement)
+        '%s, and placment is %d', histogram_name, histogram_suffixes_name,
+        placement)
     raise Error()
 
   cluster = '.'.join(sections[0:placement]) + '.'
@@ -274,7 +303,13 @@ def _ValidateMilestoneString(milestone_str):
 
 def _ProcessBaseHistogramAttribute(node, histogram_entry):
   if node.hasAttribute('base'):
-    is_base = node.getAttribute('base').lower() == 'true'
+    _ProcessBaseAttribute(node.getAttribute('base'), histogram_entry)
+
+
+def _ProcessBaseAttribute(base, histogram_entry):
+  """Handles the value of a base attribute, or does nothing if it is None."""
+  if base is not None:
+    is_base = base.lower() == 'true'
     histogram_entry['base'] = is_base
     if is_base and 'obsolete' not in histogram_entry:
       histogram_entry['obsolete'] = DEFAULT_BASE_HISTOGRAM_OBSOLETE_REASON
@@ -562,3 +597,341 @@ def ExtractHistograms(filename):
 
 def ExtractNames(histograms):
   return sorted(histograms.keys())
+
+
+def _ElementText(elem):
+  """Returns whether |elem| has any content, like _JoinChildNodes() does."""
+  return len(elem) > 0 or bool(''.join(elem.itertext()).strip())
+
+
+def _ElementAttribute(elem, name):
+  """Returns the normalized value of an attribute, or None if it is missing."""
+  value = elem.get(name)
+  if value is None:
+    return None
+  return _NormalizeString(value)
+
+
+def _IterParseFile(filename, histograms, histogram_suffixes):
+  """Streams the histograms and histogram_suffixes of one XML file.
+
+  Only keeps what is needed to expand histogram names and compute expiry; the
+  parsed elements are discarded as soon as they have been read.
+
+  Args:
+    filename: The XML file to read.
+    histograms: A list to append (name, entry) tuples to, where entry is a
+      dict with the 'expires_after', 'obsolete' and 'base' keys of the
+      corresponding dict returned by ExtractHistogramsFromDom().
+    histogram_suffixes: A list to append dicts describing each
+      <histogram_suffixes> tag to.
+
+  Returns:
+    True if any errors were found.
+  """
+  have_errors = False
+
+  def Suffix(elem):
+    obsolete = [c for c in elem if c.tag == 'obsolete']
+    return (_ElementAttribute(elem, 'name'),
+            bool(obsolete) and _ElementText(obsolete[0]),
+            _ElementAttribute(elem, 'base'))
+
+  for _, elem in ElementTree.iterparse(filename):
+    if elem.tag == 'histogram':
+      name = _ElementAttribute(elem, 'name')
+      entry = {}
+      expiry_str = _ElementAttribute(elem, 'expires_after')
+      if expiry_str is not None:
+        if (_ValidateMilestoneString(expiry_str) or
+            _ValidateDateString(expiry_str)):
+          entry['expires_after'] = expiry_str
+        else:
+          logging.error(
+              'Expiry of histogram %s does not match expected date format: '
+              '"%s" or milestone format: M* found %s.', name,
+              EXPIRY_DATE_PATTERN, expiry_str)
+          have_errors = True
+      if elem.find('.//obsolete') is not None:
+        entry['obsolete'] = True
+      _ProcessBaseAttribute(_ElementAttribute(elem, 'base'), entry)
+      histograms.append((name, entry))
+      elem.clear()
+    elif elem.tag == 'histogram_suffixes':
+      group_obsolete = [c for c in elem if c.tag == 'obsolete']
+      affected_histograms = []
+      for affected in elem.iter('affected-histogram'):
+        affected_histograms.append((
+            _ElementAttribute(affected, 'name'),
+            [Suffix(s) for s in affected.iter('with-suffix')]))
+      histogram_suffixes.append({
+          'name': _ElementAttribute(elem, 'name'),
+          'separator': _ElementAttribute(elem, 'separator'),
+          'ordering': _ElementAttribute(elem, 'ordering'),
+          'obsolete': bool(group_obsolete) and _ElementText(group_obsolete[0]),
+          'suffixes': [Suffix(s) for s in elem.iter('suffix')],
+          'affected_histograms': affected_histograms,
+      })
+      elem.clear()
+    elif elem.tag == 'enum':
+      elem.clear()
+  return have_errors
+
+
+def _ExpandHistogramIndexSuffixes(histograms, histogram_suffixes):
+  """Like _UpdateHistogramsWithSuffixes(), for the output of _IterParseFile().
+
+  Returns:
+    True if any errors were found.
+  """
+  have_errors = False
+  reprocess_queue = []
+
+  def GenerateHistogramSuffixes():
+    for s in histogram_suffixes:
+      yield 0, s
+    for r, s in reprocess_queue:
+      yield r, s
+
+  for reprocess_count, group in GenerateHistogramSuffixes():
+    missing = [name for name, _ in group['affected_histograms']
+               if name not in histograms]
+    if missing:
+      if reprocess_count < MAX_HISTOGRAM_SUFFIX_DEPENDENCY_DEPTH:
+        reprocess_queue.append((reprocess_count + 1, group))
+      else:
+        logging.error('histogram_suffixes %s is missing its dependency %s',
+                      group['name'], missing[0])
+        have_errors = True
+      continue
+
+    for histogram_name, with_suffixes in group['affected_histograms']:
+      for suffix_name, suffix_obsolete, suffix_base in (
+          with_suffixes or group['suffixes']):
+        try:
+          new_histogram_name = _ExpandHistogramName(
+              suffix_name, histogram_name, group['separator'],
+              group['ordering'], group['name'])
+        except Error:
+          have_errors = True
+          continue
+        if new_histogram_name != histogram_name:
+          new_histogram = dict(histograms[histogram_name])
+          if new_histogram.pop('base', False):
+            if (new_histogram.get('obsolete') ==
+                DEFAULT_BASE_HISTOGRAM_OBSOLETE_REASON):
+              del new_histogram['obsolete']
+          histograms[new_histogram_name] = new_histogram
+        entry = histograms[new_histogram_name]
+        if suffix_obsolete or group['obsolete']:
+          entry['obsolete'] = True
+        _ProcessBaseAttribute(suffix_base, entry)
+  return have_errors
+
+
+class HistogramIndex(object):
+  """A compact index of all histograms, with suffixes expanded.
+
+  Holds what tools need about each histogram without its description: its name,
+  the hash of its name, and its expiry. Much faster to compute than
+  ExtractHistogramsFromDom(), and can be cached (see LoadHistogramIndex()).
+
+  Attributes:
+    names: The sorted list of all histogram names.
+    had_errors: Whether errors were found while building the index. Unlike
+      ExtractHistogramsFromDom(), only errors that affect the index itself are
+      detected; use validate_format.py to check the XML files.
+  """
+
+  def __init__(self, histograms, had_errors):
+    self.names = sorted(histograms)
+    self.had_errors = had_errors
+    # The 64-bit hash of each name, in the same order as |names|, packed into
+    # a single string to keep the index small.
+    self._hashes = ''.join(_HashDigest(name) for name in self.names)
+    self._expiries = dict(
+        (name, entry['expires_after'])
+        for name, entry in histograms.iteritems()
+        if 'expires_after' in entry and 'obsolete' not in entry)
+
+  def __contains__(self, name):
+    i = bisect.bisect_left(self.names, name)
+    return i < len(self.names) and self.names[i] == name
+
+  def __len__(self):
+    return len(self.names)
+
+  def GetHash(self, name):
+    """Returns the hash of a histogram in the index, see HashHistogramName()."""
+    i = bisect.bisect_left(self.names, name)
+    if i == len(self.names) or self.names[i] != name:
+      raise KeyError(name)
+    return struct.unpack_from('>Q', self._hashes, i * 8)[0]
+
+  def GetExpiries(self):
+    """Returns a dict mapping the name of each histogram that is not obsolete
+    and has an expiry to its 'expires_after' value."""
+    return dict(self._expiries)
+
+
+def HashHistogramName(name):
+  """Returns the 64-bit hash that Chrome uses to identify a histogram."""
+  return struct.unpack('>Q', _HashDigest(name))[0]
+
+
+def _HashDigest(name):
+  return hashlib.md5(name).digest()[:8]
+
+
+def ExtractHistogramIndex(filenames):
+  """Builds the HistogramIndex of one or more XML files.
+
+  The files are streamed rather than loaded into a DOM tree. Like
+  merge_xml.MergeFiles(), histogram_suffixes may refer to histograms of any of
+  the files.
+
+  Args:
+    filenames: A list of XML file paths.
+
+  Returns:
+    A HistogramIndex.
+  """
+  histogram_list = []
+  histogram_suffixes = []
+  have_errors = False
+  for filename in filenames:
+    if _IterParseFile(filename, histogram_list, histogram_suffixes):
+      have_errors = True
+
+  histograms = {}
+  for name, entry in histogram_list:
+    if name in histograms:
+      logging.error('Duplicate histogram definition %s', name)
+      have_errors = True
+      continue
+    histograms[name] = entry
+  if _ExpandHistogramIndexSuffixes(histograms, histogram_suffixes):
+    have_errors = True
+  return HistogramIndex(histograms, have_errors)
+
+
+def _GetContentKey(filenames, modules=()):
+  """Returns a key identifying the contents of |filenames|, and the code that
+  processes them: this module and |modules|, file names relative to it."""
+  key = hashlib.sha1()
+  dirname = os.path.dirname(os.path.abspath(__file__))
+  for module in ('extract_histograms.py',) + tuple(modules):
+    with open(os.path.join(dirname, module), 'rb') as f:
+      key.update(hashlib.sha1(f.read()).digest())
+  for filename in filenames:
+    with open(filename, 'rb') as f:
+      key.update(hashlib.sha1(f.read()).digest())
+  return key.hexdigest()
+
+
+def _TouchCacheFile(path):
+  """Marks |path| as recently used, for _PruneCacheFiles()."""
+  try:
+    os.utime(path, None)
+  except OSError:
+    # Pruned by another process.
+    pass
+
+
+def _PruneCacheFiles(dirname, suffix):
+  """Deletes all but the most recently used files in |dirname| that end with
+  |suffix|."""
+  entries = []
+  for filename in os.listdir(dirname):
+    if filename.endswith(suffix):
+      path = os.path.join(dirname, filename)
+      try:
+        entries.append((os.path.getmtime(path), path))
+      except OSError:
+        pass
+  entries.sort(reverse=True)
+  for _, path in entries[_MAX_CACHE_FILES_PER_SUFFIX:]:
+    try:
+      os.unlink(path)
+    except OSError:
+      pass
+
+
+def _WriteCacheFile(path, data):
+  dirname = os.path.dirname(path)
+  if not os.path.isdir(dirname):
+    try:
+      os.makedirs(dirname)
+    except OSError:
+      # Another process may have created it.
+      if not os.path.isdir(dirname):
+        raise
+  # Write to a temporary file first, so that concurrent runs never see partial
+  # files.
+  fd, tmp_path = tempfile.mkstemp(dir=dirname)
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, path)
+  except:
+    os.unlink(tmp_path)
+    raise
+  _PruneCacheFiles(dirname, os.path.splitext(path)[1])
+
+
+def LoadHistogramIndex(filenames, cache_dir=None):
+  """Returns the HistogramIndex of |filenames|, from a cache if possible.
+
+  Indexes are cached in |cache_dir|, keyed by the contents of the XML files.
+  Indexes with errors are not cached, so that the errors are logged again.
+  Only the most recently used indexes are kept. Cached indexes are unpickled, so |cache_dir| must only be writable by
+  trusted users.
+
+  Args:
+    filenames: A list of XML file paths.
+    cache_dir: The directory to cache indexes in, or None to not cache them.
+
+  Returns:
+    A HistogramIndex.
+  """
+  if not cache_dir:
+    return ExtractHistogramIndex(filenames)
+
+  path = os.path.join(cache_dir, _GetContentKey(filenames) + '.index')
+  try:
+    with open(path, 'rb') as f:
+      index = cPickle.load(f)
+    _TouchCacheFile(path)
+    return index
+  except Exception:
+    # Missing or corrupt entries are simply recomputed.
+    pass
+
+  index = ExtractHistogramIndex(filenames)
+  if not index.had_errors:
+    _WriteCacheFile(path, index)
+  return index
+
+
+def _GetValidatedPath(filenames, cache_dir):
+  return os.path.join(
+      cache_dir, _GetContentKey(filenames, _VALIDATION_MODULES) + '.valid')
+
+
+def WasValidated(filenames, cache_dir=None):
+  """Returns whether MarkValidated() was called for the same |filenames|,
+  with the same contents, and the same validation code."""
+  if not cache_dir:
+    return False
+  path = _GetValidatedPath(filenames, cache_dir)
+  if not os.path.exists(path):
+    return False
+  _TouchCacheFile(path)
+  return True
+
+
+def MarkValidated(filenames, cache_dir=None):
+  """Records in |cache_dir| that the contents of |filenames| passed
+  validation. Does nothing if |cache_dir| is None."""
+  if cache_dir:
+    _WriteCacheFile(_GetValidatedPath(filenames, cache_dir), True)
@@ -0,0 +1,321 @@
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import extract_histograms
+import merge_xml
+
+
+_HISTOGRAMS_XML = """\
+<histogram-configuration>
+
+<enums>
+
+<enum name="Boolean">
+  <int value="0" label="False"/>
+  <int value="1" label="True"/>
+</enum>
+
+</enums>
+
+<histograms>
+
+<histogram name="Base.Histogram" base="true" expires_after="M70">
+  <owner>owner@chromium.org</owner>
+  <summary>A base histogram.</summary>
+</histogram>
+
+<histogram name="Chain.Histogram" expires_after="2018-12-01">
+  <owner>owner@chromium.org</owner>
+  <summary>Expanded by histogram_suffixes that depend on each other.</summary>
+</histogram>
+
+<histogram name="Obsolete.Histogram" expires_after="M70">
+  <obsolete>
+    Removed.
+  </obsolete>
+  <owner>owner@chromium.org</owner>
+  <summary>An obsolete histogram.</summary>
+</histogram>
+
+<histogram name="Prefix.Cluster.Histogram" enum="Boolean" expires_after="M71">
+  <owner>owner@chromium.org</owner>
+  <summary>Expanded with prefixes.</summary>
+</histogram>
+
+<histogram name="Suffix.Histogram" units="ms">
+  <owner>owner@chromium.org</owner>
+  <summary>Expanded with suffixes, but never expires.</summary>
+</histogram>
+
+</histograms>
+
+<histogram_suffixes_list>
+
+<histogram_suffixes name="BaseSuffixes" separator="">
+  <suffix name="Kept" label="Inherits nothing from the base histogram."/>
+  <suffix name="StillBase" label="Is a base histogram too." base="true"/>
+  <affected-histogram name="Base.Histogram"/>
+</histogram_suffixes>
+
+<histogram_suffixes name="Chain1DependsOnChain2" separator=".">
+  <suffix name="A1" label="Depends on the suffixes of Chain2DependsOnChain3."/>
+  <affected-histogram name="Chain.Histogram_C1_B1"/>
+</histogram_suffixes>
+
+<histogram_suffixes name="Chain2DependsOnChain3">
+  <suffix name="B1" label="Depends on the suffixes of Chain3."/>
+  <affected-histogram name="Chain.Histogram_C1"/>
+</histogram_suffixes>
+
+<histogram_suffixes name="Chain3">
+  <suffix name="C1" label="C1."/>
+  <suffix name="C2" label="C2."/>
+  <affected-histogram name="Chain.Histogram"/>
+</histogram_suffixes>
+
+<histogram_suffixes name="ObsoleteGroup">
+  <obsolete>
+    Removed.
+  </obsolete>
+  <suffix name="Gone" label="Obsolete with its group."/>
+  <affected-histogram name="Chain.Histogram"/>
+  <affected-histogram name="Suffix.Histogram"/>
+</histogram_suffixes>
+
+<histogram_suffixes name="PrefixSuffixes" separator="." ordering="prefix">
+  <suffix name="First" label="After the first dot."/>
+  <affected-histogram name="Prefix.Cluster.Histogram"/>
+</histogram_suffixes>
+
+<histogram_suffixes name="PrefixSuffixesWithPlacement" ordering="prefix,2">
+  <suffix name="Second" label="After the second dot."/>
+  <affected-histogram name="Prefix.Cluster.Histogram"/>
+</histogram_suffixes>
+
+<histogram_suffixes name="SomeObsolete" separator="-">
+  <suffix name="" label="The histogram itself."/>
+  <suffix name="Current" label="Current."/>
+  <suffix name="Old" label="Old.">
+    <obsolete>
+      Removed.
+    </obsolete>
+  </suffix>
+  <affected-histogram name="Chain.Histogram"/>
+  <affected-histogram name="Obsolete.Histogram"/>
+  <affected-histogram name="Suffix.Histogram"/>
+</histogram_suffixes>
+
+<histogram_suffixes name="WithSuffixes">
+  <suffix name="All1" label="All1."/>
+  <suffix name="All2" label="All2."/>
+  <affected-histogram name="Prefix.Cluster.Histogram">
+    <with-suffix name="Only"/>
+  </affected-histogram>
+  <affected-histogram name="Suffix.Histogram"/>
+</histogram_suffixes>
+
+</histogram_suffixes_list>
+
+</histogram-configuration>
+"""
+
+_EXTRA_HISTOGRAMS_XML = """\
+<histogram-configuration>
+
+<histograms>
+
+<histogram name="Zeta.Histogram" expires_after="M72">
+  <owner>owner@chromium.org</owner>
+  <summary>Defined in another file.</summary>
+</histogram>
+
+</histograms>
+
+<histogram_suffixes_list>
+
+<histogram_suffixes name="ZetaSuffixes">
+  <suffix name="Extra" label="Affects histograms of both files."/>
+  <affected-histogram name="Suffix.Histogram"/>
+  <affected-histogram name="Zeta.Histogram"/>
+</histogram_suffixes>
+
+</histogram_suffixes_list>
+
+</histogram-configuration>
+"""
+
+
+class ExtractHistogramsTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _WriteFile(self, name, contents):
+    path = os.path.join(self.temp_dir, name)
+    with open(path, 'w') as f:
+      f.write(contents)
+    return path
+
+  def _AssertIndexMatchesDom(self, filenames):
+    histograms, had_errors = extract_histograms.ExtractHistogramsFromDom(
+        merge_xml.MergeFiles(filenames))
+    self.assertFalse(had_errors)
+    index = extract_histograms.ExtractHistogramIndex(filenames)
+    self.assertFalse(index.had_errors)
+
+    self.assertEqual(sorted(histograms), index.names)
+    self.assertEqual(len(histograms), len(index))
+    expiries = dict((name, entry['expires_after'])
+                    for name, entry in histograms.iteritems()
+                    if 'expires_after' in entry and 'obsolete' not in entry)
+    self.assertEqual(expiries, index.GetExpiries())
+    return index
+
+  def testExtractHistogramIndex(self):
+    index = self._AssertIndexMatchesDom(
+        [self._WriteFile('histograms.xml', _HISTOGRAMS_XML)])
+    for name in ('Base.HistogramKept',
+                 'Chain.Histogram_C1',
+                 'Chain.Histogram_C1_B1.A1',
+                 'Prefix.First.Cluster.Histogram',
+                 'Prefix.Cluster.Second_Histogram',
+                 'Prefix.Cluster.Histogram_Only',
+                 'Suffix.Histogram-Current',
+                 'Suffix.Histogram_All1'):
+      self.assertIn(name, index)
+    for name in ('Chain.Histogram_C2_B1',
+                 'Prefix.Cluster.Histogram_All1',
+                 'Suffix.Histogram_Only'):
+      self.assertNotIn(name, index)
+
+    expiries = index.GetExpiries()
+    self.assertEqual('M70', expiries['Base.HistogramKept'])
+    self.assertEqual('2018-12-01', expiries['Chain.Histogram_C1_B1.A1'])
+    self.assertEqual('2018-12-01', expiries['Chain.Histogram-Current'])
+    for name in ('Base.Histogram',
+                 'Base.HistogramStillBase',
+                 'Chain.Histogram-Old',
+                 'Chain.Histogram_Gone',
+                 'Obsolete.Histogram-Current',
+                 'Suffix.Histogram',
+                 'Suffix.Histogram_Gone'):
+      self.assertIn(name, index)
+      self.assertNotIn(name, expiries)
+
+  def testExtractHistogramIndex_MultipleFiles(self):
+    index = self._AssertIndexMatchesDom(
+        [self._WriteFile('histograms.xml', _HISTOGRAMS_XML),
+         self._WriteFile('extra.xml', _EXTRA_HISTOGRAMS_XML)])
+    self.assertIn('Suffix.Histogram_Extra', index)
+    self.assertEqual('M72', index.GetExpiries()['Zeta.Histogram_Extra'])
+
+  def testGetHash(self):
+    index = extract_histograms.ExtractHistogramIndex(
+        [self._WriteFile('histograms.xml', _HISTOGRAMS_XML)])
+    for name in index.names:
+      self.assertEqual(extract_histograms.HashHistogramName(name),
+                       index.GetHash(name))
+    self.assertRaises(KeyError, index.GetHash, 'Missing.Histogram')
+
+  def testLoadHistogramIndex_Cache(self):
+    filenames = [self._WriteFile('histograms.xml', _HISTOGRAMS_XML)]
+    cache_dir = os.path.join(self.temp_dir, 'cache')
+    expected = extract_histograms.LoadHistogramIndex(filenames, cache_dir)
+    self.assertEqual(1, len(os.listdir(cache_dir)))
+
+    extract_index = extract_histograms.ExtractHistogramIndex
+    extract_histograms.ExtractHistogramIndex = None
+    try:
+      index = extract_histograms.LoadHistogramIndex(filenames, cache_dir)
+    finally:
+      extract_histograms.ExtractHistogramIndex = extract_index
+    self.assertEqual(expected.names, index.names)
+    self.assertEqual(expected.GetExpiries(), index.GetExpiries())
+
+  def testLoadHistogramIndex_NoCacheByDefault(self):
+    filenames = [self._WriteFile('histograms.xml', _HISTOGRAMS_XML)]
+    extract_index = extract_histograms.ExtractHistogramIndex
+    calls = []
+    def ExtractHistogramIndex(filenames):
+      calls.append(filenames)
+      return extract_index(filenames)
+    extract_histograms.ExtractHistogramIndex = ExtractHistogramIndex
+    try:
+      extract_histograms.LoadHistogramIndex(filenames)
+      extract_histograms.LoadHistogramIndex(filenames)
+    finally:
+      extract_histograms.ExtractHistogramIndex = extract_index
+    self.assertEqual([filenames, filenames], calls)
+    self.assertFalse(extract_histograms.WasValidated(filenames))
+
+  def testMarkValidated(self):
+    filenames = [self._WriteFile('histograms.xml', _HISTOGRAMS_XML)]
+    cache_dir = os.path.join(self.temp_dir, 'cache')
+    self.assertFalse(extract_histograms.WasValidated(filenames, cache_dir))
+    extract_histograms.MarkValidated(filenames, cache_dir)
+    self.assertTrue(extract_histograms.WasValidated(filenames, cache_dir))
+
+    self._WriteFile('histograms.xml', _HISTOGRAMS_XML.replace('M70', 'M71'))
+    self.assertFalse(extract_histograms.WasValidated(filenames, cache_dir))
+
+  def testMarkValidated_ValidationCodeChanged(self):
+    filenames = [self._WriteFile('histograms.xml', _HISTOGRAMS_XML)]
+    cache_dir = os.path.join(self.temp_dir, 'cache')
+    # Stands in for merge_xml.py and validate_format.py.
+    validation_module = self._WriteFile('validate.py', 'pass\n')
+    validation_modules = extract_histograms._VALIDATION_MODULES
+    extract_histograms._VALIDATION_MODULES = (validation_module,)
+    try:
+      extract_histograms.MarkValidated(filenames, cache_dir)
+      self.assertTrue(extract_histograms.WasValidated(filenames, cache_dir))
+      self._WriteFile('validate.py', 'pass  # Changed.\n')
+      self.assertFalse(extract_histograms.WasValidated(filenames, cache_dir))
+    finally:
+      extract_histograms._VALIDATION_MODULES = validation_modules
+
+  def testLoadHistogramIndex_PrunesCache(self):
+    cache_dir = os.path.join(self.temp_dir, 'cache')
+    filenames = [self._WriteFile('histograms.xml', _HISTOGRAMS_XML)]
+    extract_histograms.MarkValidated(filenames, cache_dir)
+
+    def LoadIndex(milestone):
+      self._WriteFile('histograms.xml',
+                      _HISTOGRAMS_XML.replace('M70', milestone))
+      extract_histograms.LoadHistogramIndex(filenames, cache_dir)
+      return extract_histograms._GetContentKey(filenames) + '.index'
+
+    max_files = extract_histograms._MAX_CACHE_FILES_PER_SUFFIX
+    extract_histograms._MAX_CACHE_FILES_PER_SUFFIX = 2
+    try:
+      first = LoadIndex('M70')
+      os.utime(os.path.join(cache_dir, first), (0, 0))
+      second = LoadIndex('M71')
+      os.utime(os.path.join(cache_dir, second), (1, 1))
+      # Using the first index again makes it the most recently used.
+      LoadIndex('M70')
+      third = LoadIndex('M72')
+    finally:
+      extract_histograms._MAX_CACHE_FILES_PER_SUFFIX = max_files
+    self.assertEqual(sorted([first, third]),
+                     sorted(f for f in os.listdir(cache_dir)
+                            if f.endswith('.index')))
+    # Validation results are pruned separately from indexes.
+    self.assertTrue(extract_histograms.WasValidated(
+        [self._WriteFile('histograms.xml', _HISTOGRAMS_XML)], cache_dir))
+
+  def testValidationModules(self):
+    dirname = os.path.dirname(os.path.abspath(extract_histograms.__file__))
+    for module in extract_histograms._VALIDATION_MODULES:
+      self.assertTrue(os.path.isfile(os.path.join(dirname, module)))
+
+
+if __name__ == '__main__':
+  unittest.main()
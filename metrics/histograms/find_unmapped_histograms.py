@@ -10,13 +10,17 @@ trials are entirely ignored by this script.
 
 """
 
+import bisect
+import cPickle
 import hashlib
 import logging
+import multiprocessing
 import optparse
 import os
 import re
 import subprocess
 import sys
+import tempfile
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'common'))
 import path_util
@@ -34,7 +38,15 @@ TEST_FILENAME = re.compile(r"""
     test # The word test
     \.   # A literal '.'
     """, re.VERBOSE)
+# The files that declare and define the base::UmaHistogram*() functions.
+HISTOGRAM_FUNCTIONS_FILENAME = re.compile(r"""
+    (^|/)                        # Start of a path component
+    base/metrics/                # The //base/metrics directory
+    histogram_functions\.(cc|h)  # The file declaring the functions
+    $                            # End of string
+    """, re.VERBOSE)
 NON_NEWLINE = re.compile(r'.+')
+NEWLINE = re.compile(r'\n')
 CPP_COMMENT = re.compile(r"""
     \s*             # Optional whitespace
     (?:             # Non-capturing group
@@ -107,6 +119,33 @@ STANDARD_LIKE_SUFFIXES = frozenset(['SCROLL_LATENCY_SHORT',
                                     'ASPECT_RATIO', 'LOCATION_RESPONSE_TIMES',
                                     'LOCK_TIMES', 'OOM_KILL_TIME_INTERVAL'])
 OTHER_STANDARD_LIKE_HISTOGRAMS = frozenset(['SCOPED_BLINK_UMA_HISTOGRAM_TIMER'])
+HISTOGRAM_FUNCTION_REGEX = re.compile(r"""
+    (?<![\w:])     # Not part of another identifier or namespace
+    ((?:(?:::)?    # Capture the whole function name, with optional global
+    base::)?       # and base namespaces
+    UmaHistogram   # Match the shared prefix for UMA histogram functions
+    (\w*))         # Match the rest of the function name, e.g. 'Enumeration'
+    \(             # Match the opening parenthesis for the function call
+    \s*            # Match any whitespace -- especially, any newlines
+    ([^,)]*)       # Capture the first argument, the histogram name
+    [,)]           # Match the comma/paren that delineates the first argument
+    """, re.VERBOSE)
+# The functions defined in //base/metrics/histogram_functions.h.
+HISTOGRAM_FUNCTION_SUFFIXES = frozenset(['ExactLinear', 'Enumeration',
+                                         'Boolean', 'Percentage',
+                                         'CustomCounts', 'Counts100',
+                                         'Counts1000', 'Counts10000',
+                                         'Counts100000', 'Counts1M',
+                                         'Counts10M', 'CustomTimes', 'Times',
+                                         'MediumTimes', 'LongTimes',
+                                         'CustomMicrosecondsTimes', 'MemoryKB',
+                                         'MemoryMB', 'MemoryLargeMB',
+                                         'Sparse'])
+_ALL_SUFFIXES = STANDARD_HISTOGRAM_SUFFIXES | STANDARD_LIKE_SUFFIXES
+_ALL_OTHERS = OTHER_STANDARD_HISTOGRAMS | OTHER_STANDARD_LIKE_HISTOGRAMS
+
+# Bump whenever scanFile() changes, to invalidate cached results.
+_CACHE_VERSION = 2
 
 
 def RunGit(command):
@@ -220,11 +259,194 @@ def logNonLiteralHistogram(filename, histogram):
                   histogram)
 
 
-def readChromiumHistograms():
+def _lineNumber(line_starts, offset):
+  """Returns the 1-based line number of |offset|, given the offsets at which
+  each line starts (see _lineStarts())."""
+  return bisect.bisect_right(line_starts, offset)
+
+
+def _lineStarts(contents):
+  """Returns the offsets at which each line of |contents| starts."""
+  return [0] + [match.end() for match in NEWLINE.finditer(contents)]
+
+
+def _literalHistogramName(histogram):
+  """Returns the name of a histogram from the expression used to name it, or
+  None if the expression is not a string literal."""
+  # Must begin and end with a quotation mark.
+  if not histogram or histogram[0] != '"' or histogram[-1] != '"':
+    return None
+
+  # Must not include any quotation marks other than at the beginning or end.
+  histogram_stripped = histogram.strip('"')
+  if '"' in histogram_stripped:
+    return None
+  return histogram_stripped
+
+
+def scanFile(filename):
+  """Finds the histograms emitted by a single C++ file.
+
+  Looks for invocations of the UMA_HISTOGRAM_* macros as well as calls to the
+  base::UmaHistogram*() functions.
+
+  Args:
+    filename: The path of the file to scan.
+
+  Returns:
+    A tuple of
+      a list of (literal histogram name, line number) tuples, in the order in
+        which they appear in the file,
+      a list of (unknown macro or function name, line number) tuples, and
+      a list of the expressions used as non-literal histogram names by the
+        macros. The functions are meant to be called with runtime names, so
+        those are not reported.
+  """
+  with open(filename, 'r') as f:
+    contents = removeComments(f.read())
+  line_starts = _lineStarts(contents)
+
+  matches = []
+  for match in HISTOGRAM_REGEX.finditer(contents):
+    known = (match.group(2) in _ALL_SUFFIXES or
+             match.group(1) in _ALL_OTHERS)
+    matches.append((match.start(), match.group(1), known, match.group(3),
+                    True))
+  for match in HISTOGRAM_FUNCTION_REGEX.finditer(contents):
+    known = match.group(2) in HISTOGRAM_FUNCTION_SUFFIXES
+    matches.append((match.start(), match.group(1), known, match.group(3),
+                    False))
+  matches.sort()
+
+  histograms = []
+  unknown_names = []
+  non_literal_histograms = []
+  for start, name, known, histogram, is_macro in matches:
+    line_number = _lineNumber(line_starts, start)
+    if not known:
+      unknown_names.append((name, line_number))
+      continue
+
+    histogram = collapseAdjacentCStrings(histogram.strip())
+    histogram_name = _literalHistogramName(histogram)
+    if histogram_name is None:
+      if is_macro:
+        non_literal_histograms.append(histogram)
+      continue
+    histograms.append((histogram_name, line_number))
+
+  return histograms, unknown_names, non_literal_histograms
+
+
+def _scanFileIfChanged(args):
+  """Scans a file unless its contents match its cache entry.
+
+  Runs in a worker process.
+
+  Args:
+    args: A (filename, cache entry or None) tuple.
+
+  Returns:
+    A (filename, new cache entry) tuple.
+  """
+  filename, entry = args
+  stat = os.stat(filename)
+  with open(filename, 'rb') as f:
+    digest = hashlib.sha1(f.read()).hexdigest()
+  if entry and entry['digest'] == digest:
+    result = entry['result']
+  else:
+    result = scanFile(filename)
+  return filename, {'mtime': stat.st_mtime, 'size': stat.st_size,
+                    'digest': digest, 'result': result}
+
+
+def _loadCache(cache_file):
+  """Returns the per-file scan results cached in |cache_file|, if any."""
+  if not cache_file or not os.path.exists(cache_file):
+    return {}
+  try:
+    with open(cache_file, 'rb') as f:
+      version, entries = cPickle.load(f)
+  except Exception:
+    logging.warning('Ignoring invalid cache file %s', cache_file)
+    return {}
+  if version != _CACHE_VERSION:
+    return {}
+  return entries
+
+
+def _saveCache(cache_file, entries):
+  # Write to a temporary file first, so that an interrupted run never leaves
+  # a truncated cache behind.
+  fd, tmp_path = tempfile.mkstemp(
+      dir=os.path.dirname(os.path.abspath(cache_file)))
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      cPickle.dump((_CACHE_VERSION, entries), f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, cache_file)
+  except:
+    os.unlink(tmp_path)
+    raise
+
+
+def scanFiles(filenames, jobs=None, cache_file=None):
+  """Scans |filenames| with scanFile(), in parallel.
+
+  Args:
+    filenames: The paths of the files to scan.
+    jobs: The number of processes to scan with, defaults to the number of
+      CPUs.
+    cache_file: If set, the path of a file in which to cache the results of
+      each file. Files whose size and modification time, or contents, did not
+      change since they were cached are not scanned again.
+
+  Returns:
+    A dict mapping each filename to the result of scanFile().
+  """
+  cache = _loadCache(cache_file)
+  entries = {}
+  to_scan = []
+  for filename in filenames:
+    entry = cache.get(filename)
+    if entry:
+      stat = os.stat(filename)
+      if (entry['mtime'] == stat.st_mtime and
+          entry['size'] == stat.st_size):
+        entries[filename] = entry
+        continue
+    to_scan.append((filename, entry))
+  logging.info('Scanning %d files (%d unchanged files cached)...',
+               len(to_scan), len(entries))
+
+  if jobs is None:
+    jobs = multiprocessing.cpu_count()
+  if jobs > 1 and len(to_scan) > 1:
+    pool = multiprocessing.Pool(jobs)
+    try:
+      results = pool.imap_unordered(_scanFileIfChanged, to_scan, chunksize=16)
+      entries.update(results)
+    finally:
+      pool.terminate()
+      pool.join()
+  else:
+    entries.update(_scanFileIfChanged(args) for args in to_scan)
+
+  if cache_file:
+    _saveCache(cache_file, entries)
+  return dict((filename, entry['result'])
+              for filename, entry in entries.iteritems())
+
+
+def readChromiumHistograms(jobs=None, cache_file=None):
   """Searches the Chromium source for all histogram names.
 
-  Also prints warnings for any invocations of the UMA_HISTOGRAM_* macros with
-  names that might vary during a single run of the app.
+  Also prints warnings for any invocations of the UMA_HISTOGRAM_* macros or
+  base::UmaHistogram*() functions with names that might vary during a single
+  run of the app.
+
+  Args:
+    jobs, cache_file: See scanFiles().
 
   Returns:
     A tuple of
@@ -233,69 +455,55 @@ def readChromiumHistograms():
   """
   logging.info('Scanning Chromium source for histograms...')
 
-  # Use git grep to find all invocations of the UMA_HISTOGRAM_* macros.
-  # Examples:
-  #   'path/to/foo.cc:420:  UMA_HISTOGRAM_COUNTS_100("FooGroup.FooName",'
-  #   'path/to/bar.cc:632:  UMA_HISTOGRAM_ENUMERATION('
-  locations = RunGit(['gs', 'UMA_HISTOGRAM']).split('\n')
-  all_filenames = set(location.split(':')[0] for location in locations);
-  filenames = [f for f in all_filenames
-               if C_FILENAME.match(f) and not TEST_FILENAME.match(f)]
+  # Use git grep to find all files that might emit histograms, i.e. that
+  # mention the UMA_HISTOGRAM_* macros or the base::UmaHistogram*() functions.
+  all_filenames = RunGit(['grep', '-l', '-e', 'UMA_HISTOGRAM',
+                          '-e', 'UmaHistogram']).split('\n')
+  filenames = sorted(f for f in all_filenames
+                     if C_FILENAME.match(f) and not TEST_FILENAME.match(f) and
+                     not HISTOGRAM_FUNCTIONS_FILENAME.search(f))
+  results = scanFiles(filenames, jobs, cache_file)
 
   histograms = set()
   location_map = dict()
-  unknown_macros = set()
-  all_suffixes = STANDARD_HISTOGRAM_SUFFIXES | STANDARD_LIKE_SUFFIXES
-  all_others = OTHER_STANDARD_HISTOGRAMS | OTHER_STANDARD_LIKE_HISTOGRAMS
+  unknown_names = set()
   for filename in filenames:
-    contents = ''
-    with open(filename, 'r') as f:
-      contents = removeComments(f.read())
-
-    # TODO(isherman): Look for histogram function calls like
-    # base::UmaHistogramSparse() in addition to macro invocations.
-    for match in HISTOGRAM_REGEX.finditer(contents):
-      line_number = contents[:match.start()].count('\n') + 1
-      if (match.group(2) not in all_suffixes and
-          match.group(1) not in all_others):
-        full_macro_name = match.group(1)
-        if (full_macro_name not in unknown_macros):
-          logging.warning('%s:%d: Unknown macro name: <%s>' %
-                          (filename, line_number, match.group(1)))
-          unknown_macros.add(full_macro_name)
-
-        continue
-
-      histogram = match.group(3).strip()
-      histogram = collapseAdjacentCStrings(histogram)
-
-      # Must begin and end with a quotation mark.
-      if not histogram or histogram[0] != '"' or histogram[-1] != '"':
-        logNonLiteralHistogram(filename, histogram)
-        continue
-
-      # Must not include any quotation marks other than at the beginning or end.
-      histogram_stripped = histogram.strip('"')
-      if '"' in histogram_stripped:
-        logNonLiteralHistogram(filename, histogram)
-        continue
-
-      if histogram_stripped not in histograms:
-        histograms.add(histogram_stripped)
-        location_map[histogram_stripped] = '%s:%d' % (filename, line_number)
+    file_histograms, file_unknown_names, non_literal_histograms = (
+        results[filename])
+    for name, line_number in file_unknown_names:
+      if name not in unknown_names:
+        logging.warning('%s:%d: Unknown macro or function name: <%s>' %
+                        (filename, line_number, name))
+        unknown_names.add(name)
+
+    for histogram in non_literal_histograms:
+      logNonLiteralHistogram(filename, histogram)
+
+    for histogram, line_number in file_histograms:
+      if histogram not in histograms:
+        histograms.add(histogram)
+        location_map[histogram] = '%s:%d' % (filename, line_number)
 
   return histograms, location_map
 
 
-def readXmlHistograms(histograms_file_location):
+def readXmlHistograms(histograms_file_location, cache_dir=None):
   """Parses all histogram names from histograms.xml.
 
+  Args:
+    histograms_file_location: The path of the XML file.
+    cache_dir: See extract_histograms.LoadHistogramIndex().
+
   Returns:
     A set cotaining the parsed histogram names.
   """
   logging.info('Reading histograms from %s...' % histograms_file_location)
-  histograms = extract_histograms.ExtractHistograms(histograms_file_location)
-  return set(extract_histograms.ExtractNames(histograms))
+  index = extract_histograms.LoadHistogramIndex([histograms_file_location],
+                                                cache_dir)
+  if index.had_errors:
+    logging.error('Error parsing %s', histograms_file_location)
+    raise extract_histograms.Error()
+  return set(index.names)
 
 
 def hashHistogramName(name):
@@ -373,6 +581,20 @@ def main():
       help=(
           'print file position information with histograms ' +
           '[optional, defaults to %default]'))
+  parser.add_option(
+      '--jobs', '-j', type='int', dest='jobs',
+      help='scan with N processes [optional, defaults to the number of CPUs]',
+      metavar='N')
+  parser.add_option(
+      '--cache-file', dest='cache_file',
+      help='cache the histograms found in each source file in FILE, so that '
+           'later runs only scan the files that changed [optional]',
+      metavar='FILE')
+  parser.add_option(
+      '--cache-dir', dest='cache_dir',
+      help='cache the index of the histograms XML files in DIR, which must '
+           'only be writable by trusted users [optional]',
+      metavar='DIR')
 
   (options, args) = parser.parse_args()
   if args:
@@ -381,17 +603,26 @@ def main():
 
   logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 
+  if options.cache_file:
+    # The cache file is relative to where this was run from.
+    options.cache_file = os.path.abspath(options.cache_file)
+  if options.cache_dir:
+    options.cache_dir = os.path.abspath(options.cache_dir)
+
   try:
     os.chdir(options.root_directory)
   except EnvironmentError as e:
     logging.error("Could not change to root directory: %s", e)
     sys.exit(1)
-  chromium_histograms, location_map = readChromiumHistograms()
-  xml_histograms = readXmlHistograms(options.histograms_file_location)
+  chromium_histograms, location_map = readChromiumHistograms(
+      options.jobs, options.cache_file)
+  xml_histograms = readXmlHistograms(options.histograms_file_location,
+                                     options.cache_dir)
   unmapped_histograms = chromium_histograms - xml_histograms
 
   if os.path.isfile(options.extra_histograms_file_location):
-    xml_histograms2 = readXmlHistograms(options.extra_histograms_file_location)
+    xml_histograms2 = readXmlHistograms(options.extra_histograms_file_location,
+                                        options.cache_dir)
     unmapped_histograms -= xml_histograms2
   else:
     logging.warning('No such file: %s', options.extra_histograms_file_location)
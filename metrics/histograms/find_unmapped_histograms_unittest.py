@@ -0,0 +1,106 @@
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import find_unmapped_histograms
+
+
+_SOURCE = """\
+// UMA_HISTOGRAM_COUNTS_100("Commented.Out", 1);
+void Foo(const std::string& name) {
+  UMA_HISTOGRAM_BOOLEAN("Macro.Boolean", true);
+  UMA_HISTOGRAM_COUNTS_100(
+      "Macro.Split"
+      ".Name", 1);
+  UMA_HISTOGRAM_COUNTS_100(name, 1);
+  base::UmaHistogramBoolean("Function.Boolean", true);
+  UmaHistogramSparse("Function.Sparse", 1);
+  ::base::UmaHistogramExactLinear("Function.Global", 1, 10);
+  base::UmaHistogramTimes(name + ".Suffix", delta);
+  Other::UmaHistogramTimes("Not.A.Histogram", delta);
+  UMA_HISTOGRAM_FOO("Unknown.Macro", 1);
+  base::UmaHistogramFoo("Unknown.Function", 1);
+}
+"""
+
+
+class FindUnmappedHistogramsTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _WriteFile(self, name, contents):
+    path = os.path.join(self.temp_dir, name)
+    with open(path, 'w') as f:
+      f.write(contents)
+    return path
+
+  def testLineNumbers(self):
+    contents = 'a\nbc\n\nd'
+    line_starts = find_unmapped_histograms._lineStarts(contents)
+    self.assertEqual([0, 2, 5, 6], line_starts)
+    self.assertEqual(
+        [1, 1, 2, 2, 2, 3, 4],
+        [find_unmapped_histograms._lineNumber(line_starts, offset)
+         for offset in xrange(len(contents))])
+
+  def testScanFile(self):
+    histograms, unknown_names, non_literal_histograms = (
+        find_unmapped_histograms.scanFile(self._WriteFile('a.cc', _SOURCE)))
+    self.assertEqual([('Macro.Boolean', 3),
+                      ('Macro.Split.Name', 4),
+                      ('Function.Boolean', 8),
+                      ('Function.Sparse', 9),
+                      ('Function.Global', 10)], histograms)
+    self.assertEqual([('UMA_HISTOGRAM_FOO', 13),
+                      ('base::UmaHistogramFoo', 14)], unknown_names)
+    # Non-literal names are only reported for macros.
+    self.assertEqual(['name'], non_literal_histograms)
+
+  def testScanFile_Declarations(self):
+    path = self._WriteFile('histogram_functions.h', (
+        'void UmaHistogramSparse(const std::string& name, int sample);\n'))
+    self.assertEqual(([], [], []), find_unmapped_histograms.scanFile(path))
+    functions_filename = find_unmapped_histograms.HISTOGRAM_FUNCTIONS_FILENAME
+    self.assertTrue(
+        functions_filename.search('base/metrics/histogram_functions.cc'))
+    self.assertFalse(
+        functions_filename.search('chrome/browser/histogram_functions.cc'))
+
+  def testScanFiles_Cache(self):
+    path_a = self._WriteFile('a.cc', _SOURCE)
+    path_b = self._WriteFile('b.cc', 'UMA_HISTOGRAM_BOOLEAN("B", true);\n')
+    cache_file = os.path.join(self.temp_dir, 'cache')
+    expected = find_unmapped_histograms.scanFiles([path_a, path_b], jobs=1,
+                                                  cache_file=cache_file)
+
+    scanned = []
+    scan_file = find_unmapped_histograms.scanFile
+    def ScanFile(filename):
+      scanned.append(filename)
+      return scan_file(filename)
+    find_unmapped_histograms.scanFile = ScanFile
+    try:
+      self.assertEqual(expected, find_unmapped_histograms.scanFiles(
+          [path_a, path_b], jobs=1, cache_file=cache_file))
+      self.assertEqual([], scanned)
+
+      self._WriteFile('b.cc', '\nUMA_HISTOGRAM_BOOLEAN("B2", true);\n')
+      results = find_unmapped_histograms.scanFiles(
+          [path_a, path_b], jobs=1, cache_file=cache_file)
+      self.assertEqual([path_b], scanned)
+      self.assertEqual(expected[path_a], results[path_a])
+      self.assertEqual(([('B2', 2)], [], []), results[path_b])
+    finally:
+      find_unmapped_histograms.scanFile = scan_file
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -12,7 +12,6 @@ import re
 import sys
 
 import extract_histograms
-import merge_xml
 
 _DATE_FILE_RE = re.compile(r".*MAJOR_BRANCH_DATE=(.+).*")
 _CURRENT_MILESTONE_RE = re.compile(r"MAJOR=([0-9]{2,3})\n")
@@ -189,15 +188,19 @@ def _GenerateFile(arguments):
       arguments.output_dir: A directory to put the generated file.
       arguments.major_branch_date_filepath: File path for base date.
       arguments.milestone_filepath: File path for milestone information.
+      arguments.cache_dir: A directory to cache the histograms index in, or
+        None.
 
   Raises:
     Error if there is an error in input xml files.
   """
-  descriptions = merge_xml.MergeFiles(arguments.inputs)
-  histograms, had_errors = (
-      extract_histograms.ExtractHistogramsFromDom(descriptions))
-  if had_errors:
+  index = extract_histograms.LoadHistogramIndex(arguments.inputs,
+                                                arguments.cache_dir)
+  if index.had_errors:
     raise Error("Error parsing inputs.")
+  # Only the expiry of non-obsolete histograms matters here.
+  histograms = dict((name, {"expires_after": expiry})
+                    for name, expiry in index.GetExpiries().iteritems())
   with open(arguments.major_branch_date_filepath, "r") as date_file:
     file_content = date_file.read()
   base_date = _GetBaseDate(file_content, _DATE_FILE_RE)
@@ -246,6 +249,10 @@ def _ParseArguments():
       "-m",
       required=True,
       help="A path to the file with the milestone information.")
+  arg_parser.add_argument(
+      "--cache_dir",
+      help="A directory to cache the parsed histogram descriptions in, "
+      "keyed by their contents (optional).")
   arg_parser.add_argument(
       "inputs",
       nargs="+",
@@ -5,6 +5,7 @@
 
 """Prints all histogram names."""
 
+import argparse
 import os
 import sys
 
@@ -13,15 +14,21 @@ import path_util
 
 import extract_histograms
 import histogram_paths
-import merge_xml
 
 def main():
-  doc = merge_xml.MergeFiles(histogram_paths.ALL_XMLS)
-  histograms, had_errors = extract_histograms.ExtractHistogramsFromDom(doc)
-  if had_errors:
-    raise Error("Error parsing inputs.")
-  names = extract_histograms.ExtractNames(histograms)
-  for name in names:
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--cache_dir',
+      help='A directory to cache the index of histogram names in, keyed by '
+      'the contents of the XML files. Must only be writable by trusted users '
+      '(optional).')
+  args = parser.parse_args()
+
+  index = extract_histograms.LoadHistogramIndex(histogram_paths.ALL_XMLS,
+                                                args.cache_dir)
+  if index.had_errors:
+    raise extract_histograms.Error("Error parsing inputs.")
+  for name in index.names:
     print name
 
 if __name__ == '__main__':
@@ -5,6 +5,7 @@
 
 """Verifies that the histograms XML file is well-formatted."""
 
+import argparse
 import os
 import sys
 
@@ -16,8 +17,20 @@ import histogram_paths
 import merge_xml
 
 def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--cache_dir',
+      help='A directory in which to record that the XML files passed '
+      'validation, so that unchanged files are not validated again. Must only '
+      'be writable by trusted users (optional).')
+  args = parser.parse_args()
+
+  if extract_histograms.WasValidated(histogram_paths.ALL_XMLS, args.cache_dir):
+    sys.exit(0)
   doc = merge_xml.MergeFiles(histogram_paths.ALL_XMLS)
   _, errors = extract_histograms.ExtractHistogramsFromDom(doc)
+  if not errors:
+    extract_histograms.MarkValidated(histogram_paths.ALL_XMLS, args.cache_dir)
   sys.exit(errors)
 
 if __name__ == '__main__':
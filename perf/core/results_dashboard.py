@@ -13,8 +13,10 @@ import datetime
 import httplib
 import json
 import os
+import socket
 import subprocess
 import sys
+import threading
 import traceback
 import time
 import tempfile
@@ -27,6 +29,7 @@ import httplib2
 from telemetry.internal.util import external_modules
 
 from core import path_util
+from core import streaming_json
 
 psutil = external_modules.ImportOptionalModule('psutil')
 
@@ -35,6 +38,26 @@ psutil = external_modules.ImportOptionalModule('psutil')
 SEND_RESULTS_PATH = '/add_point'
 SEND_HISTOGRAMS_PATH = '/add_histograms'
 DEFAULT_TOKEN_TIMEOUT_IN_MINUTES = 30
+# HistogramSet files are uploaded in requests of at most about this many bytes
+# of (uncompressed) JSON. See SendHistogramsFile().
+DEFAULT_HISTOGRAMS_CHUNK_SIZE = 32 * 1024 * 1024
+# Timeout of each HTTP request to the dashboard.
+DEFAULT_REQUEST_TIMEOUT_IN_SECONDS = 300
+# Retries are delayed by exponentially increasing delays, starting with
+# RETRY_BASE_DELAY_IN_SECONDS and capped to RETRY_MAX_DELAY_IN_SECONDS.
+RETRY_BASE_DELAY_IN_SECONDS = 5
+RETRY_MAX_DELAY_IN_SECONDS = 120
+# Authentication tokens are reused until this long before they expire.
+_TOKEN_EXPIRATION_MARGIN_IN_SECONDS = 5 * 60
+
+# OAuth tokens, keyed by (service_account_file, token_generator_callback), as
+# (token, expiration time) tuples. See _GetOAuthToken().
+_oauth_tokens = {}
+_oauth_tokens_lock = threading.Lock()
+
+# Per-thread state, i.e. the httplib2.Http object of each thread, which keeps
+# connections to the dashboard alive across requests. See _GetHttp().
+_thread_local = threading.local()
 
 
 class SendResultException(Exception):
@@ -65,7 +88,7 @@ def LuciAuthTokenGeneratorCallback(
 
 def SendResults(data, url, send_as_histograms=False, service_account_file=None,
                 token_generator_callback=LuciAuthTokenGeneratorCallback,
-                num_retries=3):
+                num_retries=3, deadline=None):
   """Sends results to the Chrome Performance Dashboard.
 
   This function tries to send the given data to the dashboard.
@@ -84,7 +107,9 @@ def SendResults(data, url, send_as_histograms=False, service_account_file=None,
       If |token_generator_callback| is not specified, it's default to
       LuciAuthTokenGeneratorCallback.
     num_retries: Number of times to retry uploading to the perf dashboard upon
-      recoverable error.
+      recoverable error. Retries are delayed with exponential backoff.
+    deadline: If set, the time (as returned by time.time()) after which
+      uploads are not retried anymore.
   """
   if send_as_histograms and not service_account_file:
     raise ValueError(
@@ -92,23 +117,99 @@ def SendResults(data, url, send_as_histograms=False, service_account_file=None,
         'data')
 
   start = time.time()
-  errors = []
-  all_data_uploaded = False
 
   data_type = ('histogram' if send_as_histograms else 'chartjson')
 
   dashboard_data_str = json.dumps(data)
 
+  def Send():
+    if send_as_histograms:
+      _SendHistogramJson(url, dashboard_data_str,
+                         service_account_file, token_generator_callback)
+    else:
+      # TODO(eakuefner): Remove this logic once all bots use histograms.
+      _SendResultsJson(url, dashboard_data_str)
+  all_data_uploaded = _SendWithRetries(Send, data_type, num_retries, deadline)
+
+  print 'Time spent sending results to %s: %s' % (url, time.time() - start)
+
+  return all_data_uploaded
+
+
+def SendHistogramsFile(histograms_file, url, service_account_file,
+                       token_generator_callback=LuciAuthTokenGeneratorCallback,
+                       num_retries=3,
+                       max_chunk_size=DEFAULT_HISTOGRAMS_CHUNK_SIZE,
+                       deadline=None):
+  """Sends a HistogramSet JSON file to the Chrome Performance Dashboard.
+
+  Unlike SendResults(), this never holds the whole HistogramSet in memory.
+  Histograms are read from the file one at a time and sent in several requests
+  of at most about |max_chunk_size| bytes of JSON each. Each request is a valid
+  HistogramSet by itself, i.e. it also contains the shared diagnostics that its
+  histograms refer to.
+
+  Args:
+    histograms_file: Path to a HistogramSet JSON file.
+    url: Performance Dashboard URL (including schema).
+    max_chunk_size: Approximate maximum size of each request, before
+      compression. A single histogram larger than this is sent by itself.
+
+    For |service_account_file|, |token_generator_callback|, |num_retries| and
+    |deadline|, see SendResults's documentation.
+
+  Returns:
+    True if all histograms were uploaded.
+  """
+  if not service_account_file:
+    raise ValueError(
+        'Must set a valid service_account_file for uploading histogram set '
+        'data')
+
+  start = time.time()
+  all_data_uploaded = True
+  for i, chunk in enumerate(
+      _IterHistogramSetChunks(histograms_file, max_chunk_size)):
+    print 'Sending histogram chunk %d (%d bytes).' % (i + 1, len(chunk))
+    def Send():
+      _SendHistogramJson(url, chunk,
+                         service_account_file, token_generator_callback)
+    if not _SendWithRetries(Send, 'histogram', num_retries, deadline):
+      all_data_uploaded = False
+      break
+
+  print 'Time spent sending results to %s: %s' % (url, time.time() - start)
+
+  return all_data_uploaded
+
+
+def _GetRetryDelay(attempt):
+  """Returns how long to wait before retrying after the |attempt|th try."""
+  return min(RETRY_BASE_DELAY_IN_SECONDS * 2 ** (attempt - 1),
+             RETRY_MAX_DELAY_IN_SECONDS)
+
+
+def _SendWithRetries(send_func, data_type, num_retries, deadline=None):
+  """Calls |send_func| until it succeeds, or fails with a fatal error.
+
+  Returns:
+    True if |send_func| succeeded.
+  """
+  errors = []
+  all_data_uploaded = False
+
   for i in xrange(1, num_retries + 1):
+    if i > 1:
+      delay = _GetRetryDelay(i - 1)
+      if deadline is not None and time.time() + delay > deadline:
+        errors.append('Not retrying to upload %s data: deadline exceeded.' %
+                      data_type)
+        break
+      time.sleep(delay)
     try:
       print 'Sending %s result to dashboard (attempt %i out of %i).' % (
           data_type, i, num_retries)
-      if send_as_histograms:
-        _SendHistogramJson(url, dashboard_data_str,
-                           service_account_file, token_generator_callback)
-      else:
-        # TODO(eakuefner): Remove this logic once all bots use histograms.
-        _SendResultsJson(url, dashboard_data_str)
+      send_func()
       all_data_uploaded = True
       break
     except SendResultsRetryException as e:
@@ -127,15 +228,100 @@ def SendResults(data, url, send_as_histograms=False, service_account_file=None,
   for err in errors:
     print err
 
-  print 'Time spent sending results to %s: %s' % (url, time.time() - start)
-
   return all_data_uploaded
 
 
+def _IsSharedDiagnostic(element):
+  # Histograms have names, shared diagnostics have types.
+  return (isinstance(element, dict) and 'guid' in element and
+          'type' in element and 'name' not in element)
+
+
+def _AddReferencedGuids(value, guids, referenced):
+  """Adds the strings in |value| that are in |guids| to |referenced|."""
+  if isinstance(value, basestring):
+    if value in guids:
+      referenced.add(value)
+  elif isinstance(value, dict):
+    for v in value.itervalues():
+      _AddReferencedGuids(v, guids, referenced)
+  elif isinstance(value, list):
+    for v in value:
+      _AddReferencedGuids(v, guids, referenced)
+
+
+def _IterHistogramSetChunks(histograms_file, max_chunk_size):
+  """Yields HistogramSet JSON strings that together contain |histograms_file|.
+
+  Shared diagnostics are included in every chunk that refers to them, so they
+  are kept in memory. They are few and small compared to the histograms.
+  """
+  diagnostics = {}
+  with open(histograms_file) as f:
+    for element in streaming_json.IterJsonArray(f):
+      if _IsSharedDiagnostic(element):
+        diagnostics[element['guid']] = json.dumps(element)
+
+  chunk_diagnostics = {}
+  chunk_histograms = []
+  chunk_size = 0
+  with open(histograms_file) as f:
+    for element in streaming_json.IterJsonArray(f):
+      if _IsSharedDiagnostic(element):
+        continue
+      histogram = json.dumps(element)
+      referenced = set()
+      _AddReferencedGuids(element, diagnostics, referenced)
+      new_guids = referenced.difference(chunk_diagnostics)
+      added_size = len(histogram) + sum(len(diagnostics[g]) for g in new_guids)
+      if chunk_histograms and chunk_size + added_size > max_chunk_size:
+        yield '[%s]' % ', '.join(
+            chunk_diagnostics.values() + chunk_histograms)
+        chunk_diagnostics = {}
+        chunk_histograms = []
+        chunk_size = 0
+        new_guids = referenced
+        added_size = len(histogram) + sum(
+            len(diagnostics[g]) for g in new_guids)
+      for guid in new_guids:
+        chunk_diagnostics[guid] = diagnostics[guid]
+      chunk_histograms.append(histogram)
+      chunk_size += added_size
+
+  if chunk_histograms or chunk_diagnostics:
+    yield '[%s]' % ', '.join(chunk_diagnostics.values() + chunk_histograms)
+  elif diagnostics:
+    # A HistogramSet with only diagnostics.
+    yield '[%s]' % ', '.join(diagnostics.values())
+
+
 def MakeHistogramSetWithDiagnostics(histograms_file,
                                     test_name, bot, buildername, buildnumber,
                                     revisions_dict, is_reference_build,
                                     perf_dashboard_machine_group):
+  tf = tempfile.NamedTemporaryFile(delete=False)
+  tf.close()
+  temp_histogram_output_file = tf.name
+
+  try:
+    MakeHistogramSetFileWithDiagnostics(
+        histograms_file, temp_histogram_output_file, test_name, bot,
+        buildername, buildnumber, revisions_dict, is_reference_build,
+        perf_dashboard_machine_group)
+    # TODO: Handle reference builds
+    with open(temp_histogram_output_file) as f:
+      hs = json.load(f)
+    return hs
+  finally:
+    os.remove(temp_histogram_output_file)
+
+
+def MakeHistogramSetFileWithDiagnostics(histograms_file, output_file,
+                                        test_name, bot, buildername,
+                                        buildnumber, revisions_dict,
+                                        is_reference_build,
+                                        perf_dashboard_machine_group):
+  """Like MakeHistogramSetWithDiagnostics, but writes to |output_file|."""
   add_diagnostics_args = []
   add_diagnostics_args.extend([
       '--benchmarks', test_name,
@@ -162,21 +348,10 @@ def MakeHistogramSetWithDiagnostics(histograms_file,
       path_util.GetChromiumSrcDir(), 'third_party', 'catapult', 'tracing',
       'bin', 'add_reserved_diagnostics')
 
-  tf = tempfile.NamedTemporaryFile(delete=False)
-  tf.close()
-  temp_histogram_output_file = tf.name
-
   cmd = ([sys.executable, add_reserved_diagnostics_path] +
-         add_diagnostics_args + ['--output_path', temp_histogram_output_file])
+         add_diagnostics_args + ['--output_path', output_file])
 
-  try:
-    subprocess.check_call(cmd)
-    # TODO: Handle reference builds
-    with open(temp_histogram_output_file) as f:
-      hs = json.load(f)
-    return hs
-  finally:
-    os.remove(temp_histogram_output_file)
+  subprocess.check_call(cmd)
 
 
 def MakeListOfPoints(charts, bot, test_name, buildername,
@@ -432,8 +607,9 @@ def _SendResultsJson(url, results_json):
   data = urllib.urlencode({'data': results_json})
   req = urllib2.Request(url + SEND_RESULTS_PATH, data)
   try:
-    urllib2.urlopen(req)
-  except (urllib2.HTTPError, urllib2.URLError, httplib.HTTPException):
+    urllib2.urlopen(req, timeout=DEFAULT_REQUEST_TIMEOUT_IN_SECONDS)
+  except (urllib2.HTTPError, urllib2.URLError, httplib.HTTPException,
+          socket.error):
     error = traceback.format_exc()
 
     if 'HTTPError: 400' in error:
@@ -459,8 +635,7 @@ def _SendHistogramJson(url, histogramset_json,
     None if successful, or an error string if there were errors.
   """
   try:
-    oauth_token = token_generator_callback(
-        service_account_file, DEFAULT_TOKEN_TIMEOUT_IN_MINUTES)
+    oauth_token = _GetOAuthToken(service_account_file, token_generator_callback)
 
     data = zlib.compress(histogramset_json)
     headers = {
@@ -468,19 +643,59 @@ def _SendHistogramJson(url, histogramset_json,
         'User-Agent': 'perf-uploader/1.0'
     }
 
-    http = httplib2.Http()
-
-    response, _ = http.request(
+    response, _ = _GetHttp().request(
       url + SEND_HISTOGRAMS_PATH, method='POST', body=data, headers=headers)
 
     # A 500 is presented on an exception on the dashboard side, timeout,
     # exception, etc. The dashboard can also send back 400 and 403, we could
     # recover from 403 (auth error), but 400 is generally malformed data.
+    if response.status == 403:
+      # Get a new token on retry, in case this one was revoked.
+      _InvalidateOAuthToken(service_account_file, token_generator_callback)
     if response.status in (403, 500):
       raise SendResultsRetryException('HTTP Response %d: %s' % (
           response.status, response.reason))
     elif response.status != 200:
       raise SendResultsFatalException('HTTP Response %d: %s' % (
           response.status, response.reason))
-  except httplib2.HttpLib2Error:
+  except (httplib2.HttpLib2Error, httplib.HTTPException, socket.error):
+    # The connection may be broken, don't reuse it.
+    _thread_local.http = None
     raise SendResultsRetryException(traceback.format_exc())
+
+
+def _GetHttp():
+  """Returns this thread's httplib2.Http object.
+
+  Reusing it keeps the connection to the dashboard alive across requests, e.g.
+  for each chunk of a HistogramSet.
+  """
+  http = getattr(_thread_local, 'http', None)
+  if http is None:
+    http = httplib2.Http(timeout=DEFAULT_REQUEST_TIMEOUT_IN_SECONDS)
+    _thread_local.http = http
+  return http
+
+
+def _GetOAuthToken(service_account_file, token_generator_callback):
+  """Returns a token, generating a new one only when needed.
+
+  Generating a token runs luci-auth, so tokens are reused across requests
+  until shortly before they expire.
+  """
+  key = (service_account_file, token_generator_callback)
+  with _oauth_tokens_lock:
+    token, expiration = _oauth_tokens.get(key, (None, 0))
+    if time.time() < expiration:
+      return token
+    expiration = (time.time() + DEFAULT_TOKEN_TIMEOUT_IN_MINUTES * 60 -
+                  _TOKEN_EXPIRATION_MARGIN_IN_SECONDS)
+    token = token_generator_callback(
+        service_account_file, DEFAULT_TOKEN_TIMEOUT_IN_MINUTES)
+    _oauth_tokens[key] = (token, expiration)
+    return token
+
+
+def _InvalidateOAuthToken(service_account_file, token_generator_callback):
+  with _oauth_tokens_lock:
+    _oauth_tokens.pop((service_account_file, token_generator_callback), None)
@@ -1,6 +1,9 @@
 # Copyright 2018 The Chromium Authors. All rights reserved.
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
+import json
+import os
+import tempfile
 import unittest
 
 import mock
@@ -15,6 +18,10 @@ class ResultsDashboardTest(unittest.TestCase):
     self.dummy_token_generator = lambda service_file, timeout: 'Arthur-Merlin'
     self.perf_data = {'foo': 1, 'bar': 2}
     self.dashboard_url = 'https://chromeperf.appspot.com'
+    # Don't actually wait between retries.
+    sleep_patcher = mock.patch('core.results_dashboard.time.sleep')
+    self.sleep = sleep_patcher.start()
+    self.addCleanup(sleep_patcher.stop)
 
   def testRetryForSendResultRetryException(self):
     def raise_retry_exception(
@@ -32,6 +39,45 @@ class ResultsDashboardTest(unittest.TestCase):
       self.assertFalse(upload_result)
       self.assertEqual(m.call_count, 5)
 
+  def testRetryWithExponentialBackoff(self):
+    with mock.patch('core.results_dashboard._SendHistogramJson',
+                    side_effect=results_dashboard.SendResultsRetryException(
+                        'Should retry')):
+      upload_result = results_dashboard.SendResults(
+          self.perf_data, self.dashboard_url, send_as_histograms=True,
+          service_account_file=self.fake_service,
+          token_generator_callback=self.dummy_token_generator, num_retries=8)
+    self.assertFalse(upload_result)
+    self.assertEqual([5, 10, 20, 40, 80, 120, 120],
+                     [c[0][0] for c in self.sleep.call_args_list])
+
+  def testNoRetryAfterDeadline(self):
+    with mock.patch('core.results_dashboard._SendHistogramJson',
+                    side_effect=results_dashboard.SendResultsRetryException(
+                        'Should retry')) as m:
+      with mock.patch('core.results_dashboard.time.time', return_value=100):
+        upload_result = results_dashboard.SendResults(
+            self.perf_data, self.dashboard_url, send_as_histograms=True,
+            service_account_file=self.fake_service,
+            token_generator_callback=self.dummy_token_generator,
+            num_retries=5, deadline=108)
+    self.assertFalse(upload_result)
+    # The second retry would be delayed by 10 seconds, past the deadline.
+    self.assertEqual(m.call_count, 2)
+
+  def testOAuthTokenIsReused(self):
+    token_generator = mock.Mock(side_effect=['token1', 'token2'])
+    results_dashboard._oauth_tokens.clear()
+    self.addCleanup(results_dashboard._oauth_tokens.clear)
+    self.assertEqual('token1', results_dashboard._GetOAuthToken(
+        self.fake_service, token_generator))
+    self.assertEqual('token1', results_dashboard._GetOAuthToken(
+        self.fake_service, token_generator))
+    results_dashboard._InvalidateOAuthToken(self.fake_service, token_generator)
+    self.assertEqual('token2', results_dashboard._GetOAuthToken(
+        self.fake_service, token_generator))
+    self.assertEqual(token_generator.call_count, 2)
+
   def testNoRetryForSendResultFatalException(self):
 
     def raise_retry_exception(
@@ -79,3 +125,43 @@ class ResultsDashboardTest(unittest.TestCase):
           num_retries=5)
       self.assertTrue(upload_result)
       self.assertEqual(m.call_count, 3)
+
+  def testSendHistogramsFileInChunks(self):
+    diagnostic = {'guid': 'd1', 'type': 'GenericSet', 'values': ['x']}
+    histograms = [{'name': 'h%d' % i, 'guid': 'g%d' % i, 'unit': 'ms',
+                   'diagnostics': {'stories': 'd1'}} for i in xrange(3)]
+    unrelated = {'name': 'other', 'guid': 'g3', 'unit': 'ms'}
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    with tf:
+      json.dump([diagnostic] + histograms + [unrelated], tf)
+    try:
+      with mock.patch('core.results_dashboard._SendHistogramJson') as m:
+        upload_result = results_dashboard.SendHistogramsFile(
+            tf.name, self.dashboard_url, self.fake_service,
+            token_generator_callback=self.dummy_token_generator,
+            max_chunk_size=1)
+      self.assertTrue(upload_result)
+      chunks = [json.loads(c[0][1]) for c in m.call_args_list]
+    finally:
+      os.remove(tf.name)
+    # Each histogram is sent along with the diagnostics it refers to.
+    self.assertEqual([[diagnostic, h] for h in histograms] + [[unrelated]],
+                     chunks)
+
+  def testSendHistogramsFileStopsAfterFailure(self):
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    with tf:
+      json.dump([{'name': 'h1', 'guid': 'g1'}, {'name': 'h2', 'guid': 'g2'}],
+                tf)
+    try:
+      with mock.patch('core.results_dashboard._SendHistogramJson',
+                      side_effect=results_dashboard.SendResultsFatalException(
+                          'Do not retry')) as m:
+        upload_result = results_dashboard.SendHistogramsFile(
+            tf.name, self.dashboard_url, self.fake_service,
+            token_generator_callback=self.dummy_token_generator,
+            max_chunk_size=1)
+      self.assertFalse(upload_result)
+      self.assertEqual(m.call_count, 1)
+    finally:
+      os.remove(tf.name)
@@ -59,6 +59,12 @@ tools/perf/generate_perf_sharding
 rm all_desktop_perf.json
 rm win_10_test_data.json
 
+Comparing the greedy and optimal sharding maps:
+tools/perf/generate_perf_sharding
+    --output-file tools/perf/core/desktop_sharding_map.json
+    --num-shards 26 --timing-data all_desktop_perf.json
+    --algorithm optimal --simulation-report sharding_report.json
+
 """
 
 import argparse
@@ -71,6 +77,11 @@ import core.path_util
 core.path_util.AddTelemetryToPath()
 
 
+# Sharding algorithms, see _ALGORITHMS.
+GREEDY = 'greedy'
+OPTIMAL = 'optimal'
+
+
 def main(options, benchmarks_data):
   """
     benchmarks_data is a dictionary of all benchmarks to be sharded. Its
@@ -95,8 +106,14 @@ def main(options, benchmarks_data):
   for b in benchmarks_data:
     all_stories[b] = benchmarks_data[b]['stories']
 
+  if options.simulation_report:
+    report = get_simulation_report(story_timing_ordered_dict,
+                                   options.num_shards)
+    with open(options.simulation_report, 'w') as output_file:
+      json.dump(report, output_file, indent = 4, separators=(',', ': '))
+
   sharding_map = generate_sharding_map(story_timing_ordered_dict,
-      all_stories, options.num_shards, options.debug)
+      all_stories, options.num_shards, options.debug, options.algorithm)
 
   with open(options.output_file, 'w') as output_file:
     json.dump(sharding_map, output_file, indent = 4, separators=(',', ': '))
@@ -141,6 +158,15 @@ def get_parser():
   parser.add_argument(
       '--debug', action='store',
       help='If specified, the filename to write extra timing data to.')
+  parser.add_argument(
+      '--algorithm', choices=[GREEDY, OPTIMAL], default=GREEDY,
+      help='How to split the stories into shards. "greedy" fills the shards '
+      'one after the other up to the expected time per shard. "optimal" '
+      'minimizes the predicted time of the slowest shard.')
+  parser.add_argument(
+      '--simulation-report', action='store',
+      help='If specified, the filename to write a comparison of the predicted '
+      'shard times of all algorithms to.')
   parser.add_argument(
       '--benchmarks',
       help='Comma separated list of benchmark names to generate a map for',
@@ -149,12 +175,18 @@ def get_parser():
 
 
 def generate_sharding_map(
-    story_timing_ordered_dict, all_stories, num_shards, debug):
+    story_timing_ordered_dict, all_stories, num_shards, debug,
+    algorithm=GREEDY):
+  """Generates a sharding map from the (ordered) timing data of all stories.
 
-  expected_time_per_shard = _get_expected_time_per_shard(
-      story_timing_ordered_dict, num_shards)
+  Every shard runs a contiguous range of stories, in the order of
+  |story_timing_ordered_dict|. See _ALGORITHMS for the ways of choosing
+  where to split that range.
+  """
+  shards = _ALGORITHMS[algorithm](
+      story_timing_ordered_dict.items(), num_shards)
 
-  total_time = 0
+  story_indices = _get_story_indices(all_stories)
   sharding_map = collections.OrderedDict()
   debug_map = collections.OrderedDict()
   min_shard_time = sys.maxint
@@ -162,26 +194,14 @@ def generate_sharding_map(
   max_shard_time = 0
   max_shard_index = None
   num_stories = len(story_timing_ordered_dict)
-  for i in range(num_shards):
-    sharding_map[str(i)] = {'benchmarks': collections.OrderedDict()}
+  for i, shard in enumerate(shards):
     debug_map[str(i)] = collections.OrderedDict()
     time_per_shard = 0
-    stories_in_shard = []
-    expected_total_time = expected_time_per_shard * (i + 1)
-    last_diff = abs(total_time - expected_total_time)
-    # Keep adding story to the current shard until the absolute difference
-    # between the total time of shards so far and expected total time is
-    # minimal.
-    while (story_timing_ordered_dict and
-           abs(total_time + story_timing_ordered_dict.items()[0][1] -
-               expected_total_time) <= last_diff):
-      (story, time) = story_timing_ordered_dict.popitem(last=False)
-      total_time += time
+    for story, time in shard:
       time_per_shard += time
-      stories_in_shard.append(story)
       debug_map[str(i)][story] = time
-      last_diff = abs(total_time - expected_total_time)
-    _add_benchmarks_to_shard(sharding_map, i, stories_in_shard, all_stories)
+    _add_benchmarks_to_shard(sharding_map, i, [story for story, _ in shard],
+                             all_stories, story_indices)
     # Double time_per_shard to account for reference benchmark run.
     debug_map[str(i)]['expected_total_time'] = time_per_shard * 2
     if time_per_shard > max_shard_time:
@@ -207,15 +227,136 @@ def generate_sharding_map(
   return sharding_map
 
 
-def _get_expected_time_per_shard(timing_data, num_shards):
+def _greedy_shards(story_timings, num_shards):
+  """Fills shards in story order, each up to the expected time per shard."""
+  expected_time_per_shard = _get_expected_time_per_shard(
+      story_timings, num_shards)
+
+  shards = []
+  total_time = 0
+  next_story = 0
+  for i in range(num_shards):
+    shard = []
+    expected_total_time = expected_time_per_shard * (i + 1)
+    last_diff = abs(total_time - expected_total_time)
+    # Keep adding story to the current shard until the absolute difference
+    # between the total time of shards so far and expected total time is
+    # minimal.
+    while (next_story < len(story_timings) and
+           abs(total_time + story_timings[next_story][1] -
+               expected_total_time) <= last_diff):
+      shard.append(story_timings[next_story])
+      total_time += story_timings[next_story][1]
+      next_story += 1
+      last_diff = abs(total_time - expected_total_time)
+    shards.append(shard)
+  return shards
+
+
+def _count_shards_needed(story_timings, max_shard_time):
+  """Returns how many contiguous shards of at most |max_shard_time| the stories
+  need, filling each shard as much as possible."""
+  num_shards = 1
+  time_per_shard = 0
+  for _, time in story_timings:
+    if time_per_shard + time > max_shard_time:
+      num_shards += 1
+      time_per_shard = 0
+    time_per_shard += time
+  return num_shards
+
+
+def _optimal_shards(story_timings, num_shards):
+  """Splits the stories into contiguous shards minimizing the max shard time.
+
+  This is the linear partition problem. The smallest feasible max shard time
+  is found by bisection, since whether the stories fit in |num_shards| shards
+  of a given time is monotonic in that time, and can be checked in linear
+  time by filling each shard as much as possible.
+  """
+  if not story_timings:
+    return [[] for _ in range(num_shards)]
+
+  low = max(time for _, time in story_timings)
+  high = sum(time for _, time in story_timings)
+  if _count_shards_needed(story_timings, low) <= num_shards:
+    high = low
+  # |high| is always feasible, |low| is not (unless equal to |high|). Stop
+  # once they only differ in the last bits of precision.
+  while high - low > high * 1e-12:
+    mid = (low + high) / 2.0
+    if _count_shards_needed(story_timings, mid) <= num_shards:
+      high = mid
+    else:
+      low = mid
+
+  # Fill the shards up to |high|, but start a new shard for each of the last
+  # stories if needed so that no shard is left empty.
+  shards = [[]]
+  time_per_shard = 0
+  for i, (story, time) in enumerate(story_timings):
+    num_stories_left = len(story_timings) - i
+    num_shards_left = num_shards - len(shards)
+    if shards[-1] and (time_per_shard + time > high or
+                       num_stories_left <= num_shards_left):
+      shards.append([])
+      time_per_shard = 0
+    shards[-1].append((story, time))
+    time_per_shard += time
+  while len(shards) < num_shards:
+    shards.append([])
+  return shards
+
+
+_ALGORITHMS = collections.OrderedDict([
+    (GREEDY, _greedy_shards),
+    (OPTIMAL, _optimal_shards),
+])
+
+
+def get_simulation_report(story_timing_ordered_dict, num_shards):
+  """Compares the predicted shard times of all sharding algorithms.
+
+  The wall time of a perf builder is bounded by its slowest shard, so the
+  predicted critical path is the max shard time. Like the sharding map's
+  extra_infos, all times are doubled to account for the reference build.
+  """
+  report = collections.OrderedDict()
+  report['num_shards'] = num_shards
+  report['num_stories'] = len(story_timing_ordered_dict)
+  total_time = sum(story_timing_ordered_dict.itervalues()) * 2
+  report['mean_shard_time'] = total_time / num_shards
+  for algorithm, get_shards in _ALGORITHMS.iteritems():
+    shards = get_shards(story_timing_ordered_dict.items(), num_shards)
+    shard_times = [sum(time for _, time in shard) * 2 for shard in shards]
+    report[algorithm] = collections.OrderedDict([
+        ('predicted_critical_path', max(shard_times)),
+        ('predicted_min_shard_time', min(shard_times)),
+        ('predicted_shard_times', shard_times),
+    ])
+  greedy_time = report[GREEDY]['predicted_critical_path']
+  optimal_time = report[OPTIMAL]['predicted_critical_path']
+  report['predicted_critical_path_saved'] = greedy_time - optimal_time
+  return report
+
+
+def _get_expected_time_per_shard(story_timings, num_shards):
   total_run_time = 0
-  for story in timing_data:
-    total_run_time += timing_data[story]
+  for _, time in story_timings:
+    total_run_time += time
   return total_run_time / num_shards
 
 
+def _get_story_indices(all_stories):
+  """Maps each benchmark to a dict of its story names to their index."""
+  story_indices = {}
+  for b, stories in all_stories.iteritems():
+    story_indices[b] = dict((story, i) for i, story in enumerate(stories))
+  return story_indices
+
+
 def _add_benchmarks_to_shard(sharding_map, shard_index, stories_in_shard,
-    all_stories):
+    all_stories, story_indices):
   benchmarks = collections.OrderedDict()
   for story in stories_in_shard:
     (b, story) = story.split('/', 1)
@@ -227,8 +368,8 @@ def _add_benchmarks_to_shard(sharding_map, shard_index, stories_in_shard,
   benchmarks_in_shard = collections.OrderedDict()
   for b in benchmarks:
     benchmarks_in_shard[b] = {}
-    first_story = all_stories[b].index(benchmarks[b][0])
-    last_story = all_stories[b].index(benchmarks[b][-1]) + 1
+    first_story = story_indices[b][benchmarks[b][0]]
+    last_story = story_indices[b][benchmarks[b][-1]] + 1
     if first_story != 0:
       benchmarks_in_shard[b]['begin'] = first_story
     if last_story != len(all_stories[b]):
@@ -46,6 +46,51 @@ class TestShardingMapGenerator(unittest.TestCase):
     finally:
       os.remove(map_path)
 
+  def testGenerateOptimalShardingMap(self):
+    timing_data, all_stories = self._init_sample_timing_data(
+        [[60, 56, 57], [66, 54, 80, 4], [2, 8, 7, 37, 2]])
+    sharding_map = sharding_map_generator.generate_sharding_map(
+        timing_data, all_stories, 3, None, sharding_map_generator.OPTIMAL)
+    fd_map, map_path = tempfile.mkstemp(suffix='.json')
+    try:
+      with os.fdopen(fd_map, 'w') as f:
+        json.dump(sharding_map, f)
+      results = sharding_map_generator.test_sharding_map(map_path,
+          timing_data, all_stories)
+      self.assertEqual(results['0']['full_time'], 173)
+      self.assertEqual(results['1']['full_time'], 120)
+      self.assertEqual(results['2']['full_time'], 140)
+    finally:
+      os.remove(map_path)
+    self.assertEqual(sharding_map['1']['benchmarks'],
+                     {'benchmark_1': {'end': 2}})
+    self.assertEqual(sharding_map['extra_infos']['predicted_max_shard_time'],
+                     346)
+
+  def testOptimalShardingMapKeepsShardsNonEmpty(self):
+    timing_data, all_stories = self._init_sample_timing_data(
+        [[100, 1, 1, 1]])
+    sharding_map = sharding_map_generator.generate_sharding_map(
+        timing_data, all_stories, 4, None, sharding_map_generator.OPTIMAL)
+    self.assertEqual(sharding_map['0']['benchmarks']['benchmark_0'],
+                     {'end': 1})
+    self.assertEqual(sharding_map['1']['benchmarks']['benchmark_0'],
+                     {'begin': 1, 'end': 2})
+    self.assertEqual(sharding_map['2']['benchmarks']['benchmark_0'],
+                     {'begin': 2, 'end': 3})
+    self.assertEqual(sharding_map['3']['benchmarks']['benchmark_0'],
+                     {'begin': 3})
+
+  def testSimulationReport(self):
+    timing_data, _ = self._init_sample_timing_data(
+        [[60, 56, 57], [66, 54, 80, 4], [2, 8, 7, 37, 2]])
+    report = sharding_map_generator.get_simulation_report(timing_data, 3)
+    self.assertEqual(report['greedy']['predicted_critical_path'], 354)
+    self.assertEqual(report['optimal']['predicted_critical_path'], 346)
+    self.assertEqual(report['optimal']['predicted_shard_times'],
+                     [346, 240, 280])
+    self.assertEqual(report['predicted_critical_path_saved'], 8)
+
   def testGeneratePerfSharding(self):
     with tempfile_ext.NamedTemporaryDirectory() as temp_dir:
       path_output = os.path.join(temp_dir, 'path_output')
@@ -0,0 +1,155 @@
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Reads and writes large JSON arrays one element at a time.
+
+HistogramSet JSON files are arrays of (histogram and diagnostic) dicts that can
+reach hundreds of MB when many shards are merged. These helpers keep only one
+element, rather than the whole array, in memory at a time.
+"""
+
+import json
+
+
+_READ_SIZE = 1024 * 1024
+_WHITESPACE = ' \t\n\r'
+
+
+def IsJsonArray(json_file):
+  """Returns whether the JSON document in |json_file| is an array.
+
+  Only reads as far as the first non-whitespace character.
+  """
+  with open(json_file) as f:
+    while True:
+      chunk = f.read(4096)
+      if not chunk:
+        return False
+      stripped = chunk.lstrip(_WHITESPACE)
+      if stripped:
+        return stripped[0] == '['
+
+
+def IterJsonArray(f, read_size=_READ_SIZE):
+  """Yields the decoded elements of the JSON array in file object |f|.
+
+  Raises:
+    ValueError: if the file does not contain a JSON array.
+  """
+  decoder = json.JSONDecoder()
+  buf = ''
+  pos = 0
+  at_eof = False
+  expect_start = True
+  after_element = False
+  after_comma = False
+  # The number of bytes to read when an element is incomplete. Doubled each
+  # time so that large elements are decoded in a linear number of attempts.
+  next_read_size = read_size
+
+  while True:
+    # Skip to the start of the next element.
+    while True:
+      while pos < len(buf) and buf[pos] in _WHITESPACE:
+        pos += 1
+      if pos < len(buf) or at_eof:
+        break
+      buf = f.read(read_size)
+      pos = 0
+      at_eof = not buf
+
+    if pos == len(buf):
+      raise ValueError('Unexpected end of JSON array')
+    if expect_start:
+      if buf[pos] != '[':
+        raise ValueError('Expected a JSON array')
+      pos += 1
+      expect_start = False
+      continue
+    if buf[pos] == ']':
+      if after_comma:
+        raise ValueError('Unexpected "]" after "," in JSON array')
+      _CheckOnlyWhitespaceRemains(f, buf[pos + 1:], read_size)
+      return
+    if after_element:
+      if buf[pos] != ',':
+        raise ValueError('Expected "," in JSON array, found %r' % buf[pos])
+      pos += 1
+      after_element = False
+      after_comma = True
+      continue
+
+    try:
+      element, end = decoder.raw_decode(buf, pos)
+    except ValueError:
+      if at_eof:
+        raise
+      # The element continues past the end of the buffer.
+      more = f.read(next_read_size)
+      next_read_size *= 2
+      at_eof = not more
+      buf = buf[pos:] + more
+      pos = 0
+      continue
+    # A prefix of a number (e.g. "-2" of "-2.5") decodes successfully, so
+    # make sure that the element is followed by a delimiter.
+    if end == len(buf) or buf[end] not in _WHITESPACE + ',]':
+      if at_eof:
+        if end < len(buf):
+          raise ValueError('Unexpected %r in JSON array' % buf[end])
+      else:
+        more = f.read(next_read_size)
+        next_read_size *= 2
+        at_eof = not more
+        buf = buf[pos:] + more
+        pos = 0
+        continue
+    next_read_size = read_size
+    yield element
+    pos = end
+    after_element = True
+    after_comma = False
+
+
+def _CheckOnlyWhitespaceRemains(f, buf, read_size):
+  """Raises ValueError if |buf| or the rest of file object |f| contains
+  anything other than whitespace.
+  """
+  while True:
+    if buf.strip(_WHITESPACE):
+      raise ValueError('Extra data after JSON array')
+    buf = f.read(read_size)
+    if not buf:
+      return
+
+
+class JsonArrayWriter(object):
+  """Writes a JSON array to a file object, one element at a time.
+
+  Usage:
+    with JsonArrayWriter(f) as writer:
+      writer.Write(element)
+  """
+
+  def __init__(self, f):
+    self._file = f
+    self._count = 0
+
+  @property
+  def count(self):
+    """The number of elements written so far."""
+    return self._count
+
+  def __enter__(self):
+    self._file.write('[')
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._file.write(']')
+
+  def Write(self, element):
+    if self._count:
+      self._file.write(', ')
+    json.dump(element, self._file)
+    self._count += 1
@@ -0,0 +1,53 @@
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+import json
+import os
+import StringIO
+import tempfile
+import unittest
+
+from core import streaming_json
+
+
+class StreamingJsonTest(unittest.TestCase):
+
+  def testIterJsonArray(self):
+    elements = [{'a': [1, 2.5, None]}, 'b"c', -12345, True, [], {}]
+    text = json.dumps(elements, indent=2)
+    # Elements must be decoded correctly wherever reads split them.
+    for read_size in (1, 2, 3, 7, 4096):
+      self.assertEqual(elements, list(streaming_json.IterJsonArray(
+          StringIO.StringIO(text), read_size=read_size)))
+
+  def testIterJsonArray_Empty(self):
+    self.assertEqual([], list(streaming_json.IterJsonArray(
+        StringIO.StringIO(' [ ] '))))
+
+  def testIterJsonArray_Invalid(self):
+    for text in ('{}', '[1, 2', '[1 2]', '', '[1,]', '[,]', '[1]x',
+                 '[1] ]', '[] []'):
+      for read_size in (1, 4096):
+        with self.assertRaises(ValueError):
+          list(streaming_json.IterJsonArray(StringIO.StringIO(text),
+                                            read_size=read_size))
+
+  def testJsonArrayWriter(self):
+    f = StringIO.StringIO()
+    with streaming_json.JsonArrayWriter(f) as writer:
+      writer.Write({'a': 1})
+      writer.Write([2])
+    self.assertEqual(2, writer.count)
+    self.assertEqual([{'a': 1}, [2]], json.loads(f.getvalue()))
+
+  def testIsJsonArray(self):
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    try:
+      with tf:
+        tf.write('\n  [{"a": 1}]')
+      self.assertTrue(streaming_json.IsJsonArray(tf.name))
+      with open(tf.name, 'w') as f:
+        f.write('"[]"')
+      self.assertFalse(streaming_json.IsJsonArray(tf.name))
+    finally:
+      os.remove(tf.name)
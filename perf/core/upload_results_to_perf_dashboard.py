@@ -10,12 +10,16 @@
 
 import json
 import optparse
+import os
 import re
+import shutil
 import sys
+import tempfile
 import time
 import urllib
 
 from core import results_dashboard
+from core import streaming_json
 
 
 RESULTS_LINK_PATH = '/report?masters=%s&bots=%s&tests=%s&rev=%s'
@@ -59,7 +63,8 @@ def _GetDashboardJson(options):
       perf_dashboard_machine_group=options.perf_dashboard_machine_group)
   return dashboard_json
 
-def _GetDashboardHistogramData(options):
+def _GetDashboardHistogramData(options, output_file):
+  """Writes the HistogramSet to upload, with diagnostics, to |output_file|."""
   revisions = {
       '--chromium_commit_positions': _GetMainRevision(options.got_revision_cp),
       '--chromium_revisions': options.git_revision
@@ -74,15 +79,14 @@ def _GetDashboardHistogramData(options):
   stripped_test_name = options.name.replace('.reference', '')
 
   begin_time = time.time()
-  hs = results_dashboard.MakeHistogramSetWithDiagnostics(
-      options.results_file, stripped_test_name,
+  results_dashboard.MakeHistogramSetFileWithDiagnostics(
+      options.results_file, output_file, stripped_test_name,
       options.configuration_name, options.buildername, options.buildnumber,
       revisions, is_reference_build,
       perf_dashboard_machine_group=options.perf_dashboard_machine_group)
   end_time = time.time()
   print 'Duration of adding diagnostics for %s: %d seconds' % (
       stripped_test_name, end_time - begin_time)
-  return hs
 
 def _CreateParser():
   # Parse options
@@ -102,6 +106,9 @@ def _CreateParser():
   parser.add_option('--output-json-dashboard-url')
   parser.add_option('--send-as-histograms', action='store_true')
   parser.add_option('--service-account-file')
+  parser.add_option('--deadline', type='float',
+                    help='Time (in seconds since the epoch) after which '
+                    'failed uploads are not retried anymore.')
   return parser
 
 
@@ -121,36 +128,73 @@ def main(args):
     print 'Error: Invalid perf dashboard machine group'
     return 1
 
-  if not options.send_as_histograms:
-    dashboard_json = _GetDashboardJson(options)
-  else:
-    dashboard_json = _GetDashboardHistogramData(options)
+  if options.send_as_histograms:
+    return _UploadHistograms(options, service_account_file)
+
+  dashboard_json = _GetDashboardJson(options)
 
   if options.output_json_file:
     json.dump(dashboard_json, options.output_json_file,
         indent=4, separators=(',', ': '))
 
   if dashboard_json:
-    if options.output_json_dashboard_url:
-      # Dump dashboard url to file.
-      dashboard_url = GetDashboardUrl(options.name,
-          options.configuration_name, options.results_url,
-          options.got_revision_cp,
-          options.perf_dashboard_machine_group)
-      with open(options.output_json_dashboard_url, 'w') as f:
-        json.dump(dashboard_url if dashboard_url else '', f)
+    _WriteDashboardUrl(options)
 
     if not results_dashboard.SendResults(
         dashboard_json,
         options.results_url,
-        send_as_histograms=options.send_as_histograms,
-        service_account_file=service_account_file):
+        service_account_file=service_account_file,
+        deadline=options.deadline):
       return 1
   else:
     # The upload didn't fail since there was no data to upload.
     print 'Warning: No perf dashboard JSON was produced.'
   return 0
 
+
+def _UploadHistograms(options, service_account_file):
+  # HistogramSets can be hundreds of MB, so they are kept in a file and never
+  # loaded into memory as a whole.
+  tf = tempfile.NamedTemporaryFile(delete=False)
+  tf.close()
+  histograms_file = tf.name
+  try:
+    _GetDashboardHistogramData(options, histograms_file)
+
+    if options.output_json_file:
+      with open(histograms_file) as f:
+        shutil.copyfileobj(f, options.output_json_file)
+
+    with open(histograms_file) as f:
+      has_histograms = any(True for _ in streaming_json.IterJsonArray(f))
+    if not has_histograms:
+      # The upload didn't fail since there was no data to upload.
+      print 'Warning: No perf dashboard JSON was produced.'
+      return 0
+
+    _WriteDashboardUrl(options)
+
+    if not results_dashboard.SendHistogramsFile(
+        histograms_file,
+        options.results_url,
+        service_account_file,
+        deadline=options.deadline):
+      return 1
+    return 0
+  finally:
+    os.remove(histograms_file)
+
+
+def _WriteDashboardUrl(options):
+  if options.output_json_dashboard_url:
+    # Dump dashboard url to file.
+    dashboard_url = GetDashboardUrl(options.name,
+        options.configuration_name, options.results_url,
+        options.got_revision_cp,
+        options.perf_dashboard_machine_group)
+    with open(options.output_json_dashboard_url, 'w') as f:
+      json.dump(dashboard_url if dashboard_url else '', f)
+
 if __name__ == '__main__':
   sys.exit(main((sys.argv[1:])))
 
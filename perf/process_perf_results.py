@@ -4,6 +4,7 @@
 # found in the LICENSE file.
 
 import argparse
+import collections
 import json
 import logging
 import multiprocessing as mp
@@ -17,6 +18,7 @@ import time
 import uuid
 
 from core import path_util
+from core import streaming_json
 from core import upload_results_to_perf_dashboard
 from core import results_merger
 
@@ -39,6 +41,12 @@ MACHINE_GROUP_JSON_FILE = os.path.join(
 
 JSON_CONTENT_TYPE = 'application/json'
 
+# Each benchmark's upload stops being retried after this long, and is killed
+# if it has not finished _UPLOAD_KILL_GRACE_IN_SECONDS later.
+DEFAULT_UPLOAD_TIMEOUT_IN_SECONDS = 2000
+_UPLOAD_KILL_GRACE_IN_SECONDS = 60
+_UPLOAD_POLL_INTERVAL_IN_SECONDS = 0.1
+
 
 def _GetMachineGroup(build_properties):
   machine_group = None
@@ -63,7 +71,7 @@ def _GetMachineGroup(build_properties):
 
 
 def _upload_perf_results(json_to_upload, name, configuration_name,
-    build_properties, service_account_file, output_json_file):
+    build_properties, service_account_file, output_json_file, deadline=None):
   """Upload the contents of result JSON(s) to the perf dashboard."""
   args= [
       '--buildername', build_properties['buildername'],
@@ -82,16 +90,18 @@ def _upload_perf_results(json_to_upload, name, configuration_name,
   if build_properties.get('git_revision'):
     args.append('--git-revision')
     args.append(build_properties['git_revision'])
+  if deadline is not None:
+    args.append('--deadline')
+    args.append(str(deadline))
   if _is_histogram(json_to_upload):
     args.append('--send-as-histograms')
 
   return upload_results_to_perf_dashboard.main(args)
 
 def _is_histogram(json_file):
-  with open(json_file) as f:
-    data = json.load(f)
-    return isinstance(data, list)
-  return False
+  # Histogram sets are lists, chartjson results are dicts. Avoid loading the
+  # whole file, which can be very large.
+  return streaming_json.IsJsonArray(json_file)
 
 
 def _merge_json_output(output_json, jsons_to_merge, extra_links):
@@ -208,7 +218,9 @@ def _get_benchmark_name(directory):
 def process_perf_results(output_json, configuration_name,
                          service_account_file,
                          build_properties, task_output_dir,
-                         smoke_test_mode):
+                         smoke_test_mode, max_parallel_uploads=None,
+                         upload_timeout=DEFAULT_UPLOAD_TIMEOUT_IN_SECONDS,
+                         upload_journal=None):
   """Process perf results.
 
   Consists of merging the json-test-format output, uploading the perf test
@@ -220,6 +232,12 @@ def process_perf_results(output_json, configuration_name,
   perftest-output.json file containing the performance results in histogram
   or dashboard json format and an output.json file containing the json test
   results for the benchmark.
+
+  Benchmarks are uploaded in parallel, by at most |max_parallel_uploads|
+  processes (by default, one per CPU), and each upload is given
+  |upload_timeout| seconds. If |upload_journal| is set, it is the path of a
+  file recording which benchmarks were uploaded, so that rerunning this for
+  the same build only uploads the remaining ones.
   """
   begin_time = time.time()
   return_code = 0
@@ -275,7 +293,7 @@ def process_perf_results(output_json, configuration_name,
       return_code = _handle_perf_results(
           benchmark_enabled_map, benchmark_directory_map,
           configuration_name, build_properties, service_account_file,
-          extra_links)
+          extra_links, max_parallel_uploads, upload_timeout, upload_journal)
     except Exception:
       logging.exception('Error handling perf results jsons')
       return_code = 1
@@ -296,31 +314,49 @@ def _merge_chartjson_results(chartjson_dicts):
           merged_results[key][add_key] = chartjson_dict[key][add_key]
   return merged_results
 
-def _merge_histogram_results(histogram_lists):
-  merged_results = []
-  for histogram_list in histogram_lists:
-    merged_results += histogram_list
+def _merge_histogram_results(histogram_files, output_file):
+  """Merges HistogramSet JSON files into |output_file|.
 
-  return merged_results
+  Histograms are streamed from the inputs to the output one at a time, so that
+  memory use does not depend on the size of the inputs. Shards share
+  diagnostics (e.g. the benchmark's metadata), which are written only once.
+
+  Returns:
+    The number of (histogram and diagnostic) dicts written.
+  """
+  seen_guids = set()
+  with streaming_json.JsonArrayWriter(output_file) as writer:
+    for filename in histogram_files:
+      with open(filename) as f:
+        for element in streaming_json.IterJsonArray(f):
+          guid = element.get('guid') if isinstance(element, dict) else None
+          if guid is not None:
+            if guid in seen_guids:
+              continue
+            seen_guids.add(guid)
+          writer.Write(element)
+  return writer.count
 
 def _merge_perf_results(benchmark_name, results_filename, directories):
   begin_time = time.time()
-  collected_results = []
-  for directory in directories:
-    filename = join(directory, 'perf_results.json')
-    with open(filename) as pf:
-      collected_results.append(json.load(pf))
+  filenames = [join(directory, 'perf_results.json')
+               for directory in directories]
 
   # Assuming that multiple shards will only be chartjson or histogram set
   # Non-telemetry benchmarks only ever run on one shard
-  merged_results = []
-  if isinstance(collected_results[0], dict):
-    merged_results = _merge_chartjson_results(collected_results)
-  elif isinstance(collected_results[0], list):
-    merged_results =_merge_histogram_results(collected_results)
-
-  with open(results_filename, 'w') as rf:
-    json.dump(merged_results, rf)
+  if _is_histogram(filenames[0]):
+    with open(results_filename, 'w') as rf:
+      _merge_histogram_results(filenames, rf)
+  else:
+    collected_results = []
+    for filename in filenames:
+      with open(filename) as pf:
+        collected_results.append(json.load(pf))
+    merged_results = []
+    if isinstance(collected_results[0], dict):
+      merged_results = _merge_chartjson_results(collected_results)
+    with open(results_filename, 'w') as rf:
+      json.dump(merged_results, rf)
 
   end_time = time.time()
   print_duration(('%s results merging' % (benchmark_name)),
@@ -329,7 +365,7 @@ def _merge_perf_results(benchmark_name, results_filename, directories):
 
 def _upload_individual(
     benchmark_name, directories, configuration_name,
-    build_properties, output_json_file, service_account_file):
+    build_properties, output_json_file, service_account_file, deadline=None):
   tmpfile_dir = tempfile.mkdtemp()
   try:
     upload_begin_time = time.time()
@@ -353,7 +389,7 @@ def _upload_individual(
       upload_fail = _upload_perf_results(
         results_filename,
         benchmark_name, configuration_name, build_properties,
-        service_account_file, oj)
+        service_account_file, oj, deadline)
       upload_end_time = time.time()
       print_duration(('%s upload time' % (benchmark_name)),
                      upload_begin_time, upload_end_time)
@@ -372,9 +408,179 @@ def _upload_individual_benchmark(params):
     return benchmark_name, upload_fail
 
 
+def _run_upload_worker(conn):
+  """Uploads the benchmarks received on |conn|, until it receives None."""
+  while True:
+    params = conn.recv()
+    if params is None:
+      return
+    conn.send(_upload_individual_benchmark(params))
+
+
+class _UploadWorker(object):
+  """A process uploading one benchmark at a time.
+
+  Workers are reused across benchmarks, so that they keep their connection to
+  and authentication token for the perf dashboard. A worker whose upload
+  misses its deadline is killed, without affecting the other uploads.
+  """
+
+  def __init__(self):
+    self._conn, child_conn = mp.Pipe()
+    self._process = mp.Process(target=_run_upload_worker, args=(child_conn,))
+    self._process.daemon = True
+    self._process.start()
+    child_conn.close()
+    self.benchmark_name = None
+    self.start_time = None
+    self.deadline = None
+
+  def Start(self, params, timeout):
+    self.benchmark_name = params[0]
+    self.start_time = time.time()
+    self.deadline = self.start_time + timeout
+    self._conn.send(params + (self.deadline,))
+
+  def Poll(self):
+    """Returns whether the upload failed, or None if it is still running."""
+    if not self._conn.poll():
+      return None
+    try:
+      _, upload_fail = self._conn.recv()
+    except EOFError:
+      logging.error('Upload worker for %s exited unexpectedly',
+                    self.benchmark_name)
+      return True
+    return upload_fail
+
+  def IsAlive(self):
+    return self._process.is_alive()
+
+  def Stop(self):
+    try:
+      self._conn.send(None)
+    except IOError:
+      # The process already exited.
+      pass
+    self._process.join()
+
+  def Kill(self):
+    self._process.terminate()
+    self._process.join()
+
+
+class _UploadJournal(object):
+  """Records which benchmarks were uploaded, so that reruns can skip them.
+
+  The journal is a JSON file, rewritten after each upload. It only applies to
+  the build it was written for.
+  """
+
+  def __init__(self, path, build):
+    self._path = path
+    self._build = build
+    self._benchmarks = {}
+    if path and os.path.exists(path):
+      try:
+        with open(path) as f:
+          journal = json.load(f)
+        if journal.get('build') == build:
+          self._benchmarks = journal['benchmarks']
+      except (ValueError, KeyError):
+        logging.warning('Ignoring invalid upload journal %s', path)
+
+  def IsUploaded(self, benchmark_name):
+    return self._benchmarks.get(benchmark_name, {}).get('status') == 'uploaded'
+
+  def Record(self, benchmark_name, timing):
+    if not self._path:
+      return
+    self._benchmarks[benchmark_name] = timing
+    # Write to a temporary file first, so that the journal is never truncated
+    # if this process is killed.
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(self._path)))
+    try:
+      with os.fdopen(fd, 'w') as f:
+        json.dump({'build': self._build, 'benchmarks': self._benchmarks}, f,
+                  sort_keys=True, indent=4, separators=(',', ': '))
+      os.rename(tmp_path, self._path)
+    except:
+      os.unlink(tmp_path)
+      raise
+
+
+def _upload_benchmarks(invocations, max_parallel_uploads, upload_timeout,
+                       journal):
+  """Uploads benchmarks in parallel.
+
+  At most |max_parallel_uploads| benchmarks are uploaded at a time. Each
+  upload stops retrying after |upload_timeout| seconds, and is killed if it
+  still has not finished shortly after that.
+
+  Returns:
+    A dict mapping each benchmark name to an (upload_fail, timing) tuple, where
+    timing is a dict describing how long the upload took.
+  """
+  begin_time = time.time()
+  results = {}
+  pending = collections.deque()
+  for params in invocations:
+    benchmark_name = params[0]
+    if journal.IsUploaded(benchmark_name):
+      print 'Skipping %s, already uploaded by a previous run' % benchmark_name
+      results[benchmark_name] = (False, collections.OrderedDict([
+          ('status', 'skipped (already uploaded)')]))
+    else:
+      pending.append(params)
+
+  idle_workers = []
+  busy_workers = []
+  try:
+    while pending or busy_workers:
+      while pending and len(busy_workers) < max_parallel_uploads:
+        worker = idle_workers.pop() if idle_workers else _UploadWorker()
+        worker.Start(pending.popleft(), upload_timeout)
+        busy_workers.append(worker)
+
+      time.sleep(_UPLOAD_POLL_INTERVAL_IN_SECONDS)
+      for worker in list(busy_workers):
+        upload_fail = worker.Poll()
+        end_time = time.time()
+        if upload_fail is None:
+          if end_time < worker.deadline + _UPLOAD_KILL_GRACE_IN_SECONDS:
+            continue
+          logging.error('Uploading %s timed out after %d seconds',
+                        worker.benchmark_name, end_time - worker.start_time)
+          worker.Kill()
+          upload_fail = True
+          status = 'timed out'
+        else:
+          status = 'failed' if upload_fail else 'uploaded'
+          if worker.IsAlive():
+            idle_workers.append(worker)
+        busy_workers.remove(worker)
+
+        timing = collections.OrderedDict([
+            ('status', status),
+            ('queued_seconds', round(worker.start_time - begin_time, 1)),
+            ('upload_seconds', round(end_time - worker.start_time, 1)),
+        ])
+        results[worker.benchmark_name] = (upload_fail, timing)
+        journal.Record(worker.benchmark_name, timing)
+  finally:
+    for worker in idle_workers:
+      worker.Stop()
+    for worker in busy_workers:
+      worker.Kill()
+  return results
+
+
 def _handle_perf_results(
     benchmark_enabled_map, benchmark_directory_map, configuration_name,
-    build_properties, service_account_file, extra_links):
+    build_properties, service_account_file, extra_links,
+    max_parallel_uploads=None, upload_timeout=DEFAULT_UPLOAD_TIMEOUT_IN_SECONDS,
+    upload_journal=None):
   """
     Upload perf results to the perf dashboard.
 
@@ -403,38 +609,29 @@ def _handle_perf_results(
           benchmark_name, directories, configuration_name,
           build_properties, output_json_file, service_account_file))
 
+    journal = _UploadJournal(upload_journal, collections.OrderedDict([
+        ('buildername', build_properties.get('buildername')),
+        ('buildnumber', build_properties.get('buildnumber')),
+        ('configuration_name', configuration_name),
+    ]))
     # Kick off the uploads in mutliple processes
-    cpus = mp.cpu_count()
-    pool = mp.Pool(cpus)
-    try:
-      async_result = pool.map_async(
-          _upload_individual_benchmark, invocations)
-      results = async_result.get(timeout=2000)
-    except mp.TimeoutError:
-      logging.error('Failed uploading benchmarks to perf dashboard in parallel')
-      pool.terminate()
-      results = []
-      for benchmark_name in benchmark_directory_map:
-        results.append((benchmark_name, False))
-
-    # Keep a mapping of benchmarks to their upload results
-    benchmark_upload_result_map = {}
-    for r in results:
-      benchmark_upload_result_map[r[0]] = bool(r[1])
+    benchmark_upload_result_map = _upload_benchmarks(
+        invocations, max_parallel_uploads or mp.cpu_count(), upload_timeout,
+        journal)
 
     logdog_dict = {}
     upload_failures_counter = 0
     logdog_stream = None
     logdog_label = 'Results Dashboard'
     for benchmark_name, output_file in results_dict.iteritems():
-      failure = benchmark_upload_result_map[benchmark_name]
+      failure, timing = benchmark_upload_result_map[benchmark_name]
       if failure:
         upload_failures_counter += 1
       is_reference = '.reference' in benchmark_name
       _write_perf_data_to_logfile(
         benchmark_name, output_file,
         configuration_name, build_properties, logdog_dict,
-        is_reference, failure)
+        is_reference, failure, timing)
 
     logdog_file_name = _generate_unique_logdog_filename('Results_Dashboard_')
     logdog_stream = logdog_helper.text(logdog_file_name,
@@ -456,19 +653,19 @@ def _handle_perf_results(
 
 def _write_perf_data_to_logfile(benchmark_name, output_file,
     configuration_name, build_properties,
-    logdog_dict, is_ref, upload_failure):
+    logdog_dict, is_ref, upload_failure, upload_timing):
   viewer_url = None
   # logdog file to write perf results to
   if os.path.exists(output_file):
     output_json_file = logdog_helper.open_text(benchmark_name)
-    with open(output_file) as f:
-      try:
-        results = json.load(f)
-        json.dump(results, output_json_file,
-                indent=4, separators=(',', ': '))
-      except ValueError:
-        print ('Error parsing perf results JSON for benchmark  %s' %
-               benchmark_name)
+    if _is_valid_json_file(output_file):
+      with open(output_file) as f:
+        # Copy rather than re-serialize, since histogram sets can be too large
+        # to load into memory.
+        shutil.copyfileobj(f, output_json_file)
+    else:
+      print ('Error parsing perf results JSON for benchmark  %s' %
+             benchmark_name)
 
     output_json_file.close()
     viewer_url = output_json_file.get_viewer_url()
@@ -485,6 +682,7 @@ def _write_perf_data_to_logfile(benchmark_name, output_file,
   # the logs section of buildbot
   if is_ref:
     logdog_dict[base_benchmark_name]['perf_results_ref'] = viewer_url
+    logdog_dict[base_benchmark_name]['ref_upload_timing'] = upload_timing
     if upload_failure:
       logdog_dict[base_benchmark_name]['ref_upload_failed'] = 'True'
   else:
@@ -495,10 +693,26 @@ def _write_perf_data_to_logfile(benchmark_name, output_file,
             build_properties['got_revision_cp'],
             _GetMachineGroup(build_properties)))
     logdog_dict[base_benchmark_name]['perf_results'] = viewer_url
+    logdog_dict[base_benchmark_name]['upload_timing'] = upload_timing
     if upload_failure:
       logdog_dict[base_benchmark_name]['upload_failed'] = 'True'
 
 
+def _is_valid_json_file(json_file):
+  # Histogram sets are validated one element at a time, since they can be too
+  # large to load into memory.
+  try:
+    with open(json_file) as f:
+      if streaming_json.IsJsonArray(json_file):
+        for _ in streaming_json.IterJsonArray(f):
+          pass
+      else:
+        json.load(f)
+  except ValueError:
+    return False
+  return True
+
+
 def print_duration(step, start, end):
   print 'Duration of %s: %d seconds' % (step, end-start)
 
@@ -521,6 +735,17 @@ def main():
   parser.add_argument('--smoke-test-mode', action='store_true',
                       help='This test should be run in smoke test mode'
                       ' meaning it does not upload to the perf dashboard')
+  parser.add_argument('--max-parallel-uploads', type=int,
+                      help='The maximum number of benchmarks to upload at '
+                      'once. Defaults to the number of CPUs.')
+  parser.add_argument('--upload-timeout', type=int,
+                      default=DEFAULT_UPLOAD_TIMEOUT_IN_SECONDS,
+                      help='The number of seconds after which the upload of '
+                      'a benchmark is abandoned.')
+  parser.add_argument('--upload-journal',
+                      help='A file recording which benchmarks were uploaded. '
+                      'When rerun for the same build, benchmarks that were '
+                      'already uploaded are skipped.')
 
   args = parser.parse_args()
 
@@ -532,7 +757,8 @@ def main():
       args.output_json, args.configuration_name,
       args.service_account_file,
       args.build_properties, args.task_output_dir,
-      args.smoke_test_mode)
+      args.smoke_test_mode, args.max_parallel_uploads,
+      args.upload_timeout, args.upload_journal)
 
 
 if __name__ == '__main__':
@@ -8,6 +8,7 @@ import shutil
 import sys
 import tempfile
 import json
+import time
 import unittest
 
 from core import path_util
@@ -61,6 +62,10 @@ class ProcessPerfResultsIntegrationTest(unittest.TestCase):
     m3.start()
     self.addCleanup(m3.stop)
 
+    m4 = mock.patch('core.results_dashboard.SendHistogramsFile')
+    m4.start()
+    self.addCleanup(m4.stop)
+
 
   def tearDown(self):
     shutil.rmtree(self.test_dir)
@@ -83,5 +88,87 @@ class ProcessPerfResultsIntegrationTest(unittest.TestCase):
         task_output_dir=self.task_output_dir,
         smoke_test_mode=False)
 
+
+class MergeHistogramResultsTest(unittest.TestCase):
+  def setUp(self):
+    self.test_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.test_dir)
+
+  def testMergeDedupesDiagnosticsByGuid(self):
+    diagnostic = {'guid': 'd1', 'type': 'GenericSet', 'values': ['x']}
+    shards = [
+        [diagnostic, {'name': 'h1', 'guid': 'g1', 'diagnostics': {'a': 'd1'}}],
+        [diagnostic, {'name': 'h2', 'guid': 'g2', 'diagnostics': {'a': 'd1'}}],
+    ]
+    directories = []
+    for i, shard in enumerate(shards):
+      directory = os.path.join(self.test_dir, str(i))
+      os.makedirs(directory)
+      with open(os.path.join(directory, 'perf_results.json'), 'w') as f:
+        json.dump(shard, f)
+      directories.append(directory)
+
+    merged_file = os.path.join(self.test_dir, 'merged.json')
+    ppr_module._merge_perf_results('benchmark', merged_file, directories)
+    with open(merged_file) as f:
+      self.assertEqual([diagnostic, shards[0][1], shards[1][1]], json.load(f))
+
+
+def _fake_upload_individual(benchmark_name, directories, configuration_name,
+                            build_properties, output_json_file,
+                            service_account_file, deadline):
+  del directories, configuration_name, build_properties  # unused
+  del output_json_file, service_account_file, deadline  # unused
+  if benchmark_name == 'hanging':
+    time.sleep(60)
+  return benchmark_name, benchmark_name == 'failing'
+
+
+class UploadBenchmarksTest(unittest.TestCase):
+  def setUp(self):
+    self.test_dir = tempfile.mkdtemp()
+    self.journal_path = os.path.join(self.test_dir, 'journal.json')
+    m = mock.patch('process_perf_results._upload_individual',
+                   side_effect=_fake_upload_individual)
+    m.start()
+    self.addCleanup(m.stop)
+    m = mock.patch('process_perf_results._UPLOAD_KILL_GRACE_IN_SECONDS', 0)
+    m.start()
+    self.addCleanup(m.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self.test_dir)
+
+  def _UploadBenchmarks(self, benchmark_names, build=None):
+    invocations = [(name, [], 'test-builder', {}, None, None)
+                   for name in benchmark_names]
+    journal = ppr_module._UploadJournal(self.journal_path,
+                                        build or {'buildnumber': 1})
+    results = ppr_module._upload_benchmarks(invocations, 2, 2, journal)
+    return dict((name, (upload_fail, timing['status']))
+                for name, (upload_fail, timing) in results.iteritems())
+
+  def testFailuresAreIsolated(self):
+    self.assertEqual({
+        'a': (False, 'uploaded'),
+        'failing': (True, 'failed'),
+        'hanging': (True, 'timed out'),
+        'b': (False, 'uploaded'),
+    }, self._UploadBenchmarks(['a', 'failing', 'hanging', 'b']))
+
+  def testJournalSkipsUploadedBenchmarks(self):
+    self._UploadBenchmarks(['a', 'failing'])
+    self.assertEqual({
+        'a': (False, 'skipped (already uploaded)'),
+        'failing': (True, 'failed'),
+    }, self._UploadBenchmarks(['a', 'failing']))
+    # The journal only applies to the build it was written for.
+    self.assertEqual({
+        'a': (False, 'uploaded'),
+    }, self._UploadBenchmarks(['a'], build={'buildnumber': 2}))
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -4,12 +4,16 @@
 # found in the LICENSE file.
 
 import argparse
+import cPickle
 import cgi
 import colorsys
 import difflib
+import hashlib
+import itertools
 import random
 import os
 import re
+import signal
 import subprocess
 import sys
 import tempfile
@@ -17,6 +21,15 @@ import textwrap
 import webbrowser
 
 
+# Bump whenever the format of cached blames, or the way they are computed,
+# changes.
+BLAME_CACHE_VERSION = 1
+
+# The number of blames a BlameCache keeps, the least recently used ones are
+# evicted first.  Each blame holds the diffs of all the commits it refers to.
+BLAME_CACHE_MAX_ENTRIES = 32
+
+
 class TokenContext(object):
   """Metadata about a token.
 
@@ -101,6 +114,9 @@ def tokenize_data(data, tokenize_by_char, tokenize_whitespace):
       line_contexts = []
     else:
       column += 1
+  # |data| may not end with a newline, like the lines removed by a diff.
+  if in_identifier:
+    line_contexts.append(TokenContext(row, identifier_start, identifier))
   contexts.append(line_contexts)
   return contexts
 
@@ -144,6 +160,32 @@ def parse_chunk_header_file_range(file_range):
     return (int(file_range) - 1, int(file_range))
 
 
+def compute_changed_token_ranges(old_tokens, new_tokens):
+  """Computes the ranges of tokens that differ between two token lists.
+
+  This gives the same ranges as the chunks of
+  compute_unified_diff(old_tokens, new_tokens), without formatting and parsing
+  a line for each token.
+
+  Args:
+    old_tokens: Token strings corresponding to the old data.
+    new_tokens: Token strings corresponding to the new data.
+
+  Returns:
+    A list of tuples (removed_start, removed_end, added_start, added_end),
+    which are ranges of indices into |old_tokens| and |new_tokens|.
+  """
+  if old_tokens == new_tokens:
+    return []
+  if not old_tokens or not new_tokens:
+    return [(0, len(old_tokens), 0, len(new_tokens))]
+  # With no context lines, each chunk of the unified diff is a single
+  # non-equal opcode.
+  matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens)
+  return [(i1, i2, j1, j2) for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+          if tag != 'equal']
+
+
 def compute_changed_token_indices(previous_tokens, current_tokens):
   """Computes changed and added tokens.
 
@@ -161,21 +203,18 @@ def compute_changed_token_indices(previous_tokens, current_tokens):
   prev_patched_chunk_end = 0
   added_tokens = []
   changed_tokens = {}
-  for line in compute_unified_diff(previous_tokens, current_tokens):
-    if line.startswith("@@"):
-      parts = line.split(' ')
-      removed = parts[1].lstrip('-')
-      removed_start, removed_end = parse_chunk_header_file_range(removed)
-      added = parts[2].lstrip('+')
-      added_start, added_end = parse_chunk_header_file_range(added)
-      for i in range(added_start, added_end):
-        added_tokens.append(i)
-      for i in range(0, removed_start - prev_patched_chunk_end):
-        changed_tokens[prev_file_chunk_end + i] = prev_patched_chunk_end + i
-      prev_patched_chunk_end = removed_end
-      prev_file_chunk_end = added_end
-  for i in range(0, len(previous_tokens) - prev_patched_chunk_end):
-    changed_tokens[prev_file_chunk_end + i] = prev_patched_chunk_end + i
+  for (removed_start, removed_end, added_start,
+       added_end) in compute_changed_token_ranges(previous_tokens,
+                                                  current_tokens):
+    added_tokens.extend(xrange(added_start, added_end))
+    changed_tokens.update(itertools.izip(
+        xrange(prev_file_chunk_end, added_start),
+        xrange(prev_patched_chunk_end, removed_start)))
+    prev_patched_chunk_end = removed_end
+    prev_file_chunk_end = added_end
+  changed_tokens.update(itertools.izip(
+      xrange(prev_file_chunk_end, len(current_tokens)),
+      xrange(prev_patched_chunk_end, len(previous_tokens))))
   return added_tokens, changed_tokens
 
 
@@ -193,16 +232,10 @@ def flatten_nested_list(l):
         index_to_position[i] == (r, c); flattened[i] == l[r][c]
   """
   flattened = []
-  index_to_position = {}
-  r = 0
-  c = 0
-  for nested_list in l:
-    for element in nested_list:
-      index_to_position[len(flattened)] = (r, c)
-      flattened.append(element)
-      c += 1
-    r += 1
-    c = 0
+  index_to_position = []
+  for r, nested_list in enumerate(l):
+    flattened.extend(nested_list)
+    index_to_position.extend((r, c) for c in xrange(len(nested_list)))
   return (flattened, index_to_position)
 
 
@@ -366,7 +399,144 @@ def generate_commits(git_log_stdout):
     yield Commit(hash, author_name, author_email, author_date, message, diff)
 
 
-def uberblame_aux(file_name, git_log_stdout, data, tokenization_method):
+class BlameCache(object):
+  """An on-disk cache of computed blames.
+
+  Blames are cached by file name and by the last commit that modified the file,
+  so that a later uberblame of the file only needs to process the commits after
+  a cached one.  Cached blames are unpickled, so the cache directory must only
+  be writable by trusted users.
+  """
+
+  def __init__(self, cache_dir, tokenization_key,
+               max_entries=BLAME_CACHE_MAX_ENTRIES):
+    """Initializes the cache.
+
+    Args:
+      cache_dir: The directory to store cached blames in.
+      tokenization_key: A string identifying the tokenization method, since
+        blames computed with different tokenizations can't be mixed.
+      max_entries: The number of blames to keep in |cache_dir|.
+    """
+    self._cache_dir = cache_dir
+    self._tokenization_key = tokenization_key
+    self._max_entries = max_entries
+
+  def _get_path(self, file_name, commit_hash):
+    key = hashlib.sha1('%d\0%s\0%s\0%s' % (
+        BLAME_CACHE_VERSION, self._tokenization_key, file_name,
+        commit_hash)).hexdigest()
+    return os.path.join(self._cache_dir, key[:2], key)
+
+  def get(self, file_name, commit_hash):
+    """Returns the blame cached by put(), or None if there is none."""
+    path = self._get_path(file_name, commit_hash)
+    if not os.path.exists(path):
+      return None
+    try:
+      with open(path, 'rb') as f:
+        cached_blame = cPickle.load(f)
+    except Exception:
+      # Corrupt entries are simply recomputed.
+      return None
+    try:
+      # Mark the entry as recently used, see prune().
+      os.utime(path, None)
+    except OSError:
+      # Another process may have evicted it.
+      pass
+    return cached_blame
+
+  def put(self, file_name, commit_hash, blame):
+    """Caches |blame|, a list of lists of blamed TokenContexts."""
+    commits = []
+    commit_indices = {}
+    lines = []
+    for contexts in blame:
+      line = []
+      for context in contexts:
+        commit = context.commit
+        if commit.hash not in commit_indices:
+          commit_indices[commit.hash] = len(commits)
+          commits.append((commit.hash, commit.author_name, commit.author_email,
+                          commit.author_date, commit.message, commit.diff))
+        line.append((context.token, commit_indices[commit.hash]))
+      lines.append(line)
+
+    path = self._get_path(file_name, commit_hash)
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+      try:
+        os.makedirs(dirname)
+      except OSError:
+        # Another process may have created it.
+        if not os.path.isdir(dirname):
+          raise
+    # Write to a temporary file first, so that concurrent runs never see
+    # partial entries.
+    fd, tmp_path = tempfile.mkstemp(dir=dirname)
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        cPickle.dump({'commits': commits, 'lines': lines}, f,
+                     cPickle.HIGHEST_PROTOCOL)
+      os.rename(tmp_path, path)
+    except:
+      os.unlink(tmp_path)
+      raise
+    self.prune()
+
+  def prune(self):
+    """Evicts the least recently used blames beyond the cache's capacity."""
+    entries = []
+    for dirpath, _, filenames in os.walk(self._cache_dir):
+      for filename in filenames:
+        if filename.startswith(tempfile.gettempprefix()):
+          # A blame being written by put().
+          continue
+        path = os.path.join(dirpath, filename)
+        try:
+          entries.append((os.path.getmtime(path), path))
+        except OSError:
+          # Another process may have evicted it.
+          pass
+    entries.sort(reverse=True)
+    for _, path in entries[self._max_entries:]:
+      try:
+        os.unlink(path)
+      except OSError:
+        pass
+
+
+def apply_cached_blame(blame, cached_blame):
+  """Blames the remaining tokens of |blame| with a cached blame.
+
+  Args:
+    blame: A list of lists of TokenContexts, which are the tokens of the file
+      as of the commit that |cached_blame| was cached for.
+    cached_blame: A blame returned by BlameCache.get().
+
+  Returns:
+    A boolean indicating if the tokens matched the cached blame, and were
+    blamed.
+  """
+  lines = cached_blame['lines']
+  if len(blame) != len(lines):
+    return False
+  for contexts, line in itertools.izip(blame, lines):
+    if len(contexts) != len(line):
+      return False
+    for context, (token, _) in itertools.izip(contexts, line):
+      if context.token != token:
+        return False
+  commits = [Commit(*commit) for commit in cached_blame['commits']]
+  for contexts, line in itertools.izip(blame, lines):
+    for context, (_, commit_index) in itertools.izip(contexts, line):
+      context.commit = commits[commit_index]
+  return True
+
+
+def uberblame_aux(file_name, git_log_stdout, data, tokenization_method,
+                  blame_cache=None):
   """Computes the uberblame of file |file_name|.
 
   Args:
@@ -375,6 +545,9 @@ def uberblame_aux(file_name, git_log_stdout, data, tokenization_method):
     data: A string containing the data of file |file_name|.
     tokenization_method: A function that takes a string and returns a list of
       TokenContexts.
+    blame_cache: If set, a BlameCache.  The log is only read up to the first
+      commit with a cached blame, and the result is cached for the newest
+      commit in the log.
 
   Returns:
     A tuple (data, blame).
@@ -387,7 +560,19 @@ def uberblame_aux(file_name, git_log_stdout, data, tokenization_method):
   total_tokens = len(blame)
   uber_blame = (data, blame[:])
 
+  newest_commit = None
+  found_cached_blame = False
   for commit in generate_commits(git_log_stdout):
+    if blame_cache:
+      # At this point, |blame| holds the remaining tokens of the file as of
+      # |commit|.
+      cached_blame = blame_cache.get(file_name, commit.hash)
+      if cached_blame and apply_cached_blame(blame, cached_blame):
+        found_cached_blame = True
+        break
+      if not newest_commit:
+        newest_commit = commit
+
     if should_skip_commit(commit):
       continue
 
@@ -420,11 +605,14 @@ def uberblame_aux(file_name, git_log_stdout, data, tokenization_method):
       blame[added_lines_start:added_lines_end] = previous_contexts
       offset += len(blame) - current_blame_size
 
-  assert blame == [] or blame == [[]]
+  if not found_cached_blame:
+    assert blame == [] or blame == [[]]
+  if newest_commit:
+    blame_cache.put(file_name, newest_commit.hash, uber_blame[1])
   return uber_blame
 
 
-def uberblame(file_name, revision, tokenization_method):
+def uberblame(file_name, revision, tokenization_method, blame_cache=None):
   """Computes the uberblame of file |file_name|.
 
   Args:
@@ -432,6 +620,7 @@ def uberblame(file_name, revision, tokenization_method):
     revision: The revision to start the uberblame at.
     tokenization_method: A function that takes a string and returns a list of
       TokenContexts.
+    blame_cache: If set, a BlameCache to reuse and store blames in.
 
   Returns:
     A tuple (data, blame).
@@ -450,10 +639,14 @@ def uberblame(file_name, revision, tokenization_method):
   data = subprocess.check_output(
       ['git', 'show', '%s:%s' % (revision, file_name)])
   data, blame = uberblame_aux(file_name, git_log.stdout, data,
-                              tokenization_method)
-
-  _, stderr = git_log.communicate()
-  if git_log.returncode != 0:
+                              tokenization_method, blame_cache)
+
+  # uberblame_aux() stops reading the log early when it finds a cached blame,
+  # in which case git log is terminated by SIGPIPE.
+  git_log.stdout.close()
+  stderr = git_log.stderr.read()
+  git_log.wait()
+  if git_log.returncode not in (0, -signal.SIGPIPE):
     raise subprocess.CalledProcessError(git_log.returncode, cmd_git_log, stderr)
   return data, blame
 
@@ -711,12 +904,23 @@ def main(argv):
       '--tokenize-whitespace',
       action='store_true',
       help='also blame non-newline whitespace characters')
+  parser.add_argument(
+      '--cache-dir',
+      help='directory to cache blames in, so that later uberblames of the '
+      'same file only process newer commits; it must only be writable by '
+      'trusted users')
   args = parser.parse_args(argv)
 
   def tokenization_method(data):
     return tokenize_data(data, args.tokenize_by_char, args.tokenize_whitespace)
 
-  data, blame = uberblame(args.file, args.revision, tokenization_method)
+  blame_cache = None
+  if args.cache_dir:
+    blame_cache = BlameCache(
+        args.cache_dir, 'tokenize_by_char=%s,tokenize_whitespace=%s' %
+        (args.tokenize_by_char, args.tokenize_whitespace))
+  data, blame = uberblame(args.file, args.revision, tokenization_method,
+                          blame_cache)
   html = create_visualization(data, blame)
   if not args.skip_visualization:
     show_visualization(html)
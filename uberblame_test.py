@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# Copyright 2018 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import uberblame
+
+
+def _compute_changed_token_indices_from_unified_diff(previous_tokens,
+                                                     current_tokens):
+  """The previous compute_changed_token_indices(), which parsed the chunk
+  headers of a unified diff."""
+  prev_file_chunk_end = 0
+  prev_patched_chunk_end = 0
+  added_tokens = []
+  changed_tokens = {}
+  for line in uberblame.compute_unified_diff(previous_tokens, current_tokens):
+    if line.startswith("@@"):
+      parts = line.split(' ')
+      removed = parts[1].lstrip('-')
+      removed_start, removed_end = uberblame.parse_chunk_header_file_range(
+          removed)
+      added = parts[2].lstrip('+')
+      added_start, added_end = uberblame.parse_chunk_header_file_range(added)
+      for i in range(added_start, added_end):
+        added_tokens.append(i)
+      for i in range(0, removed_start - prev_patched_chunk_end):
+        changed_tokens[prev_file_chunk_end + i] = prev_patched_chunk_end + i
+      prev_patched_chunk_end = removed_end
+      prev_file_chunk_end = added_end
+  for i in range(0, len(previous_tokens) - prev_patched_chunk_end):
+    changed_tokens[prev_file_chunk_end + i] = prev_patched_chunk_end + i
+  return added_tokens, changed_tokens
+
+
+_REVISIONS = [
+    'int a = 1;\nint b = 2;\n',
+    'int a = 1;\nint b = 3;\nint c = b;\n',
+    '// Comment.\nint a = 1;\nint b = 3;\nint c = b;\n',
+    '// Comment.\nint a = 4;\nint c = a + 1;\nint d = 5;',
+    '// Comment.\nint a = 4;\nint c = a + 1;\nint d = 5;\nint e = 6;\n',
+]
+
+
+def _describe_blame(blame):
+  return [[(context.token, context.commit.hash, context.commit.diff)
+           for context in contexts] for contexts in blame]
+
+
+class UberblameTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def testComputeChangedTokenIndices(self):
+    rand = random.Random(0)
+    for _ in xrange(500):
+      alphabet = 'abcde'[:rand.randint(1, 5)]
+      previous_tokens = [rand.choice(alphabet)
+                         for _ in xrange(rand.randint(0, 30))]
+      current_tokens = [rand.choice(alphabet)
+                        for _ in xrange(rand.randint(0, 30))]
+      self.assertEqual(
+          _compute_changed_token_indices_from_unified_diff(previous_tokens,
+                                                           current_tokens),
+          uberblame.compute_changed_token_indices(previous_tokens,
+                                                  current_tokens))
+
+  def testTokenizeDataKeepsLastIdentifier(self):
+    contexts = uberblame.tokenize_data('a b\ncd', False, False)
+    self.assertEqual([['a', 'b'], ['cd']],
+                     [[context.token for context in line_contexts]
+                      for line_contexts in contexts])
+
+  def _git(self, *args):
+    return subprocess.check_output(
+        ['git', '-c', 'user.name=Author', '-c', 'user.email=author@example.com']
+        + list(args), cwd=self.temp_dir)
+
+  def _uberblame(self, revision, blame_cache=None):
+    def tokenization_method(data):
+      return uberblame.tokenize_data(data, False, False)
+    cwd = os.getcwd()
+    os.chdir(self.temp_dir)
+    try:
+      return uberblame.uberblame('file.cc', revision, tokenization_method,
+                                 blame_cache)
+    finally:
+      os.chdir(cwd)
+
+  def testUberblameCache(self):
+    self._git('init', '-q')
+    revisions = []
+    for i, contents in enumerate(_REVISIONS):
+      with open(os.path.join(self.temp_dir, 'file.cc'), 'w') as f:
+        f.write(contents)
+      self._git('add', 'file.cc')
+      self._git('commit', '-q', '-m', 'Revision %d' % i)
+      revisions.append(self._git('rev-parse', 'HEAD').strip())
+    expected_data, expected_blame = self._uberblame(revisions[-1])
+
+    # A cold cache, at an older revision.
+    blame_cache = uberblame.BlameCache(
+        os.path.join(self.temp_dir, 'cache'), 'tokenization')
+    self.assertEqual(
+        _describe_blame(self._uberblame(revisions[2])[1]),
+        _describe_blame(self._uberblame(revisions[2], blame_cache)[1]))
+
+    # A warm cache, with a newer log.
+    hits = []
+    get = blame_cache.get
+    def Get(file_name, commit_hash):
+      cached_blame = get(file_name, commit_hash)
+      if cached_blame:
+        hits.append(commit_hash)
+      return cached_blame
+    blame_cache.get = Get
+    data, blame = self._uberblame(revisions[-1], blame_cache)
+    self.assertEqual([revisions[2]], hits)
+    self.assertEqual(expected_data, data)
+    self.assertEqual(_describe_blame(expected_blame), _describe_blame(blame))
+
+  def testBlameCacheEvictsLeastRecentlyUsed(self):
+    cache_dir = os.path.join(self.temp_dir, 'cache')
+    blame_cache = uberblame.BlameCache(cache_dir, 'tokenization',
+                                       max_entries=2)
+    commit = uberblame.Commit('hash', 'Author', 'author@example.com', 'Date',
+                              'Message', ['diff'])
+    blame = uberblame.tokenize_data('a b', False, False)
+    for contexts in blame:
+      for context in contexts:
+        context.commit = commit
+
+    blame_cache.put('file.cc', 'commit1', blame)
+    blame_cache.put('file.cc', 'commit2', blame)
+    # Make commit1 the most recently used.
+    for path in (blame_cache._get_path('file.cc', 'commit1'),
+                 blame_cache._get_path('file.cc', 'commit2')):
+      os.utime(path, (0, 0))
+    self.assertTrue(blame_cache.get('file.cc', 'commit1'))
+    blame_cache.put('file.cc', 'commit3', blame)
+
+    self.assertTrue(blame_cache.get('file.cc', 'commit1'))
+    self.assertEqual(None, blame_cache.get('file.cc', 'commit2'))
+    self.assertTrue(blame_cache.get('file.cc', 'commit3'))
+
+
+if __name__ == '__main__':
+  unittest.main()